@@ -1,50 +1,67 @@
 #version 460
 
-struct DirectionLight
-{
-    vec3 color;
-    float ambient_intensity;
-    float diffuse_intensity;
-    vec3 direction;
-};
-
 struct Material
 {
-    vec3 ambient_color;
-    vec3 diffuse_color;
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 specular;
+    float metallic;
 };
 
 
+layout (std140, binding=0) uniform FrameData {
+    mat4 m_persp;
+    mat4 m_view;
+    vec3 light_color;
+    float light_ambient_intensity;
+    vec3 light_direction;
+    float light_diffuse_intensity;
+};
+
 // Buffers
 in vec3 normals;
 in vec2 texcoords;
+flat in int texture_layer;  // layer of texture_diff_array, -1 - not used
+flat in int material;  // index of materials table
 
 // Textures
 layout (binding=0) uniform sampler2D texture_diff;
-// layout (binding=1) uniform sampler2D texture_normal;
+layout (binding=1) uniform sampler2DArray texture_diff_array;
+// layout (binding=2) uniform sampler2D texture_normal;
 
-uniform DirectionLight light;
-uniform Material material;
+layout (std430, binding=2) readonly buffer Materials {
+    Material materials[];
+};
 
 out vec4 fragColor;
 
 
 void main() {
+    vec3 material_ambient = materials[material].ambient.rgb;
+    vec3 material_diffuse = materials[material].diffuse.rgb;
+
     vec4 ambient_color = 
-        vec4(light.color, 1.0) *
-        light.ambient_intensity *
-        vec4(material.ambient_color, 1.0f);
+        vec4(light_color, 1.0) *
+        light_ambient_intensity *
+        vec4(material_ambient, 1.0f);
 
-    float diffuse_factor = dot(normalize(normals), -light.direction);
+    float diffuse_factor = dot(normalize(normals), -light_direction);
     vec4 diffuse_color = vec4(0.0, 0.0, 0.0, 0.0);
 
     if (diffuse_factor > 0) {
         diffuse_color =            
-            vec4(light.color, 1.0) *
-            light.diffuse_intensity *
-            vec4(material.diffuse_color, 1.0f);
+            vec4(light_color, 1.0) *
+            light_diffuse_intensity *
+            vec4(material_diffuse, 1.0f);
+    }
+
+    vec4 texture_color;
+    if (texture_layer < 0) {
+        texture_color = texture(texture_diff, texcoords);
+    } else {
+        texture_color = texture(texture_diff_array, vec3(texcoords, texture_layer));
     }
 
-    // fragColor = texture(texture_diff, texcoords) * vec4(light.color + material.diffuse_color, 1.0);
-    fragColor = texture(texture_diff, texcoords) * vec4(light.color + material.diffuse_color + 1.0, 1.0);
+    // fragColor = texture_color * vec4(light_color + material_diffuse, 1.0);
+    fragColor = texture_color * vec4(light_color + material_diffuse + 1.0, 1.0);
 }
@@ -1,20 +1,52 @@
 #version 460
 
 layout (location=0) in vec3 vertex_buffer;
-layout (location=1) in vec3 normal_buffer;
+layout (location=1) in vec2 normal_buffer;  // octahedral-encoded
 layout (location=2) in vec2 texcoord_buffer;
 
-uniform mat4 m_persp;
-uniform mat4 m_view;
-uniform mat4 m_model;
+layout (std140, binding=0) uniform FrameData {
+    mat4 m_persp;
+    mat4 m_view;
+    vec3 light_color;
+    float light_ambient_intensity;
+    vec3 light_direction;
+    float light_diffuse_intensity;
+};
+
+// Per instance, model matrix includes positions dequantization
+struct Instance {
+    mat4 m_model;
+    int texture_layer;
+    int material;
+    int _padding[2];
+};
+
+layout (std430, binding=1) readonly buffer Instances {
+    Instance instances[];
+};
 
 out vec3 normals;
 out vec2 texcoords;
+flat out int texture_layer;  // layer of texture_diff_array, -1 - not used
+flat out int material;  // index of materials table
+
+
+vec3 oct_decode(vec2 e) {
+    vec3 n = vec3(e.xy, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.xy += vec2(n.x >= 0.0 ? -t : t, n.y >= 0.0 ? -t : t);
+    return normalize(n);
+}
 
 
 void main() {
-    gl_Position = m_persp * m_view * m_model * vec4(vertex_buffer, 1.0);
+    Instance instance = instances[gl_BaseInstance + gl_InstanceID];
+
+    gl_Position =
+        m_persp * m_view * instance.m_model * vec4(vertex_buffer, 1.0);
 
-    normals = normal_buffer;
+    normals = oct_decode(normal_buffer);
     texcoords = texcoord_buffer;
+    texture_layer = instance.texture_layer;
+    material = instance.material;
 }
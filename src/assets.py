@@ -1,15 +1,40 @@
+import dataclasses
+import logging
+import multiprocessing
+import typing as t
+from collections import defaultdict
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from dataclasses import field
 
+from .config import config
 from .db import Database
+from .db import MaterialID
+from .db import ModelRecord
+from .db import TextureRecord
 from .db import db_get_models
 from .db import db_get_textures
 from .gfx import GfxInstance
+from .gfx import gfx_load_material
+from .material import MATERIALS
 from .mesh import Mesh
 from .mesh import MeshID
+from .mesh import mesh_cook_job
 from .mesh import mesh_load_from_record
 from .texture import Texture
 from .texture import TextureID
+from .texture import texture_cook_job
+from .texture import texture_create_arrays
 from .texture import texture_load_from_record
+from .texture_stream import TextureStreamer
+from .texture_stream import texture_stream_create
+
+logger = logging.getLogger(__name__)
+
+
+type AssetRecord = ModelRecord | TextureRecord
 
 
 @dataclass
@@ -17,25 +42,206 @@ class AssetStorage:
     meshes: dict[MeshID, Mesh]
     textures: dict[TextureID, Texture]
 
+    # Index of material in GPU table (see `gfx_load_material`)
+    materials: dict[MaterialID, int] = field(default_factory=dict)
+
+    # Streams mips of standalone textures, when enabled
+    streamer: TextureStreamer | None = None
+
+    # -- Dedup stats: records, which share GPU data of another record
+    shared_meshes: int = 0
+    shared_textures: int = 0
+    shared_bytes: int = 0
+
 
 def assets_load_from_db(db: Database, gfx: GfxInstance) -> AssetStorage:
-    model_records = db_get_models(db)
-    texture_records = db_get_textures(db)
-    meshes = {}
-    textures = {}
+    model_records = list(db_get_models(db))
+    texture_records = list(db_get_textures(db))
+    storage = AssetStorage(meshes={}, textures={})
 
-    for record in model_records:
-        mesh = mesh_load_from_record(record, gfx)
-        if mesh.id in meshes:
-            raise ValueError(f'Duplicated mesh ID: {mesh.id}')
+    for material_id, material in MATERIALS.items():
+        storage.materials[material_id] = gfx_load_material(gfx, material)
+
+    if config.TEXTURE_STREAMING:
+        storage.streamer = texture_stream_create(
+            config.STREAMING_BUDGET,
+            config.STREAMING_MIN_SIZE,
+            config.STREAMING_UPLOADS_PER_FRAME,
+        )
+
+    # Records with the same content are loaded once, the rest ones are
+    # aliases of loaded asset (share its GPU data). Content keys are
+    # returned by cook jobs, so records are grouped after all jobs are done
+    model_keys, texture_keys = _assets_cook_records(
+        model_records, texture_records
+    )
+    model_records, model_aliases = _assets_dedup_records(
+        model_records, model_keys
+    )
+    texture_records, texture_aliases = _assets_dedup_records(
+        texture_records, texture_keys
+    )
+
+    texture_slots = {}
+    if config.TEXTURE_ARRAYS:
+        texture_slots = texture_create_arrays(texture_records, gfx)
 
-        meshes[mesh.id] = mesh
+    # Cache entries are fresh, so only GPU uploads are left for current
+    # (OpenGL context) thread
+    for record in model_records:
+        _assets_add_mesh(storage, mesh_load_from_record(record, gfx))
 
     for record in texture_records:
-        texture = texture_load_from_record(record, gfx)
-        if texture.id in textures:
-            raise ValueError(f'Duplicated mesh ID: {mesh.id}')
+        texture = texture_load_from_record(
+            record, gfx, texture_slots.get(record.id), storage.streamer
+        )
+        _assets_add_texture(storage, texture)
+
+    _assets_add_aliases(storage, model_aliases, texture_aliases)
+
+    logger.info(
+        f'Assets dedup: {storage.shared_meshes} meshes and '
+        f'{storage.shared_textures} textures are shared, '
+        f'{storage.shared_bytes / (1 << 20):.1f} MiB saved'
+    )
+
+    if gfx.upload_ring is not None:
+        logger.info(
+            f'Textures uploaded: '
+            f'{gfx.upload_ring.uploaded_bytes / (1 << 20):.1f} MiB, '
+            f'{gfx.upload_ring.stalls} upload stalls'
+        )
+
+    if storage.streamer is not None:
+        logger.info(
+            f'Textures streamed: {len(storage.streamer.textures)}, '
+            f'{storage.streamer.resident_bytes / (1 << 20):.1f} MiB resident'
+        )
+
+    return storage
+
+
+def _assets_cook_records(
+    model_records: list[ModelRecord],
+    texture_records: list[TextureRecord],
+) -> tuple[list[bytes], list[bytes]]:
+    # -> (content keys of model records, of texture records)
+    #
+    # Every source (and format) is cooked by single job, even if it is
+    # referenced by several records. Jobs of the same source write the
+    # same cache entry, so they are run one by one by single worker
+    mesh_jobs = [(mesh_cook_job, record.path) for record in model_records]
+    texture_jobs = [
+        (texture_cook_job, record.path, record.format)
+        for record in texture_records
+    ]
+    groups = defaultdict(list)
+    for job in dict.fromkeys(mesh_jobs + texture_jobs):
+        groups[job[:2]].append(job)
+
+    if config.IMPORT_WORKERS > 0:
+        # Parsing and decoding are done by worker processes into cache,
+        # which then is mapped by main process (shared by OS page cache)
+        #
+        # `spawn` is used to not fork process with active OpenGL context
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(config.IMPORT_WORKERS, mp_context) as pool:
+            keys = _assets_run_jobs(pool, list(groups.values()))
+
+        logger.info(
+            f'Assets imported by {config.IMPORT_WORKERS} workers: '
+            f'{len(model_records)} meshes, {len(texture_records)} textures'
+        )
+
+    elif config.TEXTURE_DECODE_THREADS > 0:
+        # PIL and numpy release GIL for most of decoding and encoding
+        with ThreadPoolExecutor(config.TEXTURE_DECODE_THREADS) as pool:
+            keys = _assets_run_jobs(pool, list(groups.values()))
+
+    else:
+        keys = _assets_run_jobs(None, list(groups.values()))
+
+    return (
+        [keys[job] for job in mesh_jobs],
+        [keys[job] for job in texture_jobs],
+    )
+
+
+def _assets_run_jobs(
+    pool: Executor | None,
+    groups: list[list[tuple]],
+) -> dict[tuple, t.Any]:
+    # groups: [[(function, *args), ...], ...] -> {job: result}
+    # Groups are run serially without pool
+    if pool is None:
+        results = map(_assets_run_group, groups)
+    else:
+        futures = [pool.submit(_assets_run_group, group) for group in groups]
+        results = (future.result() for future in futures)
+
+    return {
+        job: result
+        for group, group_results in zip(groups, results)
+        for job, result in zip(group, group_results)
+    }
+
+
+def _assets_run_group(group: list[tuple]) -> list[t.Any]:
+    # Entry point for worker processes
+    return [job[0](*job[1:]) for job in group]
+
+
+def _assets_add_aliases(
+    self: AssetStorage,
+    model_aliases: list[tuple[ModelRecord, MeshID]],
+    texture_aliases: list[tuple[TextureRecord, TextureID]],
+) -> None:
+    for record, original_id in model_aliases:
+        mesh = self.meshes[original_id]
+        _assets_add_mesh(self, dataclasses.replace(
+            mesh, id=record.id, path=record.path
+        ))
+        self.shared_meshes += 1
+        self.shared_bytes += mesh.size
+
+    for record, original_id in texture_aliases:
+        texture = self.textures[original_id]
+        _assets_add_texture(self, dataclasses.replace(
+            texture, id=record.id, path=record.path
+        ))
+        self.shared_textures += 1
+        self.shared_bytes += texture.size
+
+
+def _assets_dedup_records(
+    records: list[AssetRecord],
+    keys: list[bytes],
+) -> tuple[list[AssetRecord], list[tuple[AssetRecord, str]]]:
+    # keys: content key of every record
+    # -> (records to load, [(duplicate record, ID of loaded one), ...])
+    unique = []
+    aliases = []
+    loaded_ids = {}
+
+    for record, key in zip(records, keys, strict=True):
+        if key in loaded_ids:
+            aliases.append((record, loaded_ids[key]))
+        else:
+            loaded_ids[key] = record.id
+            unique.append(record)
+
+    return unique, aliases
+
+
+def _assets_add_mesh(self: AssetStorage, mesh: Mesh) -> None:
+    if mesh.id in self.meshes:
+        raise ValueError(f'Duplicated mesh ID: {mesh.id}')
+
+    self.meshes[mesh.id] = mesh
+
 
-        textures[texture.id] = texture
+def _assets_add_texture(self: AssetStorage, texture: Texture) -> None:
+    if texture.id in self.textures:
+        raise ValueError(f'Duplicated texture ID: {texture.id}')
 
-    return AssetStorage(meshes=meshes, textures=textures)
+    self.textures[texture.id] = texture
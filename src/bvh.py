@@ -0,0 +1,566 @@
+"""bvh - Dynamic Bounding Volume Hierarchy
+
+Binary tree of AABBs for spatial queries over changing set of items
+(raycast, AABB overlap, k-nearest). Leaves have item boxes enlarged by
+margin ("fat" boxes), so small moves of item change nothing in tree;
+otherwise leaf is removed and inserted again. Sibling for inserted leaf
+is chosen by surface area cost and ancestors are refit and rebalanced
+by rotations on the way up, so tree stays shallow without rebuilds.
+
+Nodes are kept in list by index, freed indices are reused.
+"""
+import heapq
+import typing as t
+from dataclasses import dataclass
+from dataclasses import field
+from math import inf
+from math import sqrt
+
+import glm
+from glm import vec3
+
+NULL_NODE = -1
+
+# Enlargement of leaf boxes (world units)
+_FAT_MARGIN = 0.1
+
+
+@dataclass
+class BvhNode:
+    # Box of subtree, fat box of item for leaf
+    aabb_min: vec3
+    aabb_max: vec3
+
+    parent: int = NULL_NODE
+    # Children of internal node, `NULL_NODE` for leaf
+    left: int = NULL_NODE
+    right: int = NULL_NODE
+    # Leaf is 0
+    height: int = 0
+
+    # -- Leaf only: exact box of item and item itself
+    item_min: vec3 | None = None
+    item_max: vec3 | None = None
+    item: t.Any = None
+
+
+@dataclass
+class Bvh:
+    nodes: list[BvhNode | None] = field(default_factory=list)
+    free_nodes: list[int] = field(default_factory=list)
+    root: int = NULL_NODE
+
+    # -- Stats
+    reinserts: int = 0
+
+
+def bvh_create() -> Bvh:
+    return Bvh()
+
+
+def bvh_insert(
+    self: Bvh,
+    aabb_min: vec3,
+    aabb_max: vec3,
+    item: t.Any,
+) -> int:
+    # -> leaf index, which is used to move and remove item
+    margin = vec3(_FAT_MARGIN)
+    leaf = _bvh_alloc_node(self, BvhNode(
+        aabb_min=aabb_min - margin,
+        aabb_max=aabb_max + margin,
+        item_min=vec3(aabb_min),
+        item_max=vec3(aabb_max),
+        item=item,
+    ))
+    _bvh_insert_leaf(self, leaf)
+
+    return leaf
+
+
+def bvh_remove(self: Bvh, leaf: int) -> None:
+    _bvh_remove_leaf(self, leaf)
+    _bvh_free_node(self, leaf)
+
+
+def bvh_move(
+    self: Bvh,
+    leaf: int,
+    aabb_min: vec3,
+    aabb_max: vec3,
+) -> bool:
+    # -> whether leaf was reinserted (item left its fat box, or box is
+    # too loose after item shrunk)
+    node = self.nodes[leaf]
+    node.item_min = vec3(aabb_min)
+    node.item_max = vec3(aabb_max)
+
+    loose = vec3(4.0 * _FAT_MARGIN)
+    if (
+        _aabb_contains(node.aabb_min, node.aabb_max, aabb_min, aabb_max)
+        and _aabb_contains(
+            aabb_min - loose, aabb_max + loose, node.aabb_min, node.aabb_max
+        )
+    ):
+        return False
+
+    _bvh_remove_leaf(self, leaf)
+
+    margin = vec3(_FAT_MARGIN)
+    node.aabb_min = aabb_min - margin
+    node.aabb_max = aabb_max + margin
+    _bvh_insert_leaf(self, leaf)
+
+    self.reinserts += 1
+    return True
+
+
+def bvh_get_height(self: Bvh) -> int:
+    if self.root == NULL_NODE:
+        return 0
+
+    return self.nodes[self.root].height + 1
+
+
+# -- Queries
+
+
+def bvh_query_aabb(
+    self: Bvh,
+    aabb_min: vec3,
+    aabb_max: vec3,
+) -> list[t.Any]:
+    # -> items, whose boxes overlap with given box
+    items = []
+    stack = [self.root] if self.root != NULL_NODE else []
+
+    while stack:
+        node = self.nodes[stack.pop()]
+        if not _aabb_overlaps(
+            node.aabb_min, node.aabb_max, aabb_min, aabb_max
+        ):
+            continue
+
+        if node.left == NULL_NODE:
+            if _aabb_overlaps(
+                node.item_min, node.item_max, aabb_min, aabb_max
+            ):
+                items.append(node.item)
+        else:
+            stack.append(node.left)
+            stack.append(node.right)
+
+    return items
+
+
+def bvh_raycast(
+    self: Bvh,
+    origin: vec3,
+    direction: vec3,
+    max_distance: float = inf,
+    hit_test: t.Callable[[t.Any, vec3, vec3], float | None] | None = None,
+) -> tuple[t.Any, float] | None:
+    """-> the nearest hit item and its distance (in units of direction
+    length), `None` if nothing is hit
+
+    Item is hit by its box, unless `hit_test(item, origin, direction)` is
+    given: it is called for items, whose boxes are hit, and returns exact
+    distance or `None` (exact distance should not be less than box one)
+    """
+    inv_direction = _inverse_direction(direction)
+    best = None
+    best_distance = max_distance
+
+    stack = []
+    if self.root != NULL_NODE:
+        _bvh_push_hit_nodes(
+            self, stack, (self.root,), origin, inv_direction, best_distance
+        )
+
+    while stack:
+        entry, index = stack.pop()
+        # Closer hit is found since node was pushed
+        if entry >= best_distance:
+            continue
+
+        node = self.nodes[index]
+        if node.left != NULL_NODE:
+            _bvh_push_hit_nodes(
+                self, stack, (node.left, node.right),
+                origin, inv_direction, best_distance,
+            )
+            continue
+
+        if hit_test is None:
+            distance = _ray_aabb(
+                origin, inv_direction,
+                node.item_min, node.item_max, best_distance,
+            )
+        else:
+            distance = hit_test(node.item, origin, direction)
+
+        if distance is not None and distance < best_distance:
+            best, best_distance = node.item, distance
+
+    if best is None:
+        return None
+
+    return best, best_distance
+
+
+def bvh_query_nearest(
+    self: Bvh,
+    point: vec3,
+    k: int,
+    max_distance: float = inf,
+) -> list[tuple[t.Any, float]]:
+    """-> up to `k` items nearest to point with distances to their boxes
+    (0 for point inside), ordered from the nearest
+
+    Best-first search: distance to node box is lower bound of distances
+    to its items, so item popped with exact distance is the nearest left.
+    """
+    result = []
+    if self.root == NULL_NODE or k <= 0:
+        return result
+
+    # (distance, tie breaker, node, is exact item distance)
+    heap = [(0.0, 0, self.root, False)]
+    counter = 1
+
+    while heap and len(result) < k:
+        distance, _, index, is_exact = heapq.heappop(heap)
+        if distance > max_distance:
+            break
+
+        node = self.nodes[index]
+        if is_exact:
+            result.append((node.item, distance))
+            continue
+
+        if node.left == NULL_NODE:
+            children = [(index, node.item_min, node.item_max, True)]
+        else:
+            children = [
+                (child, self.nodes[child].aabb_min,
+                 self.nodes[child].aabb_max, False)
+                for child in (node.left, node.right)
+            ]
+
+        for child, aabb_min, aabb_max, is_item in children:
+            heapq.heappush(heap, (
+                _point_aabb_distance(point, aabb_min, aabb_max),
+                counter, child, is_item,
+            ))
+            counter += 1
+
+    return result
+
+
+def bvh_ray_aabb(
+    origin: vec3,
+    direction: vec3,
+    aabb_min: vec3,
+    aabb_max: vec3,
+    max_distance: float = inf,
+) -> float | None:
+    # -> distance of ray entry into box (0 for origin inside), useful for
+    # `hit_test` of `bvh_raycast`
+    return _ray_aabb(
+        origin, _inverse_direction(direction), aabb_min, aabb_max, max_distance
+    )
+
+
+# -- Tree maintenance
+
+
+def _bvh_push_hit_nodes(
+    self: Bvh,
+    stack: list[tuple[float, int]],
+    indices: tuple[int, ...],
+    origin: vec3,
+    inv_direction: vec3,
+    max_distance: float,
+) -> None:
+    # Nodes, which boxes are hit by ray, are pushed with entry distance.
+    # Nearer node is popped first, so farther one is often pruned
+    hits = []
+    for index in indices:
+        node = self.nodes[index]
+        entry = _ray_aabb(
+            origin, inv_direction, node.aabb_min, node.aabb_max, max_distance
+        )
+        if entry is not None:
+            hits.append((entry, index))
+
+    hits.sort(reverse=True)
+    stack.extend(hits)
+
+
+def _bvh_alloc_node(self: Bvh, node: BvhNode) -> int:
+    if self.free_nodes:
+        index = self.free_nodes.pop()
+        self.nodes[index] = node
+    else:
+        index = len(self.nodes)
+        self.nodes.append(node)
+
+    return index
+
+
+def _bvh_free_node(self: Bvh, index: int) -> None:
+    self.nodes[index] = None
+    self.free_nodes.append(index)
+
+
+def _bvh_insert_leaf(self: Bvh, leaf: int) -> None:
+    nodes = self.nodes
+    leaf_node = nodes[leaf]
+    leaf_node.parent = NULL_NODE
+
+    if self.root == NULL_NODE:
+        self.root = leaf
+        return
+
+    # -- Sibling by surface area heuristic: descend while pushing leaf
+    # down is cheaper than pairing it with current node
+    leaf_min, leaf_max = leaf_node.aabb_min, leaf_node.aabb_max
+    index = self.root
+
+    while nodes[index].left != NULL_NODE:
+        node = nodes[index]
+        area = _aabb_area(node.aabb_min, node.aabb_max)
+        combined_area = _aabb_area(
+            glm.min(node.aabb_min, leaf_min), glm.max(node.aabb_max, leaf_max)
+        )
+
+        # Cost of new parent of this node and leaf, and cost of enlarging
+        # this node, which is paid by pushing leaf into any child
+        cost = 2.0 * combined_area
+        inheritance_cost = 2.0 * (combined_area - area)
+
+        child_costs = []
+        for child in (node.left, node.right):
+            child_node = nodes[child]
+            child_area = _aabb_area(
+                glm.min(child_node.aabb_min, leaf_min),
+                glm.max(child_node.aabb_max, leaf_max),
+            )
+            if child_node.left != NULL_NODE:
+                child_area -= _aabb_area(
+                    child_node.aabb_min, child_node.aabb_max
+                )
+            child_costs.append(child_area + inheritance_cost)
+
+        left_cost, right_cost = child_costs
+        if cost < left_cost and cost < right_cost:
+            break
+
+        index = node.left if left_cost < right_cost else node.right
+
+    # -- New parent of sibling and leaf
+    sibling = index
+    sibling_node = nodes[sibling]
+    old_parent = sibling_node.parent
+
+    new_parent = _bvh_alloc_node(self, BvhNode(
+        aabb_min=glm.min(sibling_node.aabb_min, leaf_min),
+        aabb_max=glm.max(sibling_node.aabb_max, leaf_max),
+        parent=old_parent,
+        left=sibling,
+        right=leaf,
+        height=sibling_node.height + 1,
+    ))
+    sibling_node.parent = new_parent
+    leaf_node.parent = new_parent
+
+    if old_parent == NULL_NODE:
+        self.root = new_parent
+    else:
+        _bvh_replace_child(self, old_parent, sibling, new_parent)
+
+    _bvh_refit(self, new_parent)
+
+
+def _bvh_remove_leaf(self: Bvh, leaf: int) -> None:
+    nodes = self.nodes
+
+    if leaf == self.root:
+        self.root = NULL_NODE
+        return
+
+    parent = nodes[leaf].parent
+    parent_node = nodes[parent]
+    grand_parent = parent_node.parent
+    sibling = (
+        parent_node.right if parent_node.left == leaf else parent_node.left
+    )
+
+    # Parent is replaced by sibling
+    nodes[sibling].parent = grand_parent
+    _bvh_free_node(self, parent)
+
+    if grand_parent == NULL_NODE:
+        self.root = sibling
+    else:
+        _bvh_replace_child(self, grand_parent, parent, sibling)
+        _bvh_refit(self, grand_parent)
+
+
+def _bvh_replace_child(self: Bvh, parent: int, old: int, new: int) -> None:
+    node = self.nodes[parent]
+    if node.left == old:
+        node.left = new
+    else:
+        node.right = new
+
+
+def _bvh_refit(self: Bvh, index: int) -> None:
+    # Boxes and heights from node up to root, rebalancing on the way
+    nodes = self.nodes
+
+    while index != NULL_NODE:
+        index = _bvh_balance(self, index)
+
+        node = nodes[index]
+        left, right = nodes[node.left], nodes[node.right]
+        node.aabb_min = glm.min(left.aabb_min, right.aabb_min)
+        node.aabb_max = glm.max(left.aabb_max, right.aabb_max)
+        node.height = 1 + max(left.height, right.height)
+
+        index = node.parent
+
+
+def _bvh_balance(self: Bvh, a: int) -> int:
+    """Rotate higher child of `a` up, if children heights differ by more
+    than one: `a` takes the lower grandchild of rotated child
+
+    -> index of node, which is at place of `a` now
+    """
+    nodes = self.nodes
+    node_a = nodes[a]
+    if node_a.left == NULL_NODE or node_a.height < 2:
+        return a
+
+    b, c = node_a.left, node_a.right
+    balance = nodes[c].height - nodes[b].height
+
+    if balance > 1:
+        up, other, side = c, b, 'right'
+    elif balance < -1:
+        up, other, side = b, c, 'left'
+    else:
+        return a
+
+    node_up = nodes[up]
+    f, g = node_up.left, node_up.right
+
+    # `up` takes place of `a`, `a` becomes its left child
+    node_up.left = a
+    node_up.parent = node_a.parent
+    node_a.parent = up
+
+    if node_up.parent == NULL_NODE:
+        self.root = up
+    else:
+        _bvh_replace_child(self, node_up.parent, a, up)
+
+    # Higher grandchild stays with `up`, lower one moves to `a`
+    if nodes[f].height > nodes[g].height:
+        keep, move = f, g
+    else:
+        keep, move = g, f
+
+    node_up.right = keep
+    setattr(node_a, side, move)
+    nodes[move].parent = a
+
+    node_other, node_move = nodes[other], nodes[move]
+    node_a.aabb_min = glm.min(node_other.aabb_min, node_move.aabb_min)
+    node_a.aabb_max = glm.max(node_other.aabb_max, node_move.aabb_max)
+    node_a.height = 1 + max(node_other.height, node_move.height)
+
+    node_keep = nodes[keep]
+    node_up.aabb_min = glm.min(node_a.aabb_min, node_keep.aabb_min)
+    node_up.aabb_max = glm.max(node_a.aabb_max, node_keep.aabb_max)
+    node_up.height = 1 + max(node_a.height, node_keep.height)
+
+    return up
+
+
+# -- Box math
+
+
+def _aabb_area(aabb_min: vec3, aabb_max: vec3) -> float:
+    x, y, z = aabb_max - aabb_min
+    return x * y + y * z + z * x
+
+
+def _aabb_contains(
+    outer_min: vec3,
+    outer_max: vec3,
+    inner_min: vec3,
+    inner_max: vec3,
+) -> bool:
+    return (
+        glm.all(glm.lessThanEqual(outer_min, inner_min))
+        and glm.all(glm.lessThanEqual(inner_max, outer_max))
+    )
+
+
+def _aabb_overlaps(
+    a_min: vec3,
+    a_max: vec3,
+    b_min: vec3,
+    b_max: vec3,
+) -> bool:
+    return (
+        glm.all(glm.lessThanEqual(a_min, b_max))
+        and glm.all(glm.lessThanEqual(b_min, a_max))
+    )
+
+
+def _inverse_direction(direction: vec3) -> tuple[float, float, float]:
+    # Infinity marks axis, which ray is parallel to
+    return tuple(1.0 / d if d != 0.0 else inf for d in direction)
+
+
+def _ray_aabb(
+    origin: vec3,
+    inv_direction: tuple[float, float, float],
+    aabb_min: vec3,
+    aabb_max: vec3,
+    max_distance: float,
+) -> float | None:
+    # Slab test
+    t_near, t_far = 0.0, max_distance
+
+    for axis in range(3):
+        o, inv = origin[axis], inv_direction[axis]
+
+        # Ray is parallel to slab
+        if inv == inf:
+            if o < aabb_min[axis] or o > aabb_max[axis]:
+                return None
+            continue
+
+        t0 = (aabb_min[axis] - o) * inv
+        t1 = (aabb_max[axis] - o) * inv
+        if t0 > t1:
+            t0, t1 = t1, t0
+
+        t_near = max(t_near, t0)
+        t_far = min(t_far, t1)
+        if t_near > t_far:
+            return None
+
+    return t_near
+
+
+def _point_aabb_distance(
+    point: vec3,
+    aabb_min: vec3,
+    aabb_max: vec3,
+) -> float:
+    offset = glm.max(glm.max(aabb_min - point, point - aabb_max), vec3(0.0))
+    return sqrt(glm.dot(offset, offset))
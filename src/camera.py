@@ -4,8 +4,10 @@ from dataclasses import dataclass
 from math import cos
 from math import pi
 from math import sin
+from math import tan
 
 import glm
+import numpy as np
 from glm import mat4
 from glm import radians
 from glm import vec2
@@ -13,7 +15,6 @@ from glm import vec3
 
 from .config import config
 
-
 # TODO: Refactor data model
 
 CAMERA_FOV = 60.0
@@ -40,6 +41,14 @@ class MovementController(t.NamedTuple):
     d: bool
 
 
+class CullView(t.NamedTuple):
+    # View of culling pass, see `camera_calc_cull_view`
+    planes: np.ndarray  # (6, 4) see `camera_calc_frustum_planes`
+    camera_position: vec3
+    tan_half_fov: float
+    screen_height: int
+
+
 mode = CameraMode.person
 
 v_cam_pos = vec3(0.0, 1.7, 2.0)
@@ -49,6 +58,9 @@ v_cam_up = vec3(0.0, 1.0, 0.0)
 yaw = -90.0
 pitch = 0.0
 
+# Updated on window resize only, see `camera_update_perspective`
+m_persp = mat4(1.0)
+
 # --
 # TODO:
 #   Camera should be configurable (no use global in `calc_view_matrix`)
@@ -60,10 +72,103 @@ def camera_calc_perspective_matrix() -> mat4:
     return glm.perspective(radians(CAMERA_FOV), WINDOW_ASPECT, 0.01, 100.0)
 
 
+def camera_update_perspective() -> mat4:
+    global m_persp
+
+    m_persp = camera_calc_perspective_matrix()
+    return m_persp
+
+
+def camera_get_perspective_matrix() -> mat4:
+    return m_persp
+
+
+def camera_get_position() -> vec3:
+    return vec3(v_cam_pos)
+
+
 def camera_calc_view_matrix() -> mat4:
     return glm.lookAt(v_cam_pos, v_cam_pos + v_cam_front, v_cam_up)
 
 
+def camera_calc_ray(x: float, y: float) -> tuple[vec3, vec3]:
+    """-> ray (origin on near plane, unit direction) through screen point,
+    `x` and `y` are relative to screen size, origin is top left corner
+    """
+    m_inv = glm.inverse(m_persp * camera_calc_view_matrix())
+    ndc_x, ndc_y = 2.0 * x - 1.0, 1.0 - 2.0 * y
+
+    near = m_inv * glm.vec4(ndc_x, ndc_y, -1.0, 1.0)
+    far = m_inv * glm.vec4(ndc_x, ndc_y, 1.0, 1.0)
+    near, far = vec3(near) / near.w, vec3(far) / far.w
+
+    return near, glm.normalize(far - near)
+
+
+def camera_calc_projected_size(center: vec3, radius: float) -> float:
+    # Bounding sphere size on screen: radius relative to half screen height
+    distance = glm.distance(v_cam_pos, center)
+    if distance <= radius:
+        return float('inf')
+
+    return radius / (distance * tan(radians(CAMERA_FOV) / 2))
+
+
+def camera_calc_distances(points: np.ndarray) -> np.ndarray:
+    # (3, n) -> (n,) distances from camera
+    offsets = points - np.array(v_cam_pos, dtype=np.float32)[:, None]
+    return np.sqrt(np.einsum('ij,ij->j', offsets, offsets))
+
+
+def camera_calc_projected_sizes(
+    distances: np.ndarray,
+    radii: np.ndarray,
+) -> np.ndarray:
+    # Vectorized `camera_calc_projected_size`
+    sizes = radii / (
+        np.maximum(distances, 1e-6) * tan(radians(CAMERA_FOV) / 2)
+    )
+    return np.where(distances <= radii, np.inf, sizes)
+
+
+def camera_calc_frustum_planes(m_view_persp: mat4) -> np.ndarray:
+    """(6, 4) planes of view frustum in world space: (normal, d), normal
+    is unit and points inside, so point is inside if `dot(n, p) + d >= 0`
+    """
+    # glm matrix bytes are column-major
+    m = np.frombuffer(m_view_persp.to_bytes(), dtype=np.float32)
+    m = m.reshape(4, 4).T
+
+    # Clip space is -w <= x, y, z <= w
+    planes = np.array([
+        m[3] + m[0], m[3] - m[0],  # left, right
+        m[3] + m[1], m[3] - m[1],  # bottom, top
+        m[3] + m[2], m[3] - m[2],  # near, far
+    ])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def camera_calc_view_position(m_view_persp: mat4) -> np.ndarray:
+    # -> camera position in world space: it is projected to clip space
+    # point at infinity (0, 0, z, 0)
+    m = np.frombuffer(m_view_persp.to_bytes(), dtype=np.float32)
+    m = m.reshape(4, 4).T.astype(np.float64)
+
+    position = np.linalg.solve(m, (0.0, 0.0, 1.0, 0.0))
+    return position[:3] / position[3]
+
+
+def camera_calc_cull_view(m_view_persp: mat4) -> CullView:
+    # Camera of GPU culling, matches `camera_calc_frustum_planes` and
+    # `camera_calc_projected_sizes`
+    return CullView(
+        planes=camera_calc_frustum_planes(m_view_persp).astype(np.float32),
+        camera_position=vec3(v_cam_pos),
+        tan_half_fov=tan(radians(CAMERA_FOV) / 2),
+        screen_height=config.WINDOW_HEIGHT,
+    )
+
+
 to_radian = lambda angle: angle / 180 * pi
 
 
@@ -18,8 +18,44 @@ class Config:
 
     ASSETS_DIR: str
     SHADERS_DIR: str
+    CACHE_DIR: str
+
+    IMPORT_WORKERS: int
+    VERTEX_FORMAT: str
+    MESH_OPTIMIZE: bool
+    MESH_OPTIMIZE_OVERDRAW: bool
+    VERTEX_CACHE_SIZE: int
+    TEXTURE_DECODE_THREADS: int
+    TEXTURE_UPLOAD_SLOTS: int
+    TEXTURE_UPLOAD_SLOT_SIZE: int
+    TEXTURE_ARRAYS: bool
+    TEXTURE_ARRAY_LAYERS: int
+    TEXTURE_COMPRESSION: str
+    TEXTURE_COMPRESSION_QUALITY: int
+
+    TEXTURE_STREAMING: bool
+    STREAMING_BUDGET: int  # bytes
+    STREAMING_MIN_SIZE: int
+    STREAMING_UPLOADS_PER_FRAME: int
+
+    GEOMETRY_VERTEX_CHUNK: int  # bytes
+    GEOMETRY_INDEX_CHUNK: int  # bytes
+    DRAW_RING_SLOTS: int
+    DRAW_RING_SLOT_SIZE: int
+    FRUSTUM_CULLING: bool
+    OCCLUSION_CULLING: bool
+    OCCLUSION_READBACK_WIDTH: int
+    OCCLUSION_MAX_LATENCY: int
+    OCCLUSION_MAX_MOVE: float
+    GPU_CULLING: bool
+    PORTAL_CULLING: bool
+
+    LOD_LEVELS: int
+    LOD_RATIO: float
+    LOD_THRESHOLDS: list[float]
 
     ROOT_SCENE: str
+    STATIC_CHUNK_SIZE: float
 
 
 def config_init() -> None:
@@ -29,6 +65,10 @@ def config_init() -> None:
     win_conf = conf['window']
     win_color = getattr(color, win_conf['color'], color.DARK2)
     paths_conf = conf['paths']
+    assets_conf = conf['assets']
+    streaming_conf = conf['streaming']
+    render_conf = conf['render']
+    lod_conf = conf['lod']
 
     return Config(
         WINDOW_WIDTH=win_conf['width'],
@@ -41,8 +81,44 @@ def config_init() -> None:
         #
         SHADERS_DIR=paths_conf['shaders_dir'],
         ASSETS_DIR=paths_conf['assets_dir'],
+        CACHE_DIR=paths_conf['cache_dir'],
+        #
+        IMPORT_WORKERS=assets_conf['import_workers'],
+        VERTEX_FORMAT=assets_conf['vertex_format'],
+        MESH_OPTIMIZE=assets_conf['mesh_optimize'],
+        MESH_OPTIMIZE_OVERDRAW=assets_conf['mesh_optimize_overdraw'],
+        VERTEX_CACHE_SIZE=assets_conf['vertex_cache_size'],
+        TEXTURE_DECODE_THREADS=assets_conf['texture_decode_threads'],
+        TEXTURE_UPLOAD_SLOTS=assets_conf['texture_upload_slots'],
+        TEXTURE_UPLOAD_SLOT_SIZE=assets_conf['texture_upload_slot_size'],
+        TEXTURE_ARRAYS=assets_conf['texture_arrays'],
+        TEXTURE_ARRAY_LAYERS=assets_conf['texture_array_layers'],
+        TEXTURE_COMPRESSION=assets_conf['texture_compression'],
+        TEXTURE_COMPRESSION_QUALITY=assets_conf['texture_compression_quality'],
+        #
+        TEXTURE_STREAMING=streaming_conf['enabled'],
+        STREAMING_BUDGET=streaming_conf['budget_mb'] << 20,
+        STREAMING_MIN_SIZE=streaming_conf['min_size'],
+        STREAMING_UPLOADS_PER_FRAME=streaming_conf['uploads_per_frame'],
+        #
+        GEOMETRY_VERTEX_CHUNK=render_conf['geometry_vertex_chunk_mb'] << 20,
+        GEOMETRY_INDEX_CHUNK=render_conf['geometry_index_chunk_mb'] << 20,
+        DRAW_RING_SLOTS=render_conf['draw_ring_slots'],
+        DRAW_RING_SLOT_SIZE=render_conf['draw_ring_slot_size'],
+        FRUSTUM_CULLING=render_conf['frustum_culling'],
+        OCCLUSION_CULLING=render_conf['occlusion_culling'],
+        OCCLUSION_READBACK_WIDTH=render_conf['occlusion_readback_width'],
+        OCCLUSION_MAX_LATENCY=render_conf['occlusion_max_latency'],
+        OCCLUSION_MAX_MOVE=render_conf['occlusion_max_move'],
+        GPU_CULLING=render_conf['gpu_culling'],
+        PORTAL_CULLING=render_conf['portal_culling'],
+        #
+        LOD_LEVELS=lod_conf['levels'],
+        LOD_RATIO=lod_conf['ratio'],
+        LOD_THRESHOLDS=lod_conf['thresholds'],
         #
         ROOT_SCENE=conf['world']['root_scene'],
+        STATIC_CHUNK_SIZE=conf['world']['static_chunk_size'],
     )
 
 
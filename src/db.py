@@ -10,6 +10,7 @@ class Database:
 
 type ModelID = str
 type TextureID = str
+type MaterialID = str
 
 
 @dataclass
@@ -22,6 +23,8 @@ class ModelRecord:
 class TextureRecord:
     id: TextureID
     path: str
+    # GPU format (see `texture_resolve_format`), NULL - default one
+    format: str | None = None
 
 
 @dataclass
@@ -30,6 +33,8 @@ class ObjectRecord:
     name: str
     model: ModelID
     texture: TextureID
+    # Preset of `material.MATERIALS`, NULL - default one
+    material: MaterialID | None = None
 
 
 MODELS_T = 'models'
@@ -43,7 +48,8 @@ MODELS_DECL = f'''{MODELS_T}(
 
 TEXTURES_DECL = f'''{TEXTURES_T}(
     id TEXT PRIMARY KEY,
-    path TEXT NOT NULL
+    path TEXT NOT NULL,
+    format TEXT
 )'''
 
 OBJECTS_DECL = f'''{OBJECTS_T}(
@@ -51,6 +57,7 @@ OBJECTS_DECL = f'''{OBJECTS_T}(
     name TEXT NOT NULL,
     model TEXT NOT NULL,
     texture TEXT NOT NULL,
+    material TEXT,
 
     FOREIGN KEY (model) REFERENCES {MODELS_T} (id),
     FOREIGN KEY (texture) REFERENCES {TEXTURES_T} (id)
@@ -60,7 +67,30 @@ OBJECTS_DECL = f'''{OBJECTS_T}(
 
 def db_create() -> Database:
     conn = sqlite3.connect("gamedata.sqlite")
-    return Database(conn)
+    db = Database(conn)
+
+    db_migrate(db)
+    return db
+
+
+def db_migrate(self: Database) -> None:
+    # Columns added to existing tables
+    cur = self.conn.cursor()
+    columns = {
+        row[1] for row in cur.execute(f'PRAGMA table_info({TEXTURES_T});')
+    }
+
+    if columns and 'format' not in columns:
+        cur.execute(f'ALTER TABLE {TEXTURES_T} ADD COLUMN format TEXT;')
+        self.conn.commit()
+
+    columns = {
+        row[1] for row in cur.execute(f'PRAGMA table_info({OBJECTS_T});')
+    }
+
+    if columns and 'material' not in columns:
+        cur.execute(f'ALTER TABLE {OBJECTS_T} ADD COLUMN material TEXT;')
+        self.conn.commit()
 
 
 def db_create_tables(self: Database) -> None:
@@ -95,7 +125,7 @@ def db_get_models(self: Database) -> t.Iterator[ModelRecord]:
 def db_get_textures(self: Database) -> t.Iterator[TextureRecord]:
     cur = self.conn.cursor()
     query = cur.execute(
-        f'SELECT id, path FROM {TEXTURES_T};'
+        f'SELECT id, path, format FROM {TEXTURES_T};'
     )
     return (TextureRecord(*row) for row in query.fetchall())
 
@@ -103,6 +133,6 @@ def db_get_textures(self: Database) -> t.Iterator[TextureRecord]:
 def db_get_objects(self: Database) -> t.Iterator[ObjectRecord]:
     cur = self.conn.cursor()
     query = cur.execute(
-        f'SELECT id, name, model, texture FROM {OBJECTS_T};'
+        f'SELECT id, name, model, texture, material FROM {OBJECTS_T};'
     )
     return (ObjectRecord(*row) for row in query.fetchall())
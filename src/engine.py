@@ -5,15 +5,21 @@ from .assets import AssetStorage
 from .assets import assets_load_from_db
 from .camera import MovementController
 from .camera import camera_control
+from .camera import camera_update_perspective
 from .clock import Clock
 from .clock import clock_create
 from .clock import clock_update
+from .config import config
 from .db import Database
 from .db import db_create
 from .gfx import GfxInstance
 from .gfx import gfx_create
 from .gfx import gfx_log_info
+from .gfx import gfx_reset_state
+from .gfx import gfx_resize
+from .gfx import gfx_set_perspective
 from .gfx import gfx_should_stop
+from .gfx import gfx_shutdown
 from .gfx import gfx_stop
 from .gui import *
 from .input_ import *
@@ -21,6 +27,8 @@ from .logging_ex import logging_init
 from .scene import Scene
 from .scene import scene_draw
 from .scene import scene_load_from_config
+from .texture_stream import texture_stream_close
+from .texture_stream import texture_stream_update
 from .window import WCallbackType
 from .window import on_char_wrapper
 from .window import on_keyboard_wrapper
@@ -59,6 +67,7 @@ def engine_create() -> Engine:
 
     window = window_create()
     gfx = gfx_create()
+    gfx_set_perspective(gfx, camera_update_perspective())
     clock = clock_create()
 
     window_set_callback(window, WCallbackType.keyboard, on_keyboard)
@@ -72,7 +81,7 @@ def engine_create() -> Engine:
     db = db_create()
     assets = assets_load_from_db(db, gfx)
     world = world_load_from_db(db, assets)
-    scene = scene_load_from_config(world)
+    scene = scene_load_from_config(world, gfx)
 
     gfx_log_info()
 
@@ -108,11 +117,18 @@ def engine_run_draw_loop(self: Engine, on_draw: t.Callable) -> None:
         engine_handle_controllers(self)
         scene_draw(self.scene, self.gfx)
 
+        # Mip requests were made by scene objects while drawing
+        if self.assets.streamer is not None:
+            texture_stream_update(self.assets.streamer, self.gfx)
+
         if window_is_cursor_visible(self.window):
             gui_process_input()
 
         if self.is_editor_visible:
-            gui_on_draw(self.clock, self.scene)
+            gui_on_draw(self.clock, self.scene, self.gfx)
+
+            # GUI renderer changes GL state behind gfx
+            gfx_reset_state(self.gfx)
 
         window_swap_buffers(self.window)
 
@@ -132,6 +148,11 @@ def engine_handle_controllers(self: Engine) -> None:
 
 def engine_close(self: Engine):
     logger.info('See you')
+
+    if self.assets.streamer is not None:
+        texture_stream_close(self.assets.streamer)
+
+    gfx_shutdown(self.gfx)
     window_close(self.window)
 
 
@@ -156,9 +177,16 @@ def on_keyboard(window, key, scancode, action, mods) -> None:
 
 @on_window_resize_wrapper
 def on_window_resize(window, width, height) -> None:
-    # TODO: Recalc perspective matrix and other stuff
     gui_on_window_resize(window, width, height)
 
+    # Minimized window
+    if not width or not height:
+        return
+
+    config.WINDOW_WIDTH, config.WINDOW_HEIGHT = width, height
+    gfx_resize(e.gfx, width, height)
+    gfx_set_perspective(e.gfx, camera_update_perspective())
+
 
 @on_scroll_wrapper
 def on_scroll(window, x_offset, y_offset) -> None:
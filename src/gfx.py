@@ -3,22 +3,92 @@
 OpenGL backend for 3D graphics processing
 """
 import enum
+import itertools
 import logging
+import typing as t
 from ctypes import c_void_p
 from dataclasses import dataclass
+from dataclasses import field
 
-import glm
+import numpy as np
 from glm import mat4
 from glm import vec3
 from OpenGL import GL as g
-from PIL import Image
-
+from OpenGL.GL.EXT.texture_compression_s3tc import (
+    GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+)
+from OpenGL.GL.EXT.texture_compression_s3tc import (
+    GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+)
+
+from .camera import CullView
 from .config import config
-from .gfx_uniform import UniformPtr
-from .gfx_uniform import UniformType
-from .gfx_uniform import uniform_create
-from .gfx_uniform import uniform_set
+from .gfx_arena import ArenaBlock
+from .gfx_arena import GeometryArena
+from .gfx_arena import arena_alloc
+from .gfx_arena import arena_create
+from .gfx_arena import arena_destroy
+from .gfx_arena import arena_free
+from .gfx_cull import CullItems
+from .gfx_cull import GpuCuller
+from .gfx_cull import gpu_cull_create
+from .gfx_cull import gpu_cull_destroy
+from .gfx_cull import gpu_cull_dispatch
+from .gfx_cull import gpu_cull_poll
+from .gfx_cull import gpu_cull_set_commands
+from .gfx_cull import gpu_cull_write_items
+from .gfx_hiz import DepthPyramid
+from .gfx_hiz import HiZBuffer
+from .gfx_hiz import hiz_capture
+from .gfx_hiz import hiz_create
+from .gfx_hiz import hiz_destroy
+from .gfx_hiz import hiz_poll
+from .gfx_hiz import hiz_resize
+from .gfx_indirect import DRAW_COMMAND_DTYPE
+from .gfx_indirect import INSTANCE_DTYPE
+from .gfx_indirect import DrawRing
+from .gfx_indirect import draw_ring_begin_frame
+from .gfx_indirect import draw_ring_create
+from .gfx_indirect import draw_ring_destroy
+from .gfx_indirect import draw_ring_end_frame
+from .gfx_indirect import draw_ring_grow
+from .gfx_indirect import draw_ring_write
+from .gfx_material import MATERIAL_DTYPE
+from .gfx_material import MATERIALS_BINDING
+from .gfx_material import MaterialTable
+from .gfx_material import material_table_add
+from .gfx_material import material_table_create
+from .gfx_material import material_table_destroy
+from .gfx_material import material_table_upload
+from .gfx_state import GlState
+from .gfx_state import state_active_texture
+from .gfx_state import state_begin_frame
+from .gfx_state import state_bind_buffer
+from .gfx_state import state_bind_buffer_range
+from .gfx_state import state_bind_texture
+from .gfx_state import state_bind_vertex_array
+from .gfx_state import state_clear_color
+from .gfx_state import state_create
+from .gfx_state import state_element_buffer
+from .gfx_state import state_forget_buffer
+from .gfx_state import state_forget_texture
+from .gfx_state import state_front_face
+from .gfx_state import state_invalidate
+from .gfx_state import state_set_enabled
+from .gfx_state import state_use_program
+from .gfx_state import state_vertex_buffer
+from .gfx_ubo import FrameBlock
+from .gfx_ubo import frame_block_create
+from .gfx_ubo import frame_block_destroy
+from .gfx_ubo import frame_block_set
+from .gfx_ubo import frame_block_upload
+from .gfx_upload import UploadRing
+from .gfx_upload import upload_ring_create
+from .gfx_upload import upload_ring_destroy
+from .gfx_upload import upload_ring_write_compressed
+from .gfx_upload import upload_ring_write_texture
 from .iofs import iofs_read_shader_file
+from .material import Material
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +96,7 @@ logger = logging.getLogger(__name__)
 _SHADER_EXTENSIONS = {
     'vert': g.GL_VERTEX_SHADER,
     'frag': g.GL_FRAGMENT_SHADER,
+    'comp': g.GL_COMPUTE_SHADER,
 }
 
 class ShaderPath:
@@ -33,6 +104,8 @@ class ShaderPath:
     OBJECT_FRAG = 'object.frag'
     META_GEOMETRY_VERT = 'meta_geometry.vert'
     META_GEOMETRY_FRAG = 'meta_geometry.frag'
+    HIZ_COMP = 'hiz.comp'
+    CULL_COMP = 'cull.comp'
 
 
 class DrawMode(enum.StrEnum):
@@ -41,40 +114,191 @@ class DrawMode(enum.StrEnum):
     triangles = enum.auto()
 
 
+class VertexFormat(enum.StrEnum):
+    # Interleaved vertex formats:
+    #   packed    - f32 position, octahedral snorm16 normal, f16 texcoord
+    #   quantized - unorm16 position (in mesh AABB), the rest is the same
+    packed = enum.auto()
+    quantized = enum.auto()
+
+
+VERTEX_DTYPES = {
+    VertexFormat.packed: np.dtype([
+        ('position', '<f4', 3),
+        ('normal', '<i2', 2),
+        ('texcoord', '<f2', 2),
+    ]),
+    VertexFormat.quantized: np.dtype([
+        ('position', '<u2', 4),  # w is padding
+        ('normal', '<i2', 2),
+        ('texcoord', '<f2', 2),
+    ]),
+}
+
+# attribute -> (location, size, type, normalized)
+_VERTEX_ATTRIBUTES = {
+    VertexFormat.packed: {
+        'position': (0, 3, g.GL_FLOAT, False),
+        'normal': (1, 2, g.GL_SHORT, True),
+        'texcoord': (2, 2, g.GL_HALF_FLOAT, False),
+    },
+    VertexFormat.quantized: {
+        'position': (0, 3, g.GL_UNSIGNED_SHORT, True),
+        'normal': (1, 2, g.GL_SHORT, True),
+        'texcoord': (2, 2, g.GL_HALF_FLOAT, False),
+    },
+}
+
+_INSTANCES_BINDING = 1
+
+# vertex array binding of vertex buffer
+_VERTEX_BINDING = 0
+
+# Instance data follows draw commands in frame slot of draw ring
+_INSTANCES_ALIGN = 256
+
+
+class TextureFormat(enum.StrEnum):
+    # GPU texture formats:
+    #   uncompressed - 8 bits per channel (R, RGB, RGBA by image)
+    #   bc1 - RGB, 4 bits per texel
+    #   bc3 - RGBA, 8 bits per texel
+    #   bc5 - RG (e.g. normal maps), 8 bits per texel
+    uncompressed = enum.auto()
+    bc1 = enum.auto()
+    bc3 = enum.auto()
+    bc5 = enum.auto()
+
+
+# components -> (pixels format, internal format)
+_TEXTURE_FORMATS = {
+    1: (g.GL_RED, g.GL_R8),
+    3: (g.GL_RGB, g.GL_RGB8),
+    4: (g.GL_RGBA, g.GL_RGBA8),
+}
+
+_COMPRESSED_TEXTURE_FORMATS = {
+    TextureFormat.bc1: GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+    TextureFormat.bc3: GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+    TextureFormat.bc5: g.GL_COMPRESSED_RG_RGTC2,
+}
+
+# texture units: standalone textures and texture array pages
+_TEXTURE_UNIT_2D = 0
+_TEXTURE_UNIT_ARRAY = 1
+# Textures are bound for uploads to unit, which is not used by draws
+_TEXTURE_UNIT_UPLOAD = 2
+
+_INDEX_TYPES = {
+    np.dtype(np.uint16): g.GL_UNSIGNED_SHORT,
+    np.dtype(np.uint32): g.GL_UNSIGNED_INT,
+}
+
+
+@dataclass
+class MeshLod:
+    # Relative to mesh blocks of geometry arena
+    first_index: int
+    indices_count: int
+    base_vertex: int
+
+
 @dataclass
 class MeshGfxData:
-    vao: int
-    vbo: int
-    ibo: int
+    # Blocks of geometry arenas (by vertex format and index type)
+    vertex_block: ArenaBlock
+    index_block: ArenaBlock
     vertices_count: int
     indices_count: int
     cw_order: bool
 
+    vertex_format: VertexFormat
+    index_type: int
+
+    # Maps stored positions to model space (for quantized positions)
+    m_dequant: mat4
+
+    # Detail levels in shared buffers, from the most detailed one
+    lods: list[MeshLod]
+
+
+@dataclass
+class TextureResidency:
+    # Streamed texture has only levels [top_level, levels_count) in VRAM
+    size: int  # max dimension of level 0
+    levels_count: int
+    top_level: int
+    resident_bytes: int
+
+    # Most detailed level, requested by objects at current frame
+    requested_level: int
+    last_used_frame: int = 0
+
 
 @dataclass
 class TextureGfxData:
+    # `GL_TEXTURE_2D` or, if layer is set, `GL_TEXTURE_2D_ARRAY` texture
     id: int
+    layer: int = -1
 
+    # Set for streamed textures only, see `texture_stream`
+    residency: TextureResidency | None = None
 
-@dataclass
-class GfxData:
-    m_persp: UniformPtr[mat4]
-    m_view: UniformPtr[mat4]
-    m_model: UniformPtr[mat4]
 
-    light_color: UniformPtr[vec3]
-    # light_ambient_intensity: UniformPtr[float]
-    # light_diffuse_intensity: UniformPtr[float]
-    # light_direction: UniformPtr[vec3]
+class DrawBatch(t.NamedTuple):
+    # Instances of mesh LOD with texture, drawn by single command
+    mesh: MeshGfxData
+    texture: TextureGfxData
+    lod: int
+    first_instance: int
+    instances_count: int
+
 
-    # material_ambient_color: UniformPtr[vec3]
-    # material_diffuse_color: UniformPtr[vec3]
+class CullLayout(t.NamedTuple):
+    # Draw commands of GPU culling, see `gfx_draw_scene_culled`
+    batches: list[DrawBatch]  # per batch and LOD, without instances
+    item_commands: np.ndarray  # LOD 0 command by item slot, -1 - unused
+    batches_count: int  # size of batch index space
 
 
 @dataclass
 class GfxInstance:
     obj_program: int
-    data: GfxData
+
+    # Camera and light data, shared by all draws
+    frame: FrameBlock
+
+    # Materials of all objects, see `gfx_load_material`
+    materials: MaterialTable
+
+    # Async texture upload, `None` if disabled
+    upload_ring: UploadRing | None
+
+    # Draw commands and instance data of frames in flight
+    draw_ring: DrawRing
+
+    # Depth pyramid of drawn frames for occlusion culling, `None` if
+    # disabled
+    hiz: HiZBuffer | None = None
+
+    # Culling of render queue by compute shader, `None` if disabled
+    culler: GpuCuller | None = None
+    cull_batches: list[DrawBatch] = field(default_factory=list)
+
+    # All meshes are packed into arenas, single vertex array per format
+    vertex_arenas: dict[VertexFormat, GeometryArena] = field(
+        default_factory=dict
+    )
+    index_arenas: dict[int, GeometryArena] = field(default_factory=dict)
+    vertex_arrays: dict[VertexFormat, int] = field(default_factory=dict)
+
+    # Shadow of GL state, redundant state changes are skipped
+    state: GlState = field(default_factory=state_create)
+
+    # -- Stats of last frame
+    draw_calls: int = 0  # multi-draw calls
+    draw_commands: int = 0
+    drawn_instances: int = 0
 
 
 def gfx_create() -> GfxInstance:
@@ -88,50 +312,55 @@ def gfx_create() -> GfxInstance:
     # g.glPolygonMode(g.GL_FRONT_AND_BACK, g.GL_FILL)
 
     program = gfx_create_program(ShaderPath.OBJECT_VERT, ShaderPath.OBJECT_FRAG)
-    gfx_use_program(program)
-
-    # -- Camera data
-    m_persp = uniform_create(program, 'm_persp', UniformType.mat4)
-    m_view = uniform_create(program, 'm_view', UniformType.mat4)
-    m_model = uniform_create(program, 'm_model', UniformType.mat4)
-
-    # -- Shading data
-    light_color = uniform_create(program, 'light.color', UniformType.vec3)
-    # light_ambient_intensity = uniform_create(
-    #     program, 'light.ambient_intensity', UniformType.float
-    # )
-    # light_diffuse_intensity = uniform_create(
-    #     program, 'light.diffuse_intensity', UniformType.float
-    # )
-    # light_direction = uniform_create(
-    #     program, 'light.direction', UniformType.vec3
-    # )
-
-    # material_ambient_color = uniform_create(
-    #     program, 'material.ambient_color', UniformType.vec3
-    # )
-    # material_diffuse_color = uniform_create(
-    #     program, 'material.diffuse_color', UniformType.vec3
-    # )
-
-    gfx_use_program(0)
+
+    # -- Texture upload
+    upload_ring = None
+    if config.TEXTURE_UPLOAD_SLOTS > 0:
+        upload_ring = upload_ring_create(
+            config.TEXTURE_UPLOAD_SLOT_SIZE, config.TEXTURE_UPLOAD_SLOTS
+        )
+
+    # -- Compute passes, CPU is used without compute support
+    has_compute = gfx_has_compute()
+    if not has_compute and (config.OCCLUSION_CULLING or config.GPU_CULLING):
+        logger.warning('Compute shaders are not supported, culling on CPU')
+
+    culler = None
+    if config.GPU_CULLING and has_compute:
+        culler = gpu_cull_create(gfx_create_program(ShaderPath.CULL_COMP))
+
+    # Depth pyramid is tested on CPU, so it is not used by GPU culling
+    hiz = None
+    if config.OCCLUSION_CULLING and has_compute and culler is None:
+        hiz = hiz_create(
+            gfx_create_program(ShaderPath.HIZ_COMP),
+            config.WINDOW_WIDTH,
+            config.WINDOW_HEIGHT,
+            config.OCCLUSION_READBACK_WIDTH,
+        )
 
     return GfxInstance(
         obj_program=program,
-        data=GfxData(
-            m_persp=m_persp,
-            m_model=m_model,
-            m_view=m_view,
-            light_color=light_color,
-            # light_ambient_intensity=light_ambient_intensity,
-            # light_diffuse_intensity=light_diffuse_intensity,
-            # light_direction=light_direction,
-            # material_ambient_color=material_ambient_color,
-            # material_diffuse_color=material_diffuse_color,
+        frame=frame_block_create(),
+        materials=material_table_create(),
+        upload_ring=upload_ring,
+        draw_ring=draw_ring_create(
+            config.DRAW_RING_SLOT_SIZE, config.DRAW_RING_SLOTS
         ),
+        hiz=hiz,
+        culler=culler,
     )
 
 
+def gfx_has_compute() -> bool:
+    # Compute shaders are core since OpenGL 4.3
+    version = (
+        int(g.glGetIntegerv(g.GL_MAJOR_VERSION)),
+        int(g.glGetIntegerv(g.GL_MINOR_VERSION)),
+    )
+    return version >= (4, 3)
+
+
 def gfx_log_info() -> None:
     vendor = g.glGetString(g.GL_VENDOR).decode()
     renderer = g.glGetString(g.GL_RENDERER).decode()
@@ -158,8 +387,37 @@ def gfx_stop() -> None:
     should_stop = True
 
 
-def gfx_shutdown() -> None:
-    # TODO opengl shutdown
+def gfx_shutdown(self: GfxInstance) -> None:
+    # Should be called while context is alive: persistent mappings and
+    # fences are released explicitly
+    g.glFinish()
+
+    if self.upload_ring is not None:
+        upload_ring_destroy(self.upload_ring, self.state)
+
+    state_forget_buffer(self.state, self.draw_ring.buffer)
+    draw_ring_destroy(self.draw_ring)
+
+    if self.hiz is not None:
+        hiz_destroy(self.hiz, self.state)
+        g.glDeleteProgram(self.hiz.program)
+
+    if self.culler is not None:
+        gpu_cull_destroy(self.culler, self.state)
+        g.glDeleteProgram(self.culler.program)
+
+    for arena in (*self.vertex_arenas.values(), *self.index_arenas.values()):
+        arena_destroy(arena)
+
+    if self.vertex_arrays:
+        vertex_arrays = list(self.vertex_arrays.values())
+        g.glDeleteVertexArrays(len(vertex_arrays), vertex_arrays)
+        self.vertex_arrays.clear()
+
+    material_table_destroy(self.materials, self.state)
+    frame_block_destroy(self.frame)
+    g.glDeleteProgram(self.obj_program)
+
     logger.info('Rendering shutdown. See you next time')
 
 
@@ -231,189 +489,598 @@ def gfx_compile_shader(program: int, shader_filename: str):
     g.glAttachShader(program, shader)
 
 
-def gfx_use_program(program: int) -> None:
-    g.glUseProgram(program)
+def gfx_use_program(self: GfxInstance, program: int) -> None:
+    state_use_program(self.state, program)
 
 
-def gfx_clear() -> None:
-    g.glClear(g.GL_COLOR_BUFFER_BIT)
-    g.glClearColor(*config.WINDOW_COLOR)
-    g.glClear(g.GL_DEPTH_BUFFER_BIT)
+def gfx_reset_state(self: GfxInstance) -> None:
+    # Should be called after GL state was changed outside of gfx (GUI)
+    state_invalidate(self.state)
 
 
-def _create_vertex_buffer(data: glm.array) -> int:
-    vbo = g.glGenBuffers(1)
+def gfx_clear(self: GfxInstance) -> None:
+    state_clear_color(self.state, config.WINDOW_COLOR)
+    g.glClear(g.GL_COLOR_BUFFER_BIT | g.GL_DEPTH_BUFFER_BIT)
 
-    g.glBindBuffer(g.GL_ARRAY_BUFFER, vbo)
-    g.glBufferData(
-        g.GL_ARRAY_BUFFER, data.nbytes, data.ptr, g.GL_STATIC_DRAW
-    )
-    return vbo
 
+def _create_vertex_array(state: GlState, vertex_format: VertexFormat) -> int:
+    # Vertex buffer (chunk of geometry arena) is attached at draw
+    vao = g.glGenVertexArrays(1)
 
-def _create_index_buffer(data: glm.array) -> int:
-    ibo = g.glGenBuffers(1)
+    # Object is created on first bind
+    state_bind_vertex_array(state, vao)
 
-    g.glBindBuffer(g.GL_ELEMENT_ARRAY_BUFFER, ibo)
-    g.glBufferData(
-        g.GL_ELEMENT_ARRAY_BUFFER, data.nbytes, data.ptr, g.GL_STATIC_DRAW
-    )
-    return ibo
+    # -- Vertex attributes
+    # buffer format: interleaved (v1, vn1, vt1, v2, vn2, vt2, ...)
+    #
+    # More about formats: https://stackoverflow.com/a/39684775
+    #
+    dtype = VERTEX_DTYPES[vertex_format]
+
+    for name, attr in _VERTEX_ATTRIBUTES[vertex_format].items():
+        location, size, attr_type, normalized = attr
 
+        g.glVertexArrayAttribFormat(
+            vao, location, size, attr_type, normalized,
+            dtype.fields[name][1],
+        )
+        g.glVertexArrayAttribBinding(vao, location, _VERTEX_BINDING)
+        g.glEnableVertexArrayAttrib(vao, location)
 
-def _enable_buffer_attribute(attr: int, ptr: c_void_p, size: int = 3) -> None:
-    g.glVertexAttribPointer(attr, size, g.GL_FLOAT, False, 0, ptr)
-    g.glEnableVertexAttribArray(attr)
+    return vao
 
 
 def gfx_load_mesh(
     self: GfxInstance,
-    vertex_data: glm.array,
-    index_data: glm.array,
+    vertex_data: np.ndarray,
+    index_data: np.ndarray,
     vertices_count: int,
     indices_count: int,
     cw_order: bool,
+    vertex_format: VertexFormat,
+    m_dequant: mat4,
+    lods: list[MeshLod],
 ) -> MeshGfxData:
-    gfx_use_program(self.obj_program)
-
-    vao = g.glGenVertexArrays(1)
-    g.glBindVertexArray(vao)
-
-    vbo = _create_vertex_buffer(vertex_data)
-    ibo = _create_index_buffer(index_data)
-
-    # -- Enable buffer attributes
-    # buffer format: (v1, v2, ..., vn1, vn2, ..., vt1, vt2, ...)
-    #
-    # More about formats: https://stackoverflow.com/a/39684775
-    #
-    vertex_attr = 0
-    vertex_ptr = c_void_p(0)
-
-    normal_attr = 1
-    normal_ptr = c_void_p(glm.sizeof(vec3) * vertices_count)
+    index_type = _INDEX_TYPES[index_data.dtype]
 
-    texcoord_attr = 2
-    texcoord_ptr = c_void_p(glm.sizeof(vec3) * vertices_count * 2)
-
-    _enable_buffer_attribute(vertex_attr, vertex_ptr)
-    _enable_buffer_attribute(normal_attr, normal_ptr)
-    _enable_buffer_attribute(texcoord_attr, texcoord_ptr, 2)
+    if vertex_format not in self.vertex_arenas:
+        self.vertex_arenas[vertex_format] = arena_create(
+            VERTEX_DTYPES[vertex_format].itemsize,
+            config.GEOMETRY_VERTEX_CHUNK,
+        )
+        self.vertex_arrays[vertex_format] = _create_vertex_array(
+            self.state, vertex_format
+        )
 
-    # -- Cleanup
+    if index_type not in self.index_arenas:
+        self.index_arenas[index_type] = arena_create(
+            index_data.itemsize, config.GEOMETRY_INDEX_CHUNK
+        )
 
-    g.glBindBuffer(g.GL_ARRAY_BUFFER, 0)
-    g.glBindBuffer(g.GL_ELEMENT_ARRAY_BUFFER, 0)
-    g.glBindVertexArray(0)
-    gfx_use_program(0)
+    vertex_block = arena_alloc(self.vertex_arenas[vertex_format], vertex_data)
+    index_block = arena_alloc(self.index_arenas[index_type], index_data)
 
     logger.debug('Mesh loaded')
     return MeshGfxData(
-        vao=vao,
-        vbo=vbo,
-        ibo=ibo,
+        vertex_block=vertex_block,
+        index_block=index_block,
         vertices_count=vertices_count,
         indices_count=indices_count,
         cw_order=cw_order,
+        vertex_format=vertex_format,
+        index_type=index_type,
+        m_dequant=m_dequant,
+        lods=lods,
     )
 
 
-def gfx_load_texture(self: GfxInstance, image: Image) -> TextureGfxData:
-    gfx_use_program(self.obj_program)
+def gfx_unload_mesh(self: GfxInstance, mesh: MeshGfxData) -> None:
+    arena_free(self.vertex_arenas[mesh.vertex_format], mesh.vertex_block)
+    arena_free(self.index_arenas[mesh.index_type], mesh.index_block)
+
 
+def gfx_load_texture(
+    self: GfxInstance,
+    levels: list[np.ndarray],
+    format: TextureFormat,
+    width: int,
+    height: int,
+) -> TextureGfxData:
+    # levels: mip chain of (height, width, components) uint8 arrays or
+    # (blocks height, blocks width, block bytes) for compressed formats
     texture = g.glGenTextures(1)
-    # g.glActiveTexture(g.GL_TEXTURE0)
-    g.glBindTexture(g.GL_TEXTURE_2D, texture)
-    
-    num_components = len(image.getbands())
-    match num_components:
-        case 1:
-            format = g.GL_RED
-        case 3:
-            format = g.GL_RGB
-        case _:
-            format = g.GL_RGBA
+    _bind_upload_texture(self, g.GL_TEXTURE_2D, texture)
 
     # -- Texture Loading
-    g.glTexImage2D(
-        g.GL_TEXTURE_2D,       # target
-        0,                     # mipmap level
-        format,              # tex format
-        image.width,         # width
-        image.height,         # height
-        0,                     # some legacy stuff...
-        format,              # source format
-        g.GL_UNSIGNED_BYTE,    # source datatype
-        image.tobytes(),
+    # Levels are uploaded directly from (mapped) arrays, so no mipmaps
+    # generation on load. With upload ring calls return before GPU has
+    # copied pixels, see `gfx_upload`
+    g.glTexStorage2D(
+        g.GL_TEXTURE_2D,
+        len(levels),
+        _texture_internal_format(format, levels[0].shape[2]),
+        width,
+        height,
     )
-    g.glGenerateMipmap(g.GL_TEXTURE_2D)
+    _upload_texture_levels(self, levels, format, width, height)
 
     # -- Texture Parameters
-    g.glTexParameteri(g.GL_TEXTURE_2D, g.GL_TEXTURE_WRAP_S, g.GL_REPEAT)
-    g.glTexParameteri(g.GL_TEXTURE_2D, g.GL_TEXTURE_WRAP_T, g.GL_REPEAT)
-    g.glTexParameteri(g.GL_TEXTURE_2D, g.GL_TEXTURE_MIN_FILTER, g.GL_LINEAR_MIPMAP_LINEAR)
-    g.glTexParameteri(g.GL_TEXTURE_2D, g.GL_TEXTURE_MAG_FILTER, g.GL_LINEAR)
-
-    # -- Cleanup
-    gfx_use_program(0)
+    _set_texture_parameters(g.GL_TEXTURE_2D, len(levels))
 
     return TextureGfxData(id=texture)
 
 
+def _bind_upload_texture(
+    self: GfxInstance,
+    target: int,
+    texture: int,
+) -> None:
+    # Texture is bound to active unit for texture calls (storage, levels)
+    state_active_texture(self.state, _TEXTURE_UNIT_UPLOAD)
+    state_bind_texture(self.state, _TEXTURE_UNIT_UPLOAD, target, texture)
+
+
+def gfx_restream_texture(
+    self: GfxInstance,
+    texture: TextureGfxData,
+    levels: list[np.ndarray],
+    format: TextureFormat,
+    width: int,
+    height: int,
+    old_top: int,
+    new_top: int,
+) -> None:
+    """Recreate storage of 2D texture with levels [new_top, ...)
+
+    levels: full mip chain (see `gfx_load_texture`) of `width` x `height`
+    texture. Levels, which are resident already, are copied on GPU,
+    the rest ones are uploaded. Texture ID is changed
+    """
+    old_id = texture.id
+    new_id = g.glGenTextures(1)
+    levels_count = len(levels) - new_top
+
+    new_width = max(width >> new_top, 1)
+    new_height = max(height >> new_top, 1)
+
+    _bind_upload_texture(self, g.GL_TEXTURE_2D, new_id)
+    g.glTexStorage2D(
+        g.GL_TEXTURE_2D,
+        levels_count,
+        _texture_internal_format(format, levels[0].shape[2]),
+        new_width,
+        new_height,
+    )
+
+    for level in range(max(new_top, old_top), len(levels)):
+        g.glCopyImageSubData(
+            old_id, g.GL_TEXTURE_2D, level - old_top, 0, 0, 0,
+            new_id, g.GL_TEXTURE_2D, level - new_top, 0, 0, 0,
+            max(width >> level, 1), max(height >> level, 1), 1,
+        )
+
+    if new_top < old_top:
+        _upload_texture_levels(
+            self, levels[new_top:old_top], format, new_width, new_height
+        )
+
+    _set_texture_parameters(g.GL_TEXTURE_2D, levels_count)
+
+    g.glDeleteTextures(1, [old_id])
+    state_forget_texture(self.state, old_id)
+
+    texture.id = new_id
+
+
+def gfx_create_texture_array(
+    self: GfxInstance,
+    width: int,
+    height: int,
+    format: TextureFormat,
+    num_components: int,
+    layers: int,
+) -> int:
+    """Allocate texture array page with full mip chain, see
+    `gfx_load_texture_layer`
+    """
+    levels_count = max(width, height).bit_length()
+
+    texture = g.glGenTextures(1)
+    _bind_upload_texture(self, g.GL_TEXTURE_2D_ARRAY, texture)
+    g.glTexStorage3D(
+        g.GL_TEXTURE_2D_ARRAY,
+        levels_count,
+        _texture_internal_format(format, num_components),
+        width,
+        height,
+        layers,
+    )
+    _set_texture_parameters(g.GL_TEXTURE_2D_ARRAY, levels_count)
+
+    return texture
+
+
+def gfx_load_texture_layer(
+    self: GfxInstance,
+    array_id: int,
+    layer: int,
+    levels: list[np.ndarray],
+    format: TextureFormat,
+    width: int,
+    height: int,
+) -> TextureGfxData:
+    # levels: see `gfx_load_texture`, size and format should match
+    # the array page
+    _bind_upload_texture(self, g.GL_TEXTURE_2D_ARRAY, array_id)
+    _upload_texture_levels(self, levels, format, width, height, layer)
+
+    return TextureGfxData(id=array_id, layer=layer)
+
+
+def _texture_internal_format(
+    format: TextureFormat,
+    num_components: int,
+) -> int:
+    if format == TextureFormat.uncompressed:
+        return _TEXTURE_FORMATS[num_components][1]
+
+    return _COMPRESSED_TEXTURE_FORMATS[format]
+
+
+def _upload_texture_levels(
+    self: GfxInstance,
+    levels: list[np.ndarray],
+    format: TextureFormat,
+    width: int,
+    height: int,
+    layer: int = -1,
+) -> None:
+    # Upload to bound `GL_TEXTURE_2D` or layer of `GL_TEXTURE_2D_ARRAY`
+    ring = self.upload_ring
+    g.glPixelStorei(g.GL_UNPACK_ALIGNMENT, 1)
+
+    for level, data in enumerate(levels):
+        level_width = max(width >> level, 1)
+        level_height = max(height >> level, 1)
+
+        if format == TextureFormat.uncompressed:
+            pixels_format, _ = _TEXTURE_FORMATS[data.shape[2]]
+
+            if ring is not None:
+                upload_ring_write_texture(
+                    ring, self.state, level, data, pixels_format, layer
+                )
+            elif layer < 0:
+                g.glTexSubImage2D(
+                    g.GL_TEXTURE_2D, level,
+                    0, 0, level_width, level_height,
+                    pixels_format, g.GL_UNSIGNED_BYTE,
+                    data,
+                )
+            else:
+                g.glTexSubImage3D(
+                    g.GL_TEXTURE_2D_ARRAY, level,
+                    0, 0, layer, level_width, level_height, 1,
+                    pixels_format, g.GL_UNSIGNED_BYTE,
+                    data,
+                )
+            continue
+
+        internal_format = _COMPRESSED_TEXTURE_FORMATS[format]
+
+        if ring is not None:
+            upload_ring_write_compressed(
+                ring, self.state, level, data, level_width, level_height,
+                internal_format, layer,
+            )
+        elif layer < 0:
+            g.glCompressedTexSubImage2D(
+                g.GL_TEXTURE_2D, level,
+                0, 0, level_width, level_height,
+                internal_format, data.nbytes,
+                data,
+            )
+        else:
+            g.glCompressedTexSubImage3D(
+                g.GL_TEXTURE_2D_ARRAY, level,
+                0, 0, layer, level_width, level_height, 1,
+                internal_format, data.nbytes,
+                data,
+            )
+
+
+def _set_texture_parameters(target: int, levels_count: int) -> None:
+    g.glTexParameteri(target, g.GL_TEXTURE_MAX_LEVEL, levels_count - 1)
+    g.glTexParameteri(target, g.GL_TEXTURE_WRAP_S, g.GL_REPEAT)
+    g.glTexParameteri(target, g.GL_TEXTURE_WRAP_T, g.GL_REPEAT)
+    g.glTexParameteri(
+        target, g.GL_TEXTURE_MIN_FILTER, g.GL_LINEAR_MIPMAP_LINEAR
+    )
+    g.glTexParameteri(target, g.GL_TEXTURE_MAG_FILTER, g.GL_LINEAR)
+
+
 def gfx_draw_scene(
     self: GfxInstance,
-    persp_mat: mat4,
     view_mat: mat4,
-    objects_queue: tuple[tuple[MeshGfxData, TextureGfxData, mat4]],
+    batches: list[DrawBatch],
+    matrices: np.ndarray,
+    materials: np.ndarray,
 ) -> None:
-    gfx_clear()
+    """Draw sorted batches
+
+    matrices: (n, 16) model matrices of instances (with dequantization),
+        instances of a batch are `batch.first_instance` onwards
+    materials: (n,) material indices of instances
+    """
+    _gfx_begin_scene(self, view_mat)
+
+    # -- Draw commands and instance data of frame
+    commands = np.empty(len(batches), dtype=DRAW_COMMAND_DTYPE)
+    instances = np.empty(len(matrices), dtype=INSTANCE_DTYPE)
+    instances['m_model'] = matrices
+    instances['material'] = materials
+
+    for i, batch in enumerate(batches):
+        last_instance = batch.first_instance + batch.instances_count
+
+        commands[i] = _draw_command(batch)
+        instances['texture_layer'][batch.first_instance:last_instance] = (
+            batch.texture.layer
+        )
+
+    instances_offset = (
+        (commands.nbytes + _INSTANCES_ALIGN - 1) & ~(_INSTANCES_ALIGN - 1)
+    )
+    frame_size = instances_offset + instances.nbytes
+
+    if frame_size > self.draw_ring.slot_size:
+        state_forget_buffer(self.state, self.draw_ring.buffer)
+        self.draw_ring = draw_ring_grow(self.draw_ring, frame_size)
+
+    slot = draw_ring_begin_frame(self.draw_ring)
+    draw_ring_write(self.draw_ring, slot, commands)
+    draw_ring_write(self.draw_ring, slot + instances_offset, instances)
+
+    state_bind_buffer(
+        self.state, g.GL_DRAW_INDIRECT_BUFFER, self.draw_ring.buffer
+    )
+    state_bind_buffer_range(
+        self.state, g.GL_SHADER_STORAGE_BUFFER, _INSTANCES_BINDING,
+        self.draw_ring.buffer, slot + instances_offset,
+        max(instances.nbytes, INSTANCE_DTYPE.itemsize),
+    )
+    _gfx_draw_groups(self, batches, slot)
+
+    draw_ring_end_frame(self.draw_ring)
+
+    self.draw_commands = len(batches)
+    self.drawn_instances = len(matrices)
+
+    # State is left bound, see `gfx_reset_state`
+
+
+def gfx_draw_scene_culled(
+    self: GfxInstance,
+    view_mat: mat4,
+    view: CullView,
+    layout: CullLayout | None,
+    items: tuple[int, CullItems] | None,
+) -> None:
+    """Cull render queue by compute shader and draw it
+
+    layout: new layout of commands, `None` if it is not changed
+    items: (first slot, data) of changed items, `None` if none
+    """
+    culler = self.culler
+
+    if layout is not None:
+        commands = np.zeros(len(layout.batches), dtype=DRAW_COMMAND_DTYPE)
+        for i, batch in enumerate(layout.batches):
+            commands[i] = _draw_command(batch)
+
+        gpu_cull_set_commands(
+            culler, self.state, commands,
+            layout.item_commands, layout.batches_count,
+        )
+        self.cull_batches = layout.batches
+
+    if items is not None:
+        gpu_cull_write_items(culler, self.state, *items)
+
+    _gfx_begin_scene(self, view_mat)
+    gpu_cull_dispatch(culler, self.state, view, config.LOD_THRESHOLDS)
+
+    # -- Commands and instances are written by culling
+    gfx_use_program(self, self.obj_program)
+    state_bind_buffer(
+        self.state, g.GL_DRAW_INDIRECT_BUFFER, culler.commands.buffer
+    )
+    _gfx_draw_groups(self, self.cull_batches, 0)
+
+    # Instances count is known after read back only
+    self.draw_commands = len(self.cull_batches)
+    self.drawn_instances = culler.visible_count
+
+
+def gfx_poll_cull_stats(self: GfxInstance) -> tuple[int, np.ndarray] | None:
+    # -> (visible items count, texture detail by batch index) of GPU
+    # culling, when new ones are read back
+    if self.culler is None or not gpu_cull_poll(self.culler):
+        return None
+
+    return self.culler.visible_count, self.culler.batch_details
+
+
+def _gfx_begin_scene(self: GfxInstance, view_mat: mat4) -> None:
+    state_begin_frame(self.state)
+    gfx_clear(self)
 
     # -- Object Renderer --
-    gfx_use_program(self.obj_program)
+    gfx_use_program(self, self.obj_program)
+    state_set_enabled(self.state, g.GL_CULL_FACE, True)
+    state_set_enabled(self.state, g.GL_DEPTH_TEST, True)
+
+    gfx_set_view(self, view_mat)
+    frame_block_upload(self.frame)
+    material_table_upload(self.materials, self.state)
+
+    if self.materials.count:
+        state_bind_buffer_range(
+            self.state, g.GL_SHADER_STORAGE_BUFFER, MATERIALS_BINDING,
+            self.materials.buffer, 0,
+            self.materials.count * MATERIAL_DTYPE.itemsize,
+        )
 
-    gfx_set_draw_camera(self, persp_mat, view_mat)
-    
-    for gpu_mesh, gpu_texture, model_mat in objects_queue:
-        gfx_draw(self, gpu_mesh, gpu_texture, model_mat)
 
-    # -- Cleanup --
-    gfx_use_program(0)
+def _gfx_draw_groups(
+    self: GfxInstance,
+    batches: list[DrawBatch],
+    commands_offset: int,
+) -> None:
+    # Multi-draw: group of adjacent commands per call. Commands of
+    # batches are at `commands_offset` of bound indirect buffer
+    first_command = 0
+    self.draw_calls = 0
+
+    groups = itertools.groupby(
+        batches, key=lambda batch: _draw_group_key(batch.mesh, batch.texture)
+    )
+    for _, group in groups:
+        batch = next(group)
+        commands_count = 1 + sum(1 for _ in group)
+
+        gfx_multi_draw(
+            self, batch.mesh, batch.texture,
+            commands_offset + first_command * DRAW_COMMAND_DTYPE.itemsize,
+            commands_count,
+        )
+        first_command += commands_count
+        self.draw_calls += 1
+
+
+def _draw_command(batch: DrawBatch) -> tuple:
+    # -> `DRAW_COMMAND_DTYPE` record of batch
+    mesh = batch.mesh
+    mesh_lod = mesh.lods[min(batch.lod, len(mesh.lods) - 1)]
+
+    return (
+        mesh_lod.indices_count,
+        batch.instances_count,
+        mesh.index_block.offset + mesh_lod.first_index,
+        mesh.vertex_block.offset + mesh_lod.base_vertex,
+        batch.first_instance,
+    )
+
+
+def _draw_group_key(mesh: MeshGfxData, texture: TextureGfxData) -> tuple:
+    # Commands with equal keys are drawn by single multi-draw call
+    return (
+        mesh.vertex_format,
+        mesh.vertex_block.chunk,
+        mesh.index_type,
+        mesh.index_block.chunk,
+        texture.id,
+        mesh.cw_order,
+    )
+
+
+def gfx_load_material(self: GfxInstance, material: Material) -> int:
+    # -> index of material in table, which draw items refer to
+    return material_table_add(
+        self.materials,
+        tuple(material.ambient),
+        tuple(material.diffuse),
+        tuple(material.specular),
+        material.metallic,
+    )
 
 
 def gfx_set_light(self: GfxInstance, color: tuple) -> None:
-    uniform_set(self.data.light, vec3(*color))
+    frame_block_set(self.frame, 'light_color', vec3(*color))
+
+
+def gfx_set_perspective(self: GfxInstance, persp_mat: mat4) -> None:
+    # Should be called on window resize only
+    frame_block_set(self.frame, 'm_persp', persp_mat)
+
+
+def gfx_set_view(self: GfxInstance, view_mat: mat4) -> None:
+    frame_block_set(self.frame, 'm_view', view_mat)
 
 
-def gfx_set_draw_camera(self: GfxInstance, persp_mat: mat4, view_mat: mat4) -> None:
-    uniform_set(self.data.m_persp, persp_mat)
-    uniform_set(self.data.m_view, view_mat)
+def gfx_resize(self: GfxInstance, width: int, height: int) -> None:
+    g.glViewport(0, 0, width, height)
 
+    if self.hiz is not None:
+        hiz_resize(self.hiz, self.state, width, height)
 
-def gfx_draw(
+
+def gfx_capture_depth(
+    self: GfxInstance,
+    m_view_persp: mat4,
+    frame: int,
+) -> None:
+    # Depth of drawn scene is kept for occlusion culling of next frames,
+    # should be called after `gfx_draw_scene`
+    if self.hiz is not None:
+        hiz_capture(self.hiz, self.state, m_view_persp, frame)
+
+
+def gfx_get_depth_pyramid(self: GfxInstance) -> DepthPyramid | None:
+    # -> the latest captured depth, which is read back already
+    if self.hiz is None:
+        return None
+
+    return hiz_poll(self.hiz)
+
+
+def gfx_multi_draw(
     self: GfxInstance,
     mesh: MeshGfxData,
     texture: TextureGfxData,
-    model_mat: mat4,
+    commands_offset: int,
+    commands_count: int,
 ) -> None:
-    # -- 1. Draw textures
-    # g.glActiveTexture(g.GL_TEXTURE0)
-    g.glBindTexture(g.GL_TEXTURE_2D, texture.id)
-    # sampler = uniform_create(state.program, 'texture_out', UniformType.int)
-    # uniform_set(sampler, 0)
+    """Submit draw commands from bound `GL_DRAW_INDIRECT_BUFFER`
 
-    # -- 2. Draw Mesh
-    g.glBindVertexArray(mesh.vao)
-    uniform_set(self.data.m_model, model_mat)
-
-    g.glBindBuffer(g.GL_ARRAY_BUFFER, mesh.vbo)
-    g.glBindBuffer(g.GL_ELEMENT_ARRAY_BUFFER, mesh.ibo)
+    All commands should share arena chunks of `mesh` and `texture`,
+    instances are read from bound instances storage buffer
+    """
+    # -- 1. Draw textures
+    gfx_bind_texture(self, texture)
+
+    # -- 2. Draw Meshes
+    vao = self.vertex_arrays[mesh.vertex_format]
+    vertex_arena = self.vertex_arenas[mesh.vertex_format]
+    index_arena = self.index_arenas[mesh.index_type]
+
+    state_bind_vertex_array(self.state, vao)
+    state_vertex_buffer(
+        self.state, vao, _VERTEX_BINDING,
+        vertex_arena.chunks[mesh.vertex_block.chunk].buffer,
+        0, vertex_arena.element_size,
+    )
+    state_element_buffer(
+        self.state, vao, index_arena.chunks[mesh.index_block.chunk].buffer
+    )
 
     face_orient = g.GL_CW if mesh.cw_order else g.GL_CCW
-    g.glFrontFace(face_orient)
-
-    g.glDrawElements(
-        g.GL_TRIANGLES, mesh.indices_count, g.GL_UNSIGNED_INT, None
+    state_front_face(self.state, face_orient)
+
+    g.glMultiDrawElementsIndirect(
+        g.GL_TRIANGLES,
+        mesh.index_type,
+        c_void_p(commands_offset),
+        commands_count,
+        0,
     )
 
-    # -- 3. Reset texture binding
-    g.glBindTexture(g.GL_TEXTURE_2D, 0)
+
+def gfx_bind_texture(self: GfxInstance, texture: TextureGfxData) -> None:
+    # Textures of array pages stay bound, while only layer is changed
+    if texture.layer < 0:
+        unit, target = _TEXTURE_UNIT_2D, g.GL_TEXTURE_2D
+    else:
+        unit, target = _TEXTURE_UNIT_ARRAY, g.GL_TEXTURE_2D_ARRAY
+
+    state_bind_texture(self.state, unit, target, texture.id)
@@ -0,0 +1,142 @@
+"""gfx_arena - Geometry Arena
+
+Meshes are packed into a few large GPU buffers (chunks) instead of
+buffer per mesh, so draws of different meshes need no rebinding and could
+be submitted by single multi-draw call.
+
+Arena is sub-allocated in elements (vertices or indices), so block offset
+is directly `baseVertex` / `firstIndex` of draw command. Every chunk
+keeps sorted free list of ranges, neighbour ranges are merged on free.
+"""
+import logging
+import typing as t
+from dataclasses import dataclass
+
+import numpy as np
+from OpenGL import GL as g
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ArenaChunk:
+    buffer: int
+    capacity: int  # elements
+
+    # [(offset, size), ...] sorted by offset, in elements
+    free: list[tuple[int, int]]
+
+
+class ArenaBlock(t.NamedTuple):
+    chunk: int  # index of chunk in arena
+    offset: int  # elements
+    size: int  # elements
+
+
+@dataclass
+class GeometryArena:
+    element_size: int  # bytes
+    chunk_capacity: int  # elements
+    chunks: list[ArenaChunk]
+
+    # -- Stats
+    used: int = 0  # elements
+
+
+def arena_create(element_size: int, chunk_size: int) -> GeometryArena:
+    # chunk_size: bytes of regular chunk, bigger meshes get own chunk
+    return GeometryArena(
+        element_size=element_size,
+        chunk_capacity=max(chunk_size // element_size, 1),
+        chunks=[],
+    )
+
+
+def arena_destroy(self: GeometryArena) -> None:
+    for chunk in self.chunks:
+        g.glDeleteBuffers(1, [chunk.buffer])
+
+    self.chunks.clear()
+    self.used = 0
+
+
+def arena_alloc(self: GeometryArena, data: np.ndarray) -> ArenaBlock:
+    """Allocate block for `data` (array of elements) and upload it
+    """
+    size = len(data)
+    if data.dtype.itemsize != self.element_size:
+        raise ValueError(
+            f'Arena element is {self.element_size} bytes, '
+            f'got {data.dtype} elements'
+        )
+
+    block = _arena_find_block(self, size)
+    if block is None:
+        _arena_add_chunk(self, max(size, self.chunk_capacity))
+        block = _arena_find_block(self, size)
+
+    g.glNamedBufferSubData(
+        self.chunks[block.chunk].buffer,
+        block.offset * self.element_size,
+        size * self.element_size,
+        np.ascontiguousarray(data),
+    )
+    self.used += size
+    return block
+
+
+def arena_free(self: GeometryArena, block: ArenaBlock) -> None:
+    free = self.chunks[block.chunk].free
+    start, end = block.offset, block.offset + block.size
+
+    # Position of block in sorted free list
+    i = 0
+    while i < len(free) and free[i][0] < start:
+        i += 1
+
+    # -- Merge with neighbour free ranges
+    if i < len(free) and free[i][0] == end:
+        end += free.pop(i)[1]
+
+    if i > 0 and sum(free[i - 1]) == start:
+        i -= 1
+        start = free.pop(i)[0]
+
+    free.insert(i, (start, end - start))
+    self.used -= block.size
+
+
+def _arena_find_block(self: GeometryArena, size: int) -> ArenaBlock | None:
+    # First fit
+    for chunk_index, chunk in enumerate(self.chunks):
+        for i, (offset, free_size) in enumerate(chunk.free):
+            if free_size < size:
+                continue
+
+            if free_size == size:
+                chunk.free.pop(i)
+            else:
+                chunk.free[i] = (offset + size, free_size - size)
+
+            return ArenaBlock(chunk_index, offset, size)
+
+    return None
+
+
+def _arena_add_chunk(self: GeometryArena, capacity: int) -> None:
+    buffer = g.glGenBuffers(1)
+    g.glBindBuffer(g.GL_COPY_WRITE_BUFFER, buffer)
+    g.glBufferStorage(
+        g.GL_COPY_WRITE_BUFFER,
+        capacity * self.element_size,
+        None,
+        g.GL_DYNAMIC_STORAGE_BIT,
+    )
+    g.glBindBuffer(g.GL_COPY_WRITE_BUFFER, 0)
+
+    self.chunks.append(
+        ArenaChunk(buffer=buffer, capacity=capacity, free=[(0, capacity)])
+    )
+    logger.debug(
+        f'Geometry arena chunk: {capacity * self.element_size >> 10} KiB'
+    )
@@ -0,0 +1,428 @@
+"""gfx_cull - GPU Culling
+
+Optional GPU-driven path of render queue (`shaders/cull.comp`). Items
+(transforms and bounds) are kept in storage buffer by slot and patched
+for changed slots only. Every frame compute shader tests all items
+against view frustum, selects their LODs and writes instances of visible
+ones and instance counts into commands buffer, which is drawn as is. So
+CPU work of frame does not depend on number of items: layout of commands
+(command per batch and LOD) is changed only when items are added or
+removed.
+
+Visible count and texture detail of batches (for mip streaming) are read
+back asynchronously, as in `gfx_hiz`.
+"""
+import ctypes
+import logging
+import typing as t
+from dataclasses import dataclass
+from dataclasses import field
+from math import ceil
+
+import numpy as np
+from OpenGL import GL as g
+
+from .camera import CullView
+from .gfx_indirect import DRAW_COMMAND_DTYPE
+from .gfx_indirect import INSTANCE_DTYPE
+from .gfx_state import GlState
+from .gfx_state import state_bind_buffer_range
+from .gfx_state import state_forget_buffer
+from .gfx_state import state_set_uniform
+from .gfx_state import state_use_program
+from .gfx_uniform import Uniform
+from .gfx_uniform import UniformType
+from .gfx_uniform import uniform_create
+
+logger = logging.getLogger(__name__)
+
+
+# `Item` of shader storage block, std430 layout
+CULL_ITEM_DTYPE = np.dtype([
+    ('m_model', '<f4', 16),
+    ('center', '<f4', 3),
+    ('radius', '<f4'),
+    ('extents', '<f4', 3),
+    ('detail_radius', '<f4'),
+    ('texture_layer', '<i4'),
+    ('material', '<i4'),
+    ('lods_count', '<i4'),
+    ('batch', '<i4'),
+])
+
+# `CullData` uniform block, std140 layout
+_CULL_DATA_DTYPE = np.dtype([
+    ('planes', '<f4', (6, 4)),
+    ('camera_position', '<f4', 3),
+    ('tan_half_fov', '<f4'),
+    ('lod_thresholds', '<f4', 8),
+    ('items_count', '<i4'),
+    ('commands_count', '<i4'),
+    ('screen_height', '<f4'),
+    ('_padding', '<i4'),
+])
+
+MAX_LOD_THRESHOLDS = 8
+
+_DECISION_SIZE = 8
+
+# -- Buffer bindings (instances are bound to binding of draw shader)
+_DATA_BINDING = 3
+_ITEMS_BINDING = 4
+_ITEM_COMMANDS_BINDING = 5
+_COMMANDS_BINDING = 6
+_DECISIONS_BINDING = 7
+_STATS_BINDING = 8
+_INSTANCES_BINDING = 1
+
+_STAGE_CLASSIFY = 0
+_STAGE_SCAN = 1
+_STAGE_WRITE = 2
+
+_WORKGROUP_SIZE = 64
+
+_READBACK_SLOTS = 3
+
+_MAP_FLAGS = (
+    g.GL_MAP_READ_BIT | g.GL_MAP_PERSISTENT_BIT | g.GL_MAP_COHERENT_BIT
+)
+
+
+class CullItems(t.NamedTuple):
+    # Data of consecutive slots, see `CULL_ITEM_DTYPE`
+    matrices: np.ndarray  # (k, 16)
+    centers: np.ndarray  # (3, k)
+    extents: np.ndarray  # (3, k)
+    radii: np.ndarray
+    detail_radii: np.ndarray
+    texture_layers: np.ndarray
+    materials: np.ndarray
+    lods_counts: np.ndarray
+    batches: np.ndarray
+
+
+@dataclass
+class _CullBuffer:
+    buffer: int = 0
+    size: int = 0
+
+
+@dataclass
+class _StatsReadback:
+    buffer: int
+    size: int
+    mapped: np.ndarray | None  # uint32 of persistent mapping
+    fence: int | None = None
+    serial: int = 0  # number of dispatch
+
+
+@dataclass
+class GpuCuller:
+    program: int
+    stage: Uniform
+
+    data: np.ndarray  # single record of `_CULL_DATA_DTYPE`
+
+    # Buffers are grown (recreated) on demand
+    data_buffer: _CullBuffer = field(default_factory=_CullBuffer)
+    items: _CullBuffer = field(default_factory=_CullBuffer)
+    item_commands: _CullBuffer = field(default_factory=_CullBuffer)
+    commands_template: _CullBuffer = field(default_factory=_CullBuffer)
+    commands: _CullBuffer = field(default_factory=_CullBuffer)
+    decisions: _CullBuffer = field(default_factory=_CullBuffer)
+    instances: _CullBuffer = field(default_factory=_CullBuffer)
+    stats: _CullBuffer = field(default_factory=_CullBuffer)
+
+    items_count: int = 0
+    commands_count: int = 0
+    batches_count: int = 0
+
+    readbacks: list[_StatsReadback] = field(default_factory=list)
+    dispatches: int = 0
+
+    # -- Stats, read back from one of previous frames
+    stats_serial: int = 0
+    visible_count: int = 0
+    # Texture detail by batch index (0 - batch is not visible)
+    batch_details: np.ndarray = field(
+        default_factory=lambda: np.zeros(0, dtype=np.float32)
+    )
+
+
+def gpu_cull_create(program: int) -> GpuCuller:
+    # program: of `shaders/cull.comp`
+    return GpuCuller(
+        program=program,
+        stage=uniform_create(program, 'stage', UniformType.int),
+        data=np.zeros(1, dtype=_CULL_DATA_DTYPE),
+    )
+
+
+def gpu_cull_destroy(self: GpuCuller, state: GlState) -> None:
+    for buffer in (
+        self.data_buffer,
+        self.items,
+        self.item_commands,
+        self.commands_template,
+        self.commands,
+        self.decisions,
+        self.instances,
+        self.stats,
+    ):
+        if buffer.buffer:
+            state_forget_buffer(state, buffer.buffer)
+            g.glDeleteBuffers(1, [buffer.buffer])
+            buffer.buffer, buffer.size = 0, 0
+
+    for readback in self.readbacks:
+        if readback.fence is not None:
+            g.glDeleteSync(readback.fence)
+
+        g.glUnmapNamedBuffer(readback.buffer)
+        g.glDeleteBuffers(1, [readback.buffer])
+
+    self.readbacks.clear()
+
+
+def gpu_cull_write_items(
+    self: GpuCuller,
+    state: GlState,
+    first_slot: int,
+    items: CullItems,
+) -> None:
+    records = np.empty(len(items.radii), dtype=CULL_ITEM_DTYPE)
+    records['m_model'] = items.matrices
+    records['center'] = items.centers.T
+    records['radius'] = items.radii
+    records['extents'] = items.extents.T
+    records['detail_radius'] = items.detail_radii
+    records['texture_layer'] = items.texture_layers
+    records['material'] = items.materials
+    records['lods_count'] = items.lods_counts
+    records['batch'] = items.batches
+
+    offset = first_slot * CULL_ITEM_DTYPE.itemsize
+    _cull_buffer_reserve(
+        state, self.items, offset + records.nbytes, keep=True
+    )
+    g.glNamedBufferSubData(self.items.buffer, offset, records.nbytes, records)
+
+
+def gpu_cull_set_commands(
+    self: GpuCuller,
+    state: GlState,
+    commands: np.ndarray,
+    item_commands: np.ndarray,
+    batches_count: int,
+) -> None:
+    """Set layout of draw commands
+
+    commands: `DRAW_COMMAND_DTYPE` commands without instances, command
+        per batch and LOD in draw order
+    item_commands: (slots,) int32 LOD 0 command of item batch by slot, -1
+        for unused slot
+    """
+    self.items_count = len(item_commands)
+    self.commands_count = len(commands)
+    self.batches_count = batches_count
+
+    _cull_buffer_write(state, self.commands_template, commands)
+    _cull_buffer_write(state, self.item_commands, item_commands)
+
+    _cull_buffer_reserve(state, self.commands, commands.nbytes)
+    _cull_buffer_reserve(
+        state, self.decisions, self.items_count * _DECISION_SIZE
+    )
+    _cull_buffer_reserve(
+        state, self.instances, self.items_count * INSTANCE_DTYPE.itemsize
+    )
+    _cull_buffer_reserve(state, self.stats, 4 * (1 + batches_count))
+
+
+def gpu_cull_dispatch(
+    self: GpuCuller,
+    state: GlState,
+    view: CullView,
+    lod_thresholds: list[float],
+) -> None:
+    """Cull items and fill commands buffer and instances buffer. Instances
+    are bound here to binding of draw shader, commands are bound by draws
+    as `GL_DRAW_INDIRECT_BUFFER`
+    """
+    if not self.commands_count:
+        return
+
+    data = self.data[0]
+    data['planes'] = view.planes
+    data['camera_position'] = tuple(view.camera_position)
+    data['tan_half_fov'] = view.tan_half_fov
+    thresholds = lod_thresholds[:MAX_LOD_THRESHOLDS]
+    data['lod_thresholds'] = 0.0
+    data['lod_thresholds'][:len(thresholds)] = thresholds
+    data['items_count'] = self.items_count
+    data['commands_count'] = self.commands_count
+    data['screen_height'] = view.screen_height
+    _cull_buffer_write(state, self.data_buffer, self.data)
+
+    # -- Counts of commands and stats are reset
+    g.glCopyNamedBufferSubData(
+        self.commands_template.buffer, self.commands.buffer,
+        0, 0, self.commands_count * DRAW_COMMAND_DTYPE.itemsize,
+    )
+    g.glClearNamedBufferData(
+        self.stats.buffer, g.GL_R32UI, g.GL_RED_INTEGER,
+        g.GL_UNSIGNED_INT, None,
+    )
+
+    state_bind_buffer_range(
+        state, g.GL_UNIFORM_BUFFER, _DATA_BINDING,
+        self.data_buffer.buffer, 0, self.data.nbytes,
+    )
+    for binding, buffer in (
+        (_ITEMS_BINDING, self.items),
+        (_ITEM_COMMANDS_BINDING, self.item_commands),
+        (_COMMANDS_BINDING, self.commands),
+        (_DECISIONS_BINDING, self.decisions),
+        (_STATS_BINDING, self.stats),
+        (_INSTANCES_BINDING, self.instances),
+    ):
+        state_bind_buffer_range(
+            state, g.GL_SHADER_STORAGE_BUFFER, binding,
+            buffer.buffer, 0, buffer.size,
+        )
+
+    # -- Stages, each one reads results of previous one
+    state_use_program(state, self.program)
+    groups = ceil(self.items_count / _WORKGROUP_SIZE)
+
+    for stage, groups_count in (
+        (_STAGE_CLASSIFY, groups),
+        (_STAGE_SCAN, 1),
+        (_STAGE_WRITE, groups),
+    ):
+        state_set_uniform(state, self.stage, stage)
+        g.glDispatchCompute(groups_count, 1, 1)
+        g.glMemoryBarrier(g.GL_SHADER_STORAGE_BARRIER_BIT)
+
+    # Commands are read by draws, stats are copied for read back
+    g.glMemoryBarrier(
+        g.GL_COMMAND_BARRIER_BIT | g.GL_BUFFER_UPDATE_BARRIER_BIT
+    )
+    _gpu_cull_read_stats(self)
+
+
+def gpu_cull_poll(self: GpuCuller) -> bool:
+    # -> whether new stats were read back (see `GpuCuller` stats)
+    is_updated = False
+
+    for readback in self.readbacks:
+        if readback.fence is None:
+            continue
+
+        status = g.glClientWaitSync(readback.fence, 0, 0)
+        if status == g.GL_TIMEOUT_EXPIRED:
+            continue
+        if status == g.GL_WAIT_FAILED:
+            raise RuntimeError('Culling stats fence wait failed')
+
+        g.glDeleteSync(readback.fence)
+        readback.fence = None
+
+        # Fences of slots could be signaled out of order
+        if readback.serial < self.stats_serial:
+            continue
+
+        self.stats_serial = readback.serial
+        stats = readback.mapped[:readback.size // 4].copy()
+        self.visible_count = int(stats[0])
+        self.batch_details = stats[1:].view(np.float32)
+        is_updated = True
+
+    return is_updated
+
+
+# -- Buffers
+
+
+def _cull_buffer_reserve(
+    state: GlState,
+    buffer: _CullBuffer,
+    size: int,
+    keep: bool = False,
+) -> None:
+    # Buffer is recreated, if it is smaller than `size`: content is
+    # copied, if `keep`
+    size = max(size, 4)
+    if size <= buffer.size:
+        return
+
+    new_size = max(size, 2 * buffer.size)
+    new_buffer = g.glCreateBuffers(1)
+    g.glNamedBufferStorage(
+        new_buffer, new_size, None, g.GL_DYNAMIC_STORAGE_BIT
+    )
+
+    if buffer.buffer:
+        if keep:
+            g.glCopyNamedBufferSubData(
+                buffer.buffer, new_buffer, 0, 0, buffer.size
+            )
+
+        state_forget_buffer(state, buffer.buffer)
+        g.glDeleteBuffers(1, [buffer.buffer])
+
+    buffer.buffer, buffer.size = new_buffer, new_size
+
+
+def _cull_buffer_write(
+    state: GlState,
+    buffer: _CullBuffer,
+    data: np.ndarray,
+) -> None:
+    _cull_buffer_reserve(state, buffer, data.nbytes)
+    if data.nbytes:
+        g.glNamedBufferSubData(buffer.buffer, 0, data.nbytes, data)
+
+
+def _gpu_cull_read_stats(self: GpuCuller) -> None:
+    # Stats are not read back, if all read backs are in flight
+    self.dispatches += 1
+    size = 4 * (1 + self.batches_count)
+
+    readback = next(
+        (slot for slot in self.readbacks if slot.fence is None), None
+    )
+    if readback is None:
+        if len(self.readbacks) == _READBACK_SLOTS:
+            return
+
+        readback = _StatsReadback(buffer=0, size=0, mapped=None)
+        self.readbacks.append(readback)
+
+    if readback.mapped is None or len(readback.mapped) * 4 < size:
+        _stats_readback_allocate(readback, max(size, 2 * readback.size))
+
+    g.glCopyNamedBufferSubData(
+        self.stats.buffer, readback.buffer, 0, 0, size
+    )
+    readback.size = size
+    readback.serial = self.dispatches
+    readback.fence = g.glFenceSync(g.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+
+def _stats_readback_allocate(readback: _StatsReadback, size: int) -> None:
+    if readback.buffer:
+        g.glUnmapNamedBuffer(readback.buffer)
+        g.glDeleteBuffers(1, [readback.buffer])
+
+    readback.buffer = g.glCreateBuffers(1)
+    g.glNamedBufferStorage(readback.buffer, size, None, _MAP_FLAGS)
+
+    ptr = g.glMapNamedBufferRange(readback.buffer, 0, size, _MAP_FLAGS)
+    if not ptr:
+        raise RuntimeError('Unable to map culling stats buffer')
+
+    readback.mapped = np.ctypeslib.as_array(
+        ctypes.cast(ptr, ctypes.POINTER(ctypes.c_uint32)),
+        shape=(size // 4,),
+    )
@@ -0,0 +1,422 @@
+"""gfx_hiz - Hierarchical Depth Buffer
+
+Depth buffer of drawn frame is copied to texture and reduced by compute
+shader into pyramid of the farthest depths (`shaders/hiz.comp`). Small
+level of pyramid is read back asynchronously (pixel pack buffer guarded
+by fence), so CPU gets it a frame or two later without a stall. The rest
+of pyramid is reduced on CPU and kept with view-projection matrix of
+captured frame, bounds are tested against it (`depth_pyramid_test`).
+
+Bounds are occluded, if their nearest depth is farther than the farthest
+depth of pyramid texels, which cover their screen rectangle.
+"""
+import ctypes
+import logging
+from ctypes import c_void_p
+from dataclasses import dataclass
+from math import ceil
+
+import numpy as np
+from glm import mat4
+from OpenGL import GL as g
+
+from .gfx_state import GlState
+from .gfx_state import state_bind_buffer
+from .gfx_state import state_bind_texture
+from .gfx_state import state_forget_buffer
+from .gfx_state import state_forget_texture
+from .gfx_state import state_set_uniform
+from .gfx_state import state_use_program
+from .gfx_uniform import Uniform
+from .gfx_uniform import UniformType
+from .gfx_uniform import uniform_create
+
+logger = logging.getLogger(__name__)
+
+
+_MAP_FLAGS = (
+    g.GL_MAP_READ_BIT | g.GL_MAP_PERSISTENT_BIT | g.GL_MAP_COHERENT_BIT
+)
+
+# Read backs in flight, frame is not captured if all of them are busy
+_READBACK_SLOTS = 3
+
+_WORKGROUP_SIZE = 8
+
+# Texture unit of pyramid source, shared with object textures (state
+# shadow keeps them consistent)
+_SOURCE_UNIT = 0
+
+
+@dataclass
+class DepthPyramid:
+    # (height, width) max depth levels: level 0 is read back one, every
+    # next is halved (rounded up) down to 1x1
+    levels: list[np.ndarray]
+
+    # All levels in one array (texels are gathered at once) by level
+    # offsets and sizes
+    texels: np.ndarray
+    offsets: np.ndarray
+    widths: np.ndarray
+    heights: np.ndarray
+    steps: np.ndarray  # level texels per texel of level 0
+
+    # Framebuffer size and its pixels per texel of level 0
+    width: int
+    height: int
+    scale: int
+
+    # Frame, which depth was captured from
+    m_view_persp: mat4
+    frame: int
+
+
+@dataclass
+class _Readback:
+    buffer: int
+    mapped: np.ndarray  # (height, width) float32 of persistent mapping
+
+    fence: int | None = None
+    m_view_persp: mat4 | None = None
+    frame: int = 0
+
+
+@dataclass
+class HiZBuffer:
+    program: int
+    source_level: Uniform
+
+    width: int
+    height: int
+    readback_width: int
+
+    # Copy of depth buffer and its pyramid on GPU: level 0 is half size,
+    # the last level is read back
+    depth_texture: int = 0
+    pyramid_texture: int = 0
+    levels_count: int = 0
+
+    readbacks: list[_Readback] | None = None
+
+    # The latest read back pyramid, `None` until the first one is ready
+    pyramid: DepthPyramid | None = None
+
+    # -- Stats
+    captures: int = 0
+    skipped: int = 0  # all read backs were in flight
+
+
+def hiz_create(
+    program: int,
+    width: int,
+    height: int,
+    readback_width: int,
+) -> HiZBuffer:
+    # program: of `shaders/hiz.comp`
+    self = HiZBuffer(
+        program=program,
+        source_level=uniform_create(
+            program, 'source_level', UniformType.int
+        ),
+        width=width,
+        height=height,
+        readback_width=readback_width,
+    )
+    _hiz_create_targets(self)
+
+    return self
+
+
+def hiz_destroy(self: HiZBuffer, state: GlState) -> None:
+    for readback in self.readbacks:
+        if readback.fence is not None:
+            g.glDeleteSync(readback.fence)
+
+        state_forget_buffer(state, readback.buffer)
+        g.glUnmapNamedBuffer(readback.buffer)
+        g.glDeleteBuffers(1, [readback.buffer])
+
+    for texture in (self.depth_texture, self.pyramid_texture):
+        state_forget_texture(state, texture)
+    g.glDeleteTextures(2, [self.depth_texture, self.pyramid_texture])
+
+    self.readbacks = None
+    self.pyramid = None
+
+
+def hiz_resize(
+    self: HiZBuffer,
+    state: GlState,
+    width: int,
+    height: int,
+) -> None:
+    # Pyramids of old size are dropped
+    hiz_destroy(self, state)
+
+    self.width, self.height = width, height
+    _hiz_create_targets(self)
+
+
+def hiz_capture(
+    self: HiZBuffer,
+    state: GlState,
+    m_view_persp: mat4,
+    frame: int,
+) -> None:
+    """Build depth pyramid of drawn frame and start its read back,
+    should be called after draws of frame (before foreign ones)
+    """
+    readback = next(
+        (slot for slot in self.readbacks if slot.fence is None), None
+    )
+    if readback is None:
+        self.skipped += 1
+        return
+
+    # Depth of read framebuffer (default one)
+    g.glCopyTextureSubImage2D(
+        self.depth_texture, 0, 0, 0, 0, 0, self.width, self.height
+    )
+
+    state_use_program(state, self.program)
+    width, height = self.width, self.height
+
+    for level in range(self.levels_count):
+        if level == 0:
+            source, source_level = self.depth_texture, 0
+        else:
+            source, source_level = self.pyramid_texture, level - 1
+
+        width, height = max(1, width >> 1), max(1, height >> 1)
+
+        state_bind_texture(state, _SOURCE_UNIT, g.GL_TEXTURE_2D, source)
+        state_set_uniform(state, self.source_level, source_level)
+        g.glBindImageTexture(
+            0, self.pyramid_texture, level,
+            g.GL_FALSE, 0, g.GL_WRITE_ONLY, g.GL_R32F,
+        )
+        g.glDispatchCompute(
+            ceil(width / _WORKGROUP_SIZE), ceil(height / _WORKGROUP_SIZE), 1
+        )
+        # Level is fetched by the next dispatch or read back
+        g.glMemoryBarrier(
+            g.GL_TEXTURE_FETCH_BARRIER_BIT | g.GL_TEXTURE_UPDATE_BARRIER_BIT
+        )
+
+    state_bind_buffer(state, g.GL_PIXEL_PACK_BUFFER, readback.buffer)
+    g.glGetTextureImage(
+        self.pyramid_texture, self.levels_count - 1,
+        g.GL_RED, g.GL_FLOAT, readback.mapped.nbytes, c_void_p(0),
+    )
+    # Pack buffer would redirect reads of foreign code
+    state_bind_buffer(state, g.GL_PIXEL_PACK_BUFFER, 0)
+
+    readback.fence = g.glFenceSync(g.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+    readback.m_view_persp = mat4(m_view_persp)
+    readback.frame = frame
+    self.captures += 1
+
+
+def hiz_poll(self: HiZBuffer) -> DepthPyramid | None:
+    # -> the latest depth pyramid, which read back is complete
+    for readback in self.readbacks:
+        if readback.fence is None:
+            continue
+
+        status = g.glClientWaitSync(readback.fence, 0, 0)
+        if status == g.GL_TIMEOUT_EXPIRED:
+            continue
+        if status == g.GL_WAIT_FAILED:
+            raise RuntimeError('Depth read back fence wait failed')
+
+        g.glDeleteSync(readback.fence)
+        readback.fence = None
+
+        if self.pyramid is not None and self.pyramid.frame > readback.frame:
+            continue
+
+        levels = _hiz_reduce_levels(readback.mapped.copy())
+        sizes = np.array([level.size for level in levels])
+
+        self.pyramid = DepthPyramid(
+            levels=levels,
+            texels=np.concatenate([level.ravel() for level in levels]),
+            offsets=np.cumsum(sizes) - sizes,
+            widths=np.array([level.shape[1] for level in levels]),
+            heights=np.array([level.shape[0] for level in levels]),
+            steps=np.ldexp(np.float32(1.0), -np.arange(len(levels))),
+            width=self.width,
+            height=self.height,
+            scale=2 ** self.levels_count,
+            m_view_persp=readback.m_view_persp,
+            frame=readback.frame,
+        )
+
+    return self.pyramid
+
+
+def depth_pyramid_test(
+    self: DepthPyramid,
+    centers: np.ndarray,
+    extents: np.ndarray,
+) -> np.ndarray:
+    """-> mask of occluded bounds
+
+    centers, extents: (3, n) world space AABBs
+
+    Bounds are visible (conservatively), if they are not entirely inside
+    of captured view (part of them was not rendered) or cross near plane
+    """
+    # -- Clip space bounds of AABB: linear, so exact by interval math
+    m = np.frombuffer(self.m_view_persp.to_bytes(), dtype=np.float32)
+    m = m.reshape(4, 4).T
+
+    clip = m[:, :3] @ centers
+    clip += m[:, 3:]
+    reach = np.abs(m[:, :3]) @ extents
+    lo, hi = clip - reach, clip + reach
+
+    # Division by w keeps order for bounds in front of camera only
+    is_front = lo[3] > 1e-6
+    inv_lo = 1.0 / np.maximum(lo[3], 1e-6)
+    inv_hi = 1.0 / np.maximum(hi[3], 1e-6)
+
+    # Extremes are at corners of intervals
+    x0 = np.minimum(lo[0] * inv_lo, lo[0] * inv_hi)
+    x1 = np.maximum(hi[0] * inv_lo, hi[0] * inv_hi)
+    y0 = np.minimum(lo[1] * inv_lo, lo[1] * inv_hi)
+    y1 = np.maximum(hi[1] * inv_lo, hi[1] * inv_hi)
+
+    # Perspective depth is function of w (clip z = a * w + b): interval
+    # of z would lose too much precision
+    a = m[2, :3] @ m[3, :3] / (m[3, :3] @ m[3, :3])
+    b = m[2, 3] - a * m[3, 3]
+    z0 = np.minimum(a + b * inv_lo, a + b * inv_hi)
+
+    occluded = np.zeros(len(is_front), dtype=bool)
+    index = np.flatnonzero(
+        is_front
+        & (x0 >= -1.0) & (x1 <= 1.0) & (y0 >= -1.0) & (y1 <= 1.0)
+        & (z0 >= -1.0)
+    )
+    x0, x1, y0, y1, z0 = (
+        x0[index], x1[index], y0[index], y1[index], z0[index]
+    )
+
+    # -- Rectangle in texels of level 0 (texture rows are bottom up)
+    scale_x = np.float32(0.5 * self.width / self.scale)
+    scale_y = np.float32(0.5 * self.height / self.scale)
+    u0, u1 = (x0 + 1.0) * scale_x, (x1 + 1.0) * scale_x
+    v0, v1 = (y0 + 1.0) * scale_y, (y1 + 1.0) * scale_y
+
+    # Level, where rectangle is at most texel wide, so it is covered by
+    # 2x2 texels
+    size = np.maximum(np.maximum(u1 - u0, v1 - v0), 1.0)
+    levels = np.minimum(
+        np.ceil(np.log2(size)), len(self.levels) - 1
+    ).astype(np.intp)
+
+    step = self.steps[levels]
+    widths, heights = self.widths[levels], self.heights[levels]
+
+    # Clamped: the last texel covers the rest of level 0
+    tx0 = np.minimum((u0 * step).astype(np.intp), widths - 1)
+    tx1 = np.minimum((u1 * step).astype(np.intp), widths - 1)
+    ty0 = np.minimum((v0 * step).astype(np.intp), heights - 1)
+    ty1 = np.minimum((v1 * step).astype(np.intp), heights - 1)
+
+    rows0 = self.offsets[levels] + ty0 * widths
+    rows1 = self.offsets[levels] + ty1 * widths
+    texels = self.texels
+
+    farthest = np.maximum(
+        np.maximum(texels[rows0 + tx0], texels[rows0 + tx1]),
+        np.maximum(texels[rows1 + tx0], texels[rows1 + tx1]),
+    )
+    occluded[index] = z0 * 0.5 + 0.5 > farthest
+
+    return occluded
+
+
+def _hiz_create_targets(self: HiZBuffer) -> None:
+    width, height = self.width, self.height
+
+    # -- GPU levels down to the first one, which fits read back width
+    levels_count = 1
+    level_width, level_height = max(1, width >> 1), max(1, height >> 1)
+
+    while level_width > self.readback_width:
+        level_width, level_height = (
+            max(1, level_width >> 1), max(1, level_height >> 1)
+        )
+        levels_count += 1
+
+    self.levels_count = levels_count
+
+    # Direct state access, so bindings (and their shadow) are intact
+    self.depth_texture = _hiz_create_texture(
+        1, g.GL_DEPTH_COMPONENT32F, width, height
+    )
+    self.pyramid_texture = _hiz_create_texture(
+        levels_count, g.GL_R32F, max(1, width >> 1), max(1, height >> 1)
+    )
+
+    # -- Persistently mapped read back buffers
+    size = level_width * level_height * 4
+    self.readbacks = []
+
+    for _ in range(_READBACK_SLOTS):
+        buffer = g.glCreateBuffers(1)
+        g.glNamedBufferStorage(buffer, size, None, _MAP_FLAGS)
+
+        ptr = g.glMapNamedBufferRange(buffer, 0, size, _MAP_FLAGS)
+        if not ptr:
+            raise RuntimeError('Unable to map depth read back buffer')
+
+        mapped = np.ctypeslib.as_array(
+            ctypes.cast(ptr, ctypes.POINTER(ctypes.c_float)),
+            shape=(level_height, level_width),
+        )
+        self.readbacks.append(_Readback(buffer=buffer, mapped=mapped))
+
+    logger.debug(
+        f'Depth pyramid: {levels_count} GPU levels, '
+        f'read back {level_width}x{level_height}'
+    )
+
+
+def _hiz_create_texture(
+    levels_count: int,
+    internal_format: int,
+    width: int,
+    height: int,
+) -> int:
+    texture = g.glCreateTextures(g.GL_TEXTURE_2D, 1)
+    g.glTextureStorage2D(texture, levels_count, internal_format, width, height)
+
+    # Texels are fetched, not filtered
+    for name, value in (
+        (g.GL_TEXTURE_MIN_FILTER, g.GL_NEAREST),
+        (g.GL_TEXTURE_MAG_FILTER, g.GL_NEAREST),
+        (g.GL_TEXTURE_WRAP_S, g.GL_CLAMP_TO_EDGE),
+        (g.GL_TEXTURE_WRAP_T, g.GL_CLAMP_TO_EDGE),
+    ):
+        g.glTextureParameteri(texture, name, value)
+
+    return texture
+
+
+def _hiz_reduce_levels(base: np.ndarray) -> list[np.ndarray]:
+    # Odd edge is repeated, so every texel covers 2x2 texels
+    levels = [base]
+
+    while base.shape != (1, 1):
+        height, width = base.shape
+        padded = np.pad(base, ((0, height & 1), (0, width & 1)), mode='edge')
+        base = padded.reshape(
+            padded.shape[0] // 2, 2, padded.shape[1] // 2, 2
+        ).max(axis=(1, 3))
+        levels.append(base)
+
+    return levels
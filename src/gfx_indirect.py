@@ -0,0 +1,150 @@
+"""gfx_indirect - Per-Frame Draw Data Ring
+
+Persistently mapped buffer with a slot per frame in flight. Draw commands
+(`DrawElementsIndirectCommand`) and per-instance data of a frame are
+written into a slot, which then is used as `GL_DRAW_INDIRECT_BUFFER` and
+instance vertex buffer. As in `gfx_upload`, every slot is guarded by
+fence, so CPU never writes data, which GPU is still reading.
+"""
+import ctypes
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from OpenGL import GL as g
+
+logger = logging.getLogger(__name__)
+
+
+DRAW_COMMAND_DTYPE = np.dtype([
+    ('count', '<u4'),
+    ('instance_count', '<u4'),
+    ('first_index', '<u4'),
+    ('base_vertex', '<i4'),
+    ('base_instance', '<u4'),
+])
+
+# Per instance data (`Instance` of shader storage block, std430): model
+# matrix, layer of texture array page (-1 for standalone texture) and
+# index of material table. Shader reads instance by
+# `gl_BaseInstance + gl_InstanceID`
+INSTANCE_DTYPE = np.dtype([
+    ('m_model', '<f4', 16),
+    ('texture_layer', '<i4'),
+    ('material', '<i4'),
+    ('_padding', '<i4', 2),
+])
+
+_MAP_FLAGS = (
+    g.GL_MAP_WRITE_BIT | g.GL_MAP_PERSISTENT_BIT | g.GL_MAP_COHERENT_BIT
+)
+
+_SLOT_ALIGN = 256
+
+_FENCE_TIMEOUT_NS = 1_000_000_000
+
+
+@dataclass
+class DrawRing:
+    buffer: int
+    slot_size: int
+    slots_count: int
+
+    # Mapped buffer memory, valid until `draw_ring_destroy`
+    mapped: np.ndarray | None
+
+    fences: list[int | None]
+    next_slot: int = 0
+
+    # -- Stats
+    stalls: int = 0  # waits for GPU to free slot
+
+
+def draw_ring_create(slot_size: int, slots_count: int) -> DrawRing:
+    slot_size = (slot_size + _SLOT_ALIGN - 1) & ~(_SLOT_ALIGN - 1)
+    size = slot_size * slots_count
+
+    buffer = g.glGenBuffers(1)
+    g.glBindBuffer(g.GL_DRAW_INDIRECT_BUFFER, buffer)
+    g.glBufferStorage(g.GL_DRAW_INDIRECT_BUFFER, size, None, _MAP_FLAGS)
+
+    ptr = g.glMapBufferRange(g.GL_DRAW_INDIRECT_BUFFER, 0, size, _MAP_FLAGS)
+    if not ptr:
+        raise RuntimeError('Unable to map draw data buffer')
+
+    mapped = np.ctypeslib.as_array(
+        ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte)), shape=(size,)
+    )
+    g.glBindBuffer(g.GL_DRAW_INDIRECT_BUFFER, 0)
+
+    logger.debug(f'Draw data ring: {slots_count} x {slot_size} bytes')
+    return DrawRing(
+        buffer=buffer,
+        slot_size=slot_size,
+        slots_count=slots_count,
+        mapped=mapped,
+        fences=[None] * slots_count,
+    )
+
+
+def draw_ring_destroy(self: DrawRing) -> None:
+    for fence in self.fences:
+        if fence is not None:
+            g.glDeleteSync(fence)
+
+    self.mapped = None
+
+    g.glBindBuffer(g.GL_DRAW_INDIRECT_BUFFER, self.buffer)
+    g.glUnmapBuffer(g.GL_DRAW_INDIRECT_BUFFER)
+    g.glBindBuffer(g.GL_DRAW_INDIRECT_BUFFER, 0)
+    g.glDeleteBuffers(1, [self.buffer])
+
+
+def draw_ring_grow(self: DrawRing, size: int) -> DrawRing:
+    # -> new ring with slots for at least `size` bytes
+    new_size = max(size, self.slot_size * 2)
+    logger.info(f'Draw data ring is grown to {new_size} bytes per slot')
+
+    # Buffer could be still in use by GPU
+    g.glFinish()
+    draw_ring_destroy(self)
+
+    return draw_ring_create(new_size, self.slots_count)
+
+
+def draw_ring_begin_frame(self: DrawRing) -> int:
+    # -> offset of acquired slot in buffer
+    fence = self.fences[self.next_slot]
+
+    if fence is not None:
+        status = g.glClientWaitSync(fence, 0, 0)
+
+        if status == g.GL_TIMEOUT_EXPIRED:
+            self.stalls += 1
+
+        while status == g.GL_TIMEOUT_EXPIRED:
+            status = g.glClientWaitSync(
+                fence, g.GL_SYNC_FLUSH_COMMANDS_BIT, _FENCE_TIMEOUT_NS
+            )
+
+        if status == g.GL_WAIT_FAILED:
+            raise RuntimeError('Draw data fence wait failed')
+
+        g.glDeleteSync(fence)
+        self.fences[self.next_slot] = None
+
+    return self.next_slot * self.slot_size
+
+
+def draw_ring_write(self: DrawRing, offset: int, data: np.ndarray) -> None:
+    # offset: in buffer (slot offset + offset in slot)
+    data = data.reshape(-1).view(np.uint8)
+    self.mapped[offset:offset + data.nbytes] = data
+
+
+def draw_ring_end_frame(self: DrawRing) -> None:
+    # Slot is busy until GPU executes draws issued so far
+    self.fences[self.next_slot] = g.glFenceSync(
+        g.GL_SYNC_GPU_COMMANDS_COMPLETE, 0
+    )
+    self.next_slot = (self.next_slot + 1) % self.slots_count
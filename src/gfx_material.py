@@ -0,0 +1,99 @@
+"""gfx_material - Material Table
+
+All materials are stored in one shader storage buffer and draws refer to
+material by index (in per-instance data). So materials never change GL
+state between draws and objects with different materials are still
+drawn as instances of one command.
+"""
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from OpenGL import GL as g
+
+from .gfx_state import GlState
+from .gfx_state import state_forget_buffer
+
+logger = logging.getLogger(__name__)
+
+
+# `Material` of shader storage block, std430 layout
+MATERIAL_DTYPE = np.dtype([
+    ('ambient', '<f4', 4),
+    ('diffuse', '<f4', 4),
+    ('specular', '<f4', 4),
+    ('metallic', '<f4'),
+    ('_padding', '<f4', 3),
+])
+
+MATERIALS_BINDING = 2
+
+_INITIAL_CAPACITY = 16
+
+
+@dataclass
+class MaterialTable:
+    # CPU copy of table, first `count` records are used
+    data: np.ndarray
+    count: int = 0
+
+    # Created on first upload, recreated when table is grown
+    buffer: int = 0
+    buffer_capacity: int = 0
+    is_dirty: bool = False
+
+
+def material_table_create() -> MaterialTable:
+    return MaterialTable(
+        data=np.zeros(_INITIAL_CAPACITY, dtype=MATERIAL_DTYPE)
+    )
+
+
+def material_table_destroy(self: MaterialTable, state: GlState) -> None:
+    if self.buffer:
+        state_forget_buffer(state, self.buffer)
+        g.glDeleteBuffers(1, [self.buffer])
+        self.buffer = 0
+
+
+def material_table_add(
+    self: MaterialTable,
+    ambient: tuple,
+    diffuse: tuple,
+    specular: tuple,
+    metallic: float,
+) -> int:
+    # -> index of material in table
+    if self.count == len(self.data):
+        self.data = np.concatenate([
+            self.data, np.zeros(len(self.data), dtype=MATERIAL_DTYPE)
+        ])
+
+    index = self.count
+    self.data[index] = (ambient, diffuse, specular, metallic, 0.0)
+    self.count += 1
+    self.is_dirty = True
+
+    return index
+
+
+def material_table_upload(self: MaterialTable, state: GlState) -> None:
+    # Should be called before draws of frame
+    if not self.is_dirty:
+        return
+
+    data = self.data[:self.count]
+
+    if self.count > self.buffer_capacity:
+        material_table_destroy(self, state)
+
+        self.buffer = g.glCreateBuffers(1)
+        g.glNamedBufferStorage(
+            self.buffer, self.data.nbytes, None, g.GL_DYNAMIC_STORAGE_BIT
+        )
+
+        self.buffer_capacity = len(self.data)
+        logger.debug(f'Material table: {self.buffer_capacity} materials')
+
+    g.glNamedBufferSubData(self.buffer, 0, data.nbytes, data)
+    self.is_dirty = False
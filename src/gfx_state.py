@@ -0,0 +1,258 @@
+"""gfx_state - GL State Shadowing
+
+Last set GL state is kept on CPU side, so calls, which would not change
+anything, are skipped. Shadow is valid only while state is changed
+through this module: after foreign GL code (GUI renderer) or raw binds
+`state_invalidate` should be called, so the next calls are issued.
+
+Unknown state is `None`, it never matches a requested one.
+"""
+from dataclasses import dataclass
+from dataclasses import field
+
+from OpenGL import GL as g
+
+from .gfx_uniform import Uniform
+from .gfx_uniform import UniformData
+from .gfx_uniform import uniform_set
+
+
+@dataclass
+class GlState:
+    program: int | None = None
+    vertex_array: int | None = None
+    active_unit: int | None = None
+    front_face: int | None = None
+    clear_color: tuple | None = None
+
+    # target -> buffer
+    buffers: dict[int, int] = field(default_factory=dict)
+    # (target, index) -> (buffer, offset, size)
+    buffer_ranges: dict[tuple[int, int], tuple[int, int, int]] = field(
+        default_factory=dict
+    )
+    # (unit, target) -> texture
+    textures: dict[tuple[int, int], int] = field(default_factory=dict)
+    # capability -> is enabled
+    caps: dict[int, bool] = field(default_factory=dict)
+
+    # Buffers attached to vertex arrays (part of vertex array object, so
+    # they are not changed by foreign code, which uses its own ones):
+    #   (vertex array, binding) -> (buffer, offset, stride)
+    vertex_buffers: dict[tuple[int, int], tuple[int, int, int]] = field(
+        default_factory=dict
+    )
+    # vertex array -> element buffer
+    element_buffers: dict[int, int] = field(default_factory=dict)
+
+    # -- Stats, of current and last frames
+    issued: int = 0
+    elided: int = 0
+    frame_issued: int = 0
+    frame_elided: int = 0
+
+
+def state_create() -> GlState:
+    return GlState()
+
+
+def state_begin_frame(self: GlState) -> None:
+    self.frame_issued, self.frame_elided = self.issued, self.elided
+    self.issued = self.elided = 0
+
+
+def state_invalidate(self: GlState) -> None:
+    # Context state is unknown from now, objects state is kept
+    self.program = None
+    self.vertex_array = None
+    self.active_unit = None
+    self.front_face = None
+    self.clear_color = None
+
+    self.buffers.clear()
+    self.buffer_ranges.clear()
+    self.textures.clear()
+    self.caps.clear()
+
+
+def state_use_program(self: GlState, program: int) -> None:
+    if self.program == program:
+        self.elided += 1
+        return
+
+    g.glUseProgram(program)
+    self.program = program
+    self.issued += 1
+
+
+def state_bind_vertex_array(self: GlState, vertex_array: int) -> None:
+    if self.vertex_array == vertex_array:
+        self.elided += 1
+        return
+
+    g.glBindVertexArray(vertex_array)
+    self.vertex_array = vertex_array
+    self.issued += 1
+
+
+def state_bind_buffer(self: GlState, target: int, buffer: int) -> None:
+    if self.buffers.get(target) == buffer:
+        self.elided += 1
+        return
+
+    g.glBindBuffer(target, buffer)
+    self.buffers[target] = buffer
+    self.issued += 1
+
+
+def state_active_texture(self: GlState, unit: int) -> None:
+    if self.active_unit == unit:
+        self.elided += 1
+        return
+
+    g.glActiveTexture(g.GL_TEXTURE0 + unit)
+    self.active_unit = unit
+    self.issued += 1
+
+
+def state_bind_texture(
+    self: GlState,
+    unit: int,
+    target: int,
+    texture: int,
+) -> None:
+    # Unit is not activated, if texture is bound already (see
+    # `state_active_texture` to edit bound texture)
+    if self.textures.get((unit, target)) == texture:
+        self.elided += 1
+        return
+
+    state_active_texture(self, unit)
+    g.glBindTexture(target, texture)
+    self.textures[(unit, target)] = texture
+    self.issued += 1
+
+
+def state_forget_texture(self: GlState, texture: int) -> None:
+    # Deleted texture is unbound from all units, its ID could be reused
+    for key, bound in list(self.textures.items()):
+        if bound == texture:
+            self.textures[key] = 0
+
+
+def state_bind_buffer_range(
+    self: GlState,
+    target: int,
+    index: int,
+    buffer: int,
+    offset: int,
+    size: int,
+) -> None:
+    # Indexed binding (uniform, shader storage buffers)
+    binding = (buffer, offset, size)
+    if self.buffer_ranges.get((target, index)) == binding:
+        self.elided += 1
+        return
+
+    g.glBindBufferRange(target, index, buffer, offset, size)
+    self.buffer_ranges[(target, index)] = binding
+    self.issued += 1
+
+
+def state_forget_buffer(self: GlState, buffer: int) -> None:
+    # Should be called before buffer is deleted: its ID could be reused,
+    # while vertex arrays still reference the deleted buffer
+    # Bindings are either buffers or tuples, which start with buffer
+    for bindings in (
+        self.buffers,
+        self.buffer_ranges,
+        self.vertex_buffers,
+        self.element_buffers,
+    ):
+        for key, binding in list(bindings.items()):
+            if binding == buffer or (
+                isinstance(binding, tuple) and binding[0] == buffer
+            ):
+                del bindings[key]
+
+
+def state_front_face(self: GlState, mode: int) -> None:
+    if self.front_face == mode:
+        self.elided += 1
+        return
+
+    g.glFrontFace(mode)
+    self.front_face = mode
+    self.issued += 1
+
+
+def state_set_enabled(self: GlState, cap: int, is_enabled: bool) -> None:
+    if self.caps.get(cap) == is_enabled:
+        self.elided += 1
+        return
+
+    if is_enabled:
+        g.glEnable(cap)
+    else:
+        g.glDisable(cap)
+
+    self.caps[cap] = is_enabled
+    self.issued += 1
+
+
+def state_clear_color(self: GlState, color: tuple) -> None:
+    color = tuple(color)
+    if self.clear_color == color:
+        self.elided += 1
+        return
+
+    g.glClearColor(*color)
+    self.clear_color = color
+    self.issued += 1
+
+
+def state_vertex_buffer(
+    self: GlState,
+    vertex_array: int,
+    binding: int,
+    buffer: int,
+    offset: int,
+    stride: int,
+) -> None:
+    attachment = (buffer, offset, stride)
+    if self.vertex_buffers.get((vertex_array, binding)) == attachment:
+        self.elided += 1
+        return
+
+    g.glVertexArrayVertexBuffer(vertex_array, binding, buffer, offset, stride)
+    self.vertex_buffers[(vertex_array, binding)] = attachment
+    self.issued += 1
+
+
+def state_element_buffer(
+    self: GlState,
+    vertex_array: int,
+    buffer: int,
+) -> None:
+    if self.element_buffers.get(vertex_array) == buffer:
+        self.elided += 1
+        return
+
+    g.glVertexArrayElementBuffer(vertex_array, buffer)
+    self.element_buffers[vertex_array] = buffer
+    self.issued += 1
+
+
+def state_set_uniform(
+    self: GlState,
+    uniform: Uniform,
+    data: UniformData,
+) -> None:
+    # Uniform values are state of program, so they are compared with
+    # the last value set in `uniform.data`
+    if uniform.data is not None and uniform.data == data:
+        self.elided += 1
+        return
+
+    uniform_set(uniform, data)
+    self.issued += 1
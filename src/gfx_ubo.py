@@ -0,0 +1,86 @@
+"""gfx_ubo - Frame Uniform Block
+
+std140 uniform block of data, which is shared by all draws of a frame
+(camera, light). New values are compared with CPU copy of the block, so
+buffer is uploaded at most once per frame and only if anything changed.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from glm import mat4
+from glm import vec3
+from OpenGL import GL as g
+
+# `FrameData` block of shaders, std140 layout: vec3 is aligned as vec4,
+# so it is followed by float
+FRAME_DTYPE = np.dtype([
+    ('m_persp', '<f4', 16),
+    ('m_view', '<f4', 16),
+    ('light_color', '<f4', 3),
+    ('light_ambient_intensity', '<f4'),
+    ('light_direction', '<f4', 3),
+    ('light_diffuse_intensity', '<f4'),
+])
+
+FRAME_BINDING = 0
+
+
+@dataclass
+class FrameBlock:
+    buffer: int
+
+    # CPU copy of block (single record of `FRAME_DTYPE`)
+    data: np.ndarray
+    is_dirty: bool = True
+
+    # -- Stats
+    uploads: int = 0
+
+
+def frame_block_create() -> FrameBlock:
+    data = np.zeros(1, dtype=FRAME_DTYPE)
+
+    buffer = g.glGenBuffers(1)
+    g.glBindBuffer(g.GL_UNIFORM_BUFFER, buffer)
+    g.glBufferStorage(
+        g.GL_UNIFORM_BUFFER, data.nbytes, data, g.GL_DYNAMIC_STORAGE_BIT
+    )
+    g.glBindBuffer(g.GL_UNIFORM_BUFFER, 0)
+
+    # Binding point is never used by other buffers
+    g.glBindBufferBase(g.GL_UNIFORM_BUFFER, FRAME_BINDING, buffer)
+
+    return FrameBlock(buffer=buffer, data=data)
+
+
+def frame_block_destroy(self: FrameBlock) -> None:
+    g.glDeleteBuffers(1, [self.buffer])
+
+
+def frame_block_set(
+    self: FrameBlock,
+    name: str,
+    value: mat4 | vec3 | float,
+) -> None:
+    # mat4 bytes are column-major, as std140 expects
+    if isinstance(value, mat4):
+        value = np.frombuffer(value.to_bytes(), dtype=np.float32)
+    elif isinstance(value, vec3):
+        value = tuple(value)
+
+    field = self.data[name]
+    if np.array_equal(field[0], value):
+        return
+
+    field[0] = value
+    self.is_dirty = True
+
+
+def frame_block_upload(self: FrameBlock) -> None:
+    # Should be called before draws of frame
+    if not self.is_dirty:
+        return
+
+    g.glNamedBufferSubData(self.buffer, 0, self.data.nbytes, self.data)
+    self.is_dirty = False
+    self.uploads += 1
@@ -42,34 +42,29 @@ def uniform_create(program: int, name: str, type: UniformType) -> Uniform:
 
 
 def uniform_set(uniform: Uniform, data: UniformData) -> None:
-    match uniform.type:
-        case UniformType.bool:
-            assert isinstance(data, bool)
-            g.glUniform1i(uniform.id, int(data))
-
-        case UniformType.int:
-            assert isinstance(data, int)
-            g.glUniform1i(uniform.id, data)
-
-        case UniformType.float:
-            assert isinstance(data, float)
-            g.glUniform1f(uniform.id, data)
-
-        case UniformType.vec2:
-            assert isinstance(data, vec2)
-            g.glUniform2f(uniform.id, *tuple(data))
-
-        case UniformType.vec3:
-            assert isinstance(data, vec3)
-            g.glUniform3f(uniform.id, *tuple(data))
-
-        case UniformType.vec4:
-            assert isinstance(data, vec4)
-            g.glUniform4f(uniform.id, *tuple(data))
-
-        case UniformType.mat4:
-            assert isinstance(data, mat4)
-            g.glUniformMatrix4fv(uniform.id, 1, g.GL_FALSE, value_ptr(data))
-
-        case _:
-            raise ValueError
+    # Data type is not checked, see `UniformType`
+    _UNIFORM_SETTERS[uniform.type](uniform.id, data)
+
+    # Copy, as glm values are mutable
+    if not isinstance(data, _SCALAR_TYPES):
+        data = type(data)(data)
+    uniform.data = data
+
+
+_UNIFORM_SETTERS: dict[UniformType, t.Callable[[int, UniformData], None]] = {
+    UniformType.bool: lambda id, data: g.glUniform1i(id, int(data)),
+    UniformType.int: g.glUniform1i,
+    UniformType.float: g.glUniform1f,
+    UniformType.vec2: lambda id, data: g.glUniform2f(id, data.x, data.y),
+    UniformType.vec3: lambda id, data: g.glUniform3f(
+        id, data.x, data.y, data.z
+    ),
+    UniformType.vec4: lambda id, data: g.glUniform4f(
+        id, data.x, data.y, data.z, data.w
+    ),
+    UniformType.mat4: lambda id, data: g.glUniformMatrix4fv(
+        id, 1, g.GL_FALSE, value_ptr(data)
+    ),
+}
+
+_SCALAR_TYPES = (bool, int, float)
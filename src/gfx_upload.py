@@ -0,0 +1,229 @@
+"""gfx_upload - Asynchronous Texture Upload
+
+Ring of slots in one persistently mapped pixel unpack buffer (PBO).
+Pixels are copied into a free slot and `glTexSubImage2D` is sourced from
+it, so the call returns immediately and GPU copies data, while CPU goes
+on with the next texture. Every slot is guarded by fence: slot is reused
+only when GPU has finished reading from it.
+
+Buffer is created and mapped by DSA calls, the only bind is of
+`GL_PIXEL_UNPACK_BUFFER` for texture copies, which goes through GL state
+shadow and is reset after every upload (pixel calls with client memory
+pointers would read from bound PBO otherwise).
+"""
+import ctypes
+import logging
+import typing as t
+from ctypes import c_void_p
+from dataclasses import dataclass
+
+import numpy as np
+from OpenGL import GL as g
+
+from .gfx_state import GlState
+from .gfx_state import state_bind_buffer
+from .gfx_state import state_forget_buffer
+
+logger = logging.getLogger(__name__)
+
+
+_MAP_FLAGS = (
+    g.GL_MAP_WRITE_BIT | g.GL_MAP_PERSISTENT_BIT | g.GL_MAP_COHERENT_BIT
+)
+
+# Slots are aligned for fast DMA transfers
+_SLOT_ALIGN = 256
+
+_FENCE_TIMEOUT_NS = 1_000_000_000
+
+
+@dataclass
+class UploadRing:
+    pbo: int
+    slot_size: int
+    slots_count: int
+
+    # Mapped PBO memory, valid until `upload_ring_destroy`
+    mapped: np.ndarray | None
+
+    fences: list[int | None]
+    next_slot: int = 0
+
+    # -- Stats
+    uploaded_bytes: int = 0
+    stalls: int = 0  # waits for GPU to free slot
+
+
+def upload_ring_create(slot_size: int, slots_count: int) -> UploadRing:
+    slot_size = (slot_size + _SLOT_ALIGN - 1) & ~(_SLOT_ALIGN - 1)
+    size = slot_size * slots_count
+
+    pbo = g.glCreateBuffers(1)
+    g.glNamedBufferStorage(pbo, size, None, _MAP_FLAGS)
+
+    ptr = g.glMapNamedBufferRange(pbo, 0, size, _MAP_FLAGS)
+    if not ptr:
+        raise RuntimeError('Unable to map texture upload buffer')
+
+    mapped = np.ctypeslib.as_array(
+        ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte)), shape=(size,)
+    )
+
+    logger.debug(f'Texture upload ring: {slots_count} x {slot_size} bytes')
+    return UploadRing(
+        pbo=pbo,
+        slot_size=slot_size,
+        slots_count=slots_count,
+        mapped=mapped,
+        fences=[None] * slots_count,
+    )
+
+
+def upload_ring_destroy(self: UploadRing, state: GlState) -> None:
+    for fence in self.fences:
+        if fence is not None:
+            g.glDeleteSync(fence)
+
+    self.mapped = None
+
+    state_forget_buffer(state, self.pbo)
+    g.glUnmapNamedBuffer(self.pbo)
+    g.glDeleteBuffers(1, [self.pbo])
+
+
+def upload_ring_write_texture(
+    self: UploadRing,
+    state: GlState,
+    level: int,
+    pixels: np.ndarray,
+    format: int,
+    layer: int = -1,
+) -> None:
+    """Upload mip level of texture, which is bound to `GL_TEXTURE_2D`
+    (or layer of `GL_TEXTURE_2D_ARRAY` texture)
+
+    Level is split into bands of rows, which fit into ring slot
+    """
+    width = pixels.shape[1]
+
+    def upload(y: int, rows: int, offset: int, size: int) -> None:
+        if layer < 0:
+            g.glTexSubImage2D(
+                g.GL_TEXTURE_2D, level,
+                0, y, width, rows,
+                format, g.GL_UNSIGNED_BYTE,
+                c_void_p(offset),
+            )
+        else:
+            g.glTexSubImage3D(
+                g.GL_TEXTURE_2D_ARRAY, level,
+                0, y, layer, width, rows, 1,
+                format, g.GL_UNSIGNED_BYTE,
+                c_void_p(offset),
+            )
+
+    _upload_ring_write_rows(self, state, pixels, upload)
+
+
+def upload_ring_write_compressed(
+    self: UploadRing,
+    state: GlState,
+    level: int,
+    blocks: np.ndarray,
+    width: int,
+    height: int,
+    format: int,
+    layer: int = -1,
+) -> None:
+    """Same as `upload_ring_write_texture` for block compressed level
+
+    blocks: (blocks height, blocks width, block bytes) array, bands are
+    rows of 4x4 blocks
+    """
+    def upload(block_y: int, rows: int, offset: int, size: int) -> None:
+        y = block_y * 4
+        band_height = min(rows * 4, height - y)
+
+        if layer < 0:
+            g.glCompressedTexSubImage2D(
+                g.GL_TEXTURE_2D, level,
+                0, y, width, band_height,
+                format, size,
+                c_void_p(offset),
+            )
+        else:
+            g.glCompressedTexSubImage3D(
+                g.GL_TEXTURE_2D_ARRAY, level,
+                0, y, layer, width, band_height, 1,
+                format, size,
+                c_void_p(offset),
+            )
+
+    _upload_ring_write_rows(self, state, blocks, upload)
+
+
+def _upload_ring_write_rows(
+    self: UploadRing,
+    state: GlState,
+    rows: np.ndarray,
+    upload: t.Callable[[int, int, int, int], None],
+) -> None:
+    # Rows are copied by bands into slots, `upload(first row, rows count,
+    # slot offset, band size)` issues GL copy from the bound PBO
+    row_size = rows[0].nbytes
+    rows_per_slot = self.slot_size // row_size
+
+    if not rows_per_slot:
+        raise ValueError(
+            f'Texture row ({row_size} bytes) does not fit into '
+            f'upload slot ({self.slot_size} bytes)'
+        )
+
+    state_bind_buffer(state, g.GL_PIXEL_UNPACK_BUFFER, self.pbo)
+
+    for first in range(0, len(rows), rows_per_slot):
+        band = rows[first:first + rows_per_slot]
+        offset = _upload_ring_acquire(self)
+
+        np.copyto(
+            self.mapped[offset:offset + band.nbytes],
+            band.reshape(-1),
+        )
+        upload(first, len(band), offset, band.nbytes)
+
+        _upload_ring_release(self)
+        self.uploaded_bytes += band.nbytes
+
+    state_bind_buffer(state, g.GL_PIXEL_UNPACK_BUFFER, 0)
+
+
+def _upload_ring_acquire(self: UploadRing) -> int:
+    # -> offset of next free slot
+    fence = self.fences[self.next_slot]
+
+    if fence is not None:
+        status = g.glClientWaitSync(fence, 0, 0)
+
+        if status == g.GL_TIMEOUT_EXPIRED:
+            self.stalls += 1
+
+        while status == g.GL_TIMEOUT_EXPIRED:
+            status = g.glClientWaitSync(
+                fence, g.GL_SYNC_FLUSH_COMMANDS_BIT, _FENCE_TIMEOUT_NS
+            )
+
+        if status == g.GL_WAIT_FAILED:
+            raise RuntimeError('Texture upload fence wait failed')
+
+        g.glDeleteSync(fence)
+        self.fences[self.next_slot] = None
+
+    return self.next_slot * self.slot_size
+
+
+def _upload_ring_release(self: UploadRing) -> None:
+    # Slot is busy until GPU executes commands issued so far
+    self.fences[self.next_slot] = g.glFenceSync(
+        g.GL_SYNC_GPU_COMMANDS_COMPLETE, 0
+    )
+    self.next_slot = (self.next_slot + 1) % self.slots_count
@@ -8,16 +8,27 @@ from imgui.integrations import compute_fb_scale
 from imgui.integrations.opengl import ProgrammablePipelineRenderer
 from pyglfw import libapi as w
 
+from .camera import camera_calc_ray
 from .clock import Clock
+from .gfx import GfxInstance
 from .input_ import KEY_ENTER
 from .input_ import input_is_keypressed
 from .scene import Scene
+from .scene import SceneObject
+from .scene import scene_get_drawn_lod
+from .scene import scene_invalidate_object
+from .scene import scene_pick_object
 from .window import Window
+from .window import window_is_cursor_visible
 
 logger = logging.getLogger(__name__)
 
 gui_renderer: _GuiRenderer
 
+# Object picked in viewport, its node is opened in scene editor
+editor_selected: SceneObject | None = None
+_editor_scroll_to_selected = False
+
 
 GUI_KEYMAP = {
     imgui.KEY_TAB: w.GLFW_KEY_TAB,
@@ -170,10 +181,11 @@ def gui_is_keypressed(key) -> bool:
     return input_is_keypressed(window, key)
 
 
-def gui_on_draw(clock: Clock, scene: Scene) -> None:
+def gui_on_draw(clock: Clock, scene: Scene, gfx: GfxInstance) -> None:
     imgui.new_frame()
 
-    gui_draw_fps_counter(clock)
+    gui_draw_fps_counter(clock, scene, gfx)
+    gui_pick_object(scene)
     gui_draw_scene_editor(scene)
 
     with imgui.font(gui_renderer.font_editor):
@@ -183,7 +195,11 @@ def gui_on_draw(clock: Clock, scene: Scene) -> None:
     gui_renderer.render(imgui.get_draw_data())
 
 
-def gui_draw_fps_counter(clock: Clock) -> None:
+def gui_draw_fps_counter(
+    clock: Clock,
+    scene: Scene,
+    gfx: GfxInstance,
+) -> None:
     imgui.begin('FPS Counter', True, (
         imgui.WINDOW_NO_TITLE_BAR |
         imgui.WINDOW_NO_RESIZE |
@@ -193,10 +209,52 @@ def gui_draw_fps_counter(clock: Clock) -> None:
     with imgui.font(gui_renderer.font_common):
         imgui.text(str(clock.fps))
 
+    queue = scene.render_queue
+    imgui.text(
+        f'Objects: {queue.visible_count} visible '
+        f'({queue.culled_count} culled, {queue.occluded_count} occluded)'
+    )
+
+    portals = scene.portals
+    if portals is not None:
+        imgui.text(
+            f'Cells: {portals.visible_cells_count} of {len(portals.cells)} '
+            f'visible ({portals.visited_portals} portals)'
+        )
+
+    state = gfx.state
+    imgui.text(f'Draw calls: {gfx.draw_calls}')
+    imgui.text(
+        f'GL state calls: {state.frame_issued} '
+        f'(elided {state.frame_elided})'
+    )
+
     imgui.end()
 
 
+def gui_pick_object(scene: Scene) -> None:
+    # Click outside of GUI windows selects object under cursor
+    global editor_selected, _editor_scroll_to_selected
+
+    io = gui_renderer.io
+    if (
+        not window_is_cursor_visible(gui_renderer.window)
+        or io.want_capture_mouse
+        or not imgui.is_mouse_clicked(0)
+    ):
+        return
+
+    x, y = io.mouse_pos
+    width, height = io.display_size
+    origin, direction = camera_calc_ray(x / width, y / height)
+
+    editor_selected = scene_pick_object(scene, origin, direction)
+    _editor_scroll_to_selected = editor_selected is not None
+
+
 def gui_draw_scene_editor(scene: Scene) -> None:
+    global _editor_scroll_to_selected
+
     imgui.begin('Scene', True, (
         imgui.WINDOW_MENU_BAR |
         imgui.WINDOW_NO_MOVE |
@@ -205,29 +263,21 @@ def gui_draw_scene_editor(scene: Scene) -> None:
 
     with imgui.font(gui_renderer.font_editor):
         for obj in scene.objects:
-            node = imgui.tree_node(
-                f'[{obj.id:#05x}] {obj.ptr.id}',
-                imgui.TREE_NODE_BULLET,
-            )
-            if node:
-                imgui.text(f'Object Name: {obj.ptr.name}')
-
-                new, is_active = imgui.checkbox('Active', obj.is_active)
-                if new:
-                    obj.is_active = is_active
-
-                new, pos = imgui.input_float3('Position', *obj.position)
-                if new and gui_is_keypressed(KEY_ENTER):
-                    obj.position = vec3(pos)
+            flags = imgui.TREE_NODE_BULLET
+            is_selected = obj is editor_selected
+            if is_selected:
+                flags |= imgui.TREE_NODE_SELECTED
+                if _editor_scroll_to_selected:
+                    imgui.set_next_item_open(True)
 
-                new, rot = imgui.input_float3('Rotation', *obj.rotation)
-                if new and gui_is_keypressed(KEY_ENTER):
-                    obj.rotation = vec3(rot)
+            node = imgui.tree_node(f'[{obj.id:#05x}] {obj.ptr.id}', flags)
 
-                new, sc = imgui.input_float3('Scale', *obj.scale)
-                if new and gui_is_keypressed(KEY_ENTER):
-                    obj.scale = vec3(sc)
+            if is_selected and _editor_scroll_to_selected:
+                imgui.set_scroll_here_y()
+                _editor_scroll_to_selected = False
 
+            if node:
+                gui_draw_object_properties(scene, obj)
                 imgui.tree_pop()
 
         # imgui.tree_node(
@@ -236,3 +286,36 @@ def gui_draw_scene_editor(scene: Scene) -> None:
         # )
 
     imgui.end()
+
+
+def gui_draw_object_properties(scene: Scene, obj: SceneObject) -> None:
+    imgui.text(f'Object Name: {obj.ptr.name}')
+
+    if obj.is_static:
+        imgui.text(f'Static chunk: {obj.static_key.cell}')
+
+    drawn = scene_get_drawn_lod(scene, obj)
+    if drawn is not None:
+        mesh, level = drawn
+        lod = mesh.gfx_data.lods[level]
+        imgui.text(f'LOD: {level} ({lod.indices_count // 3} triangles)')
+
+    new, is_active = imgui.checkbox('Active', obj.is_active)
+    if new:
+        obj.is_active = is_active
+        scene_invalidate_object(scene, obj)
+
+    new, pos = imgui.input_float3('Position', *obj.position)
+    if new and gui_is_keypressed(KEY_ENTER):
+        obj.position = vec3(pos)
+        scene_invalidate_object(scene, obj)
+
+    new, rot = imgui.input_float3('Rotation', *obj.rotation)
+    if new and gui_is_keypressed(KEY_ENTER):
+        obj.rotation = vec3(rot)
+        scene_invalidate_object(scene, obj)
+
+    new, sc = imgui.input_float3('Scale', *obj.scale)
+    if new and gui_is_keypressed(KEY_ENTER):
+        obj.scale = vec3(sc)
+        scene_invalidate_object(scene, obj)
@@ -1,7 +1,23 @@
+import hashlib
+import itertools
+import os
+import typing as t
+from dataclasses import dataclass
+
 from PIL import Image
 
 from .config import config
 
+HASH_BLOCK_SIZE = 1 << 20
+
+
+@dataclass
+class SourceKey:
+    # Identity of asset source file, cooked cache entries are keyed by it
+    size: int
+    mtime_ns: int
+    hash: bytes
+
 
 def iofs_read_shader_file(filename: str) -> str:
     path = config.SHADERS_DIR + filename
@@ -10,13 +26,73 @@ def iofs_read_shader_file(filename: str) -> str:
         return shader_file.read()
 
 
-def iofs_read_mesh_file(filename: str) -> str:
-    path = config.ASSETS_DIR + 'models/' + filename
+def iofs_get_mesh_path(filename: str) -> str:
+    return config.ASSETS_DIR + 'models/' + filename
+
+
+def iofs_iter_mesh_file(
+    filename: str,
+    chunk_lines: int,
+) -> t.Iterator[list[str]]:
+    # Read text mesh file by chunks of lines, so memory usage
+    # does not depend on file size
+    path = iofs_get_mesh_path(filename)
 
     with open(path, 'r') as asset_file:
-        return asset_file.read()
+        while chunk := list(itertools.islice(asset_file, chunk_lines)):
+            yield chunk
+
+
+def iofs_get_texture_path(filename: str) -> str:
+    return config.ASSETS_DIR + 'textures/' + filename
 
 
 def iofs_read_texture_file(filename: str) -> Image:
-    path = config.ASSETS_DIR + 'textures/' + filename
-    return Image.open(path).transpose(Image.FLIP_TOP_BOTTOM)
+    # NOTE: image is not flipped for OpenGL, it's done by texture cooking
+    return Image.open(iofs_get_texture_path(filename))
+
+
+def iofs_get_cache_path(filename: str) -> str:
+    path = config.CACHE_DIR + filename
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def iofs_hash_file(path: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+
+    return digest.digest()
+
+
+def iofs_source_key(path: str) -> SourceKey:
+    stat = os.stat(path)
+    return SourceKey(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        hash=iofs_hash_file(path),
+    )
+
+
+def iofs_is_source_fresh(path: str, key: SourceKey) -> bool:
+    """Check that source file content is the same as at time of `key`
+
+    Source could be touched without changes (e.g. VCS checkout), then
+    `key.mtime_ns` is updated, so caller could store it back
+    """
+    stat = os.stat(path)
+
+    if stat.st_size != key.size:
+        return False
+
+    if stat.st_mtime_ns == key.mtime_ns:
+        return True
+
+    if iofs_hash_file(path) != key.hash:
+        return False
+
+    key.mtime_ns = stat.st_mtime_ns
+    return True
@@ -1,10 +1,13 @@
 import tomllib
 from dataclasses import dataclass
+from dataclasses import field
 
 from glm import vec3
 
 from .color import GLColor
 from .config import config
+from .portal import CellParams
+from .portal import PortalParams
 
 type ObjectID = str
 
@@ -15,6 +18,9 @@ class SceneObjectParams:
     rotation: vec3
     scale: vec3
 
+    # Never moves, merged into static batch (see `scene_update_objects`)
+    is_static: bool = False
+
 
 @dataclass
 class LightParams:
@@ -34,9 +40,18 @@ class SceneParams:
     lights: list[LightParams]
     camera: CameraDesc
 
+    # Cells and portals of interiors, see `portal`
+    cells: list[CellParams] = field(default_factory=list)
+    portals: list[PortalParams] = field(default_factory=list)
+
+
+def loader_get_scene_path(name: str) -> str:
+    return 'scenes/' + name + '.toml'
 
-def loader_load_scene() -> SceneParams:
-    scene_path = 'scenes/' + config.ROOT_SCENE + '.toml'
+
+def loader_load_scene(name: str | None = None) -> SceneParams:
+    # name: of scene file, root scene of config by default
+    scene_path = loader_get_scene_path(name or config.ROOT_SCENE)
 
     with open(scene_path) as config_f:
         data = tomllib.loads(config_f.read())
@@ -46,6 +61,21 @@ def loader_load_scene() -> SceneParams:
         position=vec3(o['position']),
         rotation=vec3(o['rotation']),
         scale=vec3(o['scale']),
+        is_static=o.get('static', False),
     ) for o in data['object']]
 
-    return SceneParams(objects=objects, lights=[], camera=[])
+    cells = [CellParams(
+        name=c['name'],
+        aabb_min=vec3(c['aabb_min']),
+        aabb_max=vec3(c['aabb_max']),
+        pvs=c.get('pvs'),
+    ) for c in data.get('cell', [])]
+
+    portals = [PortalParams(
+        cells=tuple(p['cells']),
+        points=[vec3(point) for point in p['points']],
+    ) for p in data.get('portal', [])]
+
+    return SceneParams(
+        objects=objects, lights=[], camera=[], cells=cells, portals=portals
+    )
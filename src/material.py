@@ -2,6 +2,8 @@ from dataclasses import dataclass
 
 from glm import vec4
 
+from .db import MaterialID
+
 
 @dataclass
 class Material:
@@ -12,6 +14,15 @@ class Material:
     emission: None = None
 
 
+# Shading by texture only (material adds nothing), for objects without
+# material
+DEFAULT = Material(
+    ambient=vec4(0.0),
+    diffuse=vec4(0.0),
+    specular=vec4(0.0),
+    metallic=0.0,
+)
+
 PEWTER = Material(
     ambient=vec4(0.11, 0.06, 0.11, 1.0),
     diffuse=vec4(0.43, 0.47, 0.54, 1.0),
@@ -46,3 +57,11 @@ GOLD = Material(
 #     specular=RGBA(0.33, 0.33, 0.52, 1.0),
 #     metallic=51.200,
 # )
+
+
+# Materials, which are referenced by objects (see `ObjectRecord`)
+MATERIALS: dict[MaterialID, Material] = {
+    'default': DEFAULT,
+    'pewter': PEWTER,
+    'gold': GOLD,
+}
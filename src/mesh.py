@@ -1,148 +1,627 @@
+import hashlib
 import logging
 from dataclasses import dataclass
 
 import glm
-from glm import vec2
+import numpy as np
+from glm import mat4
 from glm import vec3
 
+from .config import config
 from .db import ModelRecord
+from .gfx import VERTEX_DTYPES
 from .gfx import GfxInstance
 from .gfx import MeshGfxData
+from .gfx import MeshLod
+from .gfx import VertexFormat
 from .gfx import gfx_load_mesh
-from .iofs import iofs_read_mesh_file
+from .iofs import SourceKey
+from .iofs import iofs_get_cache_path
+from .iofs import iofs_get_mesh_path
+from .iofs import iofs_iter_mesh_file
+from .iofs import iofs_source_key
+from .mesh_cache import FLAG_CW_ORDER
+from .mesh_cache import MESH_CACHE_MAX_LODS
+from .mesh_cache import MeshCacheEntry
+from .mesh_cache import MeshCacheLod
+from .mesh_cache import mesh_cache_close
+from .mesh_cache import mesh_cache_open
+from .mesh_cache import mesh_cache_write
+from .mesh_gltf import mesh_parse_gltf_file
+from .mesh_optimize import mesh_calc_acmr
+from .mesh_optimize import mesh_optimize
+from .mesh_simplify import MeshGeometry
+from .mesh_simplify import mesh_build_lods
 
 logger = logging.getLogger(__name__)
 
 
 type MeshID = str
 
+# Rows count which is parsed at once. Bounds memory usage of text
+# processing for huge files, only numeric arrays are kept in memory
+OBJ_CHUNK_LINES = 1 << 16
+
+
+@dataclass
+class MeshBounds:
+    aabb_min: vec3
+    aabb_max: vec3
+    center: vec3
+    radius: float
+
 
 @dataclass
 class Mesh:
     id: MeshID
     path: str
+    bounds: MeshBounds
     gfx_data: MeshGfxData
 
+    # Bytes of vertex and index buffers
+    size: int = 0
+
 
 @dataclass
 class ObjFile:
     name: str | None
-    vertices: list[vec3]
-    normals: list[vec3]
-    texcoords: list[vec2]
+    vertices: np.ndarray   # (n, 3) float32
+    normals: np.ndarray    # (n, 3) float32
+    texcoords: np.ndarray  # (n, 2) float32
 
-    # face format: ("v/vt/vn", "v/vt/vn", "v/vt/vn")
-    faces: list[tuple[str, str, str]]
+    # face corners of triangulated faces: (n, 3) -> (v, vt, vn), 1-based
+    faces: np.ndarray
 
 
-# TODO: support Model abstraction (with multiple meshes)
+# NOTE: multi-mesh models (glTF) are merged into single mesh
+# TODO: support Model abstraction with per-mesh materials
 def mesh_load_from_record(record: ModelRecord, gfx: GfxInstance) -> Mesh:
-    _, ext = record.path.split('.')
+    cooked = mesh_cook(record.path)
+    bounds = mesh_bounds_from_tuple(cooked.bounds)
+    vertex_format = VertexFormat(cooked.vertex_format)
 
-    if ext != 'obj':
-        raise NotImplementedError(f'Unsupported mesh extension: {ext}')
+    gfx_data = gfx_load_mesh(
+        gfx,
+        vertex_data=cooked.vertex_data,
+        index_data=cooked.index_data,
+        vertices_count=cooked.vertices_count,
+        indices_count=cooked.indices_count,
+        cw_order=bool(cooked.flags & FLAG_CW_ORDER),
+        vertex_format=vertex_format,
+        m_dequant=mesh_calc_dequant_matrix(vertex_format, bounds),
+        lods=[
+            MeshLod(
+                first_index=lod.first_index,
+                indices_count=lod.indices_count,
+                base_vertex=lod.base_vertex,
+            )
+            for lod in cooked.lods
+        ],
+    )
+    size = cooked.vertex_data.nbytes + cooked.index_data.nbytes
+    mesh_cache_close(cooked)
 
-    obj = mesh_parse_obj_file(record.path)
+    logger.info(f'Mesh loaded: {record.id}')
+    return Mesh(
+        id=record.id,
+        path=record.path,
+        bounds=bounds,
+        gfx_data=gfx_data,
+        size=size,
+    )
 
-    # ----- OBJ -> OPENGL MAPPING -----
-    # .obj has data format different than OpenGL, so
-    # normals and texcoords should be mapped to each vertex
-    face_storage = []
-    gl_indices = []
-    gl_vertices = []
-    gl_texcoords = []
-    gl_normals = []
 
-    for face_elem in obj.faces:
-        for face in face_elem:
-            v_index, tc_index, n_index = (int(i) for i in face.split('/'))
+def mesh_content_key(path: str, cooked: MeshCacheEntry) -> bytes:
+    """Key of cooked mesh data: meshes with equal keys are identical
 
-            if face not in face_storage:
-                face_storage.append(face)
+    Key is source content hash and import settings of fresh cache entry
+    (see `mesh_cook`), so source file is not read again
+    """
+    # `.gltf` external buffers are not hashed (see `mesh_cook`), so
+    # only the same file is the same content
+    if path.endswith('.gltf'):
+        return cooked.key.hash + path.encode() + cooked.settings
 
-                gl_vertices.append(obj.vertices[v_index-1])
-                gl_texcoords.append(obj.texcoords[tc_index-1])
-                gl_normals.append(obj.normals[n_index-1])
+    return cooked.key.hash + cooked.settings
 
-            idx = face_storage.index(face)
-            gl_indices.append(idx)
 
-    del obj
+def mesh_cook_job(path: str) -> bytes:
+    # Entry point for worker processes: make sure that cache is fresh
+    # -> content key of cooked mesh (see `mesh_content_key`)
+    cooked = mesh_cook(path)
+    key = mesh_content_key(path, cooked)
+    mesh_cache_close(cooked)
 
-    # ----- VECTORS UNPACKING -----
-    # ([vec3, vec3] -> [f, f, f, f, f, f])
-    gl_vertices = [v_i for v in gl_vertices for v_i in v]
-    gl_texcoords = [vt_i for vt in gl_texcoords for vt_i in vt]
-    gl_normals = [vn_i for vn in gl_normals for vn_i in vn]
+    return key
 
-    vertex_buffer = gl_vertices + gl_normals + gl_texcoords
 
-    gfx_data = gfx_load_mesh(
-        gfx,
-        vertex_data=glm.array.from_numbers(glm.float32, *vertex_buffer),
-        index_data=glm.array.from_numbers(glm.uint32, *gl_indices),
-        vertices_count=int(len(gl_vertices) / 3),
-        indices_count=len(gl_indices),
-        cw_order=False,  # .obj mesh foramt has CCW ordering
+def mesh_cook(path: str) -> MeshCacheEntry:
+    """Get mapped cooked mesh, (re)building cache entry if needed
+    """
+    source_path = iofs_get_mesh_path(path)
+    cache_path = iofs_get_cache_path(f'models/{path}.mesh')
+    settings = _mesh_cook_settings()
+
+    cooked = mesh_cache_open(cache_path, source_path)
+    if cooked is not None:
+        if cooked.settings == settings:
+            return cooked
+
+        mesh_cache_close(cooked)
+
+    # NOTE: for `.gltf` only JSON part is keyed, external buffers are
+    # expected to be re-exported together with it
+    key = iofs_source_key(source_path)
+    _, ext = path.rsplit('.', 1)
+
+    # Both .obj and glTF have CCW ordering
+    match ext:
+        case 'obj':
+            obj = mesh_parse_obj_file(path)
+            geometry = MeshGeometry(*mesh_weld_obj(obj))
+            del obj
+
+        case 'gltf' | 'glb':
+            geometry = mesh_parse_gltf_file(path)
+
+        case _:
+            raise NotImplementedError(f'Unsupported mesh extension: {ext}')
+
+    mesh_cook_geometry(path, cache_path, key, settings, geometry, flags=0)
+
+    cooked = mesh_cache_open(cache_path, source_path)
+    if cooked is None:
+        raise RuntimeError(f'Unable to open cooked mesh: {cache_path}')
+
+    return cooked
+
+
+def mesh_cook_geometry(
+    path: str,
+    cache_path: str,
+    key: SourceKey,
+    settings: bytes,
+    geometry: MeshGeometry,
+    flags: int,
+) -> None:
+    vertex_format = VertexFormat(config.VERTEX_FORMAT)
+
+    lods = [geometry] + mesh_build_lods(
+        geometry,
+        levels=min(config.LOD_LEVELS, MESH_CACHE_MAX_LODS - 1),
+        ratio=config.LOD_RATIO,
     )
-    logger.info(f'Mesh loaded: {record.id}')
-    return Mesh(
-        id=record.id,
-        path=record.path,
-        gfx_data=gfx_data,
+
+    if config.MESH_OPTIMIZE:
+        lods = [
+            _mesh_optimize_geometry(f'{path} LOD{i}', lod)
+            for i, lod in enumerate(lods)
+        ]
+
+    vertex_data, index_data, bounds, lod_ranges = mesh_pack_lods(
+        vertex_format, lods
+    )
+
+    mesh_cache_write(
+        cache_path,
+        key,
+        settings=settings,
+        flags=flags,
+        vertex_format=vertex_format,
+        vertex_data=vertex_data,
+        index_data=index_data,
+        vertices_count=len(vertex_data),
+        bounds=bounds,
+        lods=lod_ranges,
+    )
+    logger.info(f'Mesh cooked: {path} ({len(lods)} LODs)')
+
+
+def mesh_pack_lods(
+    vertex_format: VertexFormat,
+    lods: list[MeshGeometry],
+) -> tuple[np.ndarray, np.ndarray, tuple[float, ...], list[MeshCacheLod]]:
+    # -> (vertex data, index data, bounds of LOD 0, LOD ranges)
+    # All LODs share vertex and index buffers
+    lod_ranges = []
+    first_index = 0
+    base_vertex = 0
+
+    for lod in lods:
+        lod_ranges.append(
+            MeshCacheLod(first_index, len(lod.indices), base_vertex)
+        )
+        first_index += len(lod.indices)
+        base_vertex += len(lod.positions)
+
+    bounds = mesh_calc_bounds(lods[0].positions)
+    vertex_data = mesh_pack_vertices(
+        vertex_format,
+        np.concatenate([lod.positions for lod in lods]),
+        np.concatenate([lod.normals for lod in lods]),
+        np.concatenate([lod.texcoords for lod in lods]),
+        bounds,
+    )
+    index_data = mesh_pack_indices(
+        np.concatenate([lod.indices for lod in lods]),
+        max(len(lod.positions) for lod in lods),
+    )
+
+    return vertex_data, index_data, bounds, lod_ranges
+
+
+def _mesh_optimize_geometry(
+    name: str,
+    geometry: MeshGeometry,
+) -> MeshGeometry:
+    optimized = mesh_optimize(
+        geometry.positions,
+        geometry.indices,
+        cache_size=config.VERTEX_CACHE_SIZE,
+        overdraw=config.MESH_OPTIMIZE_OVERDRAW,
+    )
+
+    if logger.isEnabledFor(logging.DEBUG):
+        acmr_before = mesh_calc_acmr(
+            geometry.indices, config.VERTEX_CACHE_SIZE
+        )
+        acmr_after = mesh_calc_acmr(
+            optimized.indices, config.VERTEX_CACHE_SIZE
+        )
+        logger.debug(
+            f'Mesh optimized: {name} '
+            f'(ACMR: {acmr_before:.3f} -> {acmr_after:.3f})'
+        )
+
+    order = optimized.vertex_order
+    return MeshGeometry(
+        positions=geometry.positions[order],
+        normals=geometry.normals[order],
+        texcoords=geometry.texcoords[order],
+        indices=optimized.indices,
+    )
+
+
+def _mesh_cook_settings() -> bytes:
+    # Import settings, which affect cooked data
+    settings = (
+        config.VERTEX_FORMAT,
+        config.MESH_OPTIMIZE,
+        config.MESH_OPTIMIZE_OVERDRAW,
+        config.VERTEX_CACHE_SIZE,
+        config.LOD_LEVELS,
+        config.LOD_RATIO,
+    )
+    return hashlib.blake2b(repr(settings).encode(), digest_size=8).digest()
+
+
+def mesh_calc_bounds(vertices: np.ndarray) -> tuple[float, ...]:
+    if not len(vertices):
+        return (0.0,) * 7
+
+    aabb_min = vertices.min(axis=0)
+    aabb_max = vertices.max(axis=0)
+    center = (aabb_min + aabb_max) * 0.5
+    radius = np.sqrt(((vertices - center) ** 2).sum(axis=1).max())
+
+    return (*aabb_min.tolist(), *aabb_max.tolist(), float(radius))
+
+
+def mesh_pack_vertices(
+    vertex_format: VertexFormat,
+    vertices: np.ndarray,
+    normals: np.ndarray,
+    texcoords: np.ndarray,
+    bounds: tuple[float, ...],
+) -> np.ndarray:
+    packed = np.empty(len(vertices), dtype=VERTEX_DTYPES[vertex_format])
+
+    match vertex_format:
+        case VertexFormat.packed:
+            packed['position'] = vertices
+
+        case VertexFormat.quantized:
+            aabb_min, extent = _mesh_quantization_range(bounds)
+            position = (vertices - aabb_min) / extent
+            packed['position'][:, :3] = np.rint(
+                np.clip(position, 0.0, 1.0) * 0xFFFF
+            )
+            packed['position'][:, 3] = 0
+
+        case _:
+            raise ValueError(f'Unknown vertex format: {vertex_format}')
+
+    packed['normal'] = mesh_encode_octahedral(normals)
+    packed['texcoord'] = texcoords
+
+    return packed
+
+
+def mesh_unpack_vertices(
+    vertex_format: VertexFormat,
+    packed: np.ndarray,
+    bounds: tuple[float, ...],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Inverse of `mesh_pack_vertices` -> (positions, normals, texcoords)
+    match vertex_format:
+        case VertexFormat.packed:
+            positions = packed['position'].astype(np.float32)
+
+        case VertexFormat.quantized:
+            aabb_min, extent = _mesh_quantization_range(bounds)
+            position = packed['position'][:, :3] / np.float32(0xFFFF)
+            positions = (position * extent + aabb_min).astype(np.float32)
+
+        case _:
+            raise ValueError(f'Unknown vertex format: {vertex_format}')
+
+    normals = mesh_decode_octahedral(packed['normal'])
+    texcoords = packed['texcoord'].astype(np.float32)
+
+    return positions, normals, texcoords
+
+
+def mesh_pack_indices(indices: np.ndarray, vertices_count: int) -> np.ndarray:
+    if vertices_count <= 0xFFFF + 1:
+        return indices.astype(np.uint16)
+
+    return indices.astype(np.uint32)
+
+
+def mesh_encode_octahedral(normals: np.ndarray) -> np.ndarray:
+    # Unit vector -> point on octahedron -> unfolded to [-1, 1] square,
+    # which is stored as snorm16 pair (see `oct_decode` in object.vert)
+    l1_norm = np.abs(normals).sum(axis=1, keepdims=True)
+    n = normals / np.maximum(l1_norm, 1e-12)
+
+    xy = n[:, :2]
+    lower = n[:, 2] < 0.0
+    sign = np.where(xy[lower] >= 0.0, 1.0, -1.0)
+    xy[lower] = (1.0 - np.abs(xy[lower][:, ::-1])) * sign
+
+    return np.rint(np.clip(xy, -1.0, 1.0) * 0x7FFF).astype(np.int16)
+
+
+def mesh_decode_octahedral(encoded: np.ndarray) -> np.ndarray:
+    # See `oct_decode` in object.vert
+    xy = np.maximum(encoded / np.float32(0x7FFF), -1.0)
+    n = np.empty((len(xy), 3), dtype=np.float32)
+    n[:, :2] = xy
+    n[:, 2] = 1.0 - np.abs(xy).sum(axis=1)
+
+    t = np.maximum(-n[:, 2:], 0.0)
+    n[:, :2] += np.where(n[:, :2] >= 0.0, -t, t)
+
+    return n / np.linalg.norm(n, axis=1, keepdims=True)
+
+
+def mesh_calc_dequant_matrix(
+    vertex_format: VertexFormat,
+    bounds: MeshBounds,
+) -> mat4:
+    if vertex_format != VertexFormat.quantized:
+        return mat4(1.0)
+
+    aabb_min, extent = _mesh_quantization_range(
+        (*bounds.aabb_min, *bounds.aabb_max)
+    )
+    return glm.translate(vec3(*aabb_min)) * glm.scale(vec3(*extent))
+
+
+def _mesh_quantization_range(
+    bounds: tuple[float, ...],
+) -> tuple[np.ndarray, np.ndarray]:
+    # Same float32 values are used on packing and in dequantization matrix
+    aabb_min = np.array(bounds[0:3], dtype=np.float32)
+    aabb_max = np.array(bounds[3:6], dtype=np.float32)
+    extent = np.maximum(aabb_max - aabb_min, np.float32(1e-6))
+
+    return aabb_min, extent
+
+
+def mesh_bounds_from_tuple(bounds: tuple[float, ...]) -> MeshBounds:
+    aabb_min = vec3(bounds[0:3])
+    aabb_max = vec3(bounds[3:6])
+
+    return MeshBounds(
+        aabb_min=aabb_min,
+        aabb_max=aabb_max,
+        center=(aabb_min + aabb_max) * 0.5,
+        radius=bounds[6],
+    )
+
+
+def mesh_bounds_transform(
+    bounds: MeshBounds,
+    model_mat: mat4,
+) -> tuple[vec3, vec3]:
+    # -> world space AABB (min, max) of transformed mesh AABB
+    center = vec3(model_mat * glm.vec4(bounds.center, 1.0))
+    half = (bounds.aabb_max - bounds.aabb_min) * 0.5
+    extents = (
+        glm.abs(vec3(model_mat[0])) * half.x
+        + glm.abs(vec3(model_mat[1])) * half.y
+        + glm.abs(vec3(model_mat[2])) * half.z
+    )
+    return center - extents, center + extents
+
+
+def mesh_weld_obj(
+    obj: ObjFile,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # ----- OBJ -> OPENGL MAPPING -----
+    # .obj has data format different than OpenGL, so
+    # normals and texcoords should be mapped to each vertex.
+    #
+    # Every unique (v, vt, vn) triplet becomes a single OpenGL vertex.
+    # Triplets are packed into one integer key, so welding is a single
+    # sort-based `np.unique` pass instead of lookup per face corner
+    corners = obj.faces.astype(np.int64) - 1
+
+    if len(corners) and (corners.min() < 0):
+        raise ValueError('Unsupported OBJ face indices (relative or zero)')
+
+    n_texcoords = max(len(obj.texcoords), 1)
+    n_normals = max(len(obj.normals), 1)
+    keys = (corners[:, 0] * n_texcoords + corners[:, 1]) * n_normals
+    keys += corners[:, 2]
+
+    _, first, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
     )
+    # Keep vertices in order of first usage (as they appear in file),
+    # it is much better for vertex fetch than sorted keys order
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    indices = rank[inverse.ravel()].astype(np.uint32)
+    triplets = corners[first[order]]
+
+    vertices = obj.vertices[triplets[:, 0]]
+    texcoords = obj.texcoords[triplets[:, 1]]
+    normals = obj.normals[triplets[:, 2]]
+
+    return vertices, normals, texcoords, indices
 
 
 def mesh_parse_obj_file(path: str) -> ObjFile:
-    content = iofs_read_mesh_file(path).split('\n')
     obj_name = None
     vertices = []
     normals = []
     texcoords = []
     faces = []
 
-    for row in content:
-        if row.startswith('#'):
-            continue
+    for content in iofs_iter_mesh_file(path, OBJ_CHUNK_LINES):
+        v_rows = []
+        vn_rows = []
+        vt_rows = []
+        f_rows = []
 
-        match row.split(' '):
-            case ['o', name]:
-                obj_name = name
+        for row in content:
+            if row.startswith('#'):
+                continue
 
-            case ['v', x, y, z]:
-                vertices.append(vec3(float(x), float(y), float(z)))
+            match row[:2]:
+                case 'v ':
+                    v_rows.append(row)
 
-            case ['vn', x, y, z]:
-                normals.append(vec3(float(x), float(y), float(z)))
+                case 'vn':
+                    vn_rows.append(row)
 
-            case ['vt', s, t]:
-                texcoords.append(vec2(float(s), float(t)))
+                case 'vt':
+                    vt_rows.append(row)
 
-            case ['f', *face_elem]:
-                faces.append(face_elem)
+                case 'f ':
+                    f_rows.append(row)
 
-            case ['mtllib', *_]:
-                pass
+                case 'o ':
+                    obj_name = row[2:].strip()
 
-            case ['usemtl', *_]:
-                pass
+                case 'mt' if row.startswith('mtllib'):
+                    pass
 
-            case ['s', id]:
-                pass
+                case 'us' if row.startswith('usemtl'):
+                    pass
 
-            case ['']:
-                continue
+                case 's ' | 'g ':
+                    pass
 
-            case unknown:
-                raise ValueError(f'Error while parsing OBJ row: {unknown}')
+                case '\n' | '':
+                    continue
+
+                case _:
+                    raise ValueError(f'Error while parsing OBJ row: {row}')
+
+        if v_rows:
+            vertices.append(_obj_parse_numbers(v_rows, 'v', (3,)))
+        if vn_rows:
+            normals.append(_obj_parse_numbers(vn_rows, 'vn', (3,)))
+        if vt_rows:
+            texcoords.append(_obj_parse_numbers(vt_rows, 'vt', (2, 3)))
+        if f_rows:
+            faces.append(_obj_parse_faces(f_rows))
 
     return ObjFile(
         name=obj_name,
-        vertices=vertices,
-        normals=normals,
-        texcoords=texcoords,
-        faces=faces,
+        vertices=_obj_concat(vertices, (0, 3), np.float32),
+        normals=_obj_concat(normals, (0, 3), np.float32),
+        texcoords=_obj_concat(texcoords, (0, 2), np.float32)[:, :2],
+        faces=_obj_concat(faces, (0, 3), np.uint32),
+    )
+
+
+def _obj_concat(
+    chunks: list[np.ndarray],
+    empty_shape: tuple[int, int],
+    dtype: np.dtype,
+) -> np.ndarray:
+    if not chunks:
+        return np.empty(empty_shape, dtype=dtype)
+
+    width = min(c.shape[1] for c in chunks)
+    return np.concatenate([c[:, :width] for c in chunks])
+
+
+def _obj_parse_numbers(
+    rows: list[str],
+    prefix: str,
+    widths: tuple[int, ...],
+) -> np.ndarray:
+    # Rows are joined and converted by numpy at once:
+    # "v 1 2 3\nv 4 5 6" -> [1, 2, 3, 4, 5, 6]
+    text = ''.join(rows).replace(prefix, ' ')
+    data = _obj_parse_tokens(text, np.float32, prefix)
+
+    for width in widths:
+        if data.size == len(rows) * width:
+            return data.reshape(-1, width)
+
+    raise ValueError(f'Error while parsing OBJ rows: inconsistent `{prefix}`')
+
+
+def _obj_parse_faces(rows: list[str]) -> np.ndarray:
+    # face format: "f v/vt/vn v/vt/vn v/vt/vn ..."
+    if any('//' in row for row in rows):
+        raise ValueError('Unsupported OBJ faces without texcoords')
+
+    text = ''.join(rows).replace('f', ' ').replace('/', ' ')
+    data = _obj_parse_tokens(text, np.int64, 'f')
+    corners_count = np.fromiter(
+        (row.count('/') // 2 for row in rows), dtype=np.int64, count=len(rows)
     )
+    if data.size != corners_count.sum() * 3 or corners_count.min() < 3:
+        raise ValueError('Error while parsing OBJ rows: inconsistent `f`')
+
+    # Fast path: already triangulated mesh
+    if (corners_count == 3).all():
+        return data.reshape(-1, 3)
+
+    # Polygons are triangulated as fans: (0, i, i+1)
+    data = data.reshape(-1, 3)
+    starts = np.cumsum(corners_count) - corners_count
+    tris_count = corners_count - 2
+
+    face_of_tri = np.repeat(np.arange(len(rows)), tris_count)
+    tri_in_face = (
+        np.arange(tris_count.sum())
+        - np.repeat(np.cumsum(tris_count) - tris_count, tris_count)
+    )
+    base = starts[face_of_tri]
+
+    tris = np.stack(
+        (base, base + tri_in_face + 1, base + tri_in_face + 2), axis=1
+    )
+    return data[tris.ravel()]
+
+
+def _obj_parse_tokens(text: str, dtype: type, prefix: str) -> np.ndarray:
+    try:
+        return np.array(text.split(), dtype=dtype)
+    except ValueError:
+        raise ValueError(
+            f'Error while parsing OBJ rows: malformed `{prefix}`'
+        ) from None
 
 
 # --
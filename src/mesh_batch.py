@@ -0,0 +1,175 @@
+"""mesh_batch - Static Mesh Batching
+
+Meshes with their model transforms are merged into single world space
+mesh, which is drawn by one command with identity transform. Geometry is
+read back from mesh cache, so it is not kept in memory after loading.
+
+Batch has LOD levels of the most detailed mesh: LOD i of batch is merged
+LOD i of every mesh (or its last LOD, if mesh has less levels).
+"""
+import logging
+
+import numpy as np
+from glm import mat4
+
+from .config import config
+from .gfx import VERTEX_DTYPES
+from .gfx import GfxInstance
+from .gfx import MeshLod
+from .gfx import VertexFormat
+from .gfx import gfx_load_mesh
+from .mesh import Mesh
+from .mesh import MeshID
+from .mesh import mesh_bounds_from_tuple
+from .mesh import mesh_calc_dequant_matrix
+from .mesh import mesh_cook
+from .mesh import mesh_pack_lods
+from .mesh import mesh_unpack_vertices
+from .mesh_cache import FLAG_CW_ORDER
+from .mesh_cache import MeshCacheEntry
+from .mesh_cache import mesh_cache_close
+from .mesh_simplify import MeshGeometry
+
+logger = logging.getLogger(__name__)
+
+
+def mesh_batch_build(
+    gfx: GfxInstance,
+    batch_id: MeshID,
+    instances: list[tuple[Mesh, mat4]],
+) -> Mesh:
+    vertex_format = VertexFormat(config.VERTEX_FORMAT)
+    levels_count = max(len(mesh.gfx_data.lods) for mesh, _ in instances)
+
+    # Cache entries of instanced meshes are opened once
+    cooked = {}
+    try:
+        for mesh, _ in instances:
+            if mesh.path not in cooked:
+                cooked[mesh.path] = mesh_cook(mesh.path)
+
+        lods = [
+            _mesh_batch_merge([
+                _mesh_batch_transform(
+                    _mesh_batch_read_lod(cooked[mesh.path], level),
+                    model_mat,
+                )
+                for mesh, model_mat in instances
+            ])
+            for level in range(levels_count)
+        ]
+    finally:
+        for entry in cooked.values():
+            mesh_cache_close(entry)
+
+    vertex_data, index_data, bounds, lod_ranges = mesh_pack_lods(
+        vertex_format, lods
+    )
+    mesh_bounds = mesh_bounds_from_tuple(bounds)
+
+    gfx_data = gfx_load_mesh(
+        gfx,
+        vertex_data=vertex_data,
+        index_data=index_data,
+        vertices_count=len(vertex_data),
+        indices_count=len(index_data),
+        cw_order=False,
+        vertex_format=vertex_format,
+        m_dequant=mesh_calc_dequant_matrix(vertex_format, mesh_bounds),
+        lods=[
+            MeshLod(
+                first_index=lod.first_index,
+                indices_count=lod.indices_count,
+                base_vertex=lod.base_vertex,
+            )
+            for lod in lod_ranges
+        ],
+    )
+
+    logger.debug(
+        f'Mesh batch built: {batch_id} ({len(instances)} meshes, '
+        f'{len(lods[0].indices) // 3} triangles)'
+    )
+    return Mesh(
+        id=batch_id,
+        path=batch_id,
+        bounds=mesh_bounds,
+        gfx_data=gfx_data,
+        size=vertex_data.nbytes + index_data.nbytes,
+    )
+
+
+def _mesh_batch_read_lod(cooked: MeshCacheEntry, level: int) -> MeshGeometry:
+    level = min(level, len(cooked.lods) - 1)
+    lod = cooked.lods[level]
+
+    # LOD vertices are followed by vertices of the next one
+    if level + 1 < len(cooked.lods):
+        end_vertex = cooked.lods[level + 1].base_vertex
+    else:
+        end_vertex = cooked.vertices_count
+
+    vertex_format = VertexFormat(cooked.vertex_format)
+    vertices = cooked.vertex_data.view(VERTEX_DTYPES[vertex_format])
+
+    positions, normals, texcoords = mesh_unpack_vertices(
+        vertex_format, vertices[lod.base_vertex:end_vertex], cooked.bounds
+    )
+    indices = cooked.index_data[
+        lod.first_index:lod.first_index + lod.indices_count
+    ].astype(np.uint32)
+
+    # Batches have CCW ordering
+    if cooked.flags & FLAG_CW_ORDER:
+        indices = indices.reshape(-1, 3)[:, ::-1].ravel()
+
+    return MeshGeometry(
+        positions=positions,
+        normals=normals,
+        texcoords=texcoords,
+        indices=indices,
+    )
+
+
+def _mesh_batch_transform(
+    geometry: MeshGeometry,
+    model_mat: mat4,
+) -> MeshGeometry:
+    # glm matrix bytes are column-major
+    matrix = np.frombuffer(model_mat.to_bytes(), dtype=np.float32)
+    matrix = matrix.reshape(4, 4).T
+    linear = matrix[:3, :3]
+
+    positions = geometry.positions @ linear.T + matrix[:3, 3]
+    normals = geometry.normals @ np.linalg.inv(linear)
+    normals /= np.maximum(
+        np.linalg.norm(normals, axis=1, keepdims=True), 1e-12
+    )
+
+    # Mirroring transform flips triangles winding
+    indices = geometry.indices
+    if np.linalg.det(linear) < 0:
+        indices = indices.reshape(-1, 3)[:, ::-1].ravel()
+
+    return MeshGeometry(
+        positions=positions.astype(np.float32),
+        normals=normals.astype(np.float32),
+        texcoords=geometry.texcoords,
+        indices=indices,
+    )
+
+
+def _mesh_batch_merge(geometries: list[MeshGeometry]) -> MeshGeometry:
+    indices = []
+    vertices_count = 0
+
+    for geometry in geometries:
+        indices.append(geometry.indices + vertices_count)
+        vertices_count += len(geometry.positions)
+
+    return MeshGeometry(
+        positions=np.concatenate([part.positions for part in geometries]),
+        normals=np.concatenate([part.normals for part in geometries]),
+        texcoords=np.concatenate([part.texcoords for part in geometries]),
+        indices=np.concatenate(indices).astype(np.uint32),
+    )
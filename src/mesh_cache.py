@@ -0,0 +1,209 @@
+"""mesh_cache - Cooked Mesh Cache
+
+Binary mesh format, which is ready to upload to GPU without any parsing:
+
+    | header (128 bytes) | LOD table (128 bytes) | vertex block | index block |
+
+Blocks are 16-byte aligned. Cache entry is keyed by source file
+(size, mtime, content hash) and import settings, so stale entries are
+detected on open.
+"""
+import logging
+import mmap
+import os
+import struct
+import typing as t
+from dataclasses import dataclass
+
+import numpy as np
+
+from .iofs import SourceKey
+from .iofs import iofs_is_source_fresh
+
+logger = logging.getLogger(__name__)
+
+
+MESH_CACHE_MAGIC = b'IMSH'
+MESH_CACHE_VERSION = 3
+
+# magic, version, flags,
+# source size, source mtime, source hash, import settings hash,
+# vertex format, vertices count, indices count, vertex bytes, index bytes,
+# bounds (aabb min, aabb max, sphere radius), LODs count
+_HEADER = struct.Struct('<4sII QQ16s8s 16sIIQQ 7f I')
+_HEADER_MTIME_OFFSET = struct.calcsize('<4sIIQ')
+
+# first index, indices count, base vertex, reserved
+_LOD = struct.Struct('<IIII')
+MESH_CACHE_MAX_LODS = 8
+
+_LODS_OFFSET = 128
+_HEADER_SIZE = _LODS_OFFSET + _LOD.size * MESH_CACHE_MAX_LODS
+_BLOCK_ALIGN = 16
+
+FLAG_CW_ORDER = 1 << 0
+
+
+class MeshCacheLod(t.NamedTuple):
+    first_index: int
+    indices_count: int
+    base_vertex: int
+
+
+@dataclass
+class MeshCacheEntry:
+    key: SourceKey
+    settings: bytes
+    flags: int
+    vertex_format: str
+    vertices_count: int
+    indices_count: int
+
+    # views of mapped file, valid until `mesh_cache_close`
+    vertex_data: np.ndarray | None
+    index_data: np.ndarray | None
+
+    # (aabb_min.xyz, aabb_max.xyz, radius)
+    bounds: tuple[float, ...]
+    lods: list[MeshCacheLod]
+
+    _mmap: mmap.mmap
+
+
+def _align(size: int) -> int:
+    return (size + _BLOCK_ALIGN - 1) & ~(_BLOCK_ALIGN - 1)
+
+
+def mesh_cache_write(
+    cache_path: str,
+    key: SourceKey,
+    settings: bytes,
+    flags: int,
+    vertex_format: str,
+    vertex_data: np.ndarray,
+    index_data: np.ndarray,
+    vertices_count: int,
+    bounds: tuple[float, ...],
+    lods: list[MeshCacheLod],
+) -> None:
+    vertex_bytes = vertex_data.nbytes
+    index_bytes = index_data.nbytes
+
+    if not 0 < len(lods) <= MESH_CACHE_MAX_LODS:
+        raise ValueError(f'Unsupported mesh LODs count: {len(lods)}')
+
+    header = _HEADER.pack(
+        MESH_CACHE_MAGIC, MESH_CACHE_VERSION, flags,
+        key.size, key.mtime_ns, key.hash, settings,
+        vertex_format.encode(),
+        vertices_count, index_data.size, vertex_bytes, index_bytes,
+        *bounds, len(lods),
+    )
+    header = header.ljust(_LODS_OFFSET, b'\0') + b''.join(
+        _LOD.pack(*lod, 0) for lod in lods
+    )
+
+    # Write to temporary file first, so other readers (or crash in the
+    # middle of writing) never see partially written entry
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(vertex_data).data)
+        f.write(b'\0' * (_align(vertex_bytes) - vertex_bytes))
+        f.write(np.ascontiguousarray(index_data).data)
+
+    os.replace(tmp_path, cache_path)
+
+
+def mesh_cache_open(
+    cache_path: str,
+    source_path: str,
+) -> MeshCacheEntry | None:
+    """Map cache entry into memory. Returns `None` if entry is missing or stale
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return None
+
+    if len(mm) < _HEADER_SIZE:
+        mm.close()
+        return None
+
+    (
+        magic, version, flags,
+        size, mtime_ns, src_hash, settings,
+        vertex_format,
+        vertices_count, indices_count, vertex_bytes, index_bytes,
+        *bounds, lods_count,
+    ) = _HEADER.unpack_from(mm, 0)
+    key = SourceKey(size=size, mtime_ns=mtime_ns, hash=src_hash)
+
+    expected_size = _HEADER_SIZE + _align(vertex_bytes) + index_bytes
+    if (
+        magic != MESH_CACHE_MAGIC
+        or version != MESH_CACHE_VERSION
+        or len(mm) != expected_size
+        or not 0 < lods_count <= MESH_CACHE_MAX_LODS
+        or not _mesh_cache_is_fresh(cache_path, source_path, key)
+    ):
+        mm.close()
+        logger.info(f'Mesh cache entry is stale: {cache_path}')
+        return None
+
+    index_offset = _HEADER_SIZE + _align(vertex_bytes)
+    index_dtype = np.uint16 if index_bytes == indices_count * 2 else np.uint32
+
+    lods = [
+        MeshCacheLod(*_LOD.unpack_from(mm, _LODS_OFFSET + i * _LOD.size)[:3])
+        for i in range(lods_count)
+    ]
+
+    return MeshCacheEntry(
+        key=key,
+        settings=settings,
+        flags=flags,
+        vertex_format=vertex_format.rstrip(b'\0').decode(),
+        vertices_count=vertices_count,
+        indices_count=indices_count,
+        vertex_data=np.frombuffer(
+            mm, np.uint8, vertex_bytes, _HEADER_SIZE
+        ),
+        index_data=np.frombuffer(
+            mm, index_dtype, indices_count, index_offset
+        ),
+        bounds=tuple(bounds),
+        lods=lods,
+        _mmap=mm,
+    )
+
+
+def mesh_cache_close(self: MeshCacheEntry) -> None:
+    # Views should be released before mapping could be closed
+    self.vertex_data = None
+    self.index_data = None
+    self._mmap.close()
+
+
+def _mesh_cache_is_fresh(
+    cache_path: str,
+    source_path: str,
+    key: SourceKey,
+) -> bool:
+    mtime_ns = key.mtime_ns
+
+    if not iofs_is_source_fresh(source_path, key):
+        return False
+
+    # Source was touched, but content is the same: keep new mtime, so
+    # content is not hashed on every open
+    if key.mtime_ns != mtime_ns:
+        with open(cache_path, 'r+b') as f:
+            f.seek(_HEADER_MTIME_OFFSET)
+            f.write(struct.pack('<Q', key.mtime_ns))
+
+    return True
@@ -0,0 +1,292 @@
+"""mesh_gltf - glTF 2.0 Mesh Import
+
+Accessors are read as numpy views over mapped buffers (`.glb` binary
+chunk or external `.bin` files), interleaved buffer views are handled by
+strides, so there is no per-element conversion in Python.
+
+All triangle primitives of default scene are merged into single geometry
+with node transforms applied. Materials are not imported (world objects
+have single texture).
+"""
+import base64
+import mmap
+import os
+import struct
+
+import numpy as np
+from pygltflib import GLTF2
+
+from .iofs import iofs_get_mesh_path
+from .mesh_simplify import MeshGeometry
+
+_GLB_MAGIC = b'glTF'
+_GLB_CHUNK_JSON = b'JSON'
+_GLB_CHUNK_BIN = b'BIN\0'
+
+_MODE_TRIANGLES = 4
+
+_COMPONENT_DTYPES = {
+    5120: np.dtype('<i1'),
+    5121: np.dtype('<u1'),
+    5122: np.dtype('<i2'),
+    5123: np.dtype('<u2'),
+    5125: np.dtype('<u4'),
+    5126: np.dtype('<f4'),
+}
+
+_TYPE_WIDTHS = {
+    'SCALAR': 1,
+    'VEC2': 2,
+    'VEC3': 3,
+    'VEC4': 4,
+    'MAT4': 16,
+}
+
+
+def mesh_parse_gltf_file(path: str) -> MeshGeometry:
+    gltf, buffers = _gltf_load(iofs_get_mesh_path(path))
+
+    positions = []
+    normals = []
+    texcoords = []
+    indices = []
+    vertices_count = 0
+
+    for mesh_index, transform in _gltf_mesh_instances(gltf):
+        for primitive in gltf.meshes[mesh_index].primitives:
+            if primitive.mode not in (None, _MODE_TRIANGLES):
+                continue
+
+            p, n, tc, idx = _gltf_read_primitive(
+                gltf, buffers, primitive, transform
+            )
+            positions.append(p)
+            normals.append(n)
+            texcoords.append(tc)
+            indices.append(idx + vertices_count)
+            vertices_count += len(p)
+
+    if not positions:
+        raise ValueError(f'No triangle primitives in glTF file: {path}')
+
+    return MeshGeometry(
+        positions=np.concatenate(positions),
+        normals=np.concatenate(normals),
+        texcoords=np.concatenate(texcoords),
+        indices=np.concatenate(indices).astype(np.uint32),
+    )
+
+
+def _gltf_load(path: str) -> tuple[GLTF2, list[memoryview | bytes]]:
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    glb_bin = None
+
+    if data[:4] == _GLB_MAGIC:
+        json_data, glb_bin = _glb_read_chunks(data, path)
+    else:
+        json_data = data[:].decode()
+        data.close()
+
+    gltf = GLTF2.from_json(json_data)
+    base_dir = os.path.dirname(path)
+
+    buffers = [
+        _gltf_load_buffer(buffer.uri, base_dir, glb_bin)
+        for buffer in gltf.buffers
+    ]
+    return gltf, buffers
+
+
+def _glb_read_chunks(
+    data: mmap.mmap,
+    path: str,
+) -> tuple[str, memoryview | None]:
+    # Binary glTF: header + JSON chunk + BIN chunk, -> (JSON, BIN)
+    offset = 12
+    json_data = None
+    glb_bin = None
+
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack_from('<I4s', data, offset)
+        chunk = memoryview(data)[offset + 8:offset + 8 + length]
+
+        if chunk_type == _GLB_CHUNK_JSON:
+            json_data = bytes(chunk).decode()
+        elif chunk_type == _GLB_CHUNK_BIN and glb_bin is None:
+            glb_bin = chunk
+
+        offset += 8 + length
+
+    if json_data is None:
+        raise ValueError(f'Invalid GLB file (no JSON chunk): {path}')
+
+    return json_data, glb_bin
+
+
+def _gltf_load_buffer(
+    uri: str | None,
+    base_dir: str,
+    glb_bin: memoryview | None,
+) -> memoryview | bytes:
+    if uri is None:
+        return glb_bin
+
+    if uri.startswith('data:'):
+        return base64.b64decode(uri.split(',', 1)[1])
+
+    with open(os.path.join(base_dir, uri), 'rb') as f:
+        return memoryview(
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        )
+
+
+def _gltf_mesh_instances(gltf: GLTF2) -> list[tuple[int, np.ndarray]]:
+    # -> [(mesh index, node world transform), ...]
+    if not gltf.scenes:
+        return [(i, np.eye(4)) for i in range(len(gltf.meshes))]
+
+    scene = gltf.scenes[gltf.scene or 0]
+    instances = []
+    stack = [(node, np.eye(4)) for node in scene.nodes]
+
+    while stack:
+        node_index, parent = stack.pop()
+        node = gltf.nodes[node_index]
+        transform = parent @ _gltf_node_matrix(node)
+
+        if node.mesh is not None:
+            instances.append((node.mesh, transform))
+
+        stack.extend((child, transform) for child in node.children)
+
+    return instances
+
+
+def _gltf_node_matrix(node) -> np.ndarray:
+    if node.matrix is not None:
+        # glTF matrices are column-major
+        return np.array(node.matrix, dtype=np.float64).reshape(4, 4).T
+
+    translation = np.eye(4)
+    if node.translation is not None:
+        translation[:3, 3] = node.translation
+
+    rotation = np.eye(4)
+    if node.rotation is not None:
+        x, y, z, w = node.rotation
+        xx, yy, zz = x * x, y * y, z * z
+        xy, xz, yz = x * y, x * z, y * z
+        wx, wy, wz = w * x, w * y, w * z
+
+        rotation[:3, :3] = (
+            (1 - 2 * (yy + zz), 2 * (xy - wz), 2 * (xz + wy)),
+            (2 * (xy + wz), 1 - 2 * (xx + zz), 2 * (yz - wx)),
+            (2 * (xz - wy), 2 * (yz + wx), 1 - 2 * (xx + yy)),
+        )
+
+    scale = np.eye(4)
+    if node.scale is not None:
+        scale[:3, :3] = np.diag(node.scale)
+
+    return translation @ rotation @ scale
+
+
+def _gltf_read_primitive(
+    gltf: GLTF2,
+    buffers: list[memoryview | bytes],
+    primitive,
+    transform: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    attributes = primitive.attributes
+
+    positions = _gltf_read_accessor(gltf, buffers, attributes.POSITION)
+    vertices_count = len(positions)
+
+    if primitive.indices is not None:
+        indices = _gltf_read_accessor(gltf, buffers, primitive.indices)
+        indices = indices.ravel().astype(np.uint32)
+    else:
+        indices = np.arange(vertices_count, dtype=np.uint32)
+
+    # -- Node transform
+    linear = transform[:3, :3]
+    positions = positions @ linear.T + transform[:3, 3]
+
+    # Mirroring transform flips triangles winding
+    if np.linalg.det(linear) < 0:
+        indices = indices.reshape(-1, 3)[:, ::-1].ravel()
+
+    if attributes.NORMAL is not None:
+        normals = _gltf_read_accessor(gltf, buffers, attributes.NORMAL)
+        normals = normals @ np.linalg.inv(linear)
+    else:
+        normals = _calc_vertex_normals(positions, indices)
+
+    normals /= np.maximum(
+        np.linalg.norm(normals, axis=1, keepdims=True), 1e-12
+    )
+
+    if attributes.TEXCOORD_0 is not None:
+        texcoords = _gltf_read_accessor(gltf, buffers, attributes.TEXCOORD_0)
+        # glTF texture origin is top-left, OpenGL - bottom-left
+        texcoords = texcoords * (1.0, -1.0) + (0.0, 1.0)
+    else:
+        texcoords = np.zeros((vertices_count, 2))
+
+    return (
+        positions.astype(np.float32),
+        normals.astype(np.float32),
+        texcoords.astype(np.float32),
+        indices,
+    )
+
+
+def _gltf_read_accessor(
+    gltf: GLTF2,
+    buffers: list[memoryview | bytes],
+    accessor_index: int,
+) -> np.ndarray:
+    accessor = gltf.accessors[accessor_index]
+    dtype = _COMPONENT_DTYPES[accessor.componentType]
+    width = _TYPE_WIDTHS[accessor.type]
+
+    if accessor.sparse is not None:
+        raise NotImplementedError('Sparse glTF accessors are not supported')
+
+    if accessor.bufferView is None:
+        return np.zeros((accessor.count, width), dtype=dtype)
+
+    view = gltf.bufferViews[accessor.bufferView]
+    offset = (view.byteOffset or 0) + (accessor.byteOffset or 0)
+    stride = view.byteStride or dtype.itemsize * width
+
+    # Strided view of buffer, interleaved attributes are not copied
+    data = np.ndarray(
+        (accessor.count, width),
+        dtype=dtype,
+        buffer=buffers[view.buffer],
+        offset=offset,
+        strides=(stride, dtype.itemsize),
+    )
+
+    if accessor.normalized and dtype.kind in 'iu':
+        return np.maximum(data / np.iinfo(dtype).max, -1.0)
+
+    return data
+
+
+def _calc_vertex_normals(
+    positions: np.ndarray,
+    indices: np.ndarray,
+) -> np.ndarray:
+    triangles = indices.reshape(-1, 3)
+    v0, v1, v2 = (positions[triangles[:, i]] for i in range(3))
+    face_normals = np.cross(v1 - v0, v2 - v0)  # area weighted
+
+    normals = np.zeros_like(positions, dtype=np.float64)
+    for i in range(3):
+        np.add.at(normals, triangles[:, i], face_normals)
+
+    return normals
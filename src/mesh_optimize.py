@@ -0,0 +1,249 @@
+"""mesh_optimize - Import-time Mesh Optimization
+
+Index and vertex buffers reordering for GPU efficiency:
+
+1. Triangles order for post-transform vertex cache (Tipsify, [Sander 2007])
+2. Tipsify clusters order to reduce overdraw (outward facing first)
+3. Vertices order for pre-transform vertex fetch (order of first usage)
+"""
+import typing as t
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+
+import numpy as np
+
+
+class MeshOptimizeResult(t.NamedTuple):
+    # new vertex -> old vertex
+    vertex_order: np.ndarray
+    indices: np.ndarray
+
+
+def mesh_optimize(
+    positions: np.ndarray,
+    indices: np.ndarray,
+    cache_size: int,
+    overdraw: bool,
+) -> MeshOptimizeResult:
+    indices, clusters = mesh_optimize_vertex_cache(
+        indices, len(positions), cache_size
+    )
+    if overdraw:
+        indices = mesh_optimize_overdraw(positions, indices, clusters)
+
+    vertex_order, indices = mesh_optimize_vertex_fetch(
+        indices, len(positions)
+    )
+
+    return MeshOptimizeResult(vertex_order=vertex_order, indices=indices)
+
+
+def mesh_calc_acmr(indices: np.ndarray, cache_size: int) -> float:
+    """Average cache miss ratio (vertex shader runs per triangle), FIFO cache
+
+    Diagnostic only: simulation is a Python loop over all indices
+    """
+    if not len(indices):
+        return 0.0
+
+    fifo = deque()
+    cached = set()
+    misses = 0
+
+    for v in indices.tolist():
+        if v in cached:
+            continue
+
+        misses += 1
+        fifo.append(v)
+        cached.add(v)
+
+        if len(fifo) > cache_size:
+            cached.remove(fifo.popleft())
+
+    return misses / (len(indices) // 3)
+
+
+@dataclass
+class _Tipsify:
+    cache_size: int
+
+    # Vertex -> triangles adjacency (CSR)
+    adj_triangles: list[int]
+    adj_offsets: list[int]
+    live: list[int]  # not emitted triangles by vertex
+
+    triangles: list[list[int]]
+    emitted: list[bool]
+    cache_time: list[int]
+    dead_end: list[int] = field(default_factory=list)
+    output: list[int] = field(default_factory=list)
+
+    time: int = 0
+    cursor: int = 0  # vertices before are not live
+
+
+def mesh_optimize_vertex_cache(
+    indices: np.ndarray,
+    vertices_count: int,
+    cache_size: int,
+) -> tuple[np.ndarray, list[int]]:
+    """Tipsify triangles reordering
+
+    Returns reordered indices and clusters starts (in triangles), which are
+    points where vertex cache is flushed anyway
+    """
+    triangles = indices.reshape(-1, 3)
+    live = np.bincount(indices, minlength=vertices_count)
+
+    self = _Tipsify(
+        cache_size=cache_size,
+        adj_triangles=(np.argsort(indices, kind='stable') // 3).tolist(),
+        adj_offsets=np.concatenate(([0], np.cumsum(live))).tolist(),
+        live=live.tolist(),
+        triangles=triangles.tolist(),
+        emitted=[False] * len(triangles),
+        cache_time=[-cache_size - 1] * vertices_count,
+    )
+    clusters = []
+
+    fanning = 0 if vertices_count else -1
+    from_cache = False
+
+    while fanning >= 0:
+        if not from_cache:
+            clusters.append(len(self.output))
+
+        candidates = _tipsify_fan(self, fanning)
+
+        fanning = _tipsify_next_in_cache(self, candidates)
+        from_cache = fanning >= 0
+        if not from_cache:
+            fanning = _tipsify_next_dead_end(self)
+
+    order = np.array(self.output, dtype=np.int64)
+    return triangles[order].ravel(), clusters
+
+
+def _tipsify_fan(self: _Tipsify, fanning: int) -> list[int]:
+    # Emit not emitted triangles of vertex, -> their vertices
+    candidates = []
+
+    adj_start = self.adj_offsets[fanning]
+    adj_end = self.adj_offsets[fanning + 1]
+
+    for t_idx in self.adj_triangles[adj_start:adj_end]:
+        if self.emitted[t_idx]:
+            continue
+
+        self.emitted[t_idx] = True
+        self.output.append(t_idx)
+
+        for v in self.triangles[t_idx]:
+            self.dead_end.append(v)
+            candidates.append(v)
+            self.live[v] -= 1
+
+            if self.time - self.cache_time[v] > self.cache_size:
+                self.cache_time[v] = self.time
+                self.time += 1
+
+    return candidates
+
+
+def _tipsify_next_in_cache(self: _Tipsify, candidates: list[int]) -> int:
+    # -> live candidate, which stays in cache for its triangles and is the
+    # oldest one, -1 if none
+    fanning = -1
+    best_priority = -1
+
+    for v in candidates:
+        if not self.live[v]:
+            continue
+
+        age = self.time - self.cache_time[v]
+        priority = age if age + 2 * self.live[v] <= self.cache_size else 0
+
+        if priority > best_priority:
+            best_priority = priority
+            fanning = v
+
+    return fanning
+
+
+def _tipsify_next_dead_end(self: _Tipsify) -> int:
+    # -> the latest used live vertex, else the next live vertex in input
+    # order, -1 if all triangles are emitted
+    while self.dead_end:
+        v = self.dead_end.pop()
+        if self.live[v]:
+            return v
+
+    while self.cursor < len(self.live):
+        if self.live[self.cursor]:
+            return self.cursor
+        self.cursor += 1
+
+    return -1
+
+
+def mesh_optimize_overdraw(
+    positions: np.ndarray,
+    indices: np.ndarray,
+    clusters: list[int],
+) -> np.ndarray:
+    """Sort clusters so outward facing ones are drawn first
+
+    Clusters facing away from mesh center are likely to occlude the rest
+    of the mesh, so early-z test rejects more fragments
+    """
+    triangles = indices.reshape(-1, 3)
+    if len(clusters) < 2:
+        return indices
+
+    v0, v1, v2 = (
+        positions[triangles[:, i]].astype(np.float64) for i in range(3)
+    )
+    face_normals = np.cross(v1 - v0, v2 - v0)  # length ~ area
+    face_centroids = (v0 + v1 + v2) / 3.0
+
+    starts = np.unique(np.array(clusters, dtype=np.int64))
+    sizes = np.diff(np.append(starts, len(triangles)))
+
+    cluster_normals = np.add.reduceat(face_normals, starts)
+    cluster_centroids = (
+        np.add.reduceat(face_centroids, starts) / sizes[:, None]
+    )
+    mesh_centroid = face_centroids.mean(axis=0)
+
+    cluster_normals /= np.maximum(
+        np.linalg.norm(cluster_normals, axis=1, keepdims=True), 1e-12
+    )
+    facing = (
+        (cluster_centroids - mesh_centroid) * cluster_normals
+    ).sum(axis=1)
+
+    cluster_order = np.argsort(-facing, kind='stable')
+    cluster_of_triangle = np.repeat(np.arange(len(starts)), sizes)
+    rank = np.empty_like(cluster_order)
+    rank[cluster_order] = np.arange(len(cluster_order))
+
+    order = np.argsort(rank[cluster_of_triangle], kind='stable')
+    return triangles[order].ravel()
+
+
+def mesh_optimize_vertex_fetch(
+    indices: np.ndarray,
+    vertices_count: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Vertices are reordered by their first usage in index buffer,
+    # unused vertices are moved to the end
+    first_usage = np.full(vertices_count, len(indices), dtype=np.int64)
+    np.minimum.at(first_usage, indices, np.arange(len(indices)))
+
+    vertex_order = np.argsort(first_usage, kind='stable')
+    remap = np.empty_like(vertex_order)
+    remap[vertex_order] = np.arange(vertices_count)
+
+    return vertex_order, remap[indices].astype(indices.dtype)
@@ -0,0 +1,256 @@
+"""mesh_simplify - Mesh Simplification for LODs
+
+Quadric error metric simplification by vertex clustering [Lindstrom 2000]:
+vertices are clustered by uniform grid, every cluster is collapsed to single
+vertex, which position minimizes sum of squared distances to planes of
+cluster triangles (quadric error). Done with whole-array operations,
+so it is fast enough for import of big meshes.
+"""
+import typing as t
+
+import numpy as np
+
+# Grid resolution (cells along longest AABB axis) search bounds
+_MIN_GRID = 1
+_MAX_GRID = 4096
+
+# Triangle of cluster IDs is packed to int64 key while it fits
+_MAX_PACKED_CLUSTERS = 2_000_000
+
+
+class MeshGeometry(t.NamedTuple):
+    positions: np.ndarray  # (n, 3) float32
+    normals: np.ndarray    # (n, 3) float32
+    texcoords: np.ndarray  # (n, 2) float32
+    indices: np.ndarray    # (n * 3,) uint32
+
+
+def mesh_build_lods(
+    geometry: MeshGeometry,
+    levels: int,
+    ratio: float,
+    min_triangles: int = 16,
+) -> list[MeshGeometry]:
+    """Build chain of simplified meshes (LOD 1..levels)
+
+    Every level has about `ratio` triangles of previous one. Chain stops
+    earlier if mesh can't be simplified any more
+    """
+    lods = []
+    triangles_count = len(geometry.indices) // 3
+
+    for _ in range(levels):
+        target = int(triangles_count * ratio)
+        if target < min_triangles:
+            break
+
+        lod = mesh_simplify(geometry, target)
+        lod_triangles = len(lod.indices) // 3
+
+        if not lod_triangles or lod_triangles > triangles_count * 0.9:
+            break
+
+        lods.append(lod)
+        triangles_count = lod_triangles
+
+    return lods
+
+
+def mesh_simplify(
+    geometry: MeshGeometry,
+    target_triangles: int,
+) -> MeshGeometry:
+    positions = geometry.positions.astype(np.float64)
+    aabb_min = positions.min(axis=0)
+    aabb_max = positions.max(axis=0)
+
+    # -- Finest grid, which gives not more than target triangles
+    low, high = _MIN_GRID, _MAX_GRID
+    while low < high:
+        grid = (low + high + 1) // 2
+        clusters = _cluster_vertices(positions, aabb_min, aabb_max, grid)
+        triangles = _collapse_triangles(clusters, geometry.indices)
+
+        if len(triangles) <= target_triangles:
+            low = grid
+        else:
+            high = grid - 1
+
+    clusters = _cluster_vertices(positions, aabb_min, aabb_max, low)
+    triangles = _collapse_triangles(clusters, geometry.indices)
+
+    # -- Only clusters used by triangles become vertices
+    used, triangles = np.unique(triangles, return_inverse=True)
+    triangles = triangles.reshape(-1, 3)
+    remap = np.full(clusters.max() + 1, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    vertex_cluster = remap[clusters]
+
+    new_positions = _solve_cluster_positions(
+        positions, geometry.indices, vertex_cluster, len(used)
+    )
+
+    return MeshGeometry(
+        positions=new_positions.astype(np.float32),
+        normals=_average_cluster_normals(
+            geometry.normals, vertex_cluster, len(used)
+        ),
+        texcoords=_nearest_cluster_texcoords(
+            positions, geometry.texcoords, vertex_cluster, new_positions
+        ),
+        indices=triangles.ravel().astype(np.uint32),
+    )
+
+
+def _cluster_vertices(
+    positions: np.ndarray,
+    aabb_min: np.ndarray,
+    aabb_max: np.ndarray,
+    grid: int,
+) -> np.ndarray:
+    extent = aabb_max - aabb_min
+    cell_size = max(extent.max(), 1e-9) / grid
+    dims = np.maximum(np.ceil(extent / cell_size), 1).astype(np.int64)
+
+    cells = np.floor((positions - aabb_min) / cell_size).astype(np.int64)
+    cells = np.clip(cells, 0, dims - 1)
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    _, clusters = np.unique(keys, return_inverse=True)
+    return clusters.ravel()
+
+
+def _collapse_triangles(
+    clusters: np.ndarray,
+    indices: np.ndarray,
+) -> np.ndarray:
+    triangles = clusters[indices].reshape(-1, 3)
+
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    triangles = triangles[(a != b) & (b != c) & (a != c)]
+
+    # Drop duplicates, but keep both sides of two-sided geometry:
+    # triangles are compared with rotation, which keeps winding order
+    rotation = np.argmin(triangles, axis=1)
+    rows = np.arange(len(triangles))[:, None]
+    canonical = triangles[rows, (rotation[:, None] + np.arange(3)) % 3]
+
+    clusters_count = int(clusters.max()) + 1 if len(clusters) else 0
+
+    if clusters_count < _MAX_PACKED_CLUSTERS:
+        keys = (
+            canonical[:, 0] * clusters_count + canonical[:, 1]
+        ) * clusters_count + canonical[:, 2]
+        _, first = np.unique(keys, return_index=True)
+    else:
+        _, first = np.unique(canonical, axis=0, return_index=True)
+
+    return triangles[np.sort(first)]
+
+
+def _solve_cluster_positions(
+    positions: np.ndarray,
+    indices: np.ndarray,
+    vertex_cluster: np.ndarray,
+    clusters_count: int,
+) -> np.ndarray:
+    triangles = indices.reshape(-1, 3)
+    v0, v1, v2 = (positions[triangles[:, i]] for i in range(3))
+
+    # -- Area weighted plane quadrics: Q = (n n^T, n d, d^2)
+    normals = np.cross(v1 - v0, v2 - v0)
+    area = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(area, 1e-30)[:, None]
+    distances = -(normals * v0).sum(axis=1)
+
+    corner_cluster = vertex_cluster[triangles].ravel()
+    valid = corner_cluster >= 0
+    corner_cluster = corner_cluster[valid]
+
+    def accumulate(values: np.ndarray) -> np.ndarray:
+        per_corner = np.repeat(values * area, 3)[valid]
+        return np.bincount(
+            corner_cluster, weights=per_corner, minlength=clusters_count
+        )
+
+    quadric_a = np.empty((clusters_count, 3, 3))
+    quadric_b = np.empty((clusters_count, 3))
+
+    for i in range(3):
+        quadric_b[:, i] = accumulate(normals[:, i] * distances)
+
+        for j in range(i, 3):
+            quadric_a[:, i, j] = accumulate(normals[:, i] * normals[:, j])
+            quadric_a[:, j, i] = quadric_a[:, i, j]
+
+    # -- Mean positions of cluster vertices
+    mask = vertex_cluster >= 0
+    counts = np.bincount(vertex_cluster[mask], minlength=clusters_count)
+    mean = np.stack([
+        np.bincount(
+            vertex_cluster[mask],
+            weights=positions[mask, i],
+            minlength=clusters_count,
+        )
+        for i in range(3)
+    ], axis=1) / np.maximum(counts, 1)[:, None]
+
+    # -- Minimize quadric around mean position. Regularization keeps
+    #    degenerate cases (flat / linear clusters) close to the mean
+    trace = np.trace(quadric_a, axis1=1, axis2=2)
+    regularized = quadric_a + (
+        np.eye(3) * (trace * 1e-3 + 1e-12)[:, None, None]
+    )
+    rhs = -(np.einsum('nij,nj->ni', quadric_a, mean) + quadric_b)
+    delta = np.linalg.solve(regularized, rhs[..., None])[..., 0]
+
+    # -- Vertex could not leave bounds of its cluster: it prevents
+    #    spikes and keeps LOD inside mesh AABB (used for quantization)
+    cluster_min = np.full((clusters_count, 3), np.inf)
+    cluster_max = np.full((clusters_count, 3), -np.inf)
+    np.minimum.at(cluster_min, vertex_cluster[mask], positions[mask])
+    np.maximum.at(cluster_max, vertex_cluster[mask], positions[mask])
+
+    return np.clip(mean + delta, cluster_min, cluster_max)
+
+
+def _average_cluster_normals(
+    normals: np.ndarray,
+    vertex_cluster: np.ndarray,
+    clusters_count: int,
+) -> np.ndarray:
+    mask = vertex_cluster >= 0
+    summed = np.stack([
+        np.bincount(
+            vertex_cluster[mask],
+            weights=normals[mask, i],
+            minlength=clusters_count,
+        )
+        for i in range(3)
+    ], axis=1)
+
+    length = np.linalg.norm(summed, axis=1, keepdims=True)
+    summed = np.where(length > 1e-12, summed / np.maximum(length, 1e-12), 0)
+    summed[length[:, 0] <= 1e-12, 1] = 1.0
+
+    return summed.astype(np.float32)
+
+
+def _nearest_cluster_texcoords(
+    positions: np.ndarray,
+    texcoords: np.ndarray,
+    vertex_cluster: np.ndarray,
+    cluster_positions: np.ndarray,
+) -> np.ndarray:
+    # Texcoords could not be averaged (UV seams), so every cluster takes
+    # texcoord of its vertex closest to the new position
+    vertices = np.nonzero(vertex_cluster >= 0)[0]
+    clusters = vertex_cluster[vertices]
+
+    distance = (
+        (positions[vertices] - cluster_positions[clusters]) ** 2
+    ).sum(axis=1)
+    order = np.lexsort((distance, clusters))
+
+    _, first = np.unique(clusters[order], return_index=True)
+    return texcoords[vertices[order[first]]].astype(np.float32)
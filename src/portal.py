@@ -0,0 +1,393 @@
+"""portal - Cells and Portals Visibility
+
+Indoor levels are split into cells (rooms, AABBs) connected by portals
+(convex polygons of doorways and windows), authored in scene file:
+
+    [[cell]]
+    name = "hall"
+    aabb_min = [-3.0, 0.0, -3.0]
+    aabb_max = [3.0, 3.0, 3.0]
+    pvs = ["hall", "kitchen"]  # optional, see `portal_pvs`
+
+    [[portal]]
+    cells = ["hall", "kitchen"]
+    points = [[3, 0, -1], [3, 2.2, -1], [3, 2.2, 1], [3, 0, 1]]
+
+Every frame cells are traversed from camera cell: portal is clipped by
+current frustum, and next cell is visited with frustum narrowed to what
+is seen through clipped portal. So work depends on cells seen from
+camera, not on size of level.
+
+Objects are assigned to zones: set of cells, which their bounds overlap
+(objects on cell borders belong to both cells). Zone is visible, if any
+of its cells is visible. Objects outside of cells are always visible, as
+well as all objects, while camera is outside of cells.
+"""
+import typing as t
+from dataclasses import dataclass
+from dataclasses import field
+
+import numpy as np
+from glm import vec3
+
+from .bvh import Bvh
+from .bvh import bvh_create
+from .bvh import bvh_insert
+from .bvh import bvh_query_aabb
+
+NO_ZONE = -1
+
+# Limit of portals in chain, guards against cycles of many cells
+_MAX_DEPTH = 32
+
+# Camera closer to portal plane sees next cell by the same frustum, as
+# frustum through portal is degenerate
+_PORTAL_EPSILON = 1e-3
+
+# Relative inset of PVS samples from cell faces
+_PVS_INSET = 0.01
+
+# Frustum plane index of `camera_calc_frustum_planes`
+_FAR_PLANE = 5
+
+
+class CellParams(t.NamedTuple):
+    name: str
+    aabb_min: vec3
+    aabb_max: vec3
+    pvs: list[str] | None = None
+
+
+class PortalParams(t.NamedTuple):
+    cells: tuple[str, str]
+    points: list[vec3]  # convex polygon
+
+
+@dataclass
+class Cell:
+    name: str
+    aabb_min: vec3
+    aabb_max: vec3
+    portals: list[int] = field(default_factory=list)
+
+    # Potentially visible cells, traversal is limited to them
+    pvs: set[int] | None = None
+
+
+@dataclass
+class Portal:
+    cells: tuple[int, int]
+    points: np.ndarray  # (k, 3)
+    # Plane, normal points from the first cell to the second one
+    plane: np.ndarray  # (4,)
+
+
+@dataclass
+class PortalGraph:
+    cells: list[Cell]
+    portals: list[Portal]
+    cell_indices: dict[str, int]
+
+    # Cells (items are cell indices) by bounds
+    bvh: Bvh
+
+    # Cells of zone by zone index, see `portal_graph_get_zone`
+    zones: list[frozenset[int]] = field(default_factory=list)
+    zone_indices: dict[frozenset[int], int] = field(default_factory=dict)
+    # (zone, cell) pairs, rebuilt when zones are added
+    zone_pairs: tuple[np.ndarray, np.ndarray] | None = None
+
+    # -- Stats of last traversal
+    visible_cells_count: int = 0
+    visited_portals: int = 0
+
+
+def portal_graph_create(
+    cells: list[CellParams],
+    portals: list[PortalParams],
+) -> PortalGraph:
+    self = PortalGraph(
+        cells=[],
+        portals=[],
+        cell_indices={params.name: i for i, params in enumerate(cells)},
+        bvh=bvh_create(),
+    )
+
+    for i, params in enumerate(cells):
+        self.cells.append(Cell(params.name, params.aabb_min, params.aabb_max))
+        bvh_insert(self.bvh, params.aabb_min, params.aabb_max, i)
+
+    if len(self.cell_indices) != len(cells):
+        names = [params.name for params in cells]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        raise ValueError(f'Portals init error: duplicated cells {duplicates}')
+
+    for i, params in enumerate(portals):
+        a, b = (
+            _portal_graph_cell_index(self, name, f'portal #{i}')
+            for name in params.cells
+        )
+        points = np.array([tuple(point) for point in params.points])
+
+        # Newell's normal of polygon, oriented away from the first cell
+        normal = np.cross(points, np.roll(points, -1, axis=0)).sum(axis=0)
+        normal /= np.linalg.norm(normal)
+        plane = np.append(normal, -normal @ points.mean(axis=0))
+
+        if _plane_distance(plane, _cell_center(self.cells[a])) > 0:
+            plane = -plane
+
+        self.portals.append(Portal((a, b), points, plane))
+        self.cells[a].portals.append(i)
+        self.cells[b].portals.append(i)
+
+    for cell, params in zip(self.cells, cells):
+        if params.pvs is not None:
+            cell.pvs = {
+                _portal_graph_cell_index(self, name, f'pvs of {cell.name}')
+                for name in params.pvs
+            }
+
+    return self
+
+
+def portal_graph_find_cells(self: PortalGraph, point: vec3) -> list[int]:
+    # -> cells, which contain point (more than one on shared border)
+    return bvh_query_aabb(self.bvh, point, point)
+
+
+def portal_graph_get_zone(
+    self: PortalGraph,
+    aabb_min: vec3,
+    aabb_max: vec3,
+) -> int:
+    # -> zone of object bounds, `NO_ZONE` if they are outside of cells
+    cells = frozenset(bvh_query_aabb(self.bvh, aabb_min, aabb_max))
+    if not cells:
+        return NO_ZONE
+
+    zone = self.zone_indices.get(cells)
+    if zone is None:
+        zone = len(self.zones)
+        self.zones.append(cells)
+        self.zone_indices[cells] = zone
+        self.zone_pairs = None
+
+    return zone
+
+
+def portal_graph_traverse(
+    self: PortalGraph,
+    position: vec3,
+    planes: np.ndarray,
+) -> np.ndarray | None:
+    """-> mask of visible zones, `None` if camera is outside of cells
+
+    position: camera position
+    planes: (6, 4) view frustum, see `camera_calc_frustum_planes`
+    """
+    start_cells = portal_graph_find_cells(self, position)
+    if not start_cells:
+        self.visible_cells_count = len(self.cells)
+        return None
+
+    visible = _portal_graph_visible_cells(
+        self, start_cells, np.array(tuple(position)), planes
+    )
+    self.visible_cells_count = int(np.count_nonzero(visible))
+
+    # -- Zone is visible by any of its cells
+    if self.zone_pairs is None:
+        pairs = [
+            (zone, cell)
+            for zone, cells in enumerate(self.zones) for cell in cells
+        ]
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        self.zone_pairs = pairs[:, 0], pairs[:, 1]
+
+    zone_ids, zone_cells = self.zone_pairs
+    counts = np.bincount(
+        zone_ids, weights=visible[zone_cells], minlength=len(self.zones)
+    )
+    return counts > 0
+
+
+def portal_graph_compute_pvs(
+    self: PortalGraph,
+    samples: int = 4,
+) -> dict[str, list[str]]:
+    """Offline precomputation of potentially visible sets of cells
+
+    Cells are traversed in all directions from `samples` ^ 3 points of
+    every cell (at least 2 per axis). Returns PVS names by cell name, for
+    `pvs` of scene file. Set is sampled, so it should be computed with
+    enough samples for narrow portals
+    """
+    pvs = {}
+    no_planes = np.zeros((0, 4))
+
+    for i, cell in enumerate(self.cells):
+        low = np.array(tuple(cell.aabb_min))
+        high = np.array(tuple(cell.aabb_max))
+        visible = np.zeros(len(self.cells), dtype=bool)
+
+        # Samples reach cell faces (portals are seen the widest from
+        # there), but are inset from portal planes, where frustum through
+        # portal is degenerate
+        steps = np.linspace(_PVS_INSET, 1.0 - _PVS_INSET, samples)
+        for x in steps:
+            for y in steps:
+                for z in steps:
+                    point = low + (high - low) * np.array((x, y, z))
+                    visible |= _portal_graph_visible_cells(
+                        self, [i], point, no_planes, use_pvs=False
+                    )
+
+        pvs[cell.name] = [
+            self.cells[j].name for j in np.flatnonzero(visible).tolist()
+        ]
+
+    return pvs
+
+
+def _portal_graph_visible_cells(
+    self: PortalGraph,
+    start_cells: list[int],
+    position: np.ndarray,
+    planes: np.ndarray,
+    use_pvs: bool = True,
+) -> np.ndarray:
+    # -> mask of cells, which are seen from position through portals
+    visible = np.zeros(len(self.cells), dtype=bool)
+    self.visited_portals = 0
+
+    allowed = None
+    if use_pvs and all(self.cells[i].pvs is not None for i in start_cells):
+        allowed = set().union(*(self.cells[i].pvs for i in start_cells))
+
+    far = planes[_FAR_PLANE:_FAR_PLANE + 1]
+
+    # Depth-first: (cell, frustum, portals of chain)
+    stack = [(cell, planes, ()) for cell in start_cells]
+    while stack:
+        cell, frustum, chain = stack.pop()
+        visible[cell] = True
+
+        if len(chain) == _MAX_DEPTH:
+            continue
+
+        for index in self.cells[cell].portals:
+            if index in chain:
+                continue
+
+            step = _portal_graph_step(
+                self, cell, index, position, frustum, far, allowed
+            )
+            if step is not None:
+                stack.append((*step, (*chain, index)))
+
+    return visible
+
+
+def _portal_graph_step(
+    self: PortalGraph,
+    cell: int,
+    index: int,
+    position: np.ndarray,
+    frustum: np.ndarray,
+    far: np.ndarray,
+    allowed: set[int] | None,
+) -> tuple[int, np.ndarray] | None:
+    # -> next cell through portal and frustum narrowed to portal, `None`
+    # if next cell is not seen through it
+    portal = self.portals[index]
+    a, b = portal.cells
+    if cell == a:
+        other, plane = b, portal.plane
+    else:
+        other, plane = a, -portal.plane
+
+    if allowed is not None and other not in allowed:
+        return None
+
+    # Camera should be in front of portal (on side of this cell)
+    distance = _plane_distance(plane, position)
+    if distance > _PORTAL_EPSILON:
+        return None
+
+    self.visited_portals += 1
+    if distance > -_PORTAL_EPSILON:
+        return other, frustum
+
+    polygon = portal.points
+    for frustum_plane in frustum:
+        polygon = _clip_polygon(polygon, frustum_plane)
+        if len(polygon) < 3:
+            return None
+
+    narrowed = np.concatenate((
+        _portal_frustum(position, polygon), plane[None], far
+    ))
+    return other, narrowed
+
+
+def _portal_graph_cell_index(
+    self: PortalGraph,
+    name: str,
+    entry: str,
+) -> int:
+    # entry: where name is referenced, for error message
+    index = self.cell_indices.get(name)
+    if index is None:
+        raise ValueError(
+            f'Portals init error: unknown cell {name!r} in {entry}'
+        )
+
+    return index
+
+
+def _portal_frustum(position: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    # -> (k, 4) planes through position and edges of polygon, normals
+    # point inside. Degenerate edges (collinear with position) are skipped
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    normals = np.cross(polygon - position, edges)
+    lengths = np.linalg.norm(normals, axis=1)
+
+    normals = normals[lengths > 1e-9] / lengths[lengths > 1e-9, None]
+    planes = np.concatenate(
+        (normals, -(normals @ position)[:, None]), axis=1
+    )
+
+    # Orientation depends on polygon winding
+    center = polygon.mean(axis=0)
+    signs = np.sign(planes[:, :3] @ center + planes[:, 3])
+    return planes * np.where(signs < 0, -1.0, 1.0)[:, None]
+
+
+def _clip_polygon(polygon: np.ndarray, plane: np.ndarray) -> np.ndarray:
+    # Sutherland-Hodgman: -> part of convex polygon in front of plane
+    distances = polygon @ plane[:3] + plane[3]
+    if (distances >= 0).all():
+        return polygon
+
+    points = []
+    for i in range(len(polygon)):
+        j = (i + 1) % len(polygon)
+        d0, d1 = distances[i], distances[j]
+
+        if d0 >= 0:
+            points.append(polygon[i])
+        if (d0 >= 0) != (d1 >= 0):
+            points.append(
+                polygon[i] + (polygon[j] - polygon[i]) * (d0 / (d0 - d1))
+            )
+
+    return np.array(points).reshape(-1, 3)
+
+
+def _plane_distance(plane: np.ndarray, point: np.ndarray) -> float:
+    return float(plane[:3] @ point + plane[3])
+
+
+def _cell_center(cell: Cell) -> np.ndarray:
+    return np.array(tuple((cell.aabb_min + cell.aabb_max) * 0.5))
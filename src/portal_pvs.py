@@ -0,0 +1,117 @@
+"""portal_pvs - Offline PVS Precomputation
+
+Potentially visible sets of scene cells (see `portal_graph_compute_pvs`)
+are written into `pvs` keys of `[[cell]]` tables of scene file. TOML is
+patched as text, so comments, order and line endings are kept:
+
+    python -m src.portal_pvs [scene] [--samples N]
+
+Scene is the root scene of config by default.
+"""
+import argparse
+import logging
+import re
+
+from .config import config
+from .loader import loader_get_scene_path
+from .loader import loader_load_scene
+from .logging_ex import logging_init
+from .portal import portal_graph_compute_pvs
+from .portal import portal_graph_create
+
+logger = logging.getLogger(__name__)
+
+
+_TABLE_RE = re.compile(r'\s*\[')
+_CELL_TABLE_RE = re.compile(r'\s*\[\[\s*cell\s*\]\]')
+_NAME_RE = re.compile(r'\s*name\s*=\s*"([^"]*)"')
+_PVS_RE = re.compile(r'\s*pvs\s*=')
+
+
+def portal_pvs_write(text: str, pvs: dict[str, list[str]]) -> str:
+    # -> scene file text with `pvs` of cells, which are in `pvs`
+    newline = '\r\n' if '\r\n' in text else '\n'
+
+    # Tables with preceding lines, which are up to previous table
+    tables = [[]]
+    for line in text.splitlines(keepends=True):
+        if _TABLE_RE.match(line):
+            tables.append([])
+        tables[-1].append(line)
+
+    return ''.join(
+        ''.join(
+            _portal_pvs_write_cell(lines, pvs, newline)
+            if _CELL_TABLE_RE.match(lines[0]) else lines
+        )
+        for lines in tables if lines
+    )
+
+
+def _portal_pvs_write_cell(
+    lines: list[str],
+    pvs: dict[str, list[str]],
+    newline: str,
+) -> list[str]:
+    names = [match[1] for line in lines if (match := _NAME_RE.match(line))]
+    if not names or names[0] not in pvs:
+        return lines
+
+    lines = [line for line in lines if not _PVS_RE.match(line)]
+
+    # After the last key, blank lines and comments of the next table
+    # are kept after it
+    end = len(lines)
+    while end > 1 and (
+        not lines[end - 1].strip() or lines[end - 1].lstrip().startswith('#')
+    ):
+        end -= 1
+
+    if not lines[end - 1].endswith('\n'):
+        lines[end - 1] += newline
+
+    cells = ', '.join(f'"{name}"' for name in pvs[names[0]])
+    lines.insert(end, f'pvs = [{cells}]{newline}')
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Write potentially visible sets of cells into scene',
+    )
+    parser.add_argument(
+        'scene', nargs='?', default=config.ROOT_SCENE,
+        help='name of scene file (default: root scene of config)',
+    )
+    parser.add_argument(
+        '--samples', type=int, default=4,
+        help='sample points per axis of cell (default: 4)',
+    )
+    args = parser.parse_args()
+    logging_init()
+
+    scene_params = loader_load_scene(args.scene)
+    if not scene_params.cells:
+        logger.warning(f'Scene has no cells: {args.scene}')
+        return
+
+    # Current sets are replaced, they could refer to removed cells
+    cells = [cell._replace(pvs=None) for cell in scene_params.cells]
+    graph = portal_graph_create(cells, scene_params.portals)
+    pvs = portal_graph_compute_pvs(graph, args.samples)
+
+    scene_path = loader_get_scene_path(args.scene)
+    with open(scene_path, newline='') as f:
+        text = f.read()
+    with open(scene_path, 'w', newline='') as f:
+        f.write(portal_pvs_write(text, pvs))
+
+    total = sum(len(names) for names in pvs.values())
+    logger.info(
+        f'PVS written: {scene_path} ({len(pvs)} cells, '
+        f'{total / len(pvs):.1f} visible per cell)'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,723 @@
+"""render_queue - Retained Render Queue
+
+Draw items (scene objects and static chunks) are kept between frames in
+arrays by slot, only changed items are patched. Every item has 64-bit
+sort key and queue is drawn in key order, so state changes are minimal:
+
+    | program 4 | texture 16 | geometry 12 | cw 1 | batch 15 | depth 16 |
+
+    texture  - bound texture (standalone texture or array page)
+    geometry - vertex format and arena chunks (vertex array state)
+    batch    - mesh and texture pair: items of batch are adjacent, so
+               they are drawn as instances of single command
+    depth    - distance bucket, front to back inside of batch
+
+Slots are re-sorted (by numpy) only when items are added or removed.
+Depth buckets are coarse, so a moving camera changes keys of a few items
+only, which are merged into sorted order. Items outside of view frustum
+are culled every frame by single vectorized test of all bounds, sorted
+order is filtered.
+Items of zones, which are not seen through portals (see `portal`), are
+culled as well. Remaining items are tested against depth pyramid of a
+previous frame (occlusion culling), while no item has changed since it
+was captured.
+
+With GPU culling (see `gfx_cull`) queue is not updated per frame, changed
+slots and layout of draw commands are synced to GPU instead.
+"""
+import typing as t
+from dataclasses import dataclass
+from dataclasses import field
+
+import numpy as np
+from glm import mat4
+
+from .camera import camera_calc_distances
+from .camera import camera_calc_frustum_planes
+from .camera import camera_calc_projected_sizes
+from .camera import camera_calc_view_position
+from .config import config
+from .gfx import CullLayout
+from .gfx import DrawBatch
+from .gfx import MeshGfxData
+from .gfx import TextureGfxData
+from .gfx_cull import CullItems
+from .gfx_hiz import DepthPyramid
+from .gfx_hiz import depth_pyramid_test
+from .mesh import MeshBounds
+from .texture_stream import texture_stream_request
+
+PROGRAM_OBJECT = 0
+
+_PROGRAM_SHIFT = 60
+_TEXTURE_SHIFT = 44
+_GEOMETRY_SHIFT = 32
+_CW_SHIFT = 31
+_BATCH_SHIFT = 16
+
+# Widths of key fields
+_PROGRAM_BITS = 4
+_TEXTURE_BITS = 16
+_GEOMETRY_BITS = 12
+_BATCH_BITS = 15
+
+_BATCH_MASK = (1 << _BATCH_BITS) - 1
+_DEPTH_MASK = (1 << 16) - 1
+
+# Depth buckets per doubling of distance: front to back order is
+# approximate, while keys are not changed by every camera move
+_DEPTH_BUCKETS_PER_OCTAVE = 4
+
+# Changed keys are merged into sorted order, while they are not more than
+# this part of items
+_MERGE_MAX_PART = 0.125
+
+_INITIAL_CAPACITY = 256
+
+_SOA_ARRAYS = ('bounds',)
+
+
+@dataclass
+class KeyTable:
+    # Small indices of sort key fields, reused when not referenced
+    name: str
+    bits: int  # width of field
+    indices: dict[t.Hashable, int] = field(default_factory=dict)
+    refs: list[int] = field(default_factory=list)
+    free: list[int] = field(default_factory=list)
+
+
+@dataclass
+class RenderItem:
+    mesh: MeshGfxData
+    texture: TextureGfxData
+
+    # Keys of sort key fields (see `KeyTable`)
+    texture_key: t.Hashable
+    geometry_key: t.Hashable
+    batch_key: t.Hashable
+
+
+@dataclass
+class RenderQueue:
+    items: list[RenderItem | None]  # by slot
+    free_slots: list[int]
+
+    # -- Arrays by slot
+    active: np.ndarray
+    keys: np.ndarray
+    matrices: np.ndarray  # (n, 16) model matrices with dequantization
+    materials: np.ndarray  # indices of material table
+    # Bounds in world space: AABB (center, half extents) and sphere.
+    # Vectors are stored by components (SoA), as culling is faster so.
+    # AABB is packed, so frustum test is a single matrix product
+    bounds: np.ndarray  # (6, n), `centers` and `extents` are its views
+    centers: np.ndarray  # (3, n)
+    extents: np.ndarray  # (3, n)
+    radii: np.ndarray
+    detail_radii: np.ndarray  # see `render_queue_add`
+    lods_counts: np.ndarray
+    lods: np.ndarray  # selected at last update
+    zones: np.ndarray  # visibility zones of portals, -1 - always visible
+    visible: np.ndarray  # in view frustum at last update
+
+    # Active slots in key order
+    order: np.ndarray
+    is_sorted: bool = False
+
+    # Visible slots in key order, see `render_queue_batches`
+    draw_order: np.ndarray = field(
+        default_factory=lambda: np.zeros(0, dtype=np.int64)
+    )
+
+    textures: KeyTable = field(
+        default_factory=lambda: KeyTable('texture', _TEXTURE_BITS)
+    )
+    geometries: KeyTable = field(
+        default_factory=lambda: KeyTable('geometry', _GEOMETRY_BITS)
+    )
+    batches: KeyTable = field(
+        default_factory=lambda: KeyTable('batch', _BATCH_BITS)
+    )
+
+    # Texture of batch index, for mip requests
+    batch_textures: dict[int, TextureGfxData] = field(default_factory=dict)
+
+    # Number of current update, and of the last one, since which items
+    # were changed (depth of older frames does not match them)
+    frame: int = 0
+    changed_frame: int = 0
+
+    # -- GPU culling: slots [start, end) changed since the last sync,
+    # whether commands are laid out for current items, and whether the
+    # last frame was culled by GPU (`lods` are not selected then)
+    gpu_dirty_start: int = 0
+    gpu_dirty_end: int = 0
+    is_gpu_laid_out: bool = False
+    is_gpu_culled: bool = False
+
+    # -- Stats of last update
+    visible_count: int = 0
+    culled_count: int = 0  # by frustum and portals
+    occluded_count: int = 0
+
+
+def render_queue_create() -> RenderQueue:
+    n = _INITIAL_CAPACITY
+    bounds = np.zeros((6, n), dtype=np.float32)
+
+    return RenderQueue(
+        items=[],
+        free_slots=[],
+        active=np.zeros(n, dtype=bool),
+        keys=np.zeros(n, dtype=np.uint64),
+        matrices=np.zeros((n, 16), dtype=np.float32),
+        materials=np.zeros(n, dtype=np.int32),
+        bounds=bounds,
+        centers=bounds[:3],
+        extents=bounds[3:],
+        radii=np.zeros(n, dtype=np.float32),
+        detail_radii=np.zeros(n, dtype=np.float32),
+        lods_counts=np.ones(n, dtype=np.int32),
+        lods=np.zeros(n, dtype=np.int32),
+        zones=np.full(n, -1, dtype=np.int32),
+        visible=np.zeros(n, dtype=bool),
+        order=np.zeros(0, dtype=np.int64),
+    )
+
+
+def render_queue_add(
+    self: RenderQueue,
+    mesh: MeshGfxData,
+    texture: TextureGfxData,
+    material: int,
+    model_mat: mat4,
+    bounds: MeshBounds,
+    detail_radius: float | None = None,
+    program: int = PROGRAM_OBJECT,
+    zone: int = -1,
+) -> int:
+    """Add draw item, returns its slot
+
+    material: index of material table, it is per-instance data, so it
+        is not a part of sort key
+    bounds: model space bounds of mesh (culling, LOD and depth)
+    detail_radius: world space radius of object, which texture is mapped
+        on (mips are requested by its projected size), by default radius
+        of bounding sphere
+    zone: visibility zone (see `portal_graph_get_zone`), -1 if item is
+        visible from everywhere
+    """
+    texture_key = (
+        ('array', texture.id) if texture.layer >= 0 else id(texture)
+    )
+    geometry_key = (
+        mesh.vertex_format, mesh.vertex_block.chunk,
+        mesh.index_type, mesh.index_block.chunk,
+    )
+    batch_key = (id(mesh), id(texture))
+
+    if not 0 <= program < 1 << _PROGRAM_BITS:
+        raise ValueError(
+            f'Program index does not fit {_PROGRAM_BITS} bits: {program}'
+        )
+
+    texture_index, geometry_index, batch = _render_queue_acquire_keys(
+        self, texture_key, geometry_key, batch_key
+    )
+    self.batch_textures[batch] = texture
+
+    key = (
+        program << _PROGRAM_SHIFT
+        | texture_index << _TEXTURE_SHIFT
+        | geometry_index << _GEOMETRY_SHIFT
+        | int(mesh.cw_order) << _CW_SHIFT
+        | batch << _BATCH_SHIFT
+    )
+
+    if self.free_slots:
+        slot = self.free_slots.pop()
+    else:
+        slot = len(self.items)
+        self.items.append(None)
+
+        if slot == len(self.active):
+            _render_queue_grow(self)
+
+    self.items[slot] = RenderItem(
+        mesh=mesh,
+        texture=texture,
+        texture_key=texture_key,
+        geometry_key=geometry_key,
+        batch_key=batch_key,
+    )
+    self.active[slot] = True
+    self.keys[slot] = key
+    self.materials[slot] = material
+    self.lods_counts[slot] = len(mesh.lods)
+    self.lods[slot] = 0
+    self.zones[slot] = zone
+    self.visible[slot] = False
+
+    render_queue_set_transform(self, slot, model_mat, bounds, detail_radius)
+    self.is_sorted = False
+    self.is_gpu_laid_out = False
+
+    return slot
+
+
+def render_queue_set_transform(
+    self: RenderQueue,
+    slot: int,
+    model_mat: mat4,
+    bounds: MeshBounds,
+    detail_radius: float | None = None,
+) -> None:
+    # Sort key is not changed, so queue stays sorted
+    self.changed_frame = self.frame
+    _render_queue_mark_gpu_dirty(self, slot)
+    dequant_mat = model_mat * self.items[slot].mesh.m_dequant
+
+    # mat4 bytes are column-major, as instances storage expects
+    self.matrices[slot] = np.frombuffer(
+        dequant_mat.to_bytes(), dtype=np.float32
+    )
+
+    # -- World space bounds
+    matrix = np.frombuffer(model_mat.to_bytes(), dtype=np.float32)
+    matrix = matrix.reshape(4, 4).T
+    linear = matrix[:3, :3]
+
+    half_extents = np.array(bounds.aabb_max - bounds.aabb_min) * 0.5
+    radius = bounds.radius * np.linalg.norm(linear, axis=0).max()
+
+    self.centers[:, slot] = linear @ np.array(bounds.center) + matrix[:3, 3]
+    self.extents[:, slot] = np.abs(linear) @ half_extents
+    self.radii[slot] = radius
+    self.detail_radii[slot] = (
+        radius if detail_radius is None else detail_radius
+    )
+
+
+def render_queue_set_zone(self: RenderQueue, slot: int, zone: int) -> None:
+    self.zones[slot] = zone
+
+
+def render_queue_remove(self: RenderQueue, slot: int) -> None:
+    item = self.items[slot]
+
+    _key_table_release(self.textures, item.texture_key)
+    _key_table_release(self.geometries, item.geometry_key)
+
+    batch = self.batches.indices[item.batch_key]
+    if _key_table_release(self.batches, item.batch_key):
+        del self.batch_textures[batch]
+
+    self.items[slot] = None
+    self.active[slot] = False
+    self.visible[slot] = False
+    self.free_slots.append(slot)
+    self.is_sorted = False
+    self.is_gpu_laid_out = False
+    self.changed_frame = self.frame
+
+
+def render_queue_update(
+    self: RenderQueue,
+    m_view_persp: mat4,
+    depth: DepthPyramid | None = None,
+    visible_zones: np.ndarray | None = None,
+) -> None:
+    """Cull items, select LODs, request texture mips and sort items for
+    current camera
+
+    depth: the latest captured depth for occlusion culling, see
+        `gfx_get_depth_pyramid`
+    visible_zones: mask of zones seen from camera, see
+        `portal_graph_traverse`, `None` - all zones are visible
+    """
+    self.frame += 1
+    self.is_gpu_culled = False
+
+    # Slots are tested by slices (up to the last used one), which is
+    # faster than gathering of active ones
+    n = len(self.items)
+    slots = np.flatnonzero(self.active[:n])
+    distances = camera_calc_distances(self.centers[:, :n])[slots]
+
+    # -- Frustum culling
+    if config.FRUSTUM_CULLING:
+        self.visible[:n] = render_queue_cull(self, m_view_persp)
+        self.visible[:n] &= self.active[:n]
+    else:
+        self.visible[:n] = self.active[:n]
+
+    # -- Portal culling
+    if visible_zones is not None:
+        # Items without zone (-1) take the appended one
+        visible_zones = np.append(visible_zones, True)
+        self.visible[:n] &= visible_zones[self.zones[:n]]
+
+    self.culled_count = len(slots) - int(np.count_nonzero(self.visible[:n]))
+
+    # -- Occlusion culling
+    self.occluded_count = 0
+    if depth is not None and _render_queue_depth_is_valid(
+        self, depth, m_view_persp
+    ):
+        self.occluded_count = render_queue_occlude(self, depth)
+
+    visible = self.visible[slots]
+    self.visible_count = int(np.count_nonzero(visible))
+
+    # -- LODs
+    sizes = camera_calc_projected_sizes(distances, self.radii[slots])
+    lods = (sizes[:, None] < np.array(config.LOD_THRESHOLDS)).sum(axis=1)
+    self.lods[slots] = np.minimum(lods, self.lods_counts[slots] - 1)
+
+    # -- Depth buckets (logarithmic, near objects are sorted finer)
+    buckets = np.minimum(
+        np.log2(1.0 + distances) * _DEPTH_BUCKETS_PER_OCTAVE, _DEPTH_MASK
+    ).astype(np.uint64)
+    keys = self.keys[slots] & np.uint64(~_DEPTH_MASK & (2 ** 64 - 1))
+    keys |= buckets
+    _render_queue_sort(self, slots, keys)
+
+    # Culling changes every frame, so it filters sorted order
+    self.draw_order = self.order[self.visible[self.order]]
+
+    # -- Texture mips of visible items: the most detailed request of batch
+    keys, distances = keys[visible], distances[visible]
+    batches = (keys >> np.uint64(_BATCH_SHIFT)) & np.uint64(_BATCH_MASK)
+    batches = batches.astype(np.int64)
+
+    # Projected size is relative to half screen height
+    detail = camera_calc_projected_sizes(
+        distances, self.detail_radii[slots[visible]]
+    ) * config.WINDOW_HEIGHT
+
+    max_detail = np.zeros(len(self.batches.refs))
+    np.maximum.at(max_detail, batches, detail)
+
+    for batch in np.unique(batches).tolist():
+        texture_stream_request(self.batch_textures[batch], max_detail[batch])
+
+
+def render_queue_cull(self: RenderQueue, m_view_persp: mat4) -> np.ndarray:
+    # -> mask of used slots (including inactive ones), which bounds are
+    # (at least partially) inside of view frustum
+    n = len(self.items)
+    planes = camera_calc_frustum_planes(m_view_persp).astype(np.float32)
+    normals, offsets = planes[:, :3], planes[:, 3:]
+
+    # Bounds are outside, if they are behind any plane. AABB reaches
+    # projection of extents on plane normal, so its signed distances to
+    # planes are (6, n) product of packed bounds
+    weights = np.concatenate((normals, np.abs(normals)), axis=1)
+    distances = weights @ self.bounds[:, :n]
+    distances += offsets
+    inside = distances.min(axis=0) >= 0
+
+    # Sphere reaches radius: it is conservative as well, so it could cull
+    # only items, which are inside by AABB
+    slots = np.flatnonzero(inside)
+    distances = normals @ self.centers[:, slots]
+    distances += offsets
+    inside[slots] = distances.min(axis=0) + self.radii[slots] >= 0
+
+    return inside
+
+
+def render_queue_occlude(self: RenderQueue, depth: DepthPyramid) -> int:
+    # Visible items, which are hidden by depth, are marked not visible,
+    # -> their number
+    n = len(self.items)
+    slots = np.flatnonzero(self.visible[:n])
+
+    occluded = slots[
+        depth_pyramid_test(
+            depth, self.centers[:, slots], self.extents[:, slots]
+        )
+    ]
+    self.visible[occluded] = False
+
+    return len(occluded)
+
+
+def _render_queue_depth_is_valid(
+    self: RenderQueue,
+    depth: DepthPyramid,
+    m_view_persp: mat4,
+) -> bool:
+    # Conservative fallback: depth, which could miss items drawn now
+    # (added or moved since it was captured) or could have removed ones,
+    # is not used, as well as too old one. Bounds are tested in captured
+    # view, so camera rotation does not matter, but from moved camera
+    # items could be seen behind edges of occluders
+    if (
+        depth.frame <= self.changed_frame
+        or self.frame - depth.frame > config.OCCLUSION_MAX_LATENCY
+    ):
+        return False
+
+    position = camera_calc_view_position(m_view_persp)
+    captured = camera_calc_view_position(depth.m_view_persp)
+    distance = np.linalg.norm(position - captured)
+    return bool(distance <= config.OCCLUSION_MAX_MOVE)
+
+
+def render_queue_batches(
+    self: RenderQueue,
+) -> tuple[list[DrawBatch], np.ndarray, np.ndarray]:
+    """Draw batches of sorted queue
+
+    Returns (batches, model matrices, materials of instances): items of
+    the same batch and LOD, which are adjacent, are instances of one batch
+    """
+    order = self.draw_order
+    matrices = self.matrices[order]
+    materials = self.materials[order]
+
+    if not len(order):
+        return [], matrices, materials
+
+    batch_ids = self.keys[order] >> np.uint64(_BATCH_SHIFT)
+    lods = self.lods[order]
+
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = (batch_ids[1:] != batch_ids[:-1]) | (lods[1:] != lods[:-1])
+
+    starts = np.flatnonzero(is_start)
+    counts = np.diff(starts, append=len(order))
+
+    batches = []
+    for first, count in zip(starts.tolist(), counts.tolist()):
+        item = self.items[order[first]]
+        batches.append(
+            DrawBatch(item.mesh, item.texture, int(lods[first]), first, count)
+        )
+
+    return batches, matrices, materials
+
+
+def render_queue_sync_gpu(
+    self: RenderQueue,
+) -> tuple[CullLayout | None, tuple[int, CullItems] | None]:
+    """Changes since the last sync for `gfx_draw_scene_culled`
+
+    Returns (layout of commands, if items were added or removed; first
+    slot and data of changed slots, if any). Commands are laid out per
+    batch and LOD, in key order without depth: instances are compacted by
+    GPU, so their order is arbitrary anyway
+    """
+    self.is_gpu_culled = True
+
+    layout = None
+    if not self.is_gpu_laid_out:
+        layout = _render_queue_layout_gpu(self)
+        self.is_gpu_laid_out = True
+
+    items = None
+    start, end = self.gpu_dirty_start, self.gpu_dirty_end
+    if start < end:
+        span = slice(start, end)
+        items = start, CullItems(
+            matrices=self.matrices[span],
+            centers=self.centers[:, span],
+            extents=self.extents[:, span],
+            radii=self.radii[span],
+            detail_radii=self.detail_radii[span],
+            texture_layers=np.array([
+                -1 if item is None else item.texture.layer
+                for item in self.items[span]
+            ], dtype=np.int32),
+            materials=self.materials[span],
+            lods_counts=self.lods_counts[span],
+            batches=(
+                self.keys[span] >> np.uint64(_BATCH_SHIFT)
+                & np.uint64(_BATCH_MASK)
+            ).astype(np.int32),
+        )
+        self.gpu_dirty_start = self.gpu_dirty_end = 0
+
+    return layout, items
+
+
+def render_queue_apply_gpu_stats(
+    self: RenderQueue,
+    visible_count: int,
+    batch_details: np.ndarray,
+) -> None:
+    """Stats and texture mip requests of GPU culling
+
+    batch_details: texture detail by batch index (see `render_queue_update`),
+        0 for not visible batch
+    """
+    active_count = len(self.items) - len(self.free_slots)
+    self.visible_count = visible_count
+    self.culled_count = max(active_count - visible_count, 0)
+    self.occluded_count = 0
+
+    # Stats are read back with latency, removed batches are skipped
+    for batch in np.flatnonzero(batch_details > 0).tolist():
+        texture = self.batch_textures.get(batch)
+        if texture is not None:
+            texture_stream_request(texture, float(batch_details[batch]))
+
+
+def _render_queue_layout_gpu(self: RenderQueue) -> CullLayout:
+    n = len(self.items)
+    slots = np.flatnonzero(self.active[:n])
+
+    keys = self.keys[slots] & np.uint64(~_DEPTH_MASK & (2 ** 64 - 1))
+    order = slots[np.argsort(keys, kind='stable')]
+    batch_ids = self.keys[order] >> np.uint64(_BATCH_SHIFT)
+
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = batch_ids[1:] != batch_ids[:-1]
+    starts = np.flatnonzero(is_start)
+    counts = np.diff(starts, append=len(order))
+
+    # Command per LOD of every batch, LODs of batch are consecutive
+    lods_counts = self.lods_counts[order[starts]]
+    first_commands = np.cumsum(lods_counts) - lods_counts
+
+    item_commands = np.full(n, -1, dtype=np.int32)
+    item_commands[order] = np.repeat(first_commands, counts)
+
+    batches = []
+    for first, lods_count in zip(starts.tolist(), lods_counts.tolist()):
+        item = self.items[order[first]]
+        batches.extend(
+            DrawBatch(item.mesh, item.texture, lod, 0, 0)
+            for lod in range(lods_count)
+        )
+
+    return CullLayout(batches, item_commands, len(self.batches.refs))
+
+
+def render_queue_get_lod(self: RenderQueue, slot: int) -> int | None:
+    # -> LOD selected at the last update, `None` if it was selected by GPU
+    if self.is_gpu_culled:
+        return None
+
+    return int(self.lods[slot])
+
+
+def _render_queue_sort(
+    self: RenderQueue,
+    slots: np.ndarray,
+    keys: np.ndarray,
+) -> None:
+    # Set new keys of active `slots` and keep `order` sorted by them
+    changed = keys != self.keys[slots]
+    changed_count = int(np.count_nonzero(changed))
+
+    if self.is_sorted and not changed_count:
+        return
+
+    self.keys[slots] = keys
+
+    if not self.is_sorted or changed_count > len(slots) * _MERGE_MAX_PART:
+        self.order = slots[np.argsort(keys, kind='stable')]
+        self.is_sorted = True
+        return
+
+    # Unchanged slots stay sorted, changed ones are inserted among them
+    moved = slots[changed]
+    is_moved = np.zeros(len(self.active), dtype=bool)
+    is_moved[moved] = True
+    order = self.order[~is_moved[self.order]]
+
+    moved = moved[np.argsort(self.keys[moved], kind='stable')]
+    positions = np.searchsorted(
+        self.keys[order], self.keys[moved], side='right'
+    )
+    self.order = np.insert(order, positions, moved)
+
+
+def _render_queue_acquire_keys(
+    self: RenderQueue,
+    texture_key: t.Hashable,
+    geometry_key: t.Hashable,
+    batch_key: t.Hashable,
+) -> list[int]:
+    # -> indices of texture, geometry and batch keys. Nothing is acquired,
+    # if any of tables is full
+    tables = (self.textures, self.geometries, self.batches)
+    keys = (texture_key, geometry_key, batch_key)
+    indices = []
+
+    try:
+        for table, key in zip(tables, keys):
+            indices.append(_key_table_acquire(table, key))
+    except RuntimeError:
+        for table, key in zip(tables, keys[:len(indices)]):
+            _key_table_release(table, key)
+        raise
+
+    return indices
+
+
+def _render_queue_grow(self: RenderQueue) -> None:
+    for name in (
+        'active', 'keys', 'matrices', 'materials', 'bounds', 'radii',
+        'detail_radii', 'lods_counts', 'lods', 'zones', 'visible',
+    ):
+        array = getattr(self, name)
+
+        if name in _SOA_ARRAYS:
+            # Slots are the last axis of SoA arrays
+            size = array.shape[1]
+            grown = np.zeros((array.shape[0], 2 * size), array.dtype)
+            grown[:, :size] = array
+        else:
+            grown = np.zeros((2 * len(array), *array.shape[1:]), array.dtype)
+            grown[:len(array)] = array
+
+        setattr(self, name, grown)
+
+    self.centers, self.extents = self.bounds[:3], self.bounds[3:]
+
+
+def _render_queue_mark_gpu_dirty(self: RenderQueue, slot: int) -> None:
+    if self.gpu_dirty_start < self.gpu_dirty_end:
+        self.gpu_dirty_start = min(self.gpu_dirty_start, slot)
+        self.gpu_dirty_end = max(self.gpu_dirty_end, slot + 1)
+    else:
+        self.gpu_dirty_start, self.gpu_dirty_end = slot, slot + 1
+
+
+def _key_table_acquire(self: KeyTable, key: t.Hashable) -> int:
+    index = self.indices.get(key)
+
+    if index is None:
+        if self.free:
+            index = self.free.pop()
+        elif len(self.refs) < 1 << self.bits:
+            index = len(self.refs)
+            self.refs.append(0)
+        else:
+            # Bigger index would corrupt neighbour fields of sort key
+            raise RuntimeError(
+                f'Render queue {self.name} table is full: '
+                f'{1 << self.bits} keys ({self.bits} bits)'
+            )
+
+        self.indices[key] = index
+
+    self.refs[index] += 1
+    return index
+
+
+def _key_table_release(self: KeyTable, key: t.Hashable) -> bool:
+    # -> whether index is not referenced anymore
+    index = self.indices[key]
+    self.refs[index] -= 1
+
+    if self.refs[index]:
+        return False
+
+    del self.indices[key]
+    self.free.append(index)
+    return True
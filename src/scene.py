@@ -1,16 +1,68 @@
+import logging
+import typing as t
 from dataclasses import dataclass
+from dataclasses import field
+from math import floor
 
+import glm
+from glm import mat4
 from glm import vec3
 
+from .bvh import Bvh
+from .bvh import bvh_create
+from .bvh import bvh_insert
+from .bvh import bvh_move
+from .bvh import bvh_ray_aabb
+from .bvh import bvh_raycast
+from .bvh import bvh_remove
+from .camera import camera_calc_cull_view
+from .camera import camera_calc_frustum_planes
 from .camera import camera_calc_model_matrix
-from .camera import camera_calc_perspective_matrix
 from .camera import camera_calc_view_matrix
+from .camera import camera_get_perspective_matrix
+from .camera import camera_get_position
+from .config import config
 from .gfx import GfxInstance
+from .gfx import gfx_capture_depth
 from .gfx import gfx_draw_scene
+from .gfx import gfx_draw_scene_culled
+from .gfx import gfx_get_depth_pyramid
+from .gfx import gfx_poll_cull_stats
+from .gfx import gfx_unload_mesh
 from .loader import loader_load_scene
+from .mesh import Mesh
+from .mesh import mesh_bounds_transform
+from .mesh_batch import mesh_batch_build
+from .portal import NO_ZONE
+from .portal import PortalGraph
+from .portal import portal_graph_create
+from .portal import portal_graph_get_zone
+from .portal import portal_graph_traverse
+from .render_queue import RenderQueue
+from .render_queue import render_queue_add
+from .render_queue import render_queue_apply_gpu_stats
+from .render_queue import render_queue_batches
+from .render_queue import render_queue_create
+from .render_queue import render_queue_get_lod
+from .render_queue import render_queue_remove
+from .render_queue import render_queue_set_transform
+from .render_queue import render_queue_set_zone
+from .render_queue import render_queue_sync_gpu
+from .render_queue import render_queue_update
+from .texture import Texture
+from .texture import TextureID
 from .world import World
 from .world import WorldObject
 
+logger = logging.getLogger(__name__)
+
+
+class StaticChunkKey(t.NamedTuple):
+    texture: TextureID
+    material: int
+    cell: tuple[int, int, int]
+    zone: int  # of portals, chunks do not span rooms
+
 
 @dataclass
 class SceneObject:
@@ -21,6 +73,29 @@ class SceneObject:
     scale: vec3
 
     is_active: bool
+    is_static: bool = False
+
+    # Item of render queue, set for active dynamic objects
+    render_slot: int | None = None
+    # Leaf of scene BVH, set for active objects
+    bvh_leaf: int | None = None
+
+    # Chunk, which static object is merged into
+    static_key: StaticChunkKey | None = None
+
+
+@dataclass
+class StaticChunk:
+    texture: Texture
+    objects: list[SceneObject]
+
+    # Merged active objects, `None` if there are no ones
+    mesh: Mesh | None = None
+    render_slot: int | None = None
+
+    # The biggest bounding radius of objects, see `scene_draw`
+    object_radius: float = 0.0
+
 
 @dataclass
 class Scene:
@@ -28,8 +103,25 @@ class Scene:
 
     _obj_id_iter: int
 
+    # Static objects are drawn by chunks of spatial grid
+    static_chunks: dict[StaticChunkKey, StaticChunk] = field(
+        default_factory=dict
+    )
+    # Draw items are kept between frames, only changed ones are updated
+    render_queue: RenderQueue = field(default_factory=render_queue_create)
+
+    # Objects changed since last frame by id, see `scene_invalidate_object`
+    dirty_objects: dict[int, SceneObject] = field(default_factory=dict)
 
-def scene_load_from_config(world: World) -> Scene:
+    # Spatial index of active objects (items are `SceneObject`), see
+    # `bvh` module for raycast, overlap and nearest queries
+    bvh: Bvh = field(default_factory=bvh_create)
+
+    # Cells and portals of interiors, `None` if scene has no cells
+    portals: PortalGraph | None = None
+
+
+def scene_load_from_config(world: World, gfx: GfxInstance) -> Scene:
     scene_params = loader_load_scene()
     objects = []
     _obj_id_iter = 0
@@ -44,13 +136,28 @@ def scene_load_from_config(world: World) -> Scene:
                 position=obj_params.position,
                 rotation=obj_params.rotation,
                 scale=obj_params.scale,
-                is_active=True
+                is_active=True,
+                is_static=obj_params.is_static,
             ),
         )
         _obj_id_iter += 1
         
 
-    return Scene(_obj_id_iter=_obj_id_iter, objects=objects)
+    portals = None
+    if scene_params.cells:
+        portals = portal_graph_create(
+            scene_params.cells, scene_params.portals
+        )
+
+    scene = Scene(
+        _obj_id_iter=_obj_id_iter, objects=objects, portals=portals
+    )
+
+    for obj in objects:
+        scene_invalidate_object(scene, obj)
+    scene_update_objects(scene, gfx)
+
+    return scene
 
 
 def scene_add_object(
@@ -60,31 +167,301 @@ def scene_add_object(
     r: vec3 | None = None,
     s: vec3 | None = None, 
 ) -> None:
-    self.objects.append(
-        SceneObject(
-            id=self._obj_id_iter,
-            ptr=ptr,
-            position=p,
-            rotation=r,
-            scale=s,
-            is_active=True,
-        )
+    obj = SceneObject(
+        id=self._obj_id_iter,
+        ptr=ptr,
+        position=p,
+        rotation=r,
+        scale=s,
+        is_active=True,
     )
+    self.objects.append(obj)
     self._obj_id_iter += 1
 
+    scene_invalidate_object(self, obj)
+
 
 def scene_draw(self: Scene, gfx: GfxInstance):
+    scene_update_objects(self, gfx)
+
+    view_mat = camera_calc_view_matrix()
+    m_view_persp = camera_get_perspective_matrix() * view_mat
+
+    if gfx.culler is not None:
+        _scene_draw_culled(self, gfx, view_mat, m_view_persp)
+        return
+
+    # Cells seen through portals from camera cell
+    visible_zones = None
+    if self.portals is not None and config.PORTAL_CULLING:
+        visible_zones = portal_graph_traverse(
+            self.portals,
+            camera_get_position(),
+            camera_calc_frustum_planes(m_view_persp),
+        )
+
+    # Culling, LODs, texture mips and depth order for current camera,
+    # occluders are taken from depth of a previous frame
+    render_queue_update(
+        self.render_queue,
+        m_view_persp,
+        gfx_get_depth_pyramid(gfx),
+        visible_zones,
+    )
+    batches, matrices, materials = render_queue_batches(self.render_queue)
+
     gfx_draw_scene(
         gfx,
-        persp_mat=camera_calc_perspective_matrix(),  # TODO
-        view_mat=camera_calc_view_matrix(),  # TODO
-        objects_queue=(
-            (
-                obj.ptr.mesh.gfx_data,
-                obj.ptr.texture.gfx_data,
-                camera_calc_model_matrix(obj.position, obj.rotation, obj.scale),
+        view_mat=view_mat,
+        batches=batches,
+        matrices=matrices,
+        materials=materials,
+    )
+    gfx_capture_depth(gfx, m_view_persp, self.render_queue.frame)
+
+
+def _scene_draw_culled(
+    self: Scene,
+    gfx: GfxInstance,
+    view_mat: mat4,
+    m_view_persp: mat4,
+) -> None:
+    # GPU culling: only changes of render queue are synced, stats and
+    # texture mip requests come from read back of previous frames
+    layout, items = render_queue_sync_gpu(self.render_queue)
+
+    view = camera_calc_cull_view(m_view_persp)
+    if not config.FRUSTUM_CULLING:
+        view.planes[:] = (0.0, 0.0, 0.0, 1.0)
+
+    gfx_draw_scene_culled(gfx, view_mat, view, layout, items)
+
+    stats = gfx_poll_cull_stats(gfx)
+    if stats is not None:
+        render_queue_apply_gpu_stats(self.render_queue, *stats)
+
+
+def scene_invalidate_object(self: Scene, obj: SceneObject) -> None:
+    # Should be called on change of object (transform, activity), its
+    # draw item (or chunk of static object) is updated at the next frame,
+    # spatial index is updated at once
+    _scene_update_bvh_leaf(self, obj)
+
+    self.dirty_objects[obj.id] = obj
+
+
+def scene_update_objects(self: Scene, gfx: GfxInstance) -> None:
+    """Update draw items of changed objects, move changed static objects
+    to their chunks and rebuild chunks, which have changed objects
+    """
+    if not self.dirty_objects:
+        return
+
+    changed_keys = set()
+
+    for obj in self.dirty_objects.values():
+        if not obj.is_static:
+            _scene_update_render_item(self, obj)
+            continue
+
+        if obj.static_key is not None:
+            self.static_chunks[obj.static_key].objects.remove(obj)
+            changed_keys.add(obj.static_key)
+
+        key = _scene_static_key(self, obj)
+        if key not in self.static_chunks:
+            self.static_chunks[key] = StaticChunk(
+                texture=obj.ptr.texture, objects=[]
             )
-            for obj in self.objects
-            if obj.is_active
+
+        self.static_chunks[key].objects.append(obj)
+        obj.static_key = key
+        changed_keys.add(key)
+
+    self.dirty_objects.clear()
+
+    for key in changed_keys:
+        _scene_build_static_chunk(self, gfx, key)
+
+
+def scene_get_drawn_lod(
+    self: Scene,
+    obj: SceneObject,
+) -> tuple[Mesh, int] | None:
+    # -> drawn mesh of object (or of its chunk) and its LOD at last frame,
+    # `None` if it is not drawn or LOD is selected by GPU culling
+    if obj.is_static:
+        chunk = self.static_chunks.get(obj.static_key)
+        if chunk is None or chunk.render_slot is None:
+            return None
+
+        mesh, slot = chunk.mesh, chunk.render_slot
+    else:
+        if obj.render_slot is None:
+            return None
+
+        mesh, slot = obj.ptr.mesh, obj.render_slot
+
+    lod = render_queue_get_lod(self.render_queue, slot)
+    if lod is None:
+        return None
+
+    return mesh, lod
+
+
+def scene_pick_object(
+    self: Scene,
+    origin: vec3,
+    direction: vec3,
+) -> SceneObject | None:
+    # -> the nearest object hit by ray, by box of its mesh in object space
+    def hit_test(obj: SceneObject, origin: vec3, direction: vec3):
+        m_inv = glm.inverse(
+            camera_calc_model_matrix(obj.position, obj.rotation, obj.scale)
+        )
+        bounds = obj.ptr.mesh.bounds
+
+        # Ray parameter is the same in object space
+        return bvh_ray_aabb(
+            vec3(m_inv * glm.vec4(origin, 1.0)),
+            vec3(m_inv * glm.vec4(direction, 0.0)),
+            bounds.aabb_min,
+            bounds.aabb_max,
+        )
+
+    hit = bvh_raycast(self.bvh, origin, direction, hit_test=hit_test)
+    return None if hit is None else hit[0]
+
+
+def _scene_update_bvh_leaf(self: Scene, obj: SceneObject) -> None:
+    if not obj.is_active:
+        if obj.bvh_leaf is not None:
+            bvh_remove(self.bvh, obj.bvh_leaf)
+            obj.bvh_leaf = None
+        return
+
+    aabb_min, aabb_max = _scene_object_aabb(obj)
+
+    if obj.bvh_leaf is None:
+        obj.bvh_leaf = bvh_insert(self.bvh, aabb_min, aabb_max, obj)
+    else:
+        bvh_move(self.bvh, obj.bvh_leaf, aabb_min, aabb_max)
+
+
+def _scene_update_render_item(self: Scene, obj: SceneObject) -> None:
+    if not obj.is_active:
+        if obj.render_slot is not None:
+            render_queue_remove(self.render_queue, obj.render_slot)
+            obj.render_slot = None
+        return
+
+    model_mat = camera_calc_model_matrix(
+        obj.position, obj.rotation, obj.scale
+    )
+    mesh = obj.ptr.mesh
+
+    if obj.render_slot is None:
+        obj.render_slot = render_queue_add(
+            self.render_queue,
+            mesh.gfx_data,
+            obj.ptr.texture.gfx_data,
+            obj.ptr.material,
+            model_mat,
+            mesh.bounds,
+            zone=_scene_object_zone(self, obj),
+        )
+    else:
+        render_queue_set_transform(
+            self.render_queue, obj.render_slot, model_mat, mesh.bounds
+        )
+        render_queue_set_zone(
+            self.render_queue, obj.render_slot, _scene_object_zone(self, obj)
+        )
+
+
+def _scene_object_aabb(obj: SceneObject) -> tuple[vec3, vec3]:
+    # -> world space AABB of object
+    model_mat = camera_calc_model_matrix(
+        obj.position, obj.rotation, obj.scale
+    )
+    return mesh_bounds_transform(obj.ptr.mesh.bounds, model_mat)
+
+
+def _scene_object_zone(self: Scene, obj: SceneObject) -> int:
+    if self.portals is None:
+        return NO_ZONE
+
+    return portal_graph_get_zone(self.portals, *_scene_object_aabb(obj))
+
+
+# -- Static batching
+
+
+def _scene_static_key(self: Scene, obj: SceneObject) -> StaticChunkKey:
+    size = config.STATIC_CHUNK_SIZE
+    cell = tuple(floor(coord / size) for coord in obj.position)
+
+    return StaticChunkKey(
+        texture=obj.ptr.texture.id,
+        material=obj.ptr.material,
+        cell=cell,
+        zone=_scene_object_zone(self, obj),
+    )
+
+
+def _scene_build_static_chunk(
+    self: Scene,
+    gfx: GfxInstance,
+    key: StaticChunkKey,
+) -> None:
+    chunk = self.static_chunks[key]
+
+    if chunk.render_slot is not None:
+        render_queue_remove(self.render_queue, chunk.render_slot)
+        chunk.render_slot = None
+
+    if chunk.mesh is not None:
+        gfx_unload_mesh(gfx, chunk.mesh.gfx_data)
+        chunk.mesh = None
+
+    if not chunk.objects:
+        del self.static_chunks[key]
+        return
+
+    active = [obj for obj in chunk.objects if obj.is_active]
+    if not active:
+        return
+
+    instances = []
+    for obj in active:
+        model_mat = camera_calc_model_matrix(
+            obj.position, obj.rotation, obj.scale
         )
+        instances.append((obj.ptr.mesh, model_mat))
+
+    x, y, z = key.cell
+    chunk.mesh = mesh_batch_build(
+        gfx,
+        f'static/{key.texture}/{key.material}/{x}_{y}_{z}/{key.zone}',
+        instances,
+    )
+    chunk.object_radius = max(
+        obj.ptr.mesh.bounds.radius * max(abs(obj.scale)) for obj in active
+    )
+
+    # Texture is mapped per object, so its detail is requested for the
+    # biggest object (as if it is at chunk center)
+    chunk.render_slot = render_queue_add(
+        self.render_queue,
+        chunk.mesh.gfx_data,
+        chunk.texture.gfx_data,
+        key.material,
+        mat4(1.0),
+        chunk.mesh.bounds,
+        detail_radius=chunk.object_radius,
+        zone=key.zone,
+    )
+
+    logger.info(
+        f'Static chunk built: {chunk.mesh.id} ({len(active)} objects)'
     )
@@ -1,11 +1,32 @@
+import hashlib
 import logging
+import typing as t
+from collections import defaultdict
 from dataclasses import dataclass
 
+import numpy as np
+
+from .config import config
 from .db import TextureRecord
 from .gfx import GfxInstance
+from .gfx import TextureFormat
 from .gfx import TextureGfxData
+from .gfx import gfx_create_texture_array
 from .gfx import gfx_load_texture
+from .gfx import gfx_load_texture_layer
+from .iofs import iofs_get_cache_path
+from .iofs import iofs_get_texture_path
 from .iofs import iofs_read_texture_file
+from .iofs import iofs_source_key
+from .texture_bc import bc_encode
+from .texture_cache import TextureCacheEntry
+from .texture_cache import texture_build_mips
+from .texture_cache import texture_cache_close
+from .texture_cache import texture_cache_open
+from .texture_cache import texture_cache_read_header
+from .texture_cache import texture_cache_write
+from .texture_stream import TextureStreamer
+from .texture_stream import texture_stream_load
 
 logger = logging.getLogger(__name__)
 
@@ -19,18 +40,240 @@ class Texture:
     path: str
     gfx_data: TextureGfxData
 
+    # Bytes of full mip chain in GPU format
+    size: int = 0
+
+
+class TextureShape(t.NamedTuple):
+    width: int
+    height: int
+    format: TextureFormat
+    components: int  # of uncompressed format, 0 for block compressed
+
+
+class TextureArraySlot(t.NamedTuple):
+    array_id: int
+    layer: int
+
 
 def texture_load_from_record(
     record: TextureRecord,
     gfx: GfxInstance,
+    slot: TextureArraySlot | None = None,
+    streamer: TextureStreamer | None = None,
 ) -> Texture:
-    image = iofs_read_texture_file(record.path)
-    gfx_data = gfx_load_texture(gfx, image)
-    image.close()
+    cooked = texture_cook(record.path, record.format)
+    return texture_load_from_cooked(record, gfx, cooked, slot, streamer)
+
+
+def texture_load_from_cooked(
+    record: TextureRecord,
+    gfx: GfxInstance,
+    cooked: TextureCacheEntry,
+    slot: TextureArraySlot | None = None,
+    streamer: TextureStreamer | None = None,
+) -> Texture:
+    # Cache entry is closed after upload (or owned by streamer, which
+    # uploads the rest of mips later)
+    levels = cooked.levels
+    format = TextureFormat(cooked.format)
+    size = sum(level.nbytes for level in levels)
+
+    if slot is not None:
+        gfx_data = gfx_load_texture_layer(
+            gfx, slot.array_id, slot.layer,
+            levels, format, cooked.width, cooked.height,
+        )
+        texture_cache_close(cooked)
+
+    elif streamer is not None:
+        gfx_data = texture_stream_load(streamer, gfx, cooked)
+
+    else:
+        gfx_data = gfx_load_texture(
+            gfx, levels, format, cooked.width, cooked.height
+        )
+        texture_cache_close(cooked)
 
     logger.info(f'Texture loaded: {record.id}')
     return Texture(
         id=record.id,
         path=record.path,
         gfx_data=gfx_data,
+        size=size,
     )
+
+
+def texture_content_key(cooked: TextureCacheEntry) -> bytes:
+    # See `mesh_content_key`
+    return cooked.key.hash + cooked.settings
+
+
+def texture_create_arrays(
+    records: list[TextureRecord],
+    gfx: GfxInstance,
+) -> dict[TextureID, TextureArraySlot]:
+    """Allocate texture array pages for textures of the same size and format
+
+    Textures, which have no pair, are left standalone (not in result)
+    """
+    groups = defaultdict(list)
+    for record in records:
+        shape = texture_probe(record.path, record.format)
+        groups[shape].append(record.id)
+
+    slots = {}
+    pages_count = 0
+
+    for shape, texture_ids in groups.items():
+        for start in range(0, len(texture_ids), config.TEXTURE_ARRAY_LAYERS):
+            page = texture_ids[start:start + config.TEXTURE_ARRAY_LAYERS]
+            if len(page) < 2:
+                continue
+
+            array_id = gfx_create_texture_array(gfx, *shape, len(page))
+            pages_count += 1
+
+            for layer, texture_id in enumerate(page):
+                slots[texture_id] = TextureArraySlot(array_id, layer)
+
+    logger.info(
+        f'Texture arrays: {len(slots)} of {len(records)} textures '
+        f'in {pages_count} pages'
+    )
+    return slots
+
+
+def texture_cook_job(path: str, format: str | None) -> bytes:
+    # See `mesh_cook_job`
+    cooked = texture_cook(path, format)
+    key = texture_content_key(cooked)
+    texture_cache_close(cooked)
+
+    return key
+
+
+def texture_cook(path: str, format: str | None) -> TextureCacheEntry:
+    """Get mapped cooked texture, (re)building cache entry if needed
+
+    format: requested format (see `texture_resolve_format`)
+    """
+    source_path = iofs_get_texture_path(path)
+    cache_path = iofs_get_cache_path(f'textures/{path}.dds')
+    settings = _texture_cook_settings(format)
+
+    cooked = texture_cache_open(cache_path, source_path)
+    if cooked is not None:
+        if cooked.settings == settings:
+            return cooked
+
+        texture_cache_close(cooked)
+
+    key = iofs_source_key(source_path)
+
+    # OpenGL expects rows from bottom to top
+    pixels = texture_decode(path)[::-1]
+    h, w, components = pixels.shape
+
+    gpu_format = texture_resolve_format(format, components)
+    levels = texture_build_mips(pixels)
+
+    if gpu_format != TextureFormat.uncompressed:
+        quality = config.TEXTURE_COMPRESSION_QUALITY
+        levels = [bc_encode(level, gpu_format, quality) for level in levels]
+
+    texture_cache_write(cache_path, key, settings, gpu_format, w, h, levels)
+
+    size = sum(level.nbytes for level in levels)
+    logger.info(
+        f'Texture cooked: {path} ({w}x{h}, {gpu_format}, {size >> 10} KiB)'
+    )
+
+    cooked = texture_cache_open(cache_path, source_path)
+    if cooked is None:
+        raise RuntimeError(f'Unable to open cooked texture: {cache_path}')
+
+    return cooked
+
+
+def texture_resolve_format(
+    format: str | None,
+    components: int,
+) -> TextureFormat:
+    """GPU format for requested one
+
+    `None` means default format from config, `auto` selects BC3 for
+    images with alpha channel and BC1 for the rest
+    """
+    format = format or config.TEXTURE_COMPRESSION
+
+    if format == 'auto':
+        if components == 4:
+            return TextureFormat.bc3
+        return TextureFormat.bc1
+
+    return TextureFormat(format)
+
+
+def _texture_cook_settings(format: str | None) -> bytes:
+    settings = (
+        format or config.TEXTURE_COMPRESSION,
+        config.TEXTURE_COMPRESSION_QUALITY,
+    )
+    return hashlib.blake2b(repr(settings).encode(), digest_size=8).digest()
+
+
+def texture_probe(path: str, format: str | None) -> TextureShape:
+    # Shape is read from header of cooked texture, source image header is
+    # read on cache miss only, see `texture_decode` for components
+    source_path = iofs_get_texture_path(path)
+    cache_path = iofs_get_cache_path(f'textures/{path}.dds')
+    settings = _texture_cook_settings(format)
+
+    header = texture_cache_read_header(cache_path, source_path)
+    if header is not None and header.settings == settings:
+        return _texture_shape(
+            header.width,
+            header.height,
+            TextureFormat(header.format),
+            header.components,
+        )
+
+    image = iofs_read_texture_file(path)
+    components = {'L': 1, 'RGB': 3}.get(image.mode, 4)
+    width, height = image.size
+    image.close()
+
+    return _texture_shape(
+        width, height, texture_resolve_format(format, components), components
+    )
+
+
+def _texture_shape(
+    width: int,
+    height: int,
+    format: TextureFormat,
+    components: int,
+) -> TextureShape:
+    # Block compressed formats define their own channels, so components
+    # are not a part of shape (texture arrays are grouped by shape)
+    if format != TextureFormat.uncompressed:
+        components = 0
+
+    return TextureShape(width, height, format, components)
+
+
+def texture_decode(path: str) -> np.ndarray:
+    # -> (height, width, components) uint8 array
+    image = iofs_read_texture_file(path)
+
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    pixels = np.asarray(image, dtype=np.uint8)
+    image.close()
+
+    if pixels.ndim == 2:
+        pixels = pixels[..., np.newaxis]
+
+    return pixels
@@ -0,0 +1,259 @@
+"""texture_bc - Block Compression Encoder
+
+CPU encoder of BC1 (DXT1), BC3 (DXT5) and BC5 (RGTC2) formats. Image is
+split into 4x4 blocks and all blocks are encoded at once by whole-array
+operations.
+
+Color endpoints are selected by `quality` level:
+    0 - corners of colors bounding box (fastest)
+    1 - extremes of colors along principal axis
+    2 - principal axis + least squares refinement of endpoints
+        for selected indices (slowest, lowest error)
+
+Single channel blocks (BC3 alpha, BC5 channels) always use min / max
+endpoints with 8 interpolated values.
+"""
+import numpy as np
+
+BC_BLOCK_BYTES = {
+    'bc1': 8,
+    'bc3': 16,
+    'bc5': 16,
+}
+
+_POWER_ITERATIONS = 8
+_REFINE_ITERATIONS = 2
+
+# BC1 palette index -> weight of color0 (palette is c0, c1, 2/3, 1/3)
+_BC1_WEIGHTS = np.array([1.0, 0.0, 2.0 / 3.0, 1.0 / 3.0])
+
+# Single channel palette index -> weight of value0
+_BC4_WEIGHTS = np.array([1.0, 0.0, *(np.arange(6, 0, -1) / 7.0)])
+
+_BC1_BLOCK = np.dtype([('c0', '<u2'), ('c1', '<u2'), ('indices', '<u4')])
+_BC4_BLOCK = np.dtype([('a0', 'u1'), ('a1', 'u1'), ('indices', 'u1', 6)])
+
+
+def bc_encode(pixels: np.ndarray, format: str, quality: int) -> np.ndarray:
+    """Encode (height, width, components) uint8 image
+
+    Returns (blocks height, blocks width, block bytes) uint8 array
+    """
+    blocks = _bc_split_blocks(pixels)
+    bh, bw, _, components = blocks.shape
+    blocks = blocks.reshape(bh * bw, 16, components)
+
+    # Grayscale is replicated to RGB
+    rgb = blocks[..., :3] if components >= 3 else np.repeat(
+        blocks[..., :1], 3, axis=2
+    )
+
+    match format:
+        case 'bc1':
+            encoded = [_bc1_encode(rgb, quality)]
+
+        case 'bc3':
+            alpha = (
+                blocks[..., 3] if components == 4
+                else np.full(blocks.shape[:2], 255.0)
+            )
+            encoded = [_bc4_encode(alpha), _bc1_encode(rgb, quality)]
+
+        case 'bc5':
+            green = (
+                blocks[..., 1] if components >= 2
+                else np.zeros(blocks.shape[:2])
+            )
+            encoded = [_bc4_encode(blocks[..., 0]), _bc4_encode(green)]
+
+        case _:
+            raise ValueError(f'Unsupported block compression: {format}')
+
+    return np.concatenate(encoded, axis=1).reshape(bh, bw, -1)
+
+
+def _bc_split_blocks(pixels: np.ndarray) -> np.ndarray:
+    # -> (blocks height, blocks width, 16, components) float array,
+    # partial blocks are padded by edge texels
+    height, width, components = pixels.shape
+    pad_h, pad_w = -height % 4, -width % 4
+
+    if pad_h or pad_w:
+        pixels = np.pad(pixels, ((0, pad_h), (0, pad_w), (0, 0)), 'edge')
+
+    bh, bw = pixels.shape[0] // 4, pixels.shape[1] // 4
+    blocks = pixels.reshape(bh, 4, bw, 4, components).swapaxes(1, 2)
+
+    return blocks.reshape(bh, bw, 16, components).astype(np.float32)
+
+
+# -- BC1 color block
+
+
+def _bc1_encode(colors: np.ndarray, quality: int) -> np.ndarray:
+    # colors: (n, 16, 3) -> (n, 8) uint8
+    c0, c1 = _bc1_initial_endpoints(colors, quality)
+    v0, v1, indices, error = _bc1_fit(colors, c0, c1)
+
+    for _ in range(_REFINE_ITERATIONS if quality >= 2 else 0):
+        c0, c1 = _bc1_refine_endpoints(colors, indices, c0, c1)
+        r0, r1, r_indices, r_error = _bc1_fit(colors, c0, c1)
+
+        better = r_error < error
+        v0 = np.where(better, r0, v0)
+        v1 = np.where(better, r1, v1)
+        indices = np.where(better[:, None], r_indices, indices)
+        error = np.minimum(r_error, error)
+
+    block = np.empty(len(colors), dtype=_BC1_BLOCK)
+    block['c0'] = v0
+    block['c1'] = v1
+    block['indices'] = _bc_pack_indices(indices, bits=2)
+
+    return block.view(np.uint8).reshape(-1, 8)
+
+
+def _bc1_initial_endpoints(
+    colors: np.ndarray,
+    quality: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    if quality <= 0:
+        # Bounding box is inset a bit, extreme colors are rare
+        low, high = colors.min(axis=1), colors.max(axis=1)
+        inset = (high - low) / 16.0
+        return high - inset, low + inset
+
+    mean = colors.mean(axis=1)
+    centered = colors - mean[:, None]
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+
+    # Principal axis by power iteration
+    axis = np.ones((len(colors), 3), dtype=np.float32)
+    for _ in range(_POWER_ITERATIONS):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        axis /= np.maximum(
+            np.abs(axis).max(axis=1, keepdims=True), 1e-12
+        )
+
+    axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+    projection = np.einsum('nki,ni->nk', centered, axis)
+
+    c0 = mean + axis * projection.max(axis=1)[:, None]
+    c1 = mean + axis * projection.min(axis=1)[:, None]
+    return np.clip(c0, 0, 255), np.clip(c1, 0, 255)
+
+
+def _bc1_refine_endpoints(
+    colors: np.ndarray,
+    indices: np.ndarray,
+    c0: np.ndarray,
+    c1: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Least squares endpoints for fixed indices:
+    #   min sum |w * c0 + (1 - w) * c1 - color|^2
+    w0 = _BC1_WEIGHTS[indices]
+    w1 = 1.0 - w0
+
+    a00 = (w0 * w0).sum(axis=1)
+    a01 = (w0 * w1).sum(axis=1)
+    a11 = (w1 * w1).sum(axis=1)
+    b0 = np.einsum('nk,nki->ni', w0, colors)
+    b1 = np.einsum('nk,nki->ni', w1, colors)
+
+    det = a00 * a11 - a01 * a01
+    solvable = np.abs(det) > 1e-6
+    det = np.where(solvable, det, 1.0)[:, None]
+
+    new_c0 = (a11[:, None] * b0 - a01[:, None] * b1) / det
+    new_c1 = (a00[:, None] * b1 - a01[:, None] * b0) / det
+
+    return (
+        np.clip(np.where(solvable[:, None], new_c0, c0), 0, 255),
+        np.clip(np.where(solvable[:, None], new_c1, c1), 0, 255),
+    )
+
+
+def _bc1_fit(
+    colors: np.ndarray,
+    c0: np.ndarray,
+    c1: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Quantize endpoints and select indices
+    # -> (color0 565, color1 565, indices, squared error)
+    v0 = _bc_pack_565(c0)
+    v1 = _bc_pack_565(c1)
+
+    # 4-color mode requires color0 > color1
+    swap = v0 < v1
+    v0, v1 = np.where(swap, v1, v0), np.where(swap, v0, v1)
+
+    palette = (
+        _BC1_WEIGHTS[None, :, None] * _bc_unpack_565(v0)[:, None]
+        + (1.0 - _BC1_WEIGHTS)[None, :, None] * _bc_unpack_565(v1)[:, None]
+    )
+    distance = (
+        (colors[:, :, None] - palette[:, None]) ** 2
+    ).sum(axis=3)
+
+    indices = distance.argmin(axis=2)
+    error = distance.min(axis=2).sum(axis=1)
+
+    # Equal endpoints switch block into 3-color mode, where index 3
+    # is black, so only index 0 is used
+    indices[v0 == v1] = 0
+    return v0, v1, indices, error
+
+
+def _bc_pack_565(colors: np.ndarray) -> np.ndarray:
+    r = np.rint(colors[:, 0] * (31 / 255)).astype(np.uint16)
+    g = np.rint(colors[:, 1] * (63 / 255)).astype(np.uint16)
+    b = np.rint(colors[:, 2] * (31 / 255)).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def _bc_unpack_565(values: np.ndarray) -> np.ndarray:
+    # Bits are replicated as hardware does
+    values = values.astype(np.uint32)
+    r = (values >> 11) & 31
+    g = (values >> 5) & 63
+    b = values & 31
+
+    return np.stack(
+        ((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)),
+        axis=1,
+    ).astype(np.float32)
+
+
+# -- BC4 single channel block (BC3 alpha, BC5 channels)
+
+
+def _bc4_encode(values: np.ndarray) -> np.ndarray:
+    # values: (n, 16) -> (n, 8) uint8
+    a0 = np.rint(values.max(axis=1))
+    a1 = np.rint(values.min(axis=1))
+
+    palette = (
+        _BC4_WEIGHTS[None] * a0[:, None]
+        + (1.0 - _BC4_WEIGHTS)[None] * a1[:, None]
+    )
+    indices = np.abs(values[:, :, None] - palette[:, None]).argmin(axis=2)
+    indices[a0 == a1] = 0
+
+    block = np.empty(len(values), dtype=_BC4_BLOCK)
+    block['a0'] = a0
+    block['a1'] = a1
+
+    packed = _bc_pack_indices(indices, bits=3)
+    block['indices'] = (
+        (packed[:, None] >> (8 * np.arange(6, dtype=np.uint64))) & 0xff
+    )
+
+    return block.view(np.uint8).reshape(-1, 8)
+
+
+def _bc_pack_indices(indices: np.ndarray, bits: int) -> np.ndarray:
+    # (n, 16) -> (n,) uint64, texel i is at bits [i * bits, (i + 1) * bits)
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(bits)
+    return np.bitwise_or.reduce(
+        indices.astype(np.uint64) << shifts, axis=1
+    )
@@ -0,0 +1,377 @@
+"""texture_cache - Cooked Texture Cache
+
+Textures are cooked into DDS files with full mip chain, which are mapped
+and uploaded level by level without decoding:
+
+    | 'DDS ' | DDS header (124 bytes) | level 0 | level 1 | ... | level N |
+
+Levels are tightly packed, rows are stored bottom-up (already flipped for
+OpenGL), so standard DDS viewers show cooked textures upside down.
+Uncompressed (L8, RGB8, RGBA8) and block compressed (DXT1, DXT5, ATI2)
+formats are used, see `texture_bc`.
+
+Source file key (size, mtime, content hash) and import settings are kept
+in `reserved1` field of DDS header, cache version - in `reserved2`, so
+stale entries are detected on open.
+"""
+import logging
+import mmap
+import os
+import struct
+import typing as t
+from dataclasses import dataclass
+
+import numpy as np
+
+from .iofs import SourceKey
+from .iofs import iofs_is_source_fresh
+from .texture_bc import BC_BLOCK_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+TEXTURE_CACHE_MAGIC = b'ILTX'
+TEXTURE_CACHE_VERSION = 3
+
+_DDS_MAGIC = b'DDS '
+
+# magic, size, flags, height, width, pitch, depth, mip levels count,
+# reserved (source key), pixel format (size, flags, FourCC, bits count,
+# R, G, B, A masks), caps, caps2, caps3, caps4, reserved (cache version)
+_DDS_HEADER = struct.Struct('<4s 7I 44s 2I4s5I 4I I')
+
+# magic, source size, source mtime, source hash, import settings
+_SOURCE_KEY = struct.Struct('<4sQQ16s8s')
+_SOURCE_KEY_OFFSET = struct.calcsize('<4s 7I')
+_SOURCE_MTIME_OFFSET = _SOURCE_KEY_OFFSET + struct.calcsize('<4sQ')
+
+_DDSD_FLAGS = 0x1 | 0x2 | 0x4 | 0x1000 | 0x20000
+_DDSD_PITCH = 0x8
+_DDSD_LINEARSIZE = 0x80000
+_DDSCAPS_TEXTURE = 0x1000
+_DDSCAPS_MIPMAP = 0x8 | 0x400000
+
+_DDPF_ALPHAPIXELS = 0x1
+_DDPF_FOURCC = 0x4
+_DDPF_RGB = 0x40
+_DDPF_LUMINANCE = 0x20000
+
+# components -> (pixel format flags, R, G, B, A masks); bytes order is RGBA
+_PIXEL_FORMATS = {
+    1: (_DDPF_LUMINANCE, 0xff, 0, 0, 0),
+    3: (_DDPF_RGB, 0xff, 0xff00, 0xff0000, 0),
+    4: (_DDPF_RGB | _DDPF_ALPHAPIXELS, 0xff, 0xff00, 0xff0000, 0xff000000),
+}
+
+# block compressed format -> (FourCC, decoded components)
+_COMPRESSED_FORMATS = {
+    'bc1': (b'DXT1', 3),
+    'bc3': (b'DXT5', 4),
+    'bc5': (b'ATI2', 2),
+}
+_FOURCC_FORMATS = {
+    fourcc: format for format, (fourcc, _) in _COMPRESSED_FORMATS.items()
+}
+
+UNCOMPRESSED = 'uncompressed'
+
+
+@dataclass
+class TextureCacheEntry:
+    key: SourceKey
+    settings: bytes
+    format: str  # `UNCOMPRESSED` or block compression format
+    width: int
+    height: int
+    components: int
+
+    # Views of mapped file, from level 0, valid until `texture_cache_close`:
+    #   uncompressed - (height, width, components)
+    #   compressed - (blocks height, blocks width, block bytes)
+    levels: list[np.ndarray] | None
+
+    _mmap: mmap.mmap
+
+
+class TextureCacheHeader(t.NamedTuple):
+    # Entry description without levels, see `texture_cache_read_header`
+    key: SourceKey
+    settings: bytes
+    format: str
+    width: int
+    height: int
+    components: int
+    levels_count: int
+
+
+def texture_build_mips(pixels: np.ndarray) -> list[np.ndarray]:
+    # -> full mip chain (down to 1x1) of (height, width, components) image
+    levels = [pixels]
+
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        levels.append(_texture_downsample(levels[-1]))
+
+    return levels
+
+
+def _texture_downsample(pixels: np.ndarray) -> np.ndarray:
+    # 2x2 box filter. Level sizes are rounded down as OpenGL expects,
+    # so last row / column of odd sized level is dropped
+    summed = pixels.astype(np.uint16)
+
+    for axis in (0, 1):
+        size = summed.shape[axis]
+
+        if size == 1:
+            summed = summed * 2
+            continue
+
+        even = summed.take(range(0, size - 1, 2), axis=axis)
+        odd = summed.take(range(1, size, 2), axis=axis)
+        summed = even + odd
+
+    return ((summed + 2) // 4).astype(np.uint8)
+
+
+def texture_cache_write(
+    cache_path: str,
+    key: SourceKey,
+    settings: bytes,
+    format: str,
+    width: int,
+    height: int,
+    levels: list[np.ndarray],
+) -> None:
+    caps = _DDSCAPS_TEXTURE
+    if len(levels) > 1:
+        caps |= _DDSCAPS_MIPMAP
+
+    if format == UNCOMPRESSED:
+        components = levels[0].shape[2]
+        pf_flags, *masks = _PIXEL_FORMATS[components]
+        flags = _DDSD_FLAGS | _DDSD_PITCH
+        pitch = width * components
+        fourcc, bits_count = b'\0' * 4, components * 8
+    else:
+        pf_flags, masks = _DDPF_FOURCC, (0, 0, 0, 0)
+        flags = _DDSD_FLAGS | _DDSD_LINEARSIZE
+        pitch = levels[0].nbytes
+        fourcc, bits_count = _COMPRESSED_FORMATS[format][0], 0
+
+    source_key = _SOURCE_KEY.pack(
+        TEXTURE_CACHE_MAGIC, key.size, key.mtime_ns, key.hash, settings,
+    )
+    header = _DDS_HEADER.pack(
+        _DDS_MAGIC, 124, flags,
+        height, width, pitch, 0, len(levels),
+        source_key,
+        32, pf_flags, fourcc, bits_count, *masks,
+        caps, 0, 0, 0, TEXTURE_CACHE_VERSION,
+    )
+
+    # See `mesh_cache_write`
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for level in levels:
+            f.write(np.ascontiguousarray(level).data)
+
+    os.replace(tmp_path, cache_path)
+
+
+def texture_cache_open(
+    cache_path: str,
+    source_path: str,
+) -> TextureCacheEntry | None:
+    """Map cache entry into memory. Returns `None` if entry is missing or stale
+    """
+    mm = _texture_cache_map(cache_path)
+    if mm is None:
+        return None
+
+    header = _texture_cache_parse_header(mm)
+
+    if (
+        header is None
+        or len(mm) != _texture_cache_size(header)
+        or not _texture_cache_is_fresh(cache_path, source_path, header.key)
+    ):
+        mm.close()
+        logger.info(f'Texture cache entry is stale: {cache_path}')
+        return None
+
+    levels = []
+    offset = _DDS_HEADER.size
+
+    for shape in _texture_level_shapes(header):
+        level_size = int(np.prod(shape))
+        levels.append(
+            np.frombuffer(mm, np.uint8, level_size, offset).reshape(shape)
+        )
+        offset += level_size
+
+    return TextureCacheEntry(
+        key=header.key,
+        settings=header.settings,
+        format=header.format,
+        width=header.width,
+        height=header.height,
+        components=header.components,
+        levels=levels,
+        _mmap=mm,
+    )
+
+
+def texture_cache_read_header(
+    cache_path: str,
+    source_path: str,
+) -> TextureCacheHeader | None:
+    """Read header of cache entry only, levels are not mapped. Returns
+    `None` if entry is missing or stale
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as f:
+        data = f.read(_DDS_HEADER.size)
+        file_size = os.fstat(f.fileno()).st_size
+
+    if len(data) < _DDS_HEADER.size:
+        return None
+
+    header = _texture_cache_parse_header(data)
+    if (
+        header is None
+        or file_size != _texture_cache_size(header)
+        or not _texture_cache_is_fresh(cache_path, source_path, header.key)
+    ):
+        return None
+
+    return header
+
+
+def texture_cache_close(self: TextureCacheEntry) -> None:
+    # Views should be released before mapping could be closed
+    self.levels = None
+    self._mmap.close()
+
+
+def texture_level_sizes(
+    width: int,
+    height: int,
+    levels_count: int,
+) -> list[tuple[int, int]]:
+    # -> [(width, height), ...] of mip levels
+    return [
+        (max(width >> i, 1), max(height >> i, 1))
+        for i in range(levels_count)
+    ]
+
+
+def _texture_level_shape(
+    width: int,
+    height: int,
+    format: str,
+    components: int,
+) -> tuple[int, int, int]:
+    if format == UNCOMPRESSED:
+        return (height, width, components)
+
+    return ((height + 3) // 4, (width + 3) // 4, BC_BLOCK_BYTES[format])
+
+
+def _texture_cache_map(cache_path: str) -> mmap.mmap | None:
+    # -> mapping of file, which is long enough for header, else `None`
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return None
+
+    if len(mm) < _DDS_HEADER.size:
+        mm.close()
+        return None
+
+    return mm
+
+
+def _texture_cache_parse_header(data: bytes) -> TextureCacheHeader | None:
+    # -> `None` if data is not cache entry of current version
+    (
+        dds_magic, _, _,
+        height, width, _, _, levels_count,
+        source_key,
+        _, pf_flags, fourcc, bits_count, *masks,
+        _, _, _, _, version,
+    ) = _DDS_HEADER.unpack_from(data, 0)
+    magic, size, mtime_ns, src_hash, settings = _SOURCE_KEY.unpack(
+        source_key
+    )
+
+    if pf_flags & _DDPF_FOURCC:
+        format = _FOURCC_FORMATS.get(fourcc)
+        is_valid_format = format is not None
+        components = _COMPRESSED_FORMATS[format][1] if format else 0
+    else:
+        format = UNCOMPRESSED
+        components = bits_count // 8
+        is_valid_format = (
+            _PIXEL_FORMATS.get(components) == (pf_flags, *masks)
+        )
+
+    if (
+        dds_magic != _DDS_MAGIC
+        or magic != TEXTURE_CACHE_MAGIC
+        or version != TEXTURE_CACHE_VERSION
+        or not is_valid_format
+    ):
+        return None
+
+    return TextureCacheHeader(
+        key=SourceKey(size=size, mtime_ns=mtime_ns, hash=src_hash),
+        settings=settings,
+        format=format,
+        width=width,
+        height=height,
+        components=components,
+        levels_count=levels_count,
+    )
+
+
+def _texture_level_shapes(
+    header: TextureCacheHeader,
+) -> list[tuple[int, int, int]]:
+    return [
+        _texture_level_shape(w, h, header.format, header.components)
+        for w, h in texture_level_sizes(
+            header.width, header.height, header.levels_count
+        )
+    ]
+
+
+def _texture_cache_size(header: TextureCacheHeader) -> int:
+    # -> expected size of entry file
+    return _DDS_HEADER.size + sum(
+        int(np.prod(shape)) for shape in _texture_level_shapes(header)
+    )
+
+
+def _texture_cache_is_fresh(
+    cache_path: str,
+    source_path: str,
+    key: SourceKey,
+) -> bool:
+    mtime_ns = key.mtime_ns
+
+    if not iofs_is_source_fresh(source_path, key):
+        return False
+
+    if key.mtime_ns != mtime_ns:
+        with open(cache_path, 'r+b') as f:
+            f.seek(_SOURCE_MTIME_OFFSET)
+            f.write(struct.pack('<Q', key.mtime_ns))
+
+    return True
@@ -0,0 +1,257 @@
+"""texture_stream - Texture Streaming
+
+Streamed textures are loaded with low detail mips only. Every frame
+objects request mip levels, which they need on screen, and streamer:
+
+1. Raises resolution of requested textures (limited uploads per frame)
+2. Drops top mips of least recently used textures, while resident size
+   of streamed textures is over VRAM budget
+
+Mip levels are read from mapped texture cache entries, which stay open
+while texture is streamed. Only standalone 2D textures are streamed,
+texture array pages are always resident.
+"""
+import logging
+from dataclasses import dataclass
+
+from .gfx import GfxInstance
+from .gfx import TextureFormat
+from .gfx import TextureGfxData
+from .gfx import TextureResidency
+from .gfx import gfx_load_texture
+from .gfx import gfx_restream_texture
+from .texture_cache import TextureCacheEntry
+from .texture_cache import texture_cache_close
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamedTexture:
+    gfx_data: TextureGfxData
+    cooked: TextureCacheEntry
+
+
+@dataclass
+class TextureStreamer:
+    textures: list[StreamedTexture]
+
+    budget: int  # bytes
+    min_size: int  # max dimension of initially loaded top level
+    uploads_per_frame: int
+
+    frame: int = 0
+    resident_bytes: int = 0
+
+    # -- Stats
+    loaded_levels: int = 0
+    evicted_levels: int = 0
+
+
+def texture_stream_create(
+    budget: int,
+    min_size: int,
+    uploads_per_frame: int,
+) -> TextureStreamer:
+    return TextureStreamer(
+        textures=[],
+        budget=budget,
+        min_size=min_size,
+        uploads_per_frame=uploads_per_frame,
+    )
+
+
+def texture_stream_load(
+    self: TextureStreamer,
+    gfx: GfxInstance,
+    cooked: TextureCacheEntry,
+) -> TextureGfxData:
+    """Load low detail mips of cooked texture and start streaming of it
+
+    Cache entry is owned by streamer from now
+    """
+    levels_count = len(cooked.levels)
+    top_level = 0
+
+    while (
+        top_level < levels_count - 1
+        and max(cooked.width, cooked.height) >> top_level > self.min_size
+    ):
+        top_level += 1
+
+    gfx_data = gfx_load_texture(
+        gfx,
+        cooked.levels[top_level:],
+        TextureFormat(cooked.format),
+        max(cooked.width >> top_level, 1),
+        max(cooked.height >> top_level, 1),
+    )
+    resident_bytes = _texture_stream_calc_bytes(cooked, top_level)
+
+    gfx_data.residency = TextureResidency(
+        size=max(cooked.width, cooked.height),
+        levels_count=levels_count,
+        top_level=top_level,
+        resident_bytes=resident_bytes,
+        requested_level=levels_count,
+    )
+    self.resident_bytes += resident_bytes
+    self.textures.append(StreamedTexture(gfx_data=gfx_data, cooked=cooked))
+
+    return gfx_data
+
+
+def texture_stream_request(
+    texture: TextureGfxData,
+    width_on_screen: float,
+) -> None:
+    """Request level of streamed texture, which texels are about as big
+    as pixels of object `width_on_screen` pixels wide
+    """
+    residency = texture.residency
+    if residency is None:
+        return
+
+    level = 0
+    while level < residency.levels_count - 1 and (
+        residency.size >> (level + 1) >= width_on_screen
+    ):
+        level += 1
+
+    residency.requested_level = min(residency.requested_level, level)
+
+
+def texture_stream_update(self: TextureStreamer, gfx: GfxInstance) -> None:
+    # Should be called once per frame, after objects made their requests
+    self.frame += 1
+
+    raise_queue = []
+    for texture in self.textures:
+        residency = texture.gfx_data.residency
+
+        if residency.requested_level < residency.levels_count:
+            residency.last_used_frame = self.frame
+
+        if residency.requested_level < residency.top_level:
+            raise_queue.append(texture)
+
+    # -- 1. Raise resolution, textures with biggest lack of detail first
+    raise_queue.sort(key=lambda texture: (
+        texture.gfx_data.residency.requested_level
+        - texture.gfx_data.residency.top_level
+    ))
+
+    for texture in raise_queue[:self.uploads_per_frame]:
+        residency = texture.gfx_data.residency
+        _texture_stream_set_top(self, gfx, texture, residency.top_level - 1)
+
+    # -- 2. Evict top mips of least recently used textures
+    if self.resident_bytes > self.budget:
+        _texture_stream_evict(self, gfx)
+
+    for texture in self.textures:
+        residency = texture.gfx_data.residency
+        residency.requested_level = residency.levels_count
+
+
+def texture_stream_close(self: TextureStreamer) -> None:
+    for texture in self.textures:
+        texture_cache_close(texture.cooked)
+
+    self.textures.clear()
+
+
+def _texture_stream_evict(self: TextureStreamer, gfx: GfxInstance) -> None:
+    # 1. Textures, which are not used at current frame, from the least
+    #    recently used one
+    # 2. Textures, which are used, but have more detail than requested
+    #
+    # Used textures are never dropped below requested level (it would be
+    # raised again at the next frame), so budget could be exceeded then
+    unused = sorted(
+        (
+            texture for texture in self.textures
+            if texture.gfx_data.residency.last_used_frame < self.frame
+        ),
+        key=lambda texture: texture.gfx_data.residency.last_used_frame,
+    )
+    for texture in unused:
+        residency = texture.gfx_data.residency
+        _texture_stream_drop_to(self, gfx, texture, residency.levels_count - 1)
+
+        if self.resident_bytes <= self.budget:
+            return
+
+    for texture in self.textures:
+        residency = texture.gfx_data.residency
+        if residency.last_used_frame < self.frame:
+            continue
+
+        _texture_stream_drop_to(self, gfx, texture, residency.requested_level)
+
+        if self.resident_bytes <= self.budget:
+            return
+
+    logger.debug(
+        f'Texture streaming budget is exceeded: '
+        f'{self.resident_bytes >> 20} / {self.budget >> 20} MiB'
+    )
+
+
+def _texture_stream_drop_to(
+    self: TextureStreamer,
+    gfx: GfxInstance,
+    texture: StreamedTexture,
+    min_top_level: int,
+) -> None:
+    # Drop just enough top mips to fit budget, texture is restreamed once
+    residency = texture.gfx_data.residency
+    top_level = residency.top_level
+    if top_level >= min_top_level or self.resident_bytes <= self.budget:
+        return
+
+    other_bytes = self.resident_bytes - residency.resident_bytes
+    while top_level < min_top_level and other_bytes + (
+        _texture_stream_calc_bytes(texture.cooked, top_level)
+    ) > self.budget:
+        top_level += 1
+
+    self.evicted_levels += top_level - residency.top_level
+    _texture_stream_set_top(self, gfx, texture, top_level)
+
+
+def _texture_stream_set_top(
+    self: TextureStreamer,
+    gfx: GfxInstance,
+    texture: StreamedTexture,
+    top_level: int,
+) -> None:
+    residency = texture.gfx_data.residency
+    cooked = texture.cooked
+
+    gfx_restream_texture(
+        gfx,
+        texture.gfx_data,
+        cooked.levels,
+        TextureFormat(cooked.format),
+        cooked.width,
+        cooked.height,
+        old_top=residency.top_level,
+        new_top=top_level,
+    )
+
+    if top_level < residency.top_level:
+        self.loaded_levels += residency.top_level - top_level
+
+    resident_bytes = _texture_stream_calc_bytes(cooked, top_level)
+    self.resident_bytes += resident_bytes - residency.resident_bytes
+
+    residency.top_level = top_level
+    residency.resident_bytes = resident_bytes
+
+
+def _texture_stream_calc_bytes(
+    cooked: TextureCacheEntry,
+    top_level: int,
+) -> int:
+    return sum(level.nbytes for level in cooked.levels[top_level:])
@@ -1,3 +1,4 @@
+import typing as t
 from dataclasses import dataclass
 
 from .assets import AssetStorage
@@ -7,6 +8,8 @@ from .loader import ObjectID
 from .mesh import Mesh
 from .texture import Texture
 
+DEFAULT_MATERIAL = 'default'
+
 
 @dataclass
 class WorldObject:
@@ -14,6 +17,7 @@ class WorldObject:
     name: str
     mesh: Mesh
     texture: Texture
+    material: int  # index of material table, see `gfx_load_material`
 
 
 @dataclass
@@ -30,25 +34,27 @@ def world_load_from_db(db: Database, assets: AssetStorage) -> World:
                 f'World init error: duplicated object ID = {obj.id}'
             ) 
 
-        try:
-            mesh = assets.meshes[obj.model]
-        except KeyError:
-            raise ValueError(
-                f'World init error: unknown mesh ID = {obj.model}'
-            )
-
-        try:
-            texture = assets.textures[obj.texture]
-        except KeyError:
-            raise ValueError(
-                f'World init error: unknown texture ID = {obj.texture}'
-            )
+        mesh = _world_get_asset(assets.meshes, obj.model, 'mesh')
+        texture = _world_get_asset(assets.textures, obj.texture, 'texture')
+        material = _world_get_asset(
+            assets.materials, obj.material or DEFAULT_MATERIAL, 'material'
+        )
 
         objects[obj.id] = WorldObject(
             id=obj.id,
             name=obj.name,
             mesh=mesh,
             texture=texture,
+            material=material,
         )
 
     return World(objects=objects)
+
+
+def _world_get_asset(assets: dict, asset_id: str, kind: str) -> t.Any:
+    try:
+        return assets[asset_id]
+    except KeyError:
+        raise ValueError(
+            f'World init error: unknown {kind} ID = {asset_id}'
+        )
@@ -0,0 +1,45 @@
+import itertools
+
+import pytest
+from OpenGL import GL as g
+
+
+class RecordingGL:
+    """Stand-in of `OpenGL.GL` module without context: constants are the
+    real ones, calls are recorded as (name, args) and return `results`
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.results = {}
+        self._ids = itertools.count(1)
+
+    def __getattr__(self, name: str):
+        if not name.startswith('gl'):
+            return getattr(g, name)
+
+        def call(*args):
+            self.calls.append((name, args))
+            result = self.results.get(name)
+            return result(*args) if callable(result) else result
+
+        return call
+
+    def count(self, name: str) -> int:
+        return sum(1 for call_name, _ in self.calls if call_name == name)
+
+    def new_id(self, *_) -> int:
+        return next(self._ids)
+
+
+@pytest.fixture
+def recording_gl(monkeypatch):
+    # -> function, which replaces `g` of given modules by one recorder
+    gl = RecordingGL()
+
+    def install(*modules) -> RecordingGL:
+        for module in modules:
+            monkeypatch.setattr(module, 'g', gl)
+        return gl
+
+    return install
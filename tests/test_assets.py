@@ -0,0 +1,125 @@
+import multiprocessing
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src import assets
+from src.assets import assets_load_from_db
+from src.config import config
+from src.db import ModelRecord
+from src.db import TextureRecord
+from src.mesh import Mesh
+from src.mesh import mesh_cook
+from src.mesh import mesh_cook_job
+from src.mesh_cache import mesh_cache_close
+from src.texture import Texture
+from src.texture import texture_cook
+from src.texture import texture_cook_job
+from src.texture_cache import texture_cache_close
+
+_TRIANGLE = (
+    'v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nvn 0 0 1\n'
+    'f 1/1/1 2/1/1 3/1/1\n'
+)
+
+
+@pytest.fixture
+def assets_dir(tmp_path, monkeypatch):
+    # Paths of config are relative, so spawned workers see the same
+    # assets and cache
+    shutil.copy('engineconf.toml', tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    (tmp_path / 'assets' / 'models').mkdir(parents=True)
+    (tmp_path / 'assets' / 'textures').mkdir()
+    (tmp_path / 'assets' / 'models' / 'tri.obj').write_text(_TRIANGLE)
+
+    pixels = np.random.default_rng(1).integers(0, 256, (16, 16, 3))
+    Image.fromarray(pixels.astype(np.uint8)).save(
+        tmp_path / 'assets' / 'textures' / 'noise.png'
+    )
+    return tmp_path
+
+
+def test_cook_jobs_in_spawned_workers(assets_dir):
+    mp_context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(2, mp_context) as pool:
+        jobs = [
+            pool.submit(mesh_cook_job, 'tri.obj'),
+            pool.submit(texture_cook_job, 'noise.png', 'uncompressed'),
+        ]
+        for job in jobs:
+            job.result()
+
+    assert (assets_dir / 'cache' / 'models' / 'tri.obj.mesh').exists()
+    assert (assets_dir / 'cache' / 'textures' / 'noise.png.dds').exists()
+
+    # Entries cooked by workers are fresh for main process, so it only
+    # maps them
+    cooked_mesh = mesh_cook('tri.obj')
+    cooked_texture = texture_cook('noise.png', 'uncompressed')
+    assert cooked_mesh.indices_count == 3
+    assert (cooked_texture.width, cooked_texture.height) == (16, 16)
+
+    mesh_cache_close(cooked_mesh)
+    texture_cache_close(cooked_texture)
+
+
+@pytest.mark.parametrize('workers, threads', [(0, 0), (0, 2), (2, 0)])
+def test_dedup_aliases(assets_dir, monkeypatch, workers, threads):
+    models = assets_dir / 'assets' / 'models'
+    textures = assets_dir / 'assets' / 'textures'
+    shutil.copy(models / 'tri.obj', models / 'copy.obj')
+    (models / 'other.obj').write_text(_TRIANGLE.replace('v 1 0 0', 'v 2 0 0'))
+    shutil.copy(textures / 'noise.png', textures / 'copy.png')
+
+    monkeypatch.setattr(config, 'IMPORT_WORKERS', workers)
+    monkeypatch.setattr(config, 'TEXTURE_DECODE_THREADS', threads)
+    monkeypatch.setattr(config, 'TEXTURE_ARRAYS', False)
+    monkeypatch.setattr(config, 'TEXTURE_STREAMING', False)
+    monkeypatch.setattr(assets, 'MATERIALS', {})
+    monkeypatch.setattr(assets, 'db_get_models', lambda _: [
+        ModelRecord('a', 'tri.obj'),
+        ModelRecord('b', 'copy.obj'),
+        ModelRecord('c', 'other.obj'),
+        ModelRecord('d', 'tri.obj'),
+    ])
+    monkeypatch.setattr(assets, 'db_get_textures', lambda _: [
+        TextureRecord('x', 'noise.png', 'bc1'),
+        TextureRecord('y', 'copy.png', 'bc1'),
+        # Same content, but other settings
+        TextureRecord('z', 'noise.png', 'uncompressed'),
+    ])
+
+    loaded = []
+
+    def load_mesh(record, gfx):
+        loaded.append(record.id)
+        return Mesh(record.id, record.path, None, object(), size=100)
+
+    def load_texture(record, gfx, slot, streamer):
+        loaded.append(record.id)
+        return Texture(record.id, record.path, object(), size=10)
+
+    monkeypatch.setattr(assets, 'mesh_load_from_record', load_mesh)
+    monkeypatch.setattr(assets, 'texture_load_from_record', load_texture)
+
+    storage = assets_load_from_db(None, SimpleNamespace(upload_ring=None))
+
+    assert loaded == ['a', 'c', 'x', 'z']
+    assert storage.meshes['b'].gfx_data is storage.meshes['a'].gfx_data
+    assert storage.meshes['d'].gfx_data is storage.meshes['a'].gfx_data
+    assert storage.meshes['c'].gfx_data is not storage.meshes['a'].gfx_data
+    assert storage.meshes['b'].path == 'copy.obj'
+    assert storage.textures['y'].gfx_data is storage.textures['x'].gfx_data
+    assert storage.textures['z'].gfx_data is not (
+        storage.textures['x'].gfx_data
+    )
+
+    assert (storage.shared_meshes, storage.shared_textures) == (2, 1)
+    assert storage.shared_bytes == 2 * 100 + 10
@@ -0,0 +1,163 @@
+import random
+from math import inf
+
+import pytest
+from glm import vec3
+
+from src.bvh import NULL_NODE
+from src.bvh import bvh_create
+from src.bvh import bvh_get_height
+from src.bvh import bvh_insert
+from src.bvh import bvh_move
+from src.bvh import bvh_query_aabb
+from src.bvh import bvh_query_nearest
+from src.bvh import bvh_raycast
+from src.bvh import bvh_remove
+
+
+def _random_box(rng: random.Random) -> tuple[vec3, vec3]:
+    center = vec3(
+        rng.uniform(-50, 50), rng.uniform(-5, 5), rng.uniform(-50, 50)
+    )
+    extents = vec3(
+        rng.uniform(0.1, 2), rng.uniform(0.1, 2), rng.uniform(0.1, 2)
+    )
+    return center - extents, center + extents
+
+
+def _overlaps(a_min, a_max, b_min, b_max) -> bool:
+    return all(
+        a_min[i] <= b_max[i] and b_min[i] <= a_max[i] for i in range(3)
+    )
+
+
+def _ray_box(origin, direction, box_min, box_max) -> float | None:
+    # Reference slab test
+    near, far = 0.0, inf
+    for i in range(3):
+        if direction[i] == 0:
+            if not box_min[i] <= origin[i] <= box_max[i]:
+                return None
+            continue
+
+        t0 = (box_min[i] - origin[i]) / direction[i]
+        t1 = (box_max[i] - origin[i]) / direction[i]
+        near, far = max(near, min(t0, t1)), min(far, max(t0, t1))
+
+    return near if near <= far else None
+
+
+@pytest.fixture
+def boxes():
+    # BVH after random inserts, moves and removes, and its boxes by item
+    rng = random.Random(1)
+    bvh = bvh_create()
+    boxes = {}
+
+    for item in range(500):
+        box = _random_box(rng)
+        boxes[item] = [bvh_insert(bvh, *box, item), *box]
+
+    for _ in range(300):
+        item = rng.choice(list(boxes))
+        if rng.random() < 0.2:
+            bvh_remove(bvh, boxes.pop(item)[0])
+            continue
+
+        offset = vec3(rng.uniform(-20, 20), 0, rng.uniform(-20, 20))
+        boxes[item][1:] = boxes[item][1] + offset, boxes[item][2] + offset
+        bvh_move(bvh, boxes[item][0], *boxes[item][1:])
+
+    return bvh, {item: tuple(box[1:]) for item, box in boxes.items()}
+
+
+def test_tree_is_consistent(boxes):
+    bvh, items = boxes
+
+    def check(index: int, parent: int) -> int:
+        node = bvh.nodes[index]
+        assert node.parent == parent
+
+        if node.left == NULL_NODE:
+            return 0
+
+        height = 1 + max(check(node.left, index), check(node.right, index))
+        assert node.height == height
+        return height
+
+    check(bvh.root, NULL_NODE)
+    leaves = [n for n in bvh.nodes if n is not None and n.left == NULL_NODE]
+    assert sorted(leaf.item for leaf in leaves) == sorted(items)
+
+    # Balanced tree of 400 leaves
+    assert bvh_get_height(bvh) < 20
+
+
+def test_query_aabb_matches_brute_force(boxes):
+    bvh, items = boxes
+    rng = random.Random(2)
+
+    for _ in range(50):
+        low, high = _random_box(rng)
+        high += vec3(5)
+
+        expected = [
+            item for item, box in items.items()
+            if _overlaps(*box, low, high)
+        ]
+        assert sorted(bvh_query_aabb(bvh, low, high)) == sorted(expected)
+
+
+def test_raycast_hits_nearest_box(boxes):
+    bvh, items = boxes
+    rng = random.Random(3)
+
+    for _ in range(50):
+        origin = vec3(rng.uniform(-60, 60), 0, rng.uniform(-60, 60))
+        direction = vec3(rng.uniform(-1, 1), 0, rng.uniform(-1, 1))
+
+        hits = [
+            (distance, item) for item, box in items.items()
+            if (distance := _ray_box(origin, direction, *box)) is not None
+        ]
+        hit = bvh_raycast(bvh, origin, direction)
+
+        if not hits:
+            assert hit is None
+            continue
+
+        assert hit[1] == pytest.approx(min(hits)[0], abs=1e-5)
+
+
+def test_raycast_uses_hit_test():
+    bvh = bvh_create()
+    bvh_insert(bvh, vec3(1, -1, -1), vec3(2, 1, 1), 'near')
+    bvh_insert(bvh, vec3(4, -1, -1), vec3(5, 1, 1), 'far')
+    origin, direction = vec3(0), vec3(1, 0, 0)
+
+    assert bvh_raycast(bvh, origin, direction) == ('near', 1.0)
+    assert bvh_raycast(bvh, origin, direction, max_distance=0.5) is None
+
+    # Exact shape of near item is missed
+    hit = bvh_raycast(
+        bvh, origin, direction,
+        hit_test=lambda item, *_: None if item == 'near' else 4.5,
+    )
+    assert hit == ('far', 4.5)
+
+
+def test_query_nearest(boxes):
+    bvh, items = boxes
+    point = vec3(3, 0, -7)
+
+    def distance(box) -> float:
+        low, high = box
+        return sum(
+            max(low[i] - point[i], 0, point[i] - high[i]) ** 2
+            for i in range(3)
+        ) ** 0.5
+
+    expected = sorted(distance(box) for box in items.values())[:5]
+    nearest = bvh_query_nearest(bvh, point, 5)
+
+    assert [d for _, d in nearest] == pytest.approx(expected, abs=1e-5)
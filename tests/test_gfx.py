@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from glm import mat4
+from OpenGL import GL as g
+
+from src import gfx
+from src import gfx_indirect
+from src import gfx_state
+from src.gfx import DrawBatch
+from src.gfx import GfxInstance
+from src.gfx import MeshGfxData
+from src.gfx import MeshLod
+from src.gfx import TextureGfxData
+from src.gfx import VertexFormat
+from src.gfx import gfx_draw_scene
+from src.gfx_arena import ArenaBlock
+from src.gfx_arena import ArenaChunk
+from src.gfx_arena import GeometryArena
+from src.gfx_indirect import DRAW_COMMAND_DTYPE
+from src.gfx_indirect import INSTANCE_DTYPE
+from src.gfx_indirect import DrawRing
+
+
+@pytest.fixture
+def gl(recording_gl, monkeypatch):
+    gl = recording_gl(gfx, gfx_indirect, gfx_state)
+    gl.results['glFenceSync'] = gl.new_id
+
+    # Frame and material blocks are not tested here
+    for name in (
+        'frame_block_set', 'frame_block_upload', 'material_table_upload'
+    ):
+        monkeypatch.setattr(gfx, name, lambda *_: None)
+
+    return gl
+
+
+def _gfx() -> GfxInstance:
+    def arena(element_size: int) -> GeometryArena:
+        chunks = [ArenaChunk(10 + i, 1 << 16, []) for i in range(2)]
+        return GeometryArena(element_size, 1 << 16, chunks)
+
+    return GfxInstance(
+        obj_program=1,
+        frame=None,
+        materials=SimpleNamespace(count=0),
+        upload_ring=None,
+        draw_ring=DrawRing(
+            buffer=2,
+            slot_size=4096,
+            slots_count=2,
+            mapped=np.zeros(8192, dtype=np.uint8),
+            fences=[None, None],
+        ),
+        vertex_arenas={VertexFormat.packed: arena(16)},
+        index_arenas={g.GL_UNSIGNED_INT: arena(4)},
+        vertex_arrays={VertexFormat.packed: 3},
+    )
+
+
+def _mesh(vertex_offset: int, chunk: int = 0) -> MeshGfxData:
+    return MeshGfxData(
+        vertex_block=ArenaBlock(chunk, vertex_offset, 24),
+        index_block=ArenaBlock(chunk, 100, 36),
+        vertices_count=24,
+        indices_count=36,
+        cw_order=False,
+        vertex_format=VertexFormat.packed,
+        index_type=g.GL_UNSIGNED_INT,
+        m_dequant=mat4(1.0),
+        lods=[MeshLod(0, 36, 0), MeshLod(36, 12, 24)],
+    )
+
+
+def _frame_data(
+    self: GfxInstance,
+    commands_count: int,
+    instances_count: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # -> (commands, instances) written into the first ring slot
+    mapped = self.draw_ring.mapped
+    commands = mapped[:commands_count * DRAW_COMMAND_DTYPE.itemsize]
+    instances = mapped[256:256 + instances_count * INSTANCE_DTYPE.itemsize]
+    return commands.view(DRAW_COMMAND_DTYPE), instances.view(INSTANCE_DTYPE)
+
+
+def test_draw_scene_instances(gl):
+    self = _gfx()
+    cube, cone = _mesh(0), _mesh(24)
+    texture, layer = TextureGfxData(5), TextureGfxData(6, layer=3)
+
+    batches = [
+        DrawBatch(cube, texture, 0, 0, 3),
+        DrawBatch(cone, texture, 1, 3, 2),
+        DrawBatch(cube, layer, 0, 5, 1),
+    ]
+    matrices = np.arange(6 * 16, dtype=np.float32).reshape(6, 16)
+    materials = np.array([0, 1, 2, 0, 1, 2], dtype=np.int32)
+
+    gfx_draw_scene(self, mat4(1.0), batches, matrices, materials)
+
+    # Single indirect command per batch, instances by base instance
+    commands, instances = _frame_data(self, 3, 6)
+    assert commands.tolist() == [
+        (36, 3, 100, 0, 0),
+        (12, 2, 136, 48, 3),
+        (36, 1, 100, 0, 5),
+    ]
+    assert (instances['m_model'] == matrices).all()
+    assert instances['material'].tolist() == materials.tolist()
+    assert instances['texture_layer'].tolist() == [-1] * 5 + [3]
+
+    # Batches of the same arena chunks and texture are drawn by one call
+    draws = [
+        args for name, args in gl.calls
+        if name == 'glMultiDrawElementsIndirect'
+    ]
+    assert [(args[2].value or 0, args[3]) for args in draws] == [
+        (0, 2), (2 * DRAW_COMMAND_DTYPE.itemsize, 1),
+    ]
+    assert (self.draw_calls, self.draw_commands) == (2, 3)
+    assert self.drawn_instances == 6
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from src import gfx_arena
+from src.gfx_arena import ArenaBlock
+from src.gfx_arena import arena_alloc
+from src.gfx_arena import arena_create
+from src.gfx_arena import arena_free
+
+
+@pytest.fixture
+def gl(recording_gl):
+    gl = recording_gl(gfx_arena)
+    gl.results['glGenBuffers'] = gl.new_id
+    return gl
+
+
+def _indices(count: int) -> np.ndarray:
+    return np.arange(count, dtype=np.uint32)
+
+
+def test_alloc_first_fit(gl):
+    arena = arena_create(element_size=4, chunk_size=400)
+
+    blocks = [arena_alloc(arena, _indices(n)) for n in (30, 50, 20)]
+
+    assert blocks == [
+        ArenaBlock(0, 0, 30), ArenaBlock(0, 30, 50), ArenaBlock(0, 80, 20),
+    ]
+    assert arena.chunks[0].free == []
+    assert arena.used == 100
+
+    # Data is uploaded at block offset, in bytes
+    uploads = [
+        args for name, args in gl.calls if name == 'glNamedBufferSubData'
+    ]
+    assert [args[:3] for args in uploads] == [
+        (1, 0, 120), (1, 120, 200), (1, 320, 80),
+    ]
+
+    # Freed range is reused by the first block, which fits in
+    arena_free(arena, blocks[1])
+    assert arena_alloc(arena, _indices(10)) == ArenaBlock(0, 30, 10)
+    assert arena.chunks[0].free == [(40, 40)]
+
+
+def test_new_chunks(gl):
+    arena = arena_create(element_size=4, chunk_size=400)
+    arena_alloc(arena, _indices(90))
+
+    # Block, which does not fit, gets a new chunk, bigger than chunk size
+    # is allocated by a chunk of its own
+    assert arena_alloc(arena, _indices(20)) == ArenaBlock(1, 0, 20)
+    assert arena_alloc(arena, _indices(300)) == ArenaBlock(2, 0, 300)
+    assert [chunk.capacity for chunk in arena.chunks] == [100, 100, 300]
+    assert gl.count('glBufferStorage') == 3
+
+    # Small block fits in the rest of the first chunk
+    assert arena_alloc(arena, _indices(10)) == ArenaBlock(0, 90, 10)
+
+
+def test_free_merges_neighbours(gl):
+    arena = arena_create(element_size=4, chunk_size=400)
+    blocks = [arena_alloc(arena, _indices(20)) for _ in range(5)]
+
+    arena_free(arena, blocks[1])
+    arena_free(arena, blocks[3])
+    assert arena.chunks[0].free == [(20, 20), (60, 20)]
+
+    # Block between two free ranges merges both of them
+    arena_free(arena, blocks[2])
+    assert arena.chunks[0].free == [(20, 60)]
+
+    arena_free(arena, blocks[0])
+    arena_free(arena, blocks[4])
+    assert arena.chunks[0].free == [(0, 100)]
+    assert arena.used == 0
+
+
+def test_element_size_mismatch(gl):
+    arena = arena_create(element_size=4, chunk_size=400)
+
+    with pytest.raises(ValueError, match='Arena element is 4 bytes'):
+        arena_alloc(arena, np.zeros(10, dtype=np.uint16))
@@ -0,0 +1,208 @@
+import ctypes
+
+import numpy as np
+import pytest
+from glm import vec3
+from OpenGL import GL as g
+
+from src import gfx_cull
+from src import gfx_state
+from src import gfx_uniform
+from src.camera import CullView
+from src.gfx_cull import _CULL_DATA_DTYPE
+from src.gfx_cull import CULL_ITEM_DTYPE
+from src.gfx_cull import CullItems
+from src.gfx_cull import gpu_cull_create
+from src.gfx_cull import gpu_cull_dispatch
+from src.gfx_cull import gpu_cull_poll
+from src.gfx_cull import gpu_cull_set_commands
+from src.gfx_cull import gpu_cull_write_items
+from src.gfx_indirect import DRAW_COMMAND_DTYPE
+from src.gfx_state import state_create
+from src.gfx_uniform import UniformType
+
+_VIEW = CullView(
+    planes=np.zeros((6, 4), dtype=np.float32),
+    camera_position=vec3(1, 2, 3),
+    tan_half_fov=0.5,
+    screen_height=720,
+)
+
+
+@pytest.fixture
+def gl(recording_gl, monkeypatch):
+    gl = recording_gl(gfx_cull, gfx_state, gfx_uniform)
+    gl.results['glGetUniformLocation'] = 0
+    gl.results['glCreateBuffers'] = gl.new_id
+    gl.results['glFenceSync'] = gl.new_id
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+
+    # Persistent mappings are host memory
+    mappings = []
+
+    def map_range(buffer, offset, size, flags):
+        mappings.append(ctypes.create_string_buffer(size))
+        return ctypes.addressof(mappings[-1])
+
+    gl.results['glMapNamedBufferRange'] = map_range
+
+    # Setters of scalars are bound to OpenGL functions at import
+    monkeypatch.setitem(
+        gfx_uniform._UNIFORM_SETTERS, UniformType.int, gl.glUniform1i
+    )
+    return gl
+
+
+def _items(count: int, first: int = 0) -> CullItems:
+    slots = np.arange(first, first + count)
+    return CullItems(
+        matrices=np.repeat(slots[:, None], 16, axis=1).astype(np.float32),
+        centers=np.stack([slots, slots + 1, slots + 2]).astype(np.float32),
+        extents=np.full((3, count), 0.5, dtype=np.float32),
+        radii=np.full(count, 0.87, dtype=np.float32),
+        detail_radii=np.full(count, 0.5, dtype=np.float32),
+        texture_layers=np.full(count, -1, dtype=np.int32),
+        materials=slots.astype(np.int32),
+        lods_counts=np.full(count, 2, dtype=np.int32),
+        batches=slots.astype(np.int32) % 3,
+    )
+
+
+def test_std430_layout():
+    # `Item` of shaders/cull.comp: radius and detail radius are w of
+    # center and extents
+    offsets = [
+        CULL_ITEM_DTYPE.fields[name][1] for name in CULL_ITEM_DTYPE.names
+    ]
+    assert offsets == [0, 64, 76, 80, 92, 96, 100, 104, 108]
+    assert CULL_ITEM_DTYPE.itemsize == 112
+
+    # `CullData`, std140: arrays of floats are packed as vec4
+    offsets = [
+        _CULL_DATA_DTYPE.fields[name][1] for name in _CULL_DATA_DTYPE.names
+    ]
+    assert offsets == [0, 96, 108, 112, 144, 148, 152, 156]
+    assert _CULL_DATA_DTYPE.itemsize == 160
+
+
+def test_write_items(gl):
+    self = gpu_cull_create(1)
+    state = state_create()
+
+    gpu_cull_write_items(self, state, 0, _items(4))
+    buffer = self.items.buffer
+
+    # Slots are written at their offsets
+    gpu_cull_write_items(self, state, 2, _items(1, first=2))
+    name, (target, offset, size, records) = gl.calls[-1]
+    assert (name, target, offset, size) == (
+        'glNamedBufferSubData', buffer, 2 * 112, 112
+    )
+    assert records['center'].tolist() == [[2, 3, 4]]
+    assert records['extents'].tolist() == [[0.5] * 3]
+    assert records['m_model'][0].tolist() == [2] * 16
+    assert records['material'].tolist() == [2]
+
+    # Grown buffer keeps written slots
+    gpu_cull_write_items(self, state, 4, _items(4, first=4))
+    assert self.items.buffer != buffer
+    assert self.items.size == 8 * 112
+    assert (
+        'glCopyNamedBufferSubData', (buffer, self.items.buffer, 0, 0, 4 * 112)
+    ) in gl.calls
+    assert ('glDeleteBuffers', (1, [buffer])) in gl.calls
+
+
+def test_set_commands(gl):
+    self = gpu_cull_create(1)
+    state = state_create()
+    commands = np.zeros(6, dtype=DRAW_COMMAND_DTYPE)
+    item_commands = np.array([0, 2, -1, 4, 0], dtype=np.int32)
+
+    gpu_cull_set_commands(self, state, commands, item_commands, 3)
+
+    assert (self.items_count, self.commands_count) == (5, 6)
+    assert self.commands_template.size == self.commands.size == 6 * 20
+    assert self.item_commands.size == 5 * 4
+    # Decision (command, index) and instance per slot
+    assert self.decisions.size == 5 * 8
+    assert self.instances.size == 5 * 80
+    # Visible count and detail per batch
+    assert self.stats.size == 4 * 4
+
+    # Smaller layout reuses buffers
+    buffers_count = gl.count('glCreateBuffers')
+    gpu_cull_set_commands(self, state, commands[:2], item_commands[:3], 1)
+    assert gl.count('glCreateBuffers') == buffers_count
+    assert (self.items_count, self.commands_count) == (3, 2)
+
+
+def test_dispatch_and_poll(gl):
+    self = gpu_cull_create(1)
+    state = state_create()
+
+    # Empty layout is not dispatched
+    gpu_cull_dispatch(self, state, _VIEW, [0.1])
+    assert gl.count('glDispatchCompute') == 0
+
+    commands = np.zeros(2, dtype=DRAW_COMMAND_DTYPE)
+    item_commands = np.zeros(100, dtype=np.int32)
+    gpu_cull_set_commands(self, state, commands, item_commands, 2)
+    gpu_cull_dispatch(self, state, _VIEW, [0.2, 0.1])
+
+    # Stages of 64 items
+    dispatches = [
+        args for name, args in gl.calls if name == 'glDispatchCompute'
+    ]
+    assert dispatches == [(2, 1, 1), (1, 1, 1), (2, 1, 1)]
+    data = self.data[0]
+    assert data['lod_thresholds'].tolist() == pytest.approx(
+        [0.2, 0.1] + [0] * 6
+    )
+    assert (data['items_count'], data['commands_count']) == (100, 2)
+    assert data['camera_position'].tolist() == [1, 2, 3]
+
+    # Stats are read back, details are float bits
+    readback = self.readbacks[0]
+    readback.mapped[:3] = [7, *np.array([0, 2.5], np.float32).view(np.uint32)]
+
+    gl.results['glClientWaitSync'] = g.GL_TIMEOUT_EXPIRED
+    assert not gpu_cull_poll(self)
+
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+    assert gpu_cull_poll(self)
+    assert self.visible_count == 7
+    assert self.batch_details.tolist() == [0, 2.5]
+    assert not gpu_cull_poll(self)
+
+
+def test_poll_keeps_latest_stats(gl):
+    self = gpu_cull_create(1)
+    state = state_create()
+    gpu_cull_set_commands(
+        self, state, np.zeros(1, dtype=DRAW_COMMAND_DTYPE),
+        np.zeros(1, dtype=np.int32), 1,
+    )
+
+    for _ in range(4):
+        gpu_cull_dispatch(self, state, _VIEW, [])
+
+    # Dispatch is not read back, if all read backs are in flight
+    assert len(self.readbacks) == 3
+    assert [readback.serial for readback in self.readbacks] == [1, 2, 3]
+
+    # Fences signaled out of order: older stats do not replace newer ones
+    for readback in self.readbacks:
+        readback.mapped[0] = 10 * readback.serial
+    latest = self.readbacks[-1].fence
+
+    gl.results['glClientWaitSync'] = lambda fence, *_: (
+        g.GL_ALREADY_SIGNALED if fence == latest else g.GL_TIMEOUT_EXPIRED
+    )
+    assert gpu_cull_poll(self)
+    assert (self.stats_serial, self.visible_count) == (3, 30)
+
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+    assert not gpu_cull_poll(self)
+    assert (self.stats_serial, self.visible_count) == (3, 30)
+    assert all(readback.fence is None for readback in self.readbacks)
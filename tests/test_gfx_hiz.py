@@ -0,0 +1,195 @@
+import ctypes
+
+import glm
+import numpy as np
+import pytest
+from glm import vec3
+from OpenGL import GL as g
+
+from src import gfx_hiz
+from src import gfx_state
+from src import gfx_uniform
+from src.gfx_hiz import _hiz_reduce_levels
+from src.gfx_hiz import depth_pyramid_test
+from src.gfx_hiz import hiz_capture
+from src.gfx_hiz import hiz_create
+from src.gfx_hiz import hiz_poll
+from src.gfx_state import state_create
+from src.gfx_uniform import UniformType
+
+_WIDTH, _HEIGHT = 160, 96
+
+_VIEW_PERSP = glm.perspective(
+    glm.radians(60), _WIDTH / _HEIGHT, 0.1, 100.0
+) * glm.lookAt(vec3(0, 0, 0), vec3(0, 0, -1), vec3(0, 1, 0))
+
+# Wall, which faces camera: (x0, y0, x1, y1) at z
+_WALL, _WALL_Z = (-2.0, -1.0, 2.0, 1.5), -3.0
+
+
+@pytest.fixture
+def gl(recording_gl, monkeypatch):
+    gl = recording_gl(gfx_hiz, gfx_state, gfx_uniform)
+    gl.results['glGetUniformLocation'] = 0
+    gl.results['glCreateBuffers'] = gl.new_id
+    gl.results['glCreateTextures'] = gl.new_id
+    gl.results['glFenceSync'] = gl.new_id
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+
+    # Persistent mappings are host memory
+    mappings = []
+
+    def map_range(buffer, offset, size, flags):
+        mappings.append(ctypes.create_string_buffer(size))
+        return ctypes.addressof(mappings[-1])
+
+    gl.results['glMapNamedBufferRange'] = map_range
+
+    # Setters of scalars are bound to OpenGL functions at import
+    monkeypatch.setitem(
+        gfx_uniform._UNIFORM_SETTERS, UniformType.int, gl.glUniform1i
+    )
+    return gl
+
+
+def _project(points: np.ndarray) -> np.ndarray:
+    # -> (3, n) normalized device coordinates of (3, n) points
+    m = np.array(_VIEW_PERSP.to_list(), dtype=np.float64).T
+    clip = m[:, :3] @ points + m[:, 3:]
+    return clip[:3] / clip[3]
+
+
+def _wall_depth() -> np.ndarray:
+    # -> (height, width) depth buffer of frame with wall only
+    x0, y0, x1, y1 = _WALL
+    (nx0, nx1), (ny0, ny1), (nz, _) = _project(
+        np.array([(x0, y0, _WALL_Z), (x1, y1, _WALL_Z)]).T
+    )
+
+    ys, xs = np.mgrid[0:_HEIGHT, 0:_WIDTH]
+    xs = (xs + 0.5) / _WIDTH * 2 - 1
+    ys = (ys + 0.5) / _HEIGHT * 2 - 1
+    is_wall = (xs >= nx0) & (xs <= nx1) & (ys >= ny0) & (ys <= ny1)
+
+    return np.where(is_wall, nz * 0.5 + 0.5, 1.0).astype(np.float32)
+
+
+def _capture(self, state, depth: np.ndarray, frame: int) -> None:
+    # Capture, which GPU part is done by reduction of depth into read back
+    readback = next(slot for slot in self.readbacks if slot.fence is None)
+    hiz_capture(self, state, _VIEW_PERSP, frame)
+
+    height, width = depth.shape
+    readback.mapped[:] = depth.reshape(height // 2, 2, width // 2, 2).max(
+        axis=(1, 3)
+    )
+
+
+def test_reduce_levels():
+    base = np.arange(15, dtype=np.float32).reshape(3, 5)
+    levels = _hiz_reduce_levels(base)
+
+    # Odd edge is repeated, so every texel is max of 2x2 texels
+    assert [level.shape for level in levels] == [
+        (3, 5), (2, 3), (1, 2), (1, 1)
+    ]
+    assert levels[1].tolist() == [[6, 8, 9], [11, 13, 14]]
+    assert levels[2].tolist() == [[13, 14]]
+    assert levels[3].tolist() == [[14]]
+
+
+def test_capture_and_poll(gl):
+    state = state_create()
+    self = hiz_create(1, _WIDTH, _HEIGHT, _WIDTH // 2)
+    depth = _wall_depth()
+
+    # Level 0 of GPU pyramid is read back
+    assert self.levels_count == 1
+    assert self.readbacks[0].mapped.shape == (_HEIGHT // 2, _WIDTH // 2)
+
+    for frame in range(1, 5):
+        if frame <= len(self.readbacks):
+            _capture(self, state, depth, frame)
+        else:
+            hiz_capture(self, state, _VIEW_PERSP, frame)
+
+    # Frame is skipped, if all read backs are in flight
+    assert (self.captures, self.skipped) == (3, 1)
+    assert gl.count('glDispatchCompute') == 3
+    # Pack buffer is unbound after read back
+    assert gl.calls[-2] == ('glBindBuffer', (g.GL_PIXEL_PACK_BUFFER, 0))
+
+    gl.results['glClientWaitSync'] = g.GL_TIMEOUT_EXPIRED
+    assert hiz_poll(self) is None
+
+    # The latest completed frame is kept
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+    pyramid = hiz_poll(self)
+
+    assert pyramid.frame == 3
+    assert pyramid.scale == 2
+    assert gl.count('glDeleteSync') == 3
+    assert pyramid.widths.tolist() == [80, 40, 20, 10, 5, 3, 2, 1]
+    assert pyramid.heights.tolist() == [48, 24, 12, 6, 3, 2, 1, 1]
+    assert pyramid.texels[pyramid.offsets[-1]] == 1.0
+
+    gl.results['glClientWaitSync'] = g.GL_WAIT_FAILED
+    _capture(self, state, depth, 5)
+    with pytest.raises(RuntimeError, match='fence wait failed'):
+        hiz_poll(self)
+
+
+def test_occlusion(gl):
+    state = state_create()
+    self = hiz_create(1, _WIDTH, _HEIGHT, _WIDTH // 2)
+    depth = _wall_depth()
+    _capture(self, state, depth, 1)
+    pyramid = hiz_poll(self)
+
+    rng = np.random.default_rng(0)
+    n = 2000
+    centers = np.stack([
+        rng.uniform(-3, 3, n), rng.uniform(-2, 2.5, n), rng.uniform(-15, -1, n)
+    ]).astype(np.float32)
+    extents = rng.uniform(0.02, 0.6, (3, n)).astype(np.float32)
+    occluded = depth_pyramid_test(pyramid, centers, extents)
+
+    # Screen rectangles (pixels) and the nearest depths of bounds
+    signs = np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).reshape(3, 8)
+    corners = centers[:, None] + signs[..., None] * extents[:, None]
+    ndc = _project(corners.reshape(3, -1)).reshape(3, 8, n)
+    x0, y0, _ = (ndc.min(axis=1) * 0.5 + 0.5) * [[_WIDTH], [_HEIGHT], [1]]
+    x1, y1, _ = (ndc.max(axis=1) * 0.5 + 0.5) * [[_WIDTH], [_HEIGHT], [1]]
+    z0 = ndc[2].min(axis=0) * 0.5 + 0.5
+
+    # Occluded bounds are hidden by all pixels of their rectangle
+    for i in np.flatnonzero(occluded):
+        region = depth[int(y0[i]):int(y1[i]) + 1, int(x0[i]):int(x1[i]) + 1]
+        assert region.max() < z0[i]
+
+    # Bounds behind wall are occluded, if wall covers 2x2 texels of level,
+    # where their rectangle is at most texel wide (twice its size around)
+    wall = np.argwhere(depth < 1.0)
+    (wy0, wx0), (wy1, wx1) = wall.min(axis=0), wall.max(axis=0) + 1
+    margin = 2 * np.maximum(np.maximum(x1 - x0, y1 - y0), 2 * pyramid.scale)
+    behind = (
+        (z0 > depth.min())
+        & (x0 - margin >= wx0) & (x1 + margin <= wx1)
+        & (y0 - margin >= wy0) & (y1 + margin <= wy1)
+    )
+    assert behind.sum() > 100
+    assert occluded[behind].all()
+
+
+def test_not_occluded_outside_view(gl):
+    state = state_create()
+    self = hiz_create(1, _WIDTH, _HEIGHT, _WIDTH // 2)
+    _capture(self, state, _wall_depth(), 1)
+    pyramid = hiz_poll(self)
+
+    # Behind wall, crossing near plane, partially outside of view
+    centers = np.array([(0, 0, -6), (0, 0, -0.5), (0, 0, -6)]).T
+    extents = np.array([(0.2, 0.2, 0.2), (0.2, 0.2, 1.0), (50, 0.2, 0.2)]).T
+
+    occluded = depth_pyramid_test(pyramid, centers, extents)
+    assert occluded.tolist() == [True, False, False]
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from OpenGL import GL as g
+
+from src import gfx_indirect
+from src.gfx_indirect import DRAW_COMMAND_DTYPE
+from src.gfx_indirect import INSTANCE_DTYPE
+from src.gfx_indirect import DrawRing
+from src.gfx_indirect import draw_ring_begin_frame
+from src.gfx_indirect import draw_ring_end_frame
+from src.gfx_indirect import draw_ring_write
+
+
+@pytest.fixture
+def gl(recording_gl):
+    gl = recording_gl(gfx_indirect)
+    gl.results['glFenceSync'] = gl.new_id
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+    return gl
+
+
+def _ring(slot_size: int, slots_count: int) -> DrawRing:
+    return DrawRing(
+        buffer=1,
+        slot_size=slot_size,
+        slots_count=slots_count,
+        mapped=np.zeros(slot_size * slots_count, dtype=np.uint8),
+        fences=[None] * slots_count,
+    )
+
+
+def test_layouts():
+    # Sizes, which `DrawElementsIndirectCommand` and std430 `Instance`
+    # of shaders expect
+    assert DRAW_COMMAND_DTYPE.itemsize == 20
+    assert INSTANCE_DTYPE.itemsize == 80
+    assert INSTANCE_DTYPE.fields['texture_layer'][1] == 64
+    assert INSTANCE_DTYPE.fields['material'][1] == 68
+
+
+def test_frames_in_flight(gl):
+    ring = _ring(slot_size=256, slots_count=2)
+
+    offsets = []
+    for frame in range(3):
+        offsets.append(draw_ring_begin_frame(ring))
+        draw_ring_write(
+            ring, offsets[-1], np.full(4, frame + 1, dtype=np.uint32)
+        )
+        draw_ring_end_frame(ring)
+
+    assert offsets == [0, 256, 0]
+    assert ring.mapped[:16].view(np.uint32).tolist() == [3] * 4
+    assert ring.mapped[256:272].view(np.uint32).tolist() == [2] * 4
+
+    # The first slot is reused after its fence is signaled
+    assert gl.count('glFenceSync') == 3
+    assert [args for name, args in gl.calls if name == 'glDeleteSync'] == [
+        (1,),
+    ]
+    assert ring.fences == [3, 2]
+    assert ring.stalls == 0
+
+
+def test_stall_on_busy_slot(gl):
+    ring = _ring(slot_size=256, slots_count=1)
+    statuses = iter([
+        g.GL_TIMEOUT_EXPIRED, g.GL_TIMEOUT_EXPIRED, g.GL_CONDITION_SATISFIED,
+    ])
+    gl.results['glClientWaitSync'] = lambda *_: next(statuses)
+
+    draw_ring_begin_frame(ring)
+    draw_ring_end_frame(ring)
+    draw_ring_begin_frame(ring)
+
+    # Stall is counted once per frame, however long GPU is waited for
+    assert ring.stalls == 1
+    assert gl.count('glClientWaitSync') == 3
+    assert ring.fences == [None]
+
+
+def test_wait_failed(gl):
+    ring = _ring(slot_size=256, slots_count=1)
+    gl.results['glClientWaitSync'] = g.GL_WAIT_FAILED
+
+    draw_ring_begin_frame(ring)
+    draw_ring_end_frame(ring)
+    with pytest.raises(RuntimeError, match='fence wait failed'):
+        draw_ring_begin_frame(ring)
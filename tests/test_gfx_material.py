@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+from OpenGL import GL as g
+
+from src import gfx_material
+from src.assets import AssetStorage
+from src.db import OBJECTS_T
+from src.db import Database
+from src.db import db_create_tables
+from src.db import db_get_objects
+from src.db import db_migrate
+from src.gfx_material import MATERIAL_DTYPE
+from src.gfx_material import material_table_add
+from src.gfx_material import material_table_create
+from src.gfx_material import material_table_upload
+from src.gfx_state import state_bind_buffer_range
+from src.gfx_state import state_create
+from src.world import world_load_from_db
+
+
+@pytest.fixture
+def gl(recording_gl):
+    gl = recording_gl(gfx_material)
+    gl.results['glCreateBuffers'] = gl.new_id
+    return gl
+
+
+def _add(table, metallic: float) -> int:
+    return material_table_add(
+        table, (0.1,) * 4, (0.2,) * 4, (0.3,) * 4, metallic
+    )
+
+
+def test_std430_layout():
+    offsets = [MATERIAL_DTYPE.fields[name][1] for name in MATERIAL_DTYPE.names]
+    assert offsets == [0, 16, 32, 48, 52]
+    assert MATERIAL_DTYPE.itemsize == 64
+
+
+def test_upload(gl):
+    table = material_table_create()
+    state = state_create()
+
+    assert [_add(table, metallic) for metallic in range(3)] == [0, 1, 2]
+    material_table_upload(table, state)
+    material_table_upload(table, state)
+
+    # Buffer is created once, and uploaded only when table is changed
+    assert gl.count('glCreateBuffers') == 1
+    assert gl.count('glNamedBufferSubData') == 1
+    buffer, offset, size, _ = gl.calls[-1][1]
+    assert (buffer, offset, size) == (table.buffer, 0, 3 * 64)
+    assert table.data['metallic'][:3].tolist() == [0, 1, 2]
+
+    _add(table, 3)
+    material_table_upload(table, state)
+    assert gl.count('glCreateBuffers') == 1
+    assert gl.count('glNamedBufferSubData') == 2
+
+
+def test_grow(gl):
+    table = material_table_create()
+    state = state_create()
+    capacity = len(table.data)
+
+    for i in range(capacity):
+        _add(table, i)
+    material_table_upload(table, state)
+    old_buffer = table.buffer
+    state_bind_buffer_range(
+        state, g.GL_SHADER_STORAGE_BUFFER, 2, old_buffer, 0, 64
+    )
+
+    # Full table is doubled, buffer is recreated and old one is forgotten
+    assert _add(table, capacity) == capacity
+    material_table_upload(table, state)
+
+    assert len(table.data) == 2 * capacity
+    assert table.data['metallic'][:capacity + 1].tolist() == list(
+        range(capacity + 1)
+    )
+    assert table.buffer != old_buffer
+    assert ('glDeleteBuffers', (1, [old_buffer])) in gl.calls
+    assert state.buffer_ranges == {}
+
+
+def test_objects_reference_materials():
+    db = Database(sqlite3.connect(':memory:'))
+
+    # Objects table of old schema gets material column
+    db.conn.executescript(f'''
+        CREATE TABLE {OBJECTS_T}(
+            id TEXT PRIMARY KEY, name TEXT, model TEXT, texture TEXT
+        );
+        INSERT INTO {OBJECTS_T} VALUES ('a', 'A', 'cube', 'wood');
+    ''')
+    db_migrate(db)
+    db_create_tables(db)
+    db.conn.execute(
+        f"INSERT INTO {OBJECTS_T} VALUES ('b', 'B', 'cube', 'wood', 'gold')"
+    )
+
+    assert [obj.material for obj in db_get_objects(db)] == [None, 'gold']
+
+    assets = AssetStorage(
+        meshes={'cube': None},
+        textures={'wood': None},
+        materials={'default': 0, 'gold': 2},
+    )
+    world = world_load_from_db(db, assets)
+
+    # Objects without material use the default one
+    assert world.objects['a'].material == 0
+    assert world.objects['b'].material == 2
+
+    db.conn.execute(f"UPDATE {OBJECTS_T} SET material = 'jade'")
+    with pytest.raises(ValueError, match='unknown material ID = jade'):
+        world_load_from_db(db, assets)
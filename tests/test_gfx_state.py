@@ -0,0 +1,144 @@
+import pytest
+from glm import vec3
+from OpenGL import GL as g
+
+from src import gfx_state
+from src import gfx_uniform
+from src.gfx_state import state_begin_frame
+from src.gfx_state import state_bind_buffer
+from src.gfx_state import state_bind_buffer_range
+from src.gfx_state import state_bind_texture
+from src.gfx_state import state_bind_vertex_array
+from src.gfx_state import state_create
+from src.gfx_state import state_element_buffer
+from src.gfx_state import state_forget_buffer
+from src.gfx_state import state_forget_texture
+from src.gfx_state import state_invalidate
+from src.gfx_state import state_set_enabled
+from src.gfx_state import state_set_uniform
+from src.gfx_state import state_use_program
+from src.gfx_state import state_vertex_buffer
+from src.gfx_uniform import Uniform
+from src.gfx_uniform import UniformType
+
+
+@pytest.fixture
+def gl(recording_gl):
+    return recording_gl(gfx_state, gfx_uniform)
+
+
+def test_redundant_calls_elided(gl):
+    state = state_create()
+
+    for _ in range(3):
+        state_use_program(state, 1)
+        state_bind_vertex_array(state, 2)
+        state_bind_buffer(state, g.GL_DRAW_INDIRECT_BUFFER, 3)
+        state_bind_buffer_range(state, g.GL_UNIFORM_BUFFER, 0, 4, 0, 64)
+        state_set_enabled(state, g.GL_DEPTH_TEST, True)
+
+    assert (state.issued, state.elided) == (5, 10)
+    assert [name for name, _ in gl.calls] == [
+        'glUseProgram', 'glBindVertexArray', 'glBindBuffer',
+        'glBindBufferRange', 'glEnable',
+    ]
+
+    # Changed values are issued
+    state_use_program(state, 5)
+    state_bind_buffer_range(state, g.GL_UNIFORM_BUFFER, 0, 4, 64, 64)
+    state_set_enabled(state, g.GL_DEPTH_TEST, False)
+    assert (state.issued, state.elided) == (8, 10)
+    assert gl.count('glDisable') == 1
+
+
+def test_frame_stats(gl):
+    state = state_create()
+    state_use_program(state, 1)
+    state_use_program(state, 1)
+
+    state_begin_frame(state)
+    assert (state.frame_issued, state.frame_elided) == (1, 1)
+    assert (state.issued, state.elided) == (0, 0)
+
+    state_use_program(state, 1)
+    state_begin_frame(state)
+    assert (state.frame_issued, state.frame_elided) == (0, 1)
+
+
+def test_textures(gl):
+    state = state_create()
+
+    state_bind_texture(state, 0, g.GL_TEXTURE_2D, 7)
+    state_bind_texture(state, 1, g.GL_TEXTURE_2D_ARRAY, 8)
+    # Bound texture is skipped, its unit is not activated
+    state_bind_texture(state, 0, g.GL_TEXTURE_2D, 7)
+
+    assert [(name, args) for name, args in gl.calls] == [
+        ('glActiveTexture', (g.GL_TEXTURE0,)),
+        ('glBindTexture', (g.GL_TEXTURE_2D, 7)),
+        ('glActiveTexture', (g.GL_TEXTURE1,)),
+        ('glBindTexture', (g.GL_TEXTURE_2D_ARRAY, 8)),
+    ]
+
+    # Reused ID of deleted texture is bound again
+    state_forget_texture(state, 7)
+    state_bind_texture(state, 0, g.GL_TEXTURE_2D, 7)
+    assert gl.count('glBindTexture') == 3
+
+
+def test_invalidate(gl):
+    state = state_create()
+    state_use_program(state, 1)
+    state_bind_buffer(state, g.GL_ARRAY_BUFFER, 2)
+    state_vertex_buffer(state, 3, 0, 4, 0, 16)
+    state_element_buffer(state, 3, 5)
+
+    # Context state is issued again, vertex array attachments are kept
+    state_invalidate(state)
+    state_use_program(state, 1)
+    state_bind_buffer(state, g.GL_ARRAY_BUFFER, 2)
+    state_vertex_buffer(state, 3, 0, 4, 0, 16)
+    state_element_buffer(state, 3, 5)
+
+    assert gl.count('glUseProgram') == 2
+    assert gl.count('glBindBuffer') == 2
+    assert gl.count('glVertexArrayVertexBuffer') == 1
+    assert gl.count('glVertexArrayElementBuffer') == 1
+
+
+def test_forget_buffer(gl):
+    state = state_create()
+    state_bind_buffer(state, g.GL_ARRAY_BUFFER, 2)
+    state_bind_buffer(state, g.GL_DRAW_INDIRECT_BUFFER, 3)
+    state_bind_buffer_range(state, g.GL_SHADER_STORAGE_BUFFER, 1, 2, 0, 64)
+    state_vertex_buffer(state, 9, 0, 2, 0, 16)
+    state_element_buffer(state, 9, 2)
+
+    # All bindings of deleted buffer are issued again
+    state_forget_buffer(state, 2)
+    assert state.buffers == {g.GL_DRAW_INDIRECT_BUFFER: 3}
+    assert state.buffer_ranges == {}
+    assert state.vertex_buffers == {}
+    assert state.element_buffers == {}
+
+    state_bind_buffer(state, g.GL_ARRAY_BUFFER, 2)
+    state_element_buffer(state, 9, 2)
+    assert gl.count('glBindBuffer') == 3
+    assert gl.count('glVertexArrayElementBuffer') == 2
+
+
+def test_uniforms(gl):
+    state = state_create()
+    uniform = Uniform(id=3, name='light_color', type=UniformType.vec3)
+    color = vec3(1, 0.5, 0)
+
+    state_set_uniform(state, uniform, color)
+    # Value is copied, so change of the same vector is issued
+    color.x = 0.25
+    state_set_uniform(state, uniform, color)
+    state_set_uniform(state, uniform, vec3(0.25, 0.5, 0))
+
+    assert [args for name, args in gl.calls if name == 'glUniform3f'] == [
+        (3, 1.0, 0.5, 0.0), (3, 0.25, 0.5, 0.0),
+    ]
+    assert (state.issued, state.elided) == (2, 1)
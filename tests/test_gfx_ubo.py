@@ -0,0 +1,76 @@
+import re
+from pathlib import Path
+
+import glm
+import numpy as np
+import pytest
+from glm import vec3
+
+from src import gfx_ubo
+from src.gfx_indirect import INSTANCE_DTYPE
+from src.gfx_ubo import FRAME_DTYPE
+from src.gfx_ubo import frame_block_create
+from src.gfx_ubo import frame_block_set
+from src.gfx_ubo import frame_block_upload
+
+_OBJECT_VERT = Path(__file__).parents[1] / 'shaders' / 'object.vert'
+
+
+@pytest.fixture
+def gl(recording_gl):
+    gl = recording_gl(gfx_ubo)
+    gl.results['glGenBuffers'] = gl.new_id
+    return gl
+
+
+def test_std140_layout():
+    # vec3 is aligned as vec4, so float fills the rest of it
+    offsets = [FRAME_DTYPE.fields[name][1] for name in FRAME_DTYPE.names]
+    assert offsets == [0, 64, 128, 140, 144, 156]
+    assert FRAME_DTYPE.itemsize == 160
+
+    # Field order matches `FrameData` block of shaders
+    block = re.search(
+        r'uniform FrameData \{(.*?)\}', _OBJECT_VERT.read_text(), re.S
+    )
+    assert re.findall(r'(\w+);', block[1]) == list(FRAME_DTYPE.names)
+
+
+def test_instance_layout():
+    # Field order matches `Instance` of shader storage block, see sizes
+    # in `test_gfx_indirect`
+    struct = re.search(
+        r'struct Instance \{(.*?)\}', _OBJECT_VERT.read_text(), re.S
+    )
+    assert re.findall(r'(\w+)(?:\[\d+\])?;', struct[1]) == list(
+        INSTANCE_DTYPE.names
+    )
+
+
+def test_upload_on_change(gl):
+    block = frame_block_create()
+    m_view = glm.translate(vec3(1, 2, 3))
+
+    frame_block_set(block, 'm_view', m_view)
+    frame_block_set(block, 'light_color', vec3(1, 0.5, 0))
+    frame_block_upload(block)
+    frame_block_upload(block)
+
+    # Only the first upload of frame is issued
+    assert gl.count('glNamedBufferSubData') == 1
+    assert block.uploads == 1
+
+    # mat4 is stored column-major, translation is the last column
+    assert block.data['m_view'][0][12:15].tolist() == [1, 2, 3]
+    assert block.data['light_color'][0].tolist() == [1, 0.5, 0]
+
+    # The same values do not make block dirty
+    frame_block_set(block, 'm_view', glm.translate(vec3(1, 2, 3)))
+    frame_block_set(block, 'light_color', vec3(1, 0.5, 0))
+    frame_block_upload(block)
+    assert block.uploads == 1
+
+    frame_block_set(block, 'light_ambient_intensity', 0.3)
+    frame_block_upload(block)
+    assert block.uploads == 2
+    assert np.isclose(block.data['light_ambient_intensity'][0], 0.3)
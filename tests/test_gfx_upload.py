@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from OpenGL import GL as g
+
+from src import gfx_state
+from src import gfx_upload
+from src.gfx_state import state_create
+from src.gfx_upload import UploadRing
+from src.gfx_upload import upload_ring_write_compressed
+from src.gfx_upload import upload_ring_write_texture
+
+
+@pytest.fixture
+def gl(recording_gl):
+    gl = recording_gl(gfx_upload, gfx_state)
+    gl.results['glFenceSync'] = gl.new_id
+    gl.results['glClientWaitSync'] = g.GL_ALREADY_SIGNALED
+    return gl
+
+
+def _ring(slot_size: int, slots_count: int) -> UploadRing:
+    return UploadRing(
+        pbo=7,
+        slot_size=slot_size,
+        slots_count=slots_count,
+        mapped=np.zeros(slot_size * slots_count, dtype=np.uint8),
+        fences=[None] * slots_count,
+    )
+
+
+def test_texture_bands(gl):
+    ring = _ring(slot_size=256, slots_count=2)
+    state = state_create()
+    pixels = np.arange(10 * 20 * 3, dtype=np.uint32).astype(np.uint8)
+    pixels = pixels.reshape(10, 20, 3)
+
+    upload_ring_write_texture(ring, state, 0, pixels, g.GL_RGB)
+
+    # 60 bytes rows: 4 rows per slot, slots are reused in ring order
+    uploads = [args for name, args in gl.calls if name == 'glTexSubImage2D']
+    assert [(y, rows) for _, _, _, y, _, rows, *_ in uploads] == [
+        (0, 4), (4, 4), (8, 2),
+    ]
+    assert [args[-1].value or 0 for args in uploads] == [0, 256, 0]
+    assert (ring.mapped[:120] == pixels[8:].ravel()).all()
+    assert (ring.mapped[256:496] == pixels[4:8].ravel()).all()
+
+    # Reused slot waits for its fence
+    assert gl.count('glClientWaitSync') == 1
+    assert gl.count('glDeleteSync') == 1
+    assert ring.uploaded_bytes == pixels.nbytes
+    assert ring.stalls == 0
+
+    # PBO is bound for copies only
+    binds = [args for name, args in gl.calls if name == 'glBindBuffer']
+    assert binds == [
+        (g.GL_PIXEL_UNPACK_BUFFER, 7), (g.GL_PIXEL_UNPACK_BUFFER, 0),
+    ]
+    assert state.buffers[g.GL_PIXEL_UNPACK_BUFFER] == 0
+
+
+def test_compressed_layer_bands(gl):
+    ring = _ring(slot_size=256, slots_count=4)
+    # 36x20 level: 5 rows of 9 blocks (144 bytes a row)
+    blocks = np.ones((5, 9, 16), dtype=np.uint8)
+
+    upload_ring_write_compressed(
+        ring, state_create(), 2, blocks, 36, 18, 0x83F3, layer=3,
+    )
+
+    uploads = [
+        args for name, args in gl.calls
+        if name == 'glCompressedTexSubImage3D'
+    ]
+    # (y, layer, band height, size): the last band is cut by level height
+    assert [(a[3], a[4], a[6], a[9]) for a in uploads] == [
+        (0, 3, 4, 144), (4, 3, 4, 144), (8, 3, 4, 144), (12, 3, 4, 144),
+        (16, 3, 2, 144),
+    ]
+    assert ring.stalls == 0
+
+
+def test_stall_on_busy_slot(gl):
+    ring = _ring(slot_size=64, slots_count=1)
+    statuses = iter([g.GL_TIMEOUT_EXPIRED, g.GL_CONDITION_SATISFIED])
+    gl.results['glClientWaitSync'] = lambda *_: next(statuses)
+
+    upload_ring_write_texture(
+        ring, state_create(), 0, np.zeros((2, 16, 4), np.uint8), g.GL_RGBA
+    )
+
+    assert ring.stalls == 1
+    assert gl.count('glClientWaitSync') == 2
+
+
+def test_row_does_not_fit(gl):
+    ring = _ring(slot_size=256, slots_count=2)
+
+    with pytest.raises(ValueError, match='does not fit'):
+        upload_ring_write_texture(
+            ring, state_create(), 0, np.zeros((1, 100, 4), np.uint8),
+            g.GL_RGBA,
+        )
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+from src.config import config
+from src.gfx import VertexFormat
+from src.mesh import mesh_calc_bounds
+from src.mesh import mesh_decode_octahedral
+from src.mesh import mesh_encode_octahedral
+from src.mesh import mesh_pack_vertices
+from src.mesh import mesh_parse_obj_file
+from src.mesh import mesh_unpack_vertices
+from src.mesh import mesh_weld_obj
+
+
+@pytest.fixture
+def write_obj(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/')
+    (tmp_path / 'models').mkdir()
+
+    def write(text: str) -> str:
+        (tmp_path / 'models' / 'test.obj').write_text(text)
+        return 'test.obj'
+
+    return write
+
+
+_QUAD = """\
+# unit quad as one polygon
+o Quad
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 1
+s off
+f 1/1/1 2/2/1 3/3/1 4/4/1
+"""
+
+
+def test_parse_fan_triangulation(write_obj):
+    obj = mesh_parse_obj_file(write_obj(_QUAD))
+
+    assert obj.name == 'Quad'
+    assert obj.vertices.shape == (4, 3)
+    assert obj.texcoords.shape == (4, 2)
+    assert obj.normals.shape == (1, 3)
+    assert obj.faces[:, 0].tolist() == [1, 2, 3, 1, 3, 4]
+    assert obj.faces[:, 2].tolist() == [1] * 6
+
+
+def test_parse_mixed_polygons(write_obj):
+    obj = mesh_parse_obj_file(write_obj(
+        _QUAD
+        + 'v 2 0 0\nv 2 1 0\nv 3 0 0\n'
+        + 'f 2/1/1 5/2/1 6/3/1\n'
+        + 'f 5/1/1 7/2/1 6/3/1 3/4/1 2/4/1\n'
+    ))
+
+    assert obj.faces[:, 0].tolist() == [
+        1, 2, 3, 1, 3, 4,
+        2, 5, 6,
+        5, 7, 6, 5, 6, 3, 5, 3, 2,
+    ]
+
+
+def test_weld_shares_equal_corners(write_obj):
+    obj = mesh_parse_obj_file(write_obj(
+        _QUAD + 'vn 0 0 -1\nf 1/1/2 4/4/2 3/3/2\n'
+    ))
+    vertices, normals, texcoords, indices = mesh_weld_obj(obj)
+
+    # Corners of the quad are shared by its two triangles, back face
+    # has other normal, so its corners are separate vertices
+    assert len(vertices) == 7
+    assert indices.tolist() == [0, 1, 2, 0, 2, 3, 4, 5, 6]
+
+    # Vertices are in order of first usage
+    assert vertices[:4].tolist() == obj.vertices.tolist()
+    assert texcoords[4:].tolist() == obj.texcoords[[0, 3, 2]].tolist()
+    assert normals[:, 2].tolist() == [1] * 4 + [-1] * 3
+
+
+@pytest.mark.parametrize('row', [
+    'v 1 2\n',
+    'v 1 x 2\n',
+    'vt 0.5\n',
+    'f 1/1/1 2/2/1\n',
+    'f 1/1/1 2/2/1 3/3.5/1\n',
+    'l 1 2\n',
+])
+def test_parse_malformed_rows(write_obj, row):
+    with pytest.raises(ValueError, match='OBJ row'):
+        mesh_parse_obj_file(write_obj(_QUAD + row))
+
+
+def test_parse_unsupported_faces(write_obj):
+    with pytest.raises(ValueError, match='without texcoords'):
+        mesh_parse_obj_file(write_obj(_QUAD + 'f 1//1 2//1 3//1\n'))
+
+
+@pytest.mark.parametrize('face', [
+    'f -4/-4/-1 -3/-3/-1 -2/-2/-1\n',
+    'f 0/1/1 2/2/1 3/3/1\n',
+])
+def test_weld_relative_indices(write_obj, face):
+    obj = mesh_parse_obj_file(write_obj(_QUAD + face))
+
+    with pytest.raises(ValueError, match='relative or zero'):
+        mesh_weld_obj(obj)
+
+
+def test_parse_without_faces(write_obj):
+    obj = mesh_parse_obj_file(write_obj('v 0 0 0\n'))
+
+    assert obj.faces.shape == (0, 3)
+    vertices, _, _, indices = mesh_weld_obj(obj)
+    assert len(vertices) == len(indices) == 0
+    assert indices.dtype == np.uint32
+
+
+def test_octahedral_normals_error():
+    rng = np.random.default_rng(1)
+    normals = rng.normal(size=(10000, 3))
+    normals = np.concatenate((normals, np.eye(3), -np.eye(3)))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+
+    encoded = mesh_encode_octahedral(normals.astype(np.float32))
+    decoded = mesh_decode_octahedral(encoded)
+
+    assert encoded.dtype == np.int16
+    assert np.allclose(np.linalg.norm(decoded, axis=1), 1.0, atol=1e-6)
+
+    # snorm16 pair keeps direction within 0.01 degree
+    decoded = decoded.astype(np.float64)
+    angles = np.arctan2(
+        np.linalg.norm(np.cross(normals, decoded), axis=1),
+        (normals * decoded).sum(axis=1),
+    )
+    assert np.degrees(angles).max() < 0.01
+
+
+@pytest.mark.parametrize('vertex_format, vertex_size', [
+    (VertexFormat.packed, 20),
+    (VertexFormat.quantized, 16),
+])
+def test_pack_vertices_round_trip(vertex_format, vertex_size):
+    rng = np.random.default_rng(2)
+    vertices = rng.uniform(-3.0, 5.0, (1000, 3)).astype(np.float32)
+    normals = rng.normal(size=(1000, 3)).astype(np.float32)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    texcoords = rng.uniform(0.0, 1.0, (1000, 2)).astype(np.float32)
+    bounds = mesh_calc_bounds(vertices)
+
+    packed = mesh_pack_vertices(
+        vertex_format, vertices, normals, texcoords, bounds
+    )
+    positions, unpacked_normals, unpacked_texcoords = mesh_unpack_vertices(
+        vertex_format, packed, bounds
+    )
+
+    assert packed.dtype.itemsize == vertex_size
+    # Quantized positions are within a half step of 16-bit grid over AABB
+    step = (np.array(bounds[3:6]) - bounds[0:3]) / 0xFFFF
+    assert (np.abs(positions - vertices) <= step * 0.5 + 1e-5).all()
+    assert np.allclose(unpacked_normals, normals, atol=1e-3)
+    assert np.allclose(unpacked_texcoords, texcoords, atol=1e-3)
@@ -0,0 +1,117 @@
+import os
+from types import SimpleNamespace
+
+import glm
+import numpy as np
+from glm import vec3
+
+from src import mesh_batch
+from src.config import config
+from src.gfx import MeshLod
+from src.gfx import VertexFormat
+from src.mesh import Mesh
+from src.mesh import mesh_bounds_from_tuple
+from src.mesh import mesh_unpack_vertices
+from src.mesh_batch import _mesh_batch_merge
+from src.mesh_batch import _mesh_batch_transform
+from src.mesh_batch import mesh_batch_build
+from src.mesh_simplify import MeshGeometry
+
+_TRIANGLE = (
+    'v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nvn 0 0 1\n'
+    'f 1/1/1 2/1/1 3/1/1\n'
+)
+
+
+def _triangle() -> MeshGeometry:
+    return MeshGeometry(
+        positions=np.array([(0, 0, 0), (1, 0, 0), (0, 1, 0)], np.float32),
+        normals=np.array([(0, 0, 1)] * 3, np.float32),
+        texcoords=np.zeros((3, 2), np.float32),
+        indices=np.array([0, 1, 2], np.uint32),
+    )
+
+
+def test_transform():
+    model_mat = glm.translate(vec3(5, 0, 0)) * glm.scale(vec3(2, 1, 1))
+    geometry = _mesh_batch_transform(_triangle(), model_mat)
+
+    assert np.allclose(
+        geometry.positions, [(5, 0, 0), (7, 0, 0), (5, 1, 0)]
+    )
+    assert np.allclose(geometry.normals, [(0, 0, 1)] * 3)
+    assert geometry.indices.tolist() == [0, 1, 2]
+
+
+def test_transform_normals():
+    # Normals of non-uniformly scaled surface stay perpendicular to it
+    geometry = MeshGeometry(
+        positions=np.zeros((1, 3), np.float32),
+        normals=np.array([(1, 1, 0)], np.float32) / np.sqrt(2),
+        texcoords=np.zeros((1, 2), np.float32),
+        indices=np.zeros(0, np.uint32),
+    )
+    geometry = _mesh_batch_transform(geometry, glm.scale(vec3(2, 1, 1)))
+
+    assert np.allclose(geometry.normals, [(1, 2, 0) / np.sqrt(5)])
+
+
+def test_transform_mirrored():
+    # Winding is flipped to keep front faces
+    geometry = _mesh_batch_transform(_triangle(), glm.scale(vec3(-1, 1, 1)))
+
+    assert geometry.indices.tolist() == [2, 1, 0]
+    assert np.allclose(geometry.normals, [(0, 0, 1)] * 3)
+
+
+def test_merge():
+    geometry = _mesh_batch_merge([_triangle(), _triangle(), _triangle()])
+
+    assert len(geometry.positions) == 9
+    assert geometry.indices.tolist() == [0, 1, 2, 3, 4, 5, 6, 7, 8]
+
+
+def test_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/assets/')
+    monkeypatch.setattr(config, 'CACHE_DIR', f'{tmp_path}/cache/')
+    monkeypatch.setattr(config, 'VERTEX_FORMAT', 'packed')
+    os.makedirs(tmp_path / 'assets' / 'models')
+    (tmp_path / 'assets' / 'models' / 'tri.obj').write_text(_TRIANGLE)
+
+    loaded = {}
+
+    def load_mesh(gfx, **kwargs):
+        loaded.update(kwargs)
+        return SimpleNamespace(lods=kwargs['lods'])
+
+    monkeypatch.setattr(mesh_batch, 'gfx_load_mesh', load_mesh)
+
+    # The second mesh has more LODs, the first one repeats its last LOD
+    bounds = mesh_bounds_from_tuple((0, 0, 0, 1, 1, 0, 0.71))
+    meshes = [
+        Mesh('a', 'tri.obj', bounds, SimpleNamespace(lods=[None])),
+        Mesh('b', 'tri.obj', bounds, SimpleNamespace(lods=[None, None])),
+    ]
+    batch = mesh_batch_build(None, 'static/0', [
+        (meshes[0], glm.translate(vec3(0, 0, -2))),
+        (meshes[1], glm.translate(vec3(3, 0, 0))),
+    ])
+
+    assert batch.id == 'static/0'
+    assert loaded['lods'] == [MeshLod(0, 6, 0), MeshLod(6, 6, 6)]
+    assert loaded['cw_order'] is False
+    assert batch.size == (
+        loaded['vertex_data'].nbytes + loaded['index_data'].nbytes
+    )
+
+    # Merged mesh is in world space
+    positions, _, _ = mesh_unpack_vertices(
+        VertexFormat.packed, loaded['vertex_data'], None
+    )
+    assert np.allclose(positions[:6], [
+        (0, 0, -2), (1, 0, -2), (0, 1, -2),
+        (3, 0, 0), (4, 0, 0), (3, 1, 0),
+    ])
+    assert loaded['index_data'][:6].tolist() == [0, 1, 2, 3, 4, 5]
+    assert batch.bounds.aabb_min == vec3(0, 0, -2)
+    assert batch.bounds.aabb_max == vec3(4, 1, 0)
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from src import mesh
+from src.config import config
+from src.iofs import iofs_source_key
+from src.mesh_cache import MeshCacheLod
+from src.mesh_cache import mesh_cache_close
+from src.mesh_cache import mesh_cache_open
+from src.mesh_cache import mesh_cache_write
+
+_BOUNDS = (0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.87)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.obj'
+    path.write_text('v 0 0 0\n')
+    return str(path)
+
+
+def _write(cache_path: str, source_path: str, index_dtype=np.uint16):
+    vertex_data = np.arange(24 * 20, dtype=np.uint8)
+    index_data = np.arange(36, dtype=index_dtype)
+    mesh_cache_write(
+        cache_path,
+        iofs_source_key(source_path),
+        settings=b'settings',
+        flags=1,
+        vertex_format='packed',
+        vertex_data=vertex_data,
+        index_data=index_data,
+        vertices_count=24,
+        bounds=_BOUNDS,
+        lods=[MeshCacheLod(0, 36, 0), MeshCacheLod(0, 12, 0)],
+    )
+    return vertex_data, index_data
+
+
+@pytest.mark.parametrize('index_dtype', [np.uint16, np.uint32])
+def test_round_trip(tmp_path, source, index_dtype):
+    cache_path = str(tmp_path / 'source.mesh')
+    vertex_data, index_data = _write(cache_path, source, index_dtype)
+
+    cooked = mesh_cache_open(cache_path, source)
+    assert cooked is not None
+    assert cooked.settings == b'settings'
+    assert cooked.flags == 1
+    assert cooked.vertex_format == 'packed'
+    assert cooked.vertices_count == 24
+    assert cooked.indices_count == 36
+    assert cooked.index_data.dtype == index_dtype
+    assert (cooked.vertex_data == vertex_data).all()
+    assert (cooked.index_data == index_data).all()
+    assert cooked.bounds == pytest.approx(_BOUNDS)
+    assert cooked.lods == [MeshCacheLod(0, 36, 0), MeshCacheLod(0, 12, 0)]
+
+    mesh_cache_close(cooked)
+    assert cooked.vertex_data is None
+
+
+def test_stale_source(tmp_path, source):
+    cache_path = str(tmp_path / 'source.mesh')
+    _write(cache_path, source)
+
+    # Touched source with the same content keeps entry, its new mtime is
+    # stored back
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cooked = mesh_cache_open(cache_path, source)
+    assert cooked.key.mtime_ns == stat.st_mtime_ns + 10**9
+    mesh_cache_close(cooked)
+
+    # Changed content of the same size is detected by hash
+    with open(source, 'w') as f:
+        f.write('v 1 0 0\n')
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+    assert mesh_cache_open(cache_path, source) is None
+
+
+def test_truncated_entry(tmp_path, source):
+    cache_path = str(tmp_path / 'source.mesh')
+    _write(cache_path, source)
+
+    with open(cache_path, 'r+b') as f:
+        f.truncate(os.path.getsize(cache_path) - 1)
+    assert mesh_cache_open(cache_path, source) is None
+
+    open(cache_path, 'wb').close()
+    assert mesh_cache_open(cache_path, source) is None
+
+
+def test_cook_unreadable_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/assets/')
+    monkeypatch.setattr(config, 'CACHE_DIR', f'{tmp_path}/cache/')
+    os.makedirs(tmp_path / 'assets' / 'models')
+    (tmp_path / 'assets' / 'models' / 'tri.obj').write_text(
+        'v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nvn 0 0 1\n'
+        'f 1/1/1 2/1/1 3/1/1\n'
+    )
+
+    cooked = mesh.mesh_cook('tri.obj')
+    assert cooked.indices_count == 3
+    mesh.mesh_cache_close(cooked)
+
+    # Entry written by cooking is not readable back
+    os.remove(tmp_path / 'cache' / 'models' / 'tri.obj.mesh')
+    monkeypatch.setattr(mesh, 'mesh_cache_write', lambda *_, **__: None)
+    with pytest.raises(RuntimeError, match='tri.obj.mesh'):
+        mesh.mesh_cook('tri.obj')
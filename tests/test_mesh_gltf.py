@@ -0,0 +1,138 @@
+import base64
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from src.config import config
+from src.mesh_gltf import mesh_parse_gltf_file
+
+_POSITIONS = np.array([(0, 0, 0), (1, 0, 0), (0, 1, 0), (1, 1, 0)], 'f4')
+_NORMALS = np.array([(0, 0, 1)] * 4, 'f4')
+_TEXCOORDS = np.array([(0, 0), (1, 0), (0, 1), (1, 1)], 'f4')
+_INDICES = np.array([0, 1, 2, 2, 1, 3], '<u2')
+
+# Interleaved vertices: position, normal, texcoord (32 bytes)
+_VERTEX = np.dtype([('p', '<f4', 3), ('n', '<f4', 3), ('t', '<f4', 2)])
+
+
+def _gltf(
+    node: dict,
+    vertex_stride: int = _VERTEX.itemsize,
+) -> tuple[dict, bytes]:
+    # -> (JSON, binary buffer) of quad primitive
+    vertices = np.zeros(4, _VERTEX)
+    vertices['p'], vertices['n'], vertices['t'] = (
+        _POSITIONS, _NORMALS, _TEXCOORDS
+    )
+    vertex_bytes = vertices.tobytes()
+    if vertex_stride != _VERTEX.itemsize:
+        # Padding after every vertex
+        padding = vertex_stride - _VERTEX.itemsize
+        vertex_bytes = b''.join(
+            v.tobytes() + b'\xee' * padding for v in vertices
+        )
+
+    # Indices are not at the start of buffer
+    index_offset = 8
+    data = b'\0' * index_offset + _INDICES.tobytes() + b'\0\0' + vertex_bytes
+    vertex_offset = index_offset + _INDICES.nbytes + 2
+
+    def vertex_accessor(offset: int, type: str) -> dict:
+        return {
+            'bufferView': 1, 'byteOffset': offset, 'componentType': 5126,
+            'count': 4, 'type': type,
+        }
+
+    gltf = {
+        'asset': {'version': '2.0'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [node],
+        'meshes': [{'primitives': [{
+            'attributes': {'POSITION': 1, 'NORMAL': 2, 'TEXCOORD_0': 3},
+            'indices': 0,
+        }]}],
+        'buffers': [{'byteLength': len(data)}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': index_offset,
+             'byteLength': _INDICES.nbytes},
+            {'buffer': 0, 'byteOffset': vertex_offset,
+             'byteLength': len(vertex_bytes), 'byteStride': vertex_stride},
+        ],
+        'accessors': [
+            {'bufferView': 0, 'componentType': 5123, 'count': 6,
+             'type': 'SCALAR'},
+            vertex_accessor(0, 'VEC3'),
+            vertex_accessor(12, 'VEC3'),
+            vertex_accessor(24, 'VEC2'),
+        ],
+    }
+    return gltf, data
+
+
+def _glb(gltf: dict, data: bytes) -> bytes:
+    json_chunk = json.dumps(gltf).encode()
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    data += b'\0' * (-len(data) % 4)
+
+    chunks = (
+        struct.pack('<I4s', len(json_chunk), b'JSON') + json_chunk
+        + struct.pack('<I4s', len(data), b'BIN\0') + data
+    )
+    return struct.pack('<4sII', b'glTF', 2, 12 + len(chunks)) + chunks
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/')
+    (tmp_path / 'models').mkdir()
+    return tmp_path / 'models'
+
+
+@pytest.mark.parametrize('vertex_stride', [32, 40])
+def test_glb_interleaved_accessors(models_dir, vertex_stride):
+    gltf, data = _gltf({'mesh': 0}, vertex_stride)
+    (models_dir / 'quad.glb').write_bytes(_glb(gltf, data))
+
+    geometry = mesh_parse_gltf_file('quad.glb')
+
+    assert geometry.positions.tolist() == _POSITIONS.tolist()
+    assert geometry.normals.tolist() == _NORMALS.tolist()
+    # Texture origin is flipped to bottom-left
+    assert geometry.texcoords[:, 0].tolist() == _TEXCOORDS[:, 0].tolist()
+    assert geometry.texcoords[:, 1].tolist() == (
+        1.0 - _TEXCOORDS[:, 1]
+    ).tolist()
+    assert geometry.indices.tolist() == _INDICES.tolist()
+    assert geometry.indices.dtype == np.uint32
+
+
+def test_gltf_embedded_buffer_and_transform(models_dir):
+    # Mirrored and moved node
+    gltf, data = _gltf({
+        'mesh': 0, 'translation': [0, 0, 5], 'scale': [-2, 2, 2],
+    })
+    gltf['buffers'][0]['uri'] = (
+        'data:application/octet-stream;base64,'
+        + base64.b64encode(data).decode()
+    )
+    (models_dir / 'quad.gltf').write_text(json.dumps(gltf))
+
+    geometry = mesh_parse_gltf_file('quad.gltf')
+
+    expected = _POSITIONS * (-2, 2, 2) + (0, 0, 5)
+    assert np.allclose(geometry.positions, expected)
+    assert np.allclose(geometry.normals, _NORMALS)
+    # Mirroring keeps triangles front facing by flipped winding
+    assert geometry.indices.tolist() == [2, 1, 0, 3, 1, 2]
+
+
+def test_gltf_without_triangles(models_dir):
+    gltf, data = _gltf({'mesh': 0})
+    gltf['meshes'][0]['primitives'][0]['mode'] = 1  # lines
+    (models_dir / 'lines.glb').write_bytes(_glb(gltf, data))
+
+    with pytest.raises(ValueError, match='No triangle primitives'):
+        mesh_parse_gltf_file('lines.glb')
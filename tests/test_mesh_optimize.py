@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.mesh_optimize import mesh_calc_acmr
+from src.mesh_optimize import mesh_optimize
+from src.mesh_optimize import mesh_optimize_vertex_cache
+
+
+def _grid(size: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    # -> (positions, indices) of size x size vertex grid with triangles in
+    # random order
+    y, x = np.mgrid[0:size, 0:size]
+    positions = np.stack(
+        (x.ravel(), y.ravel(), np.zeros(size * size)), axis=1
+    ).astype(np.float32)
+
+    quads = (y[:-1, :-1] * size + x[:-1, :-1]).ravel()
+    triangles = np.stack((
+        np.stack((quads, quads + 1, quads + size), axis=1),
+        np.stack((quads + 1, quads + size + 1, quads + size), axis=1),
+    ), axis=1).reshape(-1, 3)
+
+    order = np.random.default_rng(seed).permutation(len(triangles))
+    return positions, triangles[order].ravel().astype(np.uint32)
+
+
+def _triangles_set(indices: np.ndarray) -> set[tuple[int, ...]]:
+    # Triangles with rotated corners are the same triangles
+    triangles = indices.reshape(-1, 3)
+    first = np.argmin(triangles, axis=1)
+    rotated = np.stack([
+        triangles[np.arange(len(triangles)), (first + i) % 3]
+        for i in range(3)
+    ], axis=1)
+    return set(map(tuple, rotated.tolist()))
+
+
+def test_calc_acmr():
+    strip = np.array([0, 1, 2, 2, 1, 3, 2, 3, 4], dtype=np.uint32)
+
+    assert mesh_calc_acmr(strip, cache_size=16) == pytest.approx(5 / 3)
+    assert mesh_calc_acmr(strip[:0], cache_size=16) == 0.0
+
+    # Vertex 0 is evicted by FIFO cache of 3 vertices
+    repeated = np.array([0, 1, 2, 1, 2, 3, 0, 3, 2], dtype=np.uint32)
+    assert mesh_calc_acmr(repeated, cache_size=3) == pytest.approx(5 / 3)
+
+
+@pytest.mark.parametrize('cache_size', [8, 16, 32])
+def test_vertex_cache_acmr_is_not_worse(cache_size):
+    positions, indices = _grid(40)
+
+    optimized, clusters = mesh_optimize_vertex_cache(
+        indices, len(positions), cache_size
+    )
+    before = mesh_calc_acmr(indices, cache_size)
+    after = mesh_calc_acmr(optimized, cache_size)
+
+    assert after <= before
+    # Regular grid has ~0.5 ACMR in the ideal order
+    assert after < 1.0
+    assert clusters[0] == 0
+    assert _triangles_set(optimized) == _triangles_set(indices)
+
+
+@pytest.mark.parametrize('overdraw', [False, True])
+def test_optimize_reorders_vertices_by_usage(overdraw):
+    positions, indices = _grid(30, seed=1)
+    # Vertex which is not referenced by triangles
+    positions = np.concatenate((positions, [[-1.0, -1.0, 0.0]]))
+
+    result = mesh_optimize(positions, indices, 16, overdraw)
+
+    # Vertices are numbered in order of their first usage, the unused one
+    # is the last
+    _, first = np.unique(result.indices, return_index=True)
+    assert (np.diff(first) > 0).all()
+    assert result.vertex_order[-1] == len(positions) - 1
+
+    # The same triangles after remapping back to old vertices
+    remapped = result.vertex_order[result.indices]
+    assert _triangles_set(remapped) == _triangles_set(indices)
+    assert mesh_calc_acmr(result.indices, 16) <= mesh_calc_acmr(indices, 16)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from src.mesh_simplify import MeshGeometry
+from src.mesh_simplify import mesh_build_lods
+from src.mesh_simplify import mesh_simplify
+
+
+def _sphere(rings: int, segments: int) -> MeshGeometry:
+    theta, phi = np.meshgrid(
+        np.linspace(0.0, np.pi, rings + 1),
+        np.linspace(0.0, 2.0 * np.pi, segments + 1),
+        indexing='ij',
+    )
+    normals = np.stack((
+        np.sin(theta) * np.cos(phi),
+        np.cos(theta),
+        np.sin(theta) * np.sin(phi),
+    ), axis=-1).reshape(-1, 3)
+
+    quads = (
+        np.arange(rings)[:, None] * (segments + 1) + np.arange(segments)
+    ).ravel()
+    row = segments + 1
+    indices = np.stack((
+        np.stack((quads, quads + row, quads + 1), axis=1),
+        np.stack((quads + 1, quads + row, quads + row + 1), axis=1),
+    ), axis=1).ravel()
+
+    return MeshGeometry(
+        positions=normals.astype(np.float32),
+        normals=normals.astype(np.float32),
+        texcoords=np.stack(
+            (phi.ravel() / (2 * np.pi), theta.ravel() / np.pi), axis=1
+        ).astype(np.float32),
+        indices=indices.astype(np.uint32),
+    )
+
+
+def _triangles_count(geometry: MeshGeometry) -> int:
+    return len(geometry.indices) // 3
+
+
+def test_lods_triangle_budgets():
+    sphere = _sphere(32, 64)
+    lods = mesh_build_lods(sphere, levels=3, ratio=0.5)
+
+    assert len(lods) == 3
+
+    previous = _triangles_count(sphere)
+    for lod in lods:
+        count = _triangles_count(lod)
+        assert 0 < count <= int(previous * 0.5)
+        previous = count
+
+
+def test_lod_geometry():
+    sphere = _sphere(32, 64)
+    lod = mesh_simplify(sphere, 500)
+
+    assert _triangles_count(lod) <= 500
+    assert lod.indices.max() < len(lod.positions)
+    assert len(lod.positions) == len(lod.normals) == len(lod.texcoords)
+
+    # Clusters are collapsed near the surface, normals are unit
+    radii = np.linalg.norm(lod.positions, axis=1)
+    assert np.allclose(radii, 1.0, atol=0.1)
+    assert np.allclose(np.linalg.norm(lod.normals, axis=1), 1.0, atol=1e-5)
+
+    # No degenerate triangles
+    triangles = lod.indices.reshape(-1, 3)
+    assert (triangles[:, 0] != triangles[:, 1]).all()
+    assert (triangles[:, 1] != triangles[:, 2]).all()
+    assert (triangles[:, 0] != triangles[:, 2]).all()
+
+
+@pytest.mark.parametrize('min_triangles, levels_count', [
+    (16, 3),
+    (200, 2),
+    (2000, 0),
+])
+def test_lods_stop_at_min_triangles(min_triangles, levels_count):
+    sphere = _sphere(32, 64)  # 4096 triangles
+    lods = mesh_build_lods(
+        sphere, levels=5, ratio=0.25, min_triangles=min_triangles
+    )
+
+    assert len(lods) == levels_count
@@ -0,0 +1,178 @@
+import re
+
+import glm
+import numpy as np
+import pytest
+from glm import vec3
+
+from src.camera import camera_calc_frustum_planes
+from src.portal import NO_ZONE
+from src.portal import CellParams
+from src.portal import PortalParams
+from src.portal import _clip_polygon
+from src.portal import portal_graph_compute_pvs
+from src.portal import portal_graph_create
+from src.portal import portal_graph_get_zone
+from src.portal import portal_graph_traverse
+from src.portal_pvs import portal_pvs_write
+
+# Rooms A, B, C in a row along X with doors between them, D is behind
+# A along Z:
+#
+#     D
+#     A B C
+_CELLS = [
+    CellParams('A', vec3(0, 0, 0), vec3(3, 3, 3)),
+    CellParams('B', vec3(3, 0, 0), vec3(6, 3, 3)),
+    CellParams('C', vec3(6, 0, 0), vec3(9, 3, 3)),
+    CellParams('D', vec3(0, 0, 3), vec3(3, 3, 6)),
+]
+
+
+def _door(x: float) -> list[vec3]:
+    return [vec3(x, 0, 1), vec3(x, 2, 1), vec3(x, 2, 2), vec3(x, 0, 2)]
+
+
+_PORTALS = [
+    PortalParams(('A', 'B'), _door(3)),
+    # Opposite winding and order of cells
+    PortalParams(('C', 'B'), _door(6)[::-1]),
+    PortalParams(
+        ('A', 'D'),
+        [vec3(1, 0, 3), vec3(2, 0, 3), vec3(2, 2, 3), vec3(1, 2, 3)],
+    ),
+]
+
+_PROJECTION = glm.perspective(glm.radians(60), 16 / 9, 0.01, 100.0)
+
+
+def _create_graph(cells=_CELLS):
+    graph = portal_graph_create(cells, _PORTALS)
+    zones = [
+        portal_graph_get_zone(
+            graph, cell.aabb_min + vec3(0.1), cell.aabb_max - vec3(0.1)
+        )
+        for cell in cells
+    ]
+    return graph, zones
+
+
+def _visible_cells(graph, zones, position, direction) -> str | None:
+    position = vec3(position)
+    m_view = glm.lookAt(position, position + vec3(direction), vec3(0, 1, 0))
+    planes = camera_calc_frustum_planes(_PROJECTION * m_view)
+
+    mask = portal_graph_traverse(graph, position, planes)
+    if mask is None:
+        return None
+
+    return ''.join(cell.name for cell, z in zip(_CELLS, zones) if mask[z])
+
+
+@pytest.mark.parametrize('position, direction, expected', [
+    ((1.5, 1.5, 1.5), (1, 0, 0), 'ABC'),
+    ((1.5, 1.5, 1.5), (-1, 0, 0), 'A'),
+    ((1.5, 1.5, 1.5), (0, 0, 1), 'AD'),
+    ((4.5, 1.5, 1.5), (-1, 0, 0), 'AB'),
+    # Door to B is at edge of view, door to C is not seen through it
+    ((1.5, 1.5, 0.2), (1, 0, 3), 'ABD'),
+    ((20, 1, 1), (1, 0, 0), None),
+])
+def test_traverse(position, direction, expected):
+    graph, zones = _create_graph()
+    assert _visible_cells(graph, zones, position, direction) == expected
+
+
+def test_zones():
+    graph, zones = _create_graph()
+    assert zones == [0, 1, 2, 3]
+
+    # Objects on border belong to both cells, outside ones to none
+    border = portal_graph_get_zone(graph, vec3(2.9, 0, 0), vec3(3.1, 3, 0.5))
+    assert graph.zones[border] == {0, 1}
+    assert portal_graph_get_zone(graph, vec3(20), vec3(21)) == NO_ZONE
+
+
+def test_clip_polygon():
+    square = np.array([(0, 0, 0), (2, 0, 0), (2, 2, 0), (0, 2, 0)], float)
+
+    # x >= 1
+    clipped = _clip_polygon(square, np.array((1.0, 0, 0, -1)))
+    assert sorted(map(tuple, clipped)) == [
+        (1, 0, 0), (1, 2, 0), (2, 0, 0), (2, 2, 0)
+    ]
+
+    # x >= 3
+    assert len(_clip_polygon(square, np.array((1.0, 0, 0, -3)))) == 0
+    # x >= -1
+    assert _clip_polygon(square, np.array((1.0, 0, 0, 1))) is square
+
+
+def test_compute_pvs():
+    graph, _ = _create_graph()
+
+    assert portal_graph_compute_pvs(graph) == {
+        'A': ['A', 'B', 'C', 'D'],
+        'B': ['A', 'B', 'C', 'D'],
+        'C': ['A', 'B', 'C'],
+        'D': ['A', 'B', 'D'],
+    }
+
+
+def test_pvs_limits_traversal():
+    cells = [
+        cell._replace(pvs=['A', 'B']) if cell.name == 'A' else cell
+        for cell in _CELLS
+    ]
+    graph, zones = _create_graph(cells)
+
+    assert _visible_cells(graph, zones, (1.5, 1.5, 1.5), (1, 0, 0)) == 'AB'
+
+
+@pytest.mark.parametrize('cells, portals, message', [
+    (_CELLS, [PortalParams(('A', 'E'), _door(3))], "'E' in portal #0"),
+    (
+        [_CELLS[0]._replace(pvs=['A', 'E']), *_CELLS[1:]],
+        _PORTALS,
+        "'E' in pvs of A",
+    ),
+    ([*_CELLS, _CELLS[0]], _PORTALS, "duplicated cells ['A']"),
+])
+def test_create_validates_cell_names(cells, portals, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        portal_graph_create(cells, portals)
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_pvs_write(newline):
+    scene = newline.join([
+        '[[cell]]',
+        'name = "A"',
+        'pvs = ["C"]',
+        'aabb_min = [0, 0, 0]',
+        '',
+        '# Next room',
+        '[[cell]]',
+        'name = "B"',
+        '',
+        '[[portal]]',
+        'cells = ["A", "B"]',
+    ])
+    expected = newline.join([
+        '[[cell]]',
+        'name = "A"',
+        'aabb_min = [0, 0, 0]',
+        'pvs = ["A", "B"]',
+        '',
+        '# Next room',
+        '[[cell]]',
+        'name = "B"',
+        'pvs = ["A", "B"]',
+        '',
+        '[[portal]]',
+        'cells = ["A", "B"]',
+    ])
+    pvs = {'A': ['A', 'B'], 'B': ['A', 'B']}
+
+    assert portal_pvs_write(scene, pvs) == expected
+    assert portal_pvs_write(expected, pvs) == expected
@@ -0,0 +1,391 @@
+from types import SimpleNamespace
+
+import glm
+import numpy as np
+import pytest
+from glm import mat4
+from glm import vec3
+from OpenGL import GL as g
+
+from src import camera
+from src import render_queue
+from src.camera import camera_calc_frustum_planes
+from src.gfx import MeshGfxData
+from src.gfx import MeshLod
+from src.gfx import TextureGfxData
+from src.gfx import VertexFormat
+from src.gfx_arena import ArenaBlock
+from src.mesh import mesh_bounds_from_tuple
+from src.mesh import mesh_bounds_transform
+from src.render_queue import _BATCH_SHIFT
+from src.render_queue import _CW_SHIFT
+from src.render_queue import _GEOMETRY_SHIFT
+from src.render_queue import _TEXTURE_SHIFT
+from src.render_queue import KeyTable
+from src.render_queue import _key_table_acquire
+from src.render_queue import _key_table_release
+from src.render_queue import _render_queue_depth_is_valid
+from src.render_queue import _render_queue_sort
+from src.render_queue import render_queue_add
+from src.render_queue import render_queue_apply_gpu_stats
+from src.render_queue import render_queue_batches
+from src.render_queue import render_queue_create
+from src.render_queue import render_queue_cull
+from src.render_queue import render_queue_get_lod
+from src.render_queue import render_queue_remove
+from src.render_queue import render_queue_set_transform
+from src.render_queue import render_queue_sync_gpu
+from src.render_queue import render_queue_update
+
+_CUBE = mesh_bounds_from_tuple((-0.5, -0.5, -0.5, 0.5, 0.5, 0.5, 0.87))
+
+# Camera at origin, looking along -Z
+_VIEW_PERSP = glm.perspective(glm.radians(60), 16 / 9, 0.1, 100.0)
+
+
+def _mesh(chunk: int = 0, cw_order: bool = False) -> MeshGfxData:
+    return MeshGfxData(
+        vertex_block=ArenaBlock(chunk, 0, 24),
+        index_block=ArenaBlock(0, 0, 36),
+        vertices_count=24,
+        indices_count=36,
+        cw_order=cw_order,
+        vertex_format=VertexFormat.packed,
+        index_type=g.GL_UNSIGNED_INT,
+        m_dequant=mat4(1.0),
+        lods=[MeshLod(0, 36, 0), MeshLod(0, 12, 0)],
+    )
+
+
+def _field(key: int, shift: int, bits: int) -> int:
+    return (int(key) >> shift) & ((1 << bits) - 1)
+
+
+def test_sort_key_fields():
+    queue = render_queue_create()
+    mesh, other_mesh = _mesh(chunk=0), _mesh(chunk=1, cw_order=True)
+    texture, layer = TextureGfxData(5), TextureGfxData(7, layer=2)
+    at = glm.translate(vec3(0, 0, -5))
+
+    slots = [
+        render_queue_add(queue, mesh, texture, 0, at, _CUBE),
+        render_queue_add(queue, mesh, texture, 1, at, _CUBE),
+        render_queue_add(queue, other_mesh, layer, 0, at, _CUBE),
+    ]
+    keys = queue.keys[slots]
+
+    # Material is per-instance data, not a part of key
+    assert keys[0] == keys[1]
+
+    assert _field(keys[0], _TEXTURE_SHIFT, 16) == 0
+    assert _field(keys[2], _TEXTURE_SHIFT, 16) == 1
+    assert _field(keys[0], _GEOMETRY_SHIFT, 12) == 0
+    assert _field(keys[2], _GEOMETRY_SHIFT, 12) == 1
+    assert _field(keys[0], _CW_SHIFT, 1) == 0
+    assert _field(keys[2], _CW_SHIFT, 1) == 1
+    assert _field(keys[0], _BATCH_SHIFT, 15) == 0
+    assert _field(keys[2], _BATCH_SHIFT, 15) == 1
+
+    # Indices of released keys are reused
+    render_queue_remove(queue, slots[2])
+    slot = render_queue_add(queue, other_mesh, texture, 0, at, _CUBE)
+    assert _field(queue.keys[slot], _GEOMETRY_SHIFT, 12) == 1
+    assert _field(queue.keys[slot], _BATCH_SHIFT, 15) == 1
+
+
+def test_key_table_overflow():
+    table = KeyTable('batch', bits=2)
+    assert [_key_table_acquire(table, key) for key in 'abcd'] == [0, 1, 2, 3]
+    assert _key_table_acquire(table, 'a') == 0
+
+    with pytest.raises(RuntimeError, match='batch table is full: 4 keys'):
+        _key_table_acquire(table, 'e')
+
+    # Released index is reused
+    assert _key_table_release(table, 'b')
+    assert _key_table_acquire(table, 'e') == 1
+
+
+def test_add_overflow_keeps_tables():
+    queue = render_queue_create()
+    queue.batches = KeyTable('batch', bits=1)
+    at = glm.translate(vec3(0, 0, -5))
+    texture = TextureGfxData(5)
+
+    render_queue_add(queue, _mesh(), texture, 0, at, _CUBE)
+    render_queue_add(queue, _mesh(), texture, 0, at, _CUBE)
+
+    # Texture and geometry keys are released on batch table overflow
+    with pytest.raises(RuntimeError, match='batch table is full'):
+        render_queue_add(queue, _mesh(chunk=1), texture, 0, at, _CUBE)
+
+    assert queue.textures.refs == [2]
+    assert queue.geometries.refs[0] == 2
+    assert list(queue.geometries.indices.values()) == [0]
+
+    with pytest.raises(ValueError, match='does not fit 4 bits'):
+        render_queue_add(queue, _mesh(), texture, 0, at, _CUBE, program=16)
+
+
+def test_update_sorts_and_batches():
+    queue = render_queue_create()
+    meshes = [_mesh(chunk=0), _mesh(chunk=1)]
+    textures = [TextureGfxData(5), TextureGfxData(6)]
+
+    for i in range(40):
+        render_queue_add(
+            queue, meshes[i % 2], textures[i // 20], i,
+            glm.translate(vec3(0, 0, -2.0 - i)), _CUBE,
+        )
+    # Behind camera
+    render_queue_add(
+        queue, meshes[0], textures[0], 0, glm.translate(vec3(0, 0, 5)), _CUBE
+    )
+
+    render_queue_update(queue, _VIEW_PERSP)
+    batches, matrices, materials = render_queue_batches(queue)
+
+    assert queue.visible_count == 40
+    assert queue.culled_count == 1
+    assert len(matrices) == len(materials) == 40
+    assert sum(batch.instances_count for batch in batches) == 40
+
+    # Instances of batch are adjacent, keys are ordered
+    assert len({(id(b.mesh), id(b.texture), b.lod) for b in batches}) == len(
+        batches
+    )
+    keys = queue.keys[queue.draw_order]
+    assert (np.diff(keys.astype(np.float64)) >= 0).all()
+
+
+def test_camera_move_keeps_depth_buckets(monkeypatch):
+    monkeypatch.setattr(camera, 'v_cam_pos', vec3(0, 0, 0))
+    queue = render_queue_create()
+    mesh, texture = _mesh(), TextureGfxData(5)
+
+    slots = np.array([
+        render_queue_add(
+            queue, mesh, texture, 0,
+            glm.translate(vec3(0, 0, -2.0 - i * 3)), _CUBE,
+        )
+        for i in range(32)
+    ])
+    render_queue_update(queue, _VIEW_PERSP)
+    keys = queue.keys[slots].copy()
+
+    # Small move changes buckets of a few items, order stays sorted
+    monkeypatch.setattr(camera, 'v_cam_pos', vec3(0, 0, -0.3))
+    render_queue_update(queue, _VIEW_PERSP)
+
+    assert 0 < np.count_nonzero(queue.keys[slots] != keys) <= 4
+    assert sorted(queue.order.tolist()) == slots.tolist()
+    assert (np.diff(queue.keys[queue.order].astype(np.float64)) >= 0).all()
+
+
+def test_sort_merges_changed_keys():
+    queue = render_queue_create()
+    slots = np.array([
+        render_queue_add(
+            queue, _mesh(), TextureGfxData(5), 0,
+            glm.translate(vec3(0, 0, -2.0)), _CUBE,
+        )
+        for _ in range(32)
+    ])
+    keys = np.arange(32, dtype=np.uint64) * np.uint64(2)
+    _render_queue_sort(queue, slots, keys)
+    assert queue.order.tolist() == slots.tolist()
+
+    # Moved items are inserted after items of equal keys
+    keys = keys.copy()
+    keys[[3, 20]] = (keys[25], keys[0])
+    _render_queue_sort(queue, slots, keys)
+
+    expected = slots[[0, 20, *range(1, 3), *range(4, 20), *range(21, 26), 3,
+                      *range(26, 32)]]
+    assert queue.order.tolist() == expected.tolist()
+
+
+def test_cull_mask():
+    planes = camera_calc_frustum_planes(_VIEW_PERSP)
+    left = planes[0]
+
+    # Point on left plane inside of the rest of frustum, and points 0.6
+    # units outside of it
+    point = np.array((0.0, 0.0, -10.0))
+    point -= (left[:3] @ point + left[3]) * left[:3]
+    outside = point - 0.6 * left[:3]
+
+    queue = render_queue_create()
+    for center, radius in [
+        ((0, 0, -10), 0.87),  # inside
+        ((0, 0, 10), 0.87),  # behind
+        ((0, 0, -200), 0.87),  # beyond far plane
+        (outside, 0.87),  # AABB and sphere reach frustum
+        (outside, 0.5),  # AABB reaches frustum, sphere does not
+    ]:
+        bounds = mesh_bounds_from_tuple((-0.5,) * 3 + (0.5,) * 3 + (radius,))
+        render_queue_add(
+            queue, _mesh(), TextureGfxData(5), 0,
+            glm.translate(vec3(*center)), bounds,
+        )
+
+    mask = render_queue_cull(queue, _VIEW_PERSP)
+    assert mask.tolist() == [True, False, False, True, False]
+
+
+def test_frustum_planes():
+    m_view_persp = _VIEW_PERSP * glm.lookAt(
+        vec3(3, 2, 1), vec3(0, 0, -5), vec3(0, 1, 0)
+    )
+    planes = camera_calc_frustum_planes(m_view_persp)
+    m_inverse = glm.inverse(m_view_persp)
+
+    def unproject(x, y, z):
+        point = m_inverse * glm.vec4(x, y, z, 1.0)
+        return np.array(point.xyz / point.w)
+
+    # Corners of clip space are on planes (within float32 precision at far
+    # plane), its center is inside of all
+    corners = [unproject(x, y, z) for x in (-1, 1) for y in (-1, 1)
+               for z in (-1, 1)]
+    distances = planes[:, :3] @ np.array(corners).T + planes[:, 3:]
+    assert np.allclose(np.sort(np.abs(distances), axis=0)[:3], 0, atol=1e-2)
+    assert (distances > -1e-2).all()
+
+    center = unproject(0, 0, 0)
+    assert (planes[:, :3] @ center + planes[:, 3] > 0).all()
+    assert np.allclose(np.linalg.norm(planes[:, :3], axis=1), 1)
+
+
+def test_cull_matches_reference():
+    # Reference: bounds are culled, if AABB or sphere is behind any plane
+    m_view_persp = _VIEW_PERSP * glm.lookAt(
+        vec3(3, 2, 1), vec3(0, 0, -5), vec3(0, 1, 0)
+    )
+    rng = np.random.default_rng(0)
+    queue = render_queue_create()
+    expected = []
+    planes = camera_calc_frustum_planes(m_view_persp)
+    normals, offsets = planes[:, :3], planes[:, 3]
+
+    for _ in range(2000):
+        model_mat = (
+            glm.translate(vec3(*rng.uniform(-60, 60, 3)))
+            * glm.rotate(rng.uniform(0, 6.28), vec3(*rng.normal(size=3)))
+            * glm.scale(vec3(*rng.uniform(0.5, 4.0, 3)))
+        )
+        render_queue_add(
+            queue, _mesh(), TextureGfxData(5), 0, model_mat, _CUBE
+        )
+
+        aabb_min, aabb_max = mesh_bounds_transform(_CUBE, model_mat)
+        center = np.array((aabb_min + aabb_max) * 0.5)
+        extents = np.array((aabb_max - aabb_min) * 0.5)
+        radius = _CUBE.radius * max(
+            glm.length(vec3(model_mat[i])) for i in range(3)
+        )
+        aabb = normals @ center + np.abs(normals) @ extents + offsets
+        sphere = normals @ center + radius + offsets
+        expected.append(min(aabb.min(), sphere.min()))
+
+    # Bounds, which touch planes, are not compared (float32 culling)
+    expected = np.array(expected)
+    mask = render_queue_cull(queue, m_view_persp)
+    certain = np.abs(expected) > 1e-3
+
+    assert (mask[certain] == (expected[certain] >= 0)).all()
+    assert 0 < mask.sum() < len(mask)
+
+
+def test_depth_is_invalid_after_camera_move():
+    queue = render_queue_create()
+    queue.frame = 2
+
+    def view(position: vec3, direction: vec3):
+        return _VIEW_PERSP * glm.lookAt(
+            position, position + direction, vec3(0, 1, 0)
+        )
+
+    captured = view(vec3(10, 0, 0), vec3(0, 0, -1))
+    depth = SimpleNamespace(frame=1, m_view_persp=captured)
+
+    # Rotation keeps depth valid, as bounds are tested in captured view
+    turned = view(vec3(10, 0, 0), vec3(1, 0, -1))
+    assert _render_queue_depth_is_valid(queue, depth, captured)
+    assert _render_queue_depth_is_valid(queue, depth, turned)
+
+    moved = view(vec3(12, 0, 0), vec3(0, 0, -1))
+    assert not _render_queue_depth_is_valid(queue, depth, moved)
+
+
+def test_lod_by_projected_size(monkeypatch):
+    monkeypatch.setattr(camera, 'v_cam_pos', vec3(0, 0, 0))
+    queue = render_queue_create()
+    mesh = _mesh()
+    mesh.lods = [MeshLod(0, 36, 0), MeshLod(0, 24, 0), MeshLod(0, 12, 0)]
+
+    # Projected sizes: 0.75 is above all thresholds, 0.19 is below the
+    # first one, the far item is below all of them and gets the last LOD
+    slots = [
+        render_queue_add(
+            queue, mesh, TextureGfxData(5), 0,
+            glm.translate(vec3(0, 0, z)), _CUBE,
+        )
+        for z in (-2.0, -8.0, -60.0)
+    ]
+    render_queue_update(queue, _VIEW_PERSP)
+
+    assert [render_queue_get_lod(queue, slot) for slot in slots] == [0, 1, 2]
+
+
+def test_sync_gpu(monkeypatch):
+    queue = render_queue_create()
+    meshes = [_mesh(chunk=0), _mesh(chunk=1)]
+    textures = [TextureGfxData(5), TextureGfxData(6, layer=2)]
+
+    slots = [
+        render_queue_add(
+            queue, meshes[i % 2], textures[i // 4], i,
+            glm.translate(vec3(0, 0, -2.0 - i)), _CUBE,
+        )
+        for i in range(8)
+    ]
+    render_queue_remove(queue, slots[5])
+    layout, (first, items) = render_queue_sync_gpu(queue)
+
+    # Command per batch and LOD, items point to LOD 0 of their batch
+    assert len(layout.batches) == 4 * 2
+    assert layout.item_commands[slots[5]] == -1
+    for slot in slots[:5] + slots[6:]:
+        command = layout.item_commands[slot]
+        batch = layout.batches[command]
+        assert batch.lod == 0 and layout.batches[command + 1].lod == 1
+        assert batch.mesh is queue.items[slot].mesh
+        assert batch.texture is queue.items[slot].texture
+
+    assert first == 0 and len(items.radii) == len(slots)
+    assert items.texture_layers.tolist() == [-1] * 4 + [2, -1, 2, 2]
+    assert items.materials.tolist() == [0, 1, 2, 3, 4, 5, 6, 7]
+    assert render_queue_get_lod(queue, slots[0]) is None
+
+    # Moved item is synced alone, layout is kept
+    assert render_queue_sync_gpu(queue) == (None, None)
+    render_queue_set_transform(
+        queue, slots[3], glm.translate(vec3(1, 0, -5)), _CUBE
+    )
+    layout, (first, items) = render_queue_sync_gpu(queue)
+    assert layout is None
+    assert first == slots[3] and items.centers[:, 0].tolist() == [1, 0, -5]
+
+    # Texture mips are requested by read back details of visible batches
+    requests = []
+    monkeypatch.setattr(
+        render_queue, 'texture_stream_request',
+        lambda texture, detail: requests.append((texture, detail)),
+    )
+    details = np.zeros(len(queue.batches.refs), dtype=np.float32)
+    details[items.batches[0]] = 40.0
+    render_queue_apply_gpu_stats(queue, 3, details)
+
+    assert requests == [(textures[0], 40.0)]
+    assert (queue.visible_count, queue.culled_count) == (3, 4)
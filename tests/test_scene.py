@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import glm
+import pytest
+from glm import vec3
+from OpenGL import GL as g
+
+from src import scene
+from src.config import config
+from src.gfx import MeshGfxData
+from src.gfx import MeshLod
+from src.gfx import TextureGfxData
+from src.gfx import VertexFormat
+from src.gfx_arena import ArenaBlock
+from src.mesh import Mesh
+from src.mesh import mesh_bounds_from_tuple
+from src.scene import Scene
+from src.scene import SceneObject
+from src.scene import scene_invalidate_object
+from src.scene import scene_update_objects
+from src.texture import Texture
+
+_CUBE = mesh_bounds_from_tuple((-0.5, -0.5, -0.5, 0.5, 0.5, 0.5, 0.87))
+
+
+def _gfx_mesh() -> MeshGfxData:
+    return MeshGfxData(
+        vertex_block=ArenaBlock(0, 0, 24),
+        index_block=ArenaBlock(0, 0, 36),
+        vertices_count=24,
+        indices_count=36,
+        cw_order=False,
+        vertex_format=VertexFormat.packed,
+        index_type=g.GL_UNSIGNED_INT,
+        m_dequant=glm.mat4(1.0),
+        lods=[MeshLod(0, 36, 0)],
+    )
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    # -> {batch ID: positions of merged objects}, of the last build
+    built = {}
+
+    def build(gfx, batch_id, instances):
+        built[batch_id] = sorted(
+            tuple(model_mat[3].xyz) for _, model_mat in instances
+        )
+        return Mesh(batch_id, batch_id, _CUBE, _gfx_mesh())
+
+    monkeypatch.setattr(config, 'STATIC_CHUNK_SIZE', 8.0)
+    monkeypatch.setattr(scene, 'mesh_batch_build', build)
+    monkeypatch.setattr(scene, 'gfx_unload_mesh', lambda *_: None)
+    return built
+
+
+def _object(self: Scene, position: tuple, texture: Texture) -> SceneObject:
+    mesh = Mesh('cube', 'cube.obj', _CUBE, _gfx_mesh())
+    obj = SceneObject(
+        id=len(self.objects),
+        ptr=SimpleNamespace(mesh=mesh, texture=texture, material=0),
+        position=vec3(position),
+        rotation=vec3(0),
+        scale=vec3(1),
+        is_active=True,
+        is_static=True,
+    )
+    self.objects.append(obj)
+    scene_invalidate_object(self, obj)
+    return obj
+
+
+def test_static_chunks(batches):
+    self = Scene(objects=[], _obj_id_iter=0)
+    wood = Texture('wood', 'wood.png', TextureGfxData(5))
+    stone = Texture('stone', 'stone.png', TextureGfxData(6))
+
+    a = _object(self, (1, 0, 1), wood)
+    _object(self, (2, 0, 2), wood)
+    c = _object(self, (20, 0, 0), wood)
+    _object(self, (3, 0, 3), stone)
+    scene_update_objects(self, None)
+
+    # Chunk per texture and grid cell
+    assert batches == {
+        'static/wood/0/0_0_0/-1': [(1, 0, 1), (2, 0, 2)],
+        'static/wood/0/2_0_0/-1': [(20, 0, 0)],
+        'static/stone/0/0_0_0/-1': [(3, 0, 3)],
+    }
+    assert self.render_queue.active.sum() == 3
+
+    # Only chunk of moved object is rebuilt
+    batches.clear()
+    a.position = vec3(4, 0, 4)
+    scene_invalidate_object(self, a)
+    scene_update_objects(self, None)
+
+    assert batches == {'static/wood/0/0_0_0/-1': [(2, 0, 2), (4, 0, 4)]}
+
+    # Object moved to other cell rebuilds both chunks, empty one is removed
+    batches.clear()
+    c.position = vec3(5, 0, 5)
+    scene_invalidate_object(self, c)
+    scene_update_objects(self, None)
+
+    assert batches == {
+        'static/wood/0/0_0_0/-1': [(2, 0, 2), (4, 0, 4), (5, 0, 5)],
+    }
+    assert len(self.static_chunks) == 2
+    assert self.render_queue.active.sum() == 2
+
+    # Inactive objects are not merged
+    batches.clear()
+    a.is_active = False
+    scene_invalidate_object(self, a)
+    scene_update_objects(self, None)
+
+    assert batches == {'static/wood/0/0_0_0/-1': [(2, 0, 2), (5, 0, 5)]}
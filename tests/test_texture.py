@@ -0,0 +1,95 @@
+import os
+
+import pytest
+from PIL import Image
+
+from src import texture
+from src.config import config
+from src.db import TextureRecord
+from src.gfx import TextureFormat
+from src.texture import TextureArraySlot
+from src.texture import TextureShape
+from src.texture import texture_create_arrays
+from src.texture import texture_probe
+
+
+@pytest.fixture
+def textures_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/assets/')
+    monkeypatch.setattr(config, 'CACHE_DIR', f'{tmp_path}/cache/')
+    os.makedirs(tmp_path / 'assets' / 'textures')
+
+    def write(name: str, width: int, height: int, mode: str) -> str:
+        Image.new(mode, (width, height)).save(
+            tmp_path / 'assets' / 'textures' / name
+        )
+        return name
+
+    return write
+
+
+@pytest.mark.parametrize('mode, format, shape', [
+    ('RGB', 'uncompressed', (64, 32, TextureFormat.uncompressed, 3)),
+    ('RGBA', 'uncompressed', (64, 32, TextureFormat.uncompressed, 4)),
+    ('L', 'uncompressed', (64, 32, TextureFormat.uncompressed, 1)),
+    ('RGB', 'auto', (64, 32, TextureFormat.bc1, 0)),
+    ('RGBA', 'auto', (64, 32, TextureFormat.bc3, 0)),
+    ('LA', 'bc5', (64, 32, TextureFormat.bc5, 0)),
+])
+def test_probe_matches_cooked(textures_dir, mode, format, shape):
+    path = textures_dir('image.png', 64, 32, mode)
+
+    # From source image header, then from header of cooked entry
+    assert texture_probe(path, format) == shape
+    texture.texture_cache_close(texture.texture_cook(path, format))
+    assert texture_probe(path, format) == shape
+
+
+def test_probe_reads_cooked_header(textures_dir, monkeypatch):
+    path = textures_dir('image.png', 64, 32, 'RGB')
+    texture.texture_cache_close(texture.texture_cook(path, 'auto'))
+
+    def read_source(*_):
+        raise AssertionError('Source image is read')
+
+    monkeypatch.setattr(texture, 'iofs_read_texture_file', read_source)
+    assert texture_probe(path, 'auto') == TextureShape(
+        64, 32, TextureFormat.bc1, 0
+    )
+
+
+def test_arrays_group_by_shape(textures_dir, monkeypatch):
+    monkeypatch.setattr(config, 'TEXTURE_ARRAY_LAYERS', 2)
+    arrays = []
+
+    def create_array(gfx, *shape_and_layers):
+        arrays.append(shape_and_layers)
+        return len(arrays)
+
+    monkeypatch.setattr(texture, 'gfx_create_texture_array', create_array)
+
+    records = [
+        TextureRecord('a', textures_dir('a.png', 64, 64, 'RGB')),
+        TextureRecord('b', textures_dir('b.png', 64, 64, 'RGB')),
+        TextureRecord('c', textures_dir('c.png', 64, 64, 'RGB')),
+        # Same size, but other format
+        TextureRecord('d', textures_dir('d.png', 64, 64, 'RGBA')),
+        TextureRecord('e', textures_dir('e.png', 32, 32, 'RGB')),
+        TextureRecord('f', textures_dir('f.png', 32, 32, 'RGB')),
+    ]
+    for record in records:
+        record.format = 'auto'
+
+    slots = texture_create_arrays(records, gfx=None)
+
+    # Pages hold up to 2 layers, the single texture of shape is standalone
+    assert slots == {
+        'a': TextureArraySlot(1, 0),
+        'b': TextureArraySlot(1, 1),
+        'e': TextureArraySlot(2, 0),
+        'f': TextureArraySlot(2, 1),
+    }
+    assert arrays == [
+        (64, 64, TextureFormat.bc1, 0, 2),
+        (32, 32, TextureFormat.bc1, 0, 2),
+    ]
@@ -0,0 +1,174 @@
+import numpy as np
+import pytest
+
+from src.texture_bc import BC_BLOCK_BYTES
+from src.texture_bc import bc_encode
+
+
+def _decode_565(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    r, g, b = (values >> 11) & 31, (values >> 5) & 63, values & 31
+    return np.stack(
+        ((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)),
+        axis=-1,
+    ).astype(np.float64)
+
+
+def _decode_bc1(blocks: np.ndarray) -> np.ndarray:
+    # (n, 8) -> (n, 16, 3), reference decoder of both block modes
+    c0 = blocks[:, 0:2].copy().view('<u2')[:, 0]
+    c1 = blocks[:, 2:4].copy().view('<u2')[:, 0]
+    bits = blocks[:, 4:8].copy().view('<u4')[:, 0].astype(np.int64)
+    indices = (bits[:, None] >> (2 * np.arange(16))) & 3
+
+    e0, e1 = _decode_565(c0), _decode_565(c1)
+    four = (c0 > c1)[:, None]
+    palette = np.stack((
+        e0,
+        e1,
+        np.where(four, (2 * e0 + e1) / 3, (e0 + e1) / 2),
+        np.where(four, (e0 + 2 * e1) / 3, 0.0),
+    ), axis=1)
+
+    return np.take_along_axis(palette, indices[:, :, None], axis=1)
+
+
+def _decode_bc4(blocks: np.ndarray) -> np.ndarray:
+    # (n, 8) -> (n, 16)
+    a0 = blocks[:, 0].astype(np.float64)
+    a1 = blocks[:, 1].astype(np.float64)
+    bits = np.zeros(len(blocks), dtype=np.int64)
+    for i in range(6):
+        bits |= blocks[:, 2 + i].astype(np.int64) << (8 * i)
+    indices = (bits[:, None] >> (3 * np.arange(16))) & 7
+
+    eight = (a0 > a1)[:, None]
+    steps = np.arange(1, 7)[None]
+    palette = np.concatenate((
+        a0[:, None],
+        a1[:, None],
+        np.where(
+            eight,
+            ((7 - steps) * a0[:, None] + steps * a1[:, None]) / 7,
+            np.where(
+                steps <= 4,
+                ((5 - steps) * a0[:, None] + steps * a1[:, None]) / 5,
+                np.where(steps == 5, 0.0, 255.0),
+            ),
+        ),
+    ), axis=1)
+
+    return np.take_along_axis(palette, indices, axis=1)
+
+
+def _blocks(pixels: np.ndarray) -> np.ndarray:
+    # (h, w, c) -> (n, 16, c) texels of 4x4 blocks, same order as encoded
+    h, w, c = pixels.shape
+    blocks = pixels.reshape(h // 4, 4, w // 4, 4, c).swapaxes(1, 2)
+    return blocks.reshape(-1, 16, c).astype(np.float64)
+
+
+def _image(components: int, size: int = 64) -> np.ndarray:
+    # Smooth gradients with a bit of noise
+    y, x = np.mgrid[0:size, 0:size] / (size - 1)
+    channels = [x, y, 1.0 - x * y, np.sin(np.pi * x) * y]
+    rng = np.random.default_rng(components)
+    pixels = np.stack(channels[:components], axis=2) * 255.0
+    pixels += rng.normal(0.0, 3.0, pixels.shape)
+    return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+
+def _rmse(decoded: np.ndarray, expected: np.ndarray) -> float:
+    return float(np.sqrt(((decoded - expected) ** 2).mean()))
+
+
+@pytest.mark.parametrize('quality, max_rmse', [(0, 6.0), (1, 4.5), (2, 4.5)])
+def test_bc1_error(quality, max_rmse):
+    pixels = _image(3)
+    encoded = bc_encode(pixels, 'bc1', quality)
+
+    assert encoded.shape == (16, 16, BC_BLOCK_BYTES['bc1'])
+    decoded = _decode_bc1(encoded.reshape(-1, 8))
+    assert _rmse(decoded, _blocks(pixels)) < max_rmse
+
+
+def test_bc1_quality_order():
+    pixels = _image(3)
+    errors = [
+        _rmse(
+            _decode_bc1(bc_encode(pixels, 'bc1', quality).reshape(-1, 8)),
+            _blocks(pixels),
+        )
+        for quality in range(3)
+    ]
+    assert errors[2] <= errors[1] <= errors[0]
+
+
+def test_bc1_solid_blocks():
+    colors = np.array([(0, 0, 0), (255, 255, 255), (200, 100, 50)])
+    pixels = np.repeat(colors[:, None], 16, axis=1).reshape(12, 4, 3)
+    pixels = pixels.astype(np.uint8)
+
+    decoded = _decode_bc1(bc_encode(pixels, 'bc1', 2).reshape(-1, 8))
+
+    # Only 5:6:5 rounding is left
+    assert np.abs(decoded - _blocks(pixels)).max() <= 4
+
+
+def test_bc3_error():
+    pixels = _image(4)
+    encoded = bc_encode(pixels, 'bc3', 1).reshape(-1, 16)
+    blocks = _blocks(pixels)
+
+    alpha = _decode_bc4(encoded[:, :8])
+    color = _decode_bc1(encoded[:, 8:])
+
+    # Alpha is within half step of 8 values between block min and max
+    alpha_range = np.ptp(blocks[..., 3], axis=1, keepdims=True)
+    assert (np.abs(alpha - blocks[..., 3]) <= alpha_range / 14 + 0.5).all()
+    assert _rmse(color, blocks[..., :3]) < 4.5
+
+
+def test_bc3_opaque():
+    pixels = _image(3)
+    alpha = _decode_bc4(bc_encode(pixels, 'bc3', 1).reshape(-1, 16)[:, :8])
+
+    assert (alpha == 255).all()
+
+
+@pytest.mark.parametrize('components', [1, 2, 3])
+def test_bc5_error(components):
+    pixels = _image(components)
+    encoded = bc_encode(pixels, 'bc5', 0).reshape(-1, 16)
+    blocks = _blocks(pixels)
+
+    red = _decode_bc4(encoded[:, :8])
+    green = _decode_bc4(encoded[:, 8:])
+
+    red_range = np.ptp(blocks[..., 0], axis=1, keepdims=True)
+    assert (np.abs(red - blocks[..., 0]) <= red_range / 14 + 0.5).all()
+
+    if components >= 2:
+        green_range = np.ptp(blocks[..., 1], axis=1, keepdims=True)
+        assert (
+            np.abs(green - blocks[..., 1]) <= green_range / 14 + 0.5
+        ).all()
+    else:
+        assert (green == 0).all()
+
+
+def test_partial_blocks():
+    pixels = _image(3, size=64)[:10, :6]
+    encoded = bc_encode(pixels, 'bc1', 1)
+
+    assert encoded.shape == (3, 2, 8)
+
+    # Partial blocks are padded by edge texels
+    padded = np.pad(pixels, ((0, 2), (0, 2), (0, 0)), 'edge')
+    decoded = _decode_bc1(encoded.reshape(-1, 8))
+    assert _rmse(decoded, _blocks(padded)) < 6.0
+
+
+def test_unsupported_format():
+    with pytest.raises(ValueError, match='Unsupported block compression'):
+        bc_encode(np.zeros((4, 4, 3), np.uint8), 'bc7', 1)
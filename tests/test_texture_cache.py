@@ -0,0 +1,135 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src import texture
+from src.config import config
+from src.iofs import iofs_source_key
+from src.texture_bc import bc_encode
+from src.texture_cache import UNCOMPRESSED
+from src.texture_cache import texture_build_mips
+from src.texture_cache import texture_cache_close
+from src.texture_cache import texture_cache_open
+from src.texture_cache import texture_cache_read_header
+from src.texture_cache import texture_cache_write
+
+_SETTINGS = b'settings'
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.png'
+    path.write_bytes(b'image')
+    return str(path)
+
+
+def _pixels(width: int, height: int, components: int) -> np.ndarray:
+    rng = np.random.default_rng(width * height + components)
+    return rng.integers(0, 256, (height, width, components), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('format, components', [
+    (UNCOMPRESSED, 1),
+    (UNCOMPRESSED, 3),
+    (UNCOMPRESSED, 4),
+    ('bc1', 3),
+    ('bc3', 4),
+    ('bc5', 2),
+])
+def test_round_trip(tmp_path, source, format, components):
+    cache_path = str(tmp_path / 'source.dds')
+    levels = texture_build_mips(_pixels(24, 12, components))
+    if format != UNCOMPRESSED:
+        levels = [bc_encode(level, format, quality=1) for level in levels]
+
+    texture_cache_write(
+        cache_path, iofs_source_key(source), _SETTINGS, format, 24, 12, levels
+    )
+    cooked = texture_cache_open(cache_path, source)
+
+    assert cooked.settings == _SETTINGS
+    assert cooked.format == format
+    assert (cooked.width, cooked.height) == (24, 12)
+    assert cooked.components == components
+    assert len(cooked.levels) == len(levels) == 5
+    assert all(
+        (cooked_level == level).all()
+        for cooked_level, level in zip(cooked.levels, levels)
+    )
+
+    header = texture_cache_read_header(cache_path, source)
+    assert header.settings == _SETTINGS
+    assert header.levels_count == 5
+
+    texture_cache_close(cooked)
+    assert cooked.levels is None
+
+
+def test_mips():
+    levels = texture_build_mips(np.full((8, 4, 3), 200, dtype=np.uint8))
+
+    assert [level.shape for level in levels] == [
+        (8, 4, 3), (4, 2, 3), (2, 1, 3), (1, 1, 3),
+    ]
+    assert all((level == 200).all() for level in levels)
+
+
+def test_stale_entries(tmp_path, source):
+    cache_path = str(tmp_path / 'source.dds')
+    levels = texture_build_mips(_pixels(4, 4, 3))
+    texture_cache_write(
+        cache_path, iofs_source_key(source), _SETTINGS, UNCOMPRESSED, 4, 4,
+        levels,
+    )
+
+    # Entry of another cache version (kept in the last header field)
+    with open(cache_path, 'r+b') as f:
+        f.seek(124)
+        version = f.read(4)
+        f.seek(124)
+        f.write(struct.pack('<I', 2))
+    assert texture_cache_open(cache_path, source) is None
+    assert texture_cache_read_header(cache_path, source) is None
+
+    with open(cache_path, 'r+b') as f:
+        f.seek(124)
+        f.write(version)
+    assert texture_cache_read_header(cache_path, source) is not None
+
+    # Source content is changed
+    stat = os.stat(source)
+    with open(source, 'wb') as f:
+        f.write(b'other')
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert texture_cache_open(cache_path, source) is None
+    assert texture_cache_read_header(cache_path, source) is None
+
+
+def test_cook(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ASSETS_DIR', f'{tmp_path}/assets/')
+    monkeypatch.setattr(config, 'CACHE_DIR', f'{tmp_path}/cache/')
+    os.makedirs(tmp_path / 'assets' / 'textures')
+    Image.fromarray(_pixels(8, 8, 4)).save(
+        tmp_path / 'assets' / 'textures' / 'noise.png'
+    )
+
+    cooked = texture.texture_cook('noise.png', 'auto')
+    assert cooked.format == 'bc3'
+    assert len(cooked.settings) == 8
+    texture.texture_cache_close(cooked)
+
+    # Entry of other settings is cooked again
+    cooked = texture.texture_cook('noise.png', UNCOMPRESSED)
+    assert cooked.format == UNCOMPRESSED
+    # Rows are flipped for OpenGL
+    assert (cooked.levels[0] == _pixels(8, 8, 4)[::-1]).all()
+    texture.texture_cache_close(cooked)
+
+    # Entry written by cooking is not readable back
+    os.remove(tmp_path / 'cache' / 'textures' / 'noise.png.dds')
+    monkeypatch.setattr(texture, 'texture_cache_write', lambda *_: None)
+    with pytest.raises(RuntimeError, match='noise.png.dds'):
+        texture.texture_cook('noise.png', UNCOMPRESSED)
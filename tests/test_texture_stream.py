@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from src import texture_stream
+from src.gfx import TextureGfxData
+from src.texture_cache import UNCOMPRESSED
+from src.texture_cache import TextureCacheEntry
+from src.texture_cache import texture_build_mips
+from src.texture_stream import texture_stream_create
+from src.texture_stream import texture_stream_load
+from src.texture_stream import texture_stream_request
+from src.texture_stream import texture_stream_update
+
+# Levels of 64x64 RGBA texture: 16384, 4096, 1024, 256, 64, 16, 4 bytes
+_LEVELS = texture_build_mips(np.zeros((64, 64, 4), dtype=np.uint8))
+
+
+@pytest.fixture
+def restreams(monkeypatch):
+    # -> (old_top, new_top) of every texture restream
+    calls = []
+
+    def restream(gfx, texture, levels, format, width, height, old_top,
+                 new_top):
+        calls.append((old_top, new_top))
+
+    monkeypatch.setattr(
+        texture_stream, 'gfx_load_texture', lambda *_: TextureGfxData(id=1)
+    )
+    monkeypatch.setattr(texture_stream, 'gfx_restream_texture', restream)
+    return calls
+
+
+def _cooked() -> TextureCacheEntry:
+    return TextureCacheEntry(
+        key=None,
+        settings=b'',
+        format=UNCOMPRESSED,
+        width=64,
+        height=64,
+        components=4,
+        levels=_LEVELS,
+        _mmap=None,
+    )
+
+
+def test_evict_restreams_once(restreams):
+    streamer = texture_stream_create(
+        budget=2000, min_size=64, uploads_per_frame=1
+    )
+    gfx_data = texture_stream_load(streamer, None, _cooked())
+    assert gfx_data.residency.top_level == 0
+    assert streamer.resident_bytes == 21844
+
+    texture_stream_update(streamer, None)
+
+    # Unused texture drops first 2 levels by single restream
+    assert restreams == [(0, 2)]
+    assert gfx_data.residency.top_level == 2
+    assert streamer.resident_bytes == gfx_data.residency.resident_bytes
+    assert streamer.resident_bytes == 1364
+    assert streamer.evicted_levels == 2
+
+
+def test_evict_keeps_requested_level(restreams):
+    streamer = texture_stream_create(
+        budget=100, min_size=64, uploads_per_frame=1
+    )
+    gfx_data = texture_stream_load(streamer, None, _cooked())
+
+    texture_stream_request(gfx_data, 32)
+    texture_stream_update(streamer, None)
+
+    # Budget stays exceeded by used texture
+    assert restreams == [(0, 1)]
+    assert gfx_data.residency.top_level == 1
+    assert streamer.resident_bytes == 5460
+
+
+def test_evict_least_recently_used_first(restreams):
+    streamer = texture_stream_create(
+        budget=30000, min_size=64, uploads_per_frame=1
+    )
+    old = texture_stream_load(streamer, None, _cooked())
+    recent = texture_stream_load(streamer, None, _cooked())
+
+    texture_stream_request(recent, 64)
+    texture_stream_update(streamer, None)
+    assert restreams == [(0, 1)]
+    assert old.residency.top_level == 1
+
+    # Both are unused now, but budget is exceeded still
+    streamer.budget = 5000
+    texture_stream_update(streamer, None)
+
+    assert restreams == [(0, 1), (1, 6), (0, 2)]
+    assert recent.residency.top_level == 2
+    assert old.residency.top_level == 6
+    assert streamer.resident_bytes == 4 + 1364
+
+
+def test_raise_limited_per_frame(restreams):
+    streamer = texture_stream_create(
+        budget=1 << 20, min_size=8, uploads_per_frame=1
+    )
+    textures = [
+        texture_stream_load(streamer, None, _cooked()) for _ in range(2)
+    ]
+    assert [texture.residency.top_level for texture in textures] == [3, 3]
+
+    for texture in textures:
+        texture_stream_request(texture, 64)
+    texture_stream_update(streamer, None)
+
+    # One level of one texture per frame
+    assert restreams == [(3, 2)]
+    assert streamer.loaded_levels == 1